@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+prepare 目录下音频脚本共用的工具模块
+
+脚本通过将 prepare/ 加入 sys.path 后导入，例如:
+  from audio_common.tts_cache import TTSCache
+"""
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+按子场景 / 场景打包音频：一个场景的全部片段合成一个对象，客户端一次请求即可预取，
+也可以用 HTTP Range 只读取其中一条
+
+每个包两个文件（与单条音频一起上传到 qa/bundles/{sub_scenes|scenes}/）:
+- {id}.mp3   各片段的音频帧首尾相接（去掉 ID3 标签与 Xing/Info 信息帧），整体仍是可播放的 MP3 码流
+- {id}.json  偏移索引:
+    {"version": 1, "id": "daily_001_sub_1", "by": "sub_scene", "size": 123456, "md5": "...",
+     "clips": [{"name": "questions/daily_001_sub_1_qa_1.mp3", "qa_id": "daily_001_sub_1_qa_1",
+                "response": null, "offset": 0, "length": 5616, "duration": 0.936}, ...],
+     "missing": ["responses/daily_001_sub_1_qa_1_response2.mp3"]}
+  单条音频为 bundle[offset : offset + length]，即 Range: bytes={offset}-{offset + length - 1}；
+  md5 与对象的 ETag 一致（超过分片上传阈值的包除外），Range 请求带 If-Match 可发现包已被重建（412 时重新获取索引）。
+  缺失或未通过校验的片段不放进包，记入 missing，客户端回退到单条音频的地址。
+
+增量重建: 状态文件记录每个包由哪些文件（名称、大小、mtime）组成，
+组成未变的包直接跳过，只有包含新增/变化/删除片段的包才重新拼接。
+
+upload_bundles() 按上传清单上传各包的文件（包在前、索引在后），整段对话音轨也用它上传。
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from . import mp3
+from .audio_inventory import AudioInventory
+from .audio_validator import AudioValidator
+from .json_index import read_json, save_merged, snapshot, write_json
+from .metrics import metrics
+from .qa_source import qa_clip_names
+from .upload_manifest import UploadManifest
+
+INDEX_VERSION = 1
+STATE_VERSION = 1
+
+CONTENT_TYPES = {".mp3": "audio/mpeg", ".json": "application/json", ".vtt": "text/vtt"}
+
+# 打包粒度 -> (问答对字段, 包所在子目录)
+GROUPINGS = {
+    "sub_scene": ("sub_scene_id", "sub_scenes"),
+    "scene": ("scene_id", "scenes"),
+}
+
+
+@dataclass
+class BundleClip:
+    name: str                   # 子目录/文件名
+    qa_id: str
+    response: Optional[int]     # 答案序号，问题为 None
+
+
+def plan_bundles(rows: Iterable[Dict[str, Any]], by: str = "sub_scene") -> Dict[str, List[BundleClip]]:
+    """按子场景或场景分组，包内顺序与数据源一致（sub_scene_id, order；问题在前、答案按序号）"""
+    column, _ = GROUPINGS[by]
+    bundles: Dict[str, List[BundleClip]] = {}
+    for qa in rows:
+        clips = bundles.setdefault(qa[column], [])
+        clips.extend(BundleClip(name, qa["id"], idx) for idx, name in qa_clip_names(qa))
+    return bundles
+
+
+class BundleBuilder:
+    """把 audio_dir 下的单条音频打包到 bundle_root/{sub_scenes|scenes}/，按状态文件增量重建"""
+
+    def __init__(
+        self,
+        audio_dir: Path,
+        bundle_root: Path,
+        validator: AudioValidator,
+        by: str = "sub_scene",
+        inventory: Optional[AudioInventory] = None,
+    ):
+        self.audio_dir = Path(audio_dir)
+        self.by = by
+        self.bundle_dir = Path(bundle_root) / GROUPINGS[by][1]
+        self.validator = validator
+        self.inventory = inventory
+        self.state_path = Path(bundle_root) / "bundle_state.json"
+        # "{粒度}/{包 id}" -> {"clips": [[名称, 大小, mtime_ns], ...], "md5": 包的 MD5}
+        self.state: Dict[str, Dict] = {}
+        self._saved: Dict[str, Dict] = {"bundles": {}}
+        self.stats = {"built": 0, "unchanged": 0, "empty": 0, "removed": 0, "clips": 0, "missing": 0, "bytes": 0}
+        self._load()
+
+    def paths(self, bundle_id: str) -> Tuple[Path, Path]:
+        """包与索引的本地路径"""
+        return self.bundle_dir / f"{bundle_id}.mp3", self.bundle_dir / f"{bundle_id}.json"
+
+    def _stat(self, path: Path) -> Optional[os.stat_result]:
+        if self.inventory is not None:
+            return self.inventory.stat(path)
+        try:
+            return os.stat(path)
+        except FileNotFoundError:
+            return None
+
+    def build(self, bundle_id: str, clips: List[BundleClip], force: bool = False) -> Optional[str]:
+        """
+        按需重建一个包，返回 "built" / "unchanged"；没有可用片段时删除旧包并返回 None
+        """
+        present: List[Tuple[BundleClip, Path, float]] = []
+        fingerprint: List[List] = []
+        missing: List[str] = []
+        for clip in clips:
+            path = self.audio_dir / clip.name
+            st = self._stat(path)
+            result = self.validator.check(path, st) if st is not None else None
+            if result is None or not result.ok:
+                missing.append(clip.name)
+                continue
+            present.append((clip, path, result.duration))
+            fingerprint.append([clip.name, st.st_size, st.st_mtime_ns])
+        self.stats["missing"] += len(missing)
+
+        key = f"{self.by}/{bundle_id}"
+        mp3_path, index_path = self.paths(bundle_id)
+        if not present:
+            self.remove(bundle_id)
+            self.stats["empty"] += 1
+            return None
+
+        recorded = self.state.get(key)
+        if (not force and recorded and recorded["clips"] == fingerprint
+                and mp3_path.exists() and index_path.exists()):
+            self.stats["unchanged"] += 1
+            return "unchanged"
+
+        entries: List[Dict[str, Any]] = []
+        digest = hashlib.md5()
+        offset = 0
+        mp3_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = mp3_path.with_name(f"{mp3_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as out:
+            for clip, path, duration in present:
+                with open(path, "rb") as f:
+                    payload = mp3.frame_data(f.read())
+                out.write(payload)
+                digest.update(payload)
+                entries.append({
+                    "name": clip.name,
+                    "qa_id": clip.qa_id,
+                    "response": clip.response,
+                    "offset": offset,
+                    "length": len(payload),
+                    "duration": round(duration, 3),
+                })
+                offset += len(payload)
+        os.replace(tmp_path, mp3_path)
+        md5 = digest.hexdigest()
+        write_json(index_path, {
+            "version": INDEX_VERSION,
+            "id": bundle_id,
+            "by": self.by,
+            "size": offset,
+            "md5": md5,
+            "clips": entries,
+            "missing": missing,
+        })
+
+        self.state[key] = {"clips": fingerprint, "md5": md5}
+        self.stats["built"] += 1
+        self.stats["clips"] += len(entries)
+        self.stats["bytes"] += offset
+        return "built"
+
+    def remove(self, bundle_id: str) -> bool:
+        """删除包、索引和状态记录，返回原来是否存在"""
+        existed = False
+        for path in self.paths(bundle_id):
+            if path.exists():
+                path.unlink()
+                existed = True
+        self.state.pop(f"{self.by}/{bundle_id}", None)
+        return existed
+
+    def prune(self, keep: Iterable[str]) -> int:
+        """删除不在 keep 中的包（对应的子场景/场景已不存在），返回删除的包数"""
+        keep = set(keep)
+        removed = 0
+        if not self.bundle_dir.is_dir():
+            return 0
+        with os.scandir(self.bundle_dir) as it:
+            stale = {entry.name.rsplit(".", 1)[0] for entry in it if entry.name.endswith((".mp3", ".json"))}
+        for bundle_id in sorted(stale - keep):
+            removed += self.remove(bundle_id)
+        self.stats["removed"] += removed
+        return removed
+
+    def _load(self) -> None:
+        data = read_json(self.state_path)
+        if data and data.get("version") == STATE_VERSION:
+            self.state = data.get("bundles", {})
+        self._saved = snapshot({"bundles": self.state})
+
+    def save(self) -> None:
+        """写回状态文件（与其他进程写入的条目合并）"""
+        merged = save_merged(self.state_path, {"bundles": self.state}, self._saved, header={"version": STATE_VERSION})
+        self.state = merged["bundles"]
+        self._saved = snapshot({"bundles": self.state})
+
+
+# ============================================================
+# 上传
+# ============================================================
+
+def upload_bundle_files(
+    uploader,
+    manifest: Optional[UploadManifest],
+    files: Sequence[Path],
+    key_for: Callable[[Path], str],
+) -> Tuple[int, int, int]:
+    """
+    按顺序上传一个包的各文件（包在前、索引在后：索引出现时包一定已是新内容），
+    某个文件失败时不再上传后面的，远端保持旧的一致状态
+    返回 (上传数, 未变化数, 失败数)
+    """
+    from .cos_uploader import UploadError
+
+    uploaded = unchanged = 0
+    for local_path in files:
+        key = key_for(local_path)
+        if manifest and manifest.is_unchanged(local_path, key):
+            unchanged += 1
+            continue
+        try:
+            with metrics.stage("upload", file=local_path.name):
+                result = uploader.upload(local_path, key, CONTENT_TYPES.get(local_path.suffix, "application/octet-stream"))
+        except (UploadError, OSError) as e:
+            print(f"  ❌ 上传失败 {local_path.name}: {e}")
+            return uploaded, unchanged, 1
+        if manifest:
+            manifest.record(local_path, key, result.etag, result.md5)
+        uploaded += 1
+    return uploaded, unchanged, 0
+
+
+def upload_bundles(
+    uploader,
+    manifest: Optional[UploadManifest],
+    groups: Sequence[Sequence[Path]],
+    key_for: Callable[[Path], str],
+    workers: int = 8,
+) -> Tuple[int, int, int]:
+    """并发上传多个包（每个包内按顺序），返回 (上传文件数, 未变化文件数, 失败的包数)"""
+    totals = (0, 0, 0)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload") as executor:
+        for result in executor.map(lambda files: upload_bundle_files(uploader, manifest, files, key_for), groups):
+            totals = tuple(a + b for a, b in zip(totals, result))
+    return totals
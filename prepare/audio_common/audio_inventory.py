@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+本地音频清单：对音频目录下的各子目录各做一次 os.scandir，取得全部音频文件
+
+- 生成/上传脚本逐个判断音频时不再对每个路径 exists() + stat()：
+  不在清单中的文件直接视为不存在（没有系统调用），在清单中的用扫描得到的目录项取 stat
+- 每个路径只有第一次查询使用扫描结果，之后的查询重新 stat（期间文件可能已被重新生成）
+- gc_audio.py 用它与问答对数据源、桶中的对象批量比对，找出孤立的音频
+
+清单中的文件以“子目录/文件名”标识（如 questions/xxx.mp3），与任务日志的 clip_key
+以及 COS Key 去掉前缀后的部分一致。
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence, Set, Tuple
+
+
+class AudioInventory:
+    """音频目录下各子目录（不递归）中的音频文件，键为绝对路径（与校验索引一致）"""
+
+    def __init__(self, root: Path, subdirs: Sequence[str], suffix: str = ".mp3"):
+        self.root = os.path.abspath(root)
+        self.subdirs = tuple(subdirs)
+        self.suffix = suffix
+        self.entries: Dict[str, os.DirEntry] = {}
+        self._dirs: Set[str] = set()
+        self._claimed: Set[str] = set()
+        self._lock = threading.Lock()
+        self.scan()
+
+    def scan(self) -> None:
+        """重新扫描（不存在的子目录视为空目录）"""
+        entries: Dict[str, os.DirEntry] = {}
+        dirs: Set[str] = set()
+        for subdir in self.subdirs:
+            directory = os.path.join(self.root, subdir)
+            dirs.add(directory)
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.name.endswith(self.suffix) and entry.is_file():
+                            entries[entry.path] = entry
+            except FileNotFoundError:
+                continue
+        with self._lock:
+            self.entries = entries
+            self._dirs = dirs
+            self._claimed = set()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, path) -> bool:
+        return os.path.abspath(path) in self.entries
+
+    def name(self, path) -> str:
+        """绝对路径 -> 子目录/文件名"""
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def files(self) -> Iterator[Tuple[str, os.DirEntry]]:
+        """按名称顺序产出 (子目录/文件名, 目录项)"""
+        for path in sorted(self.entries):
+            yield self.name(path), self.entries[path]
+
+    def stat(self, path) -> Optional[os.stat_result]:
+        """
+        文件的 stat，不存在时返回 None
+        扫描过的目录中的路径第一次查询时使用扫描结果，之后（或不在扫描范围内的路径）直接 os.stat
+        """
+        key = os.path.abspath(path)
+        with self._lock:
+            first = key not in self._claimed and os.path.dirname(key) in self._dirs
+            if first:
+                self._claimed.add(key)
+        entry = self.entries.get(key) if first else None
+        if first and entry is None:
+            return None
+        try:
+            return entry.stat() if entry is not None else os.stat(key)
+        except FileNotFoundError:
+            return None
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+音频校验：直接解析 MP3 帧头判断文件是否完整可用，取代“文件大于 1KB 即视为成功”
+
+结构校验（不解码，只读帧头，见 audio_common.mp3）:
+- 至少有一帧，帧与帧首尾相接，中间没有无法识别的字节
+- 末尾没有被截断的半帧（允许 128 字节的 ID3v1 标签）
+- 各帧的 MPEG 版本、层、采样率一致
+- 总时长不短于 MIN_DURATION，平均码率不低于 MIN_BITRATE
+
+信号校验（可选，需要 numpy 和 ffmpeg，解码后检查）:
+- 几乎无声：整体 RMS 低于 SILENCE_DBFS
+- 削波：接近满幅的采样占比超过 CLIP_RATIO
+信号问题只做报告，不会让生成脚本重新合成（重新合成通常得到同样的结果）。
+
+AudioValidator 把结果连同文件的 (大小, mtime, inode) 记录在索引文件中，
+文件未变时直接复用结果；validate_dirs() 用 scandir 一次取得目录下所有文件的 stat，
+只把新增或变化的文件放进进程池并行校验。设置 inventory（AudioInventory）后，
+check() 第一次查询各路径时使用清单的扫描结果，清单中没有的文件不再逐个 stat。多个进程共用同一索引时，保存只合并本进程新校验的条目。
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import mp3
+from .audio_inventory import AudioInventory
+from .json_index import read_json, save_merged, snapshot
+
+MIN_DURATION = 0.2          # 秒，短于此视为合成失败
+MIN_BITRATE = 16            # kbps，平均码率下限
+ID3V1_SIZE = 128
+SILENCE_DBFS = -50.0        # 整体 RMS 低于此值视为几乎无声
+CLIP_LEVEL = 0.95           # 接近满幅的采样视为削波（有损编码会把削平的波形抹出起伏，不能要求恰好满幅）
+CLIP_RATIO = 0.001          # 削波采样占比上限
+SIGNAL_SAMPLE_RATE = 16000
+
+INDEX_VERSION = 1
+MISSING = "文件不存在"            # 文件不存在时 ValidationResult.reason 的取值
+
+
+@dataclass
+class ValidationResult:
+    ok: bool                            # 结构校验是否通过
+    reason: str = ""                    # 未通过的原因
+    duration: float = 0.0               # 秒
+    bitrate: int = 0                    # 平均码率 kbps
+    signal_issue: Optional[str] = None  # 信号问题，None 表示未做信号校验，"" 表示无问题
+
+
+def validate_bytes(data: bytes) -> ValidationResult:
+    """对 MP3 数据做结构校验"""
+    start = mp3.id3v2_size(data)
+    expected = start
+    first: Optional[mp3.FrameHeader] = None
+    count = 0
+    duration = 0.0
+    frame_bytes = 0
+    for frame in mp3.iter_frames(data):
+        header = frame.header
+        if frame.offset != expected:
+            return ValidationResult(False, f"帧不连续（偏移 {expected} 处有 {frame.offset - expected} 字节无法识别）")
+        if first is None:
+            first = header
+        elif (header.version, header.layer, header.sample_rate) != (first.version, first.layer, first.sample_rate):
+            return ValidationResult(False, f"帧格式不一致（偏移 {frame.offset}）")
+        count += 1
+        duration += header.duration
+        frame_bytes += header.length
+        expected = frame.end
+
+    if first is None:
+        return ValidationResult(False, "没有可识别的 MP3 帧")
+    tail = len(data) - expected
+    if tail and not (tail == ID3V1_SIZE and data[expected:expected + 3] == b"TAG"):
+        return ValidationResult(False, f"末尾有 {tail} 字节无法识别（可能被截断）")
+    bitrate = round(frame_bytes * 8 / duration / 1000)
+    if duration < MIN_DURATION:
+        return ValidationResult(False, f"时长过短（{duration:.2f}s，{count} 帧）", duration, bitrate)
+    if bitrate < MIN_BITRATE:
+        return ValidationResult(False, f"码率过低（{bitrate}kbps）", duration, bitrate)
+    return ValidationResult(True, "", duration, bitrate)
+
+
+def check_signal(path: Path) -> str:
+    """解码后检查几乎无声和削波，返回问题描述（无问题为空字符串）"""
+    import numpy as np
+    from .postprocess import decode
+
+    samples = decode(Path(path), SIGNAL_SAMPLE_RATE)
+    if samples.size == 0:
+        return "解码结果为空"
+    rms = float(np.sqrt(np.mean(np.square(samples, dtype=np.float64))))
+    if rms == 0:
+        return "完全无声"
+    level = 20 * np.log10(rms)
+    if level < SILENCE_DBFS:
+        return f"几乎无声（RMS {level:.1f} dBFS）"
+    clipped = float(np.mean(np.abs(samples) >= CLIP_LEVEL))
+    if clipped > CLIP_RATIO:
+        return f"削波（{clipped:.2%} 的采样接近满幅）"
+    return ""
+
+
+def validate_file(path: str, signal: bool = False) -> Dict:
+    """校验单个文件（可在子进程中运行），返回 ValidationResult 的字典形式"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        return asdict(ValidationResult(False, f"无法读取: {e}"))
+    result = validate_bytes(data)
+    if signal and result.ok:
+        try:
+            result.signal_issue = check_signal(Path(path))
+        except Exception as e:
+            result.signal_issue = f"解码失败: {e}"
+    return asdict(result)
+
+
+def _fingerprint(st: os.stat_result) -> List[int]:
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+# ============================================================
+# 带索引的校验器
+# ============================================================
+
+class AudioValidator:
+    """线程安全的音频校验器，结果按文件指纹缓存在索引文件中"""
+
+    def __init__(self, index_path: Optional[Path] = None, signal: bool = False, workers: Optional[int] = None):
+        self.index_path = Path(index_path) if index_path else None
+        self.signal = signal
+        self.workers = workers or os.cpu_count() or 1
+        # 文件绝对路径 -> {"fingerprint": [大小, mtime_ns, inode], "result": ValidationResult 字典}
+        self.entries: Dict[str, Dict] = {}
+        self._saved: Dict[str, Dict] = {"files": {}}
+        self.stats = {"validated": 0, "reused": 0, "invalid": 0}
+        # 本地音频清单（可选）：check() 第一次查询各路径时用它代替 os.stat
+        self.inventory: Optional[AudioInventory] = None
+        self._dirty = False
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _reusable(self, entry: Optional[Dict], fingerprint: List[int]) -> Optional[ValidationResult]:
+        if not entry or entry.get("fingerprint") != fingerprint:
+            return None
+        result = ValidationResult(**entry["result"])
+        if self.signal and result.ok and result.signal_issue is None:
+            return None
+        return result
+
+    def _record(self, key: str, fingerprint: List[int], result: Dict) -> ValidationResult:
+        with self._lock:
+            self.entries[key] = {"fingerprint": fingerprint, "result": result}
+            self._dirty = True
+            self.stats["validated"] += 1
+        return ValidationResult(**result)
+
+    def check(self, path: Path, st: Optional[os.stat_result] = None) -> ValidationResult:
+        """校验单个文件，文件未变时复用上次的结果；st 为调用方已取得的 stat（省去一次系统调用）"""
+        self._load()
+        key = os.path.abspath(path)
+        st = st if st is not None else self._stat(key)
+        if st is None:
+            return ValidationResult(False, MISSING)
+        fingerprint = _fingerprint(st)
+        with self._lock:
+            entry = self.entries.get(key)
+        result = self._reusable(entry, fingerprint)
+        if result is not None:
+            with self._lock:
+                self.stats["reused"] += 1
+            return result
+        return self._record(key, fingerprint, validate_file(key, self.signal))
+
+    def cached(self, path: Path, st: os.stat_result) -> Optional[ValidationResult]:
+        """只查索引：文件与上次校验时一致时返回结果，否则返回 None（不解析文件，供规划时快速判断）"""
+        self._load()
+        with self._lock:
+            entry = self.entries.get(os.path.abspath(path))
+        return self._reusable(entry, _fingerprint(st))
+
+    def _stat(self, key: str) -> Optional[os.stat_result]:
+        if self.inventory is not None:
+            return self.inventory.stat(key)
+        try:
+            return os.stat(key)
+        except FileNotFoundError:
+            return None
+
+    def is_valid(self, path: Path) -> bool:
+        """文件存在且通过校验（开启信号校验时也要求没有信号问题）"""
+        result = self.check(path)
+        return result.ok and not (self.signal and result.signal_issue)
+
+    def validate_dirs(self, directories: Iterable[Path], suffix: str = ".mp3") -> Dict[str, ValidationResult]:
+        """并行校验目录下（不递归）的全部音频，返回 绝对路径 -> 结果"""
+        items: List[Tuple[str, List[int]]] = []
+        for directory in directories:
+            if not Path(directory).is_dir():
+                continue
+            with os.scandir(os.path.abspath(directory)) as it:
+                for entry in it:
+                    if entry.name.endswith(suffix) and entry.is_file():
+                        items.append((entry.path, _fingerprint(entry.stat())))
+        return self._validate_many(items)
+
+    def validate_inventory(self, inventory: AudioInventory) -> Dict[str, ValidationResult]:
+        """并行校验清单中的全部音频（与 validate_dirs 相同，但复用清单的扫描结果，不再扫描目录）"""
+        items = [(path, _fingerprint(entry.stat())) for path, entry in inventory.entries.items()]
+        return self._validate_many(items)
+
+    def validate_paths(self, paths: Iterable[Path]) -> Dict[str, ValidationResult]:
+        """并行校验给定的文件，不存在的文件计为未通过"""
+        items: List[Tuple[str, List[int]]] = []
+        results: Dict[str, ValidationResult] = {}
+        for path in paths:
+            key = os.path.abspath(path)
+            try:
+                items.append((key, _fingerprint(os.stat(key))))
+            except FileNotFoundError:
+                results[key] = ValidationResult(False, MISSING)
+        results.update(self._validate_many(items))
+        return results
+
+    def _validate_many(self, items: List[Tuple[str, List[int]]]) -> Dict[str, ValidationResult]:
+        self._load()
+        results: Dict[str, ValidationResult] = {}
+        todo: List[Tuple[str, List[int]]] = []
+        for key, fingerprint in items:
+            result = self._reusable(self.entries.get(key), fingerprint)
+            if result is None:
+                todo.append((key, fingerprint))
+            else:
+                results[key] = result
+                self.stats["reused"] += 1
+
+        if todo:
+            keys = [key for key, _ in todo]
+            if len(todo) < 64 or self.workers == 1:
+                outputs = map(validate_file, keys, [self.signal] * len(keys))
+                for (key, fingerprint), output in zip(todo, outputs):
+                    results[key] = self._record(key, fingerprint, output)
+            else:
+                chunksize = max(1, len(todo) // (self.workers * 8))
+                with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                    outputs = pool.map(validate_file, keys, [self.signal] * len(keys), chunksize=chunksize)
+                    for done, ((key, fingerprint), output) in enumerate(zip(todo, outputs), 1):
+                        results[key] = self._record(key, fingerprint, output)
+                        if done % 1000 == 0:
+                            print(f"  🔍 校验进度: {done}/{len(todo)}")
+
+        self.stats["invalid"] += sum(1 for r in results.values() if not r.ok or (self.signal and r.signal_issue))
+        return results
+
+    def forget(self, paths: Iterable[Path]) -> None:
+        """移除已删除文件的条目（保存时同步从索引文件中删除）"""
+        self._load()
+        with self._lock:
+            for path in paths:
+                if self.entries.pop(os.path.abspath(path), None) is not None:
+                    self._dirty = True
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not self.index_path:
+                return
+            data = read_json(self.index_path)
+            if data and data.get("version") == INDEX_VERSION:
+                self.entries = data.get("files", {})
+                self._saved = snapshot({"files": self.entries})
+
+    def save(self) -> None:
+        """把结果合并写回索引文件（原子替换，保留其他进程写入的条目）"""
+        if not self.index_path or not self._dirty:
+            return
+        with self._lock:
+            merged = save_merged(self.index_path, {"files": self.entries}, self._saved,
+                                 header={"version": INDEX_VERSION})
+            self.entries = merged["files"]
+            self._saved = snapshot({"files": self.entries})
+            self._dirty = False
+
+
+_shared: Dict[str, AudioValidator] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_validator(index_path: Path) -> AudioValidator:
+    """同一进程内同一索引文件只对应一个校验器（生成脚本与上传脚本在流水线中共用）"""
+    key = os.path.abspath(index_path)
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = AudioValidator(Path(key))
+        return _shared[key]
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+腾讯云COS上传组件
+
+- 连接池大小与上传并发数一致，避免线程间争抢连接
+- 网络错误 / 5xx / 429 时按带抖动的指数退避重试（full jitter）
+- 上传时带 Content-MD5 由服务端校验，并比对返回的 ETag 与本地 MD5
+- 超过阈值的文件自动分片上传，每个分片独立校验和重试，失败时中止分片任务
+- list_objects / delete_objects: 按前缀分页列出对象、每批最多 1000 个批量删除（同样带重试），供清理脚本使用
+- AsyncCosUploader: 基于 aiohttp 的异步上传（预签名 PUT URL，文件体流式发送），
+  单线程即可保持数百个上传同时进行
+
+可通过环境变量指向本地 S3 兼容服务（如 MinIO，需开启 virtual-host 风格访问）做联调：
+  COS_ENDPOINT=127.0.0.1:9000 COS_SCHEME=http
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import random
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from qcloud_cos import CosConfig, CosS3Client
+from qcloud_cos.cos_exception import CosClientError, CosServiceError
+
+from .metrics import metrics
+from .upload_manifest import file_md5
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 0.5                  # 退避基数（秒）
+DEFAULT_MAX_DELAY = 20.0                  # 单次退避上限（秒）
+DEFAULT_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+DEFAULT_PART_SIZE = 4 * 1024 * 1024       # COS 要求除最后一片外每片至少 1MB
+LIST_PAGE_SIZE = 1000
+DELETE_BATCH_SIZE = 1000                  # delete_objects 单次请求的上限
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class UploadError(Exception):
+    """重试耗尽或不可重试的上传失败"""
+
+
+class ChecksumMismatch(Exception):
+    """服务端返回的 ETag 与本地 MD5 不一致"""
+
+
+class HttpStatusError(Exception):
+    """预签名 URL 上传返回非 2xx 状态码"""
+
+    def __init__(self, status: int, body: str = ""):
+        super().__init__(f"HTTP {status}: {body[:200]}")
+        self.status = status
+
+
+@dataclass
+class UploadResult:
+    etag: str
+    md5: str
+    size: int
+    attempts: int
+    multipart: bool = False
+
+
+def _normalize_etag(etag: Optional[str]) -> str:
+    return (etag or "").strip('"').lower()
+
+
+def is_retryable(error: Exception) -> bool:
+    """网络类错误、服务端错误和限流可重试，其余 4xx 不重试"""
+    if isinstance(error, CosServiceError):
+        return error.get_status_code() in RETRYABLE_STATUS
+    if isinstance(error, HttpStatusError):
+        return error.status in RETRYABLE_STATUS
+    return isinstance(error, (CosClientError, OSError, ChecksumMismatch, asyncio.TimeoutError))
+
+
+class CosUploader:
+    """带连接池、重试、校验和分片上传的 COS 上传器（线程安全）"""
+
+    def __init__(
+        self,
+        client: CosS3Client,
+        bucket: str,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        multipart_threshold: int = DEFAULT_MULTIPART_THRESHOLD,
+        part_size: int = DEFAULT_PART_SIZE,
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+
+    @classmethod
+    def from_env(cls, bucket: str, workers: int, **kwargs) -> "CosUploader":
+        """按环境变量创建客户端，连接池大小 = 上传并发数"""
+        config_kwargs = dict(
+            Region=os.getenv("COS_REGION", "ap-guangzhou"),
+            SecretId=os.getenv("COS_SECRET_ID", ""),
+            SecretKey=os.getenv("COS_SECRET_KEY", ""),
+            Scheme=os.getenv("COS_SCHEME", "https"),
+            Timeout=int(os.getenv("COS_TIMEOUT", "30")),
+            PoolConnections=workers,
+            PoolMaxSize=workers,
+        )
+        if os.getenv("COS_ENDPOINT"):
+            config_kwargs["Endpoint"] = os.getenv("COS_ENDPOINT")
+        # SDK 自身不再重试，统一由 CosUploader 做退避重试
+        client = CosS3Client(CosConfig(**config_kwargs), retry=0)
+        return cls(client, bucket, **kwargs)
+
+    # --------------------------------------------------------
+    # 重试
+    # --------------------------------------------------------
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _with_retry(self, description: str, func):
+        """执行 func()，可重试错误按退避重试，返回 (结果, 尝试次数)"""
+        attempt = 0
+        while True:
+            try:
+                return func(), attempt + 1
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise UploadError(f"{description}: {e}") from e
+                delay = self._backoff(attempt)
+                print(f"  ⚠️ {description} 重试 {attempt + 1}/{self.max_retries}，等待{delay:.1f}s: {e}")
+                metrics.inc("upload_retries")
+                time.sleep(delay)
+                attempt += 1
+
+    # --------------------------------------------------------
+    # 上传
+    # --------------------------------------------------------
+
+    def upload(self, local_path: Path, key: str, content_type: str = "audio/mpeg") -> UploadResult:
+        """上传文件，失败抛出 UploadError"""
+        size = local_path.stat().st_size
+        if size > self.multipart_threshold:
+            return self._upload_multipart(local_path, key, size, content_type)
+
+        with open(local_path, "rb") as fp:
+            body = fp.read()
+        md5 = hashlib.md5(body).hexdigest()
+
+        def put() -> str:
+            response = self.client.put_object(
+                Bucket=self.bucket,
+                Body=body,
+                Key=key,
+                ContentType=content_type,
+                EnableMD5=True,
+            )
+            etag = _normalize_etag((response or {}).get("ETag"))
+            if etag and etag != md5:
+                raise ChecksumMismatch(f"ETag {etag} != MD5 {md5}")
+            return etag or md5
+
+        etag, attempts = self._with_retry(local_path.name, put)
+        return UploadResult(etag=etag, md5=md5, size=size, attempts=attempts)
+
+    def _upload_multipart(self, local_path: Path, key: str, size: int, content_type: str) -> UploadResult:
+        response, attempts = self._with_retry(
+            f"{local_path.name} 初始化分片",
+            lambda: self.client.create_multipart_upload(Bucket=self.bucket, Key=key, ContentType=content_type),
+        )
+        upload_id = response["UploadId"]
+        parts: List[Dict] = []
+        whole_md5 = hashlib.md5()
+
+        try:
+            with open(local_path, "rb") as fp:
+                part_number = 1
+                while True:
+                    chunk = fp.read(self.part_size)
+                    if not chunk:
+                        break
+                    whole_md5.update(chunk)
+                    part_md5 = hashlib.md5(chunk).hexdigest()
+
+                    def put_part(chunk=chunk, part_number=part_number, part_md5=part_md5) -> str:
+                        result = self.client.upload_part(
+                            Bucket=self.bucket,
+                            Key=key,
+                            Body=chunk,
+                            PartNumber=part_number,
+                            UploadId=upload_id,
+                            EnableMD5=True,
+                        )
+                        etag = _normalize_etag(result.get("ETag"))
+                        if etag and etag != part_md5:
+                            raise ChecksumMismatch(f"分片 {part_number} ETag {etag} != MD5 {part_md5}")
+                        return etag or part_md5
+
+                    etag, part_attempts = self._with_retry(f"{local_path.name} 分片 {part_number}", put_part)
+                    attempts += part_attempts
+                    parts.append({"PartNumber": part_number, "ETag": f'"{etag}"'})
+                    part_number += 1
+
+            response, complete_attempts = self._with_retry(
+                f"{local_path.name} 完成分片",
+                lambda: self.client.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    MultipartUpload={"Part": parts},
+                ),
+            )
+            attempts += complete_attempts
+        except Exception:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            except Exception as e:
+                print(f"  ⚠️ 中止分片上传失败 {local_path.name}: {e}")
+            raise
+
+        return UploadResult(
+            etag=_normalize_etag(response.get("ETag")),
+            md5=whole_md5.hexdigest(),
+            size=size,
+            attempts=attempts,
+            multipart=True,
+        )
+
+    # --------------------------------------------------------
+    # 列出与删除
+    # --------------------------------------------------------
+
+    def list_objects(self, prefix: str) -> Iterator[Dict]:
+        """分页列出前缀下的全部对象（Key / Size / ETag / LastModified）"""
+        marker = ""
+        while True:
+            response, _ = self._with_retry(
+                f"列出 {prefix}",
+                lambda: self.client.list_objects(Bucket=self.bucket, Prefix=prefix, Marker=marker,
+                                                 MaxKeys=LIST_PAGE_SIZE),
+            )
+            contents = response.get("Contents", [])
+            yield from contents
+            if response.get("IsTruncated") != "true" or not contents:
+                return
+            marker = response.get("NextMarker") or contents[-1]["Key"]
+
+    def delete_objects(self, keys: Iterable[str], batch_size: int = DELETE_BATCH_SIZE) -> List[Tuple[str, str]]:
+        """批量删除对象（每批一个 delete_objects 请求），返回删除失败的 (Key, 原因)"""
+        keys = list(keys)
+        failures: List[Tuple[str, str]] = []
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            delete = {"Object": [{"Key": key} for key in batch], "Quiet": "true"}
+            try:
+                response, _ = self._with_retry(
+                    f"删除 {len(batch)} 个对象",
+                    lambda: self.client.delete_objects(Bucket=self.bucket, Delete=delete),
+                )
+            except UploadError as e:
+                failures.extend((key, str(e)) for key in batch)
+                continue
+            errors = (response or {}).get("Error") or []
+            if isinstance(errors, dict):
+                errors = [errors]
+            failures.extend((error.get("Key", ""), f"{error.get('Code')}: {error.get('Message')}") for error in errors)
+        return failures
+
+
+class AsyncCosUploader:
+    """
+    异步上传器：复用 CosUploader 的配置与重试策略，在事件循环中通过预签名 PUT URL 上传
+
+    - 签名在本地计算，不产生额外请求
+    - 文件对象直接交给 aiohttp 分块发送，不整体读入内存
+    - 超过分片阈值的文件交给线程池中的同步分片上传
+    用法:
+        async with AsyncCosUploader(uploader, concurrency=200) as au:
+            result = await au.upload(path, key)
+    """
+
+    def __init__(self, uploader: CosUploader, concurrency: int, url_expires: int = 3600):
+        self.uploader = uploader
+        self.concurrency = concurrency
+        self.url_expires = url_expires
+        self._session = None
+
+    async def __aenter__(self) -> "AsyncCosUploader":
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self._session.close()
+        self._session = None
+
+    def _is_retryable(self, error: Exception) -> bool:
+        import aiohttp
+
+        return isinstance(error, aiohttp.ClientError) or is_retryable(error)
+
+    async def _put(self, url: str, local_path: Path, size: int, md5: str, content_type: str) -> str:
+        headers = {
+            "Content-Type": content_type,
+            "Content-Length": str(size),
+            "Content-MD5": base64.b64encode(bytes.fromhex(md5)).decode(),
+        }
+        with open(local_path, "rb") as fp:
+            async with self._session.put(url, data=fp, headers=headers) as response:
+                if response.status >= 300:
+                    raise HttpStatusError(response.status, await response.text())
+                etag = _normalize_etag(response.headers.get("ETag"))
+        if etag and etag != md5:
+            raise ChecksumMismatch(f"ETag {etag} != MD5 {md5}")
+        return etag or md5
+
+    async def upload(self, local_path: Path, key: str, content_type: str = "audio/mpeg") -> UploadResult:
+        """上传文件，失败抛出 UploadError"""
+        size = local_path.stat().st_size
+        if size > self.uploader.multipart_threshold:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.uploader.upload, local_path, key, content_type)
+
+        md5 = file_md5(local_path)
+        url = self.uploader.client.get_presigned_url(
+            Bucket=self.uploader.bucket,
+            Key=key,
+            Method="PUT",
+            Expired=self.url_expires,
+        )
+        attempt = 0
+        while True:
+            try:
+                etag = await self._put(url, local_path, size, md5, content_type)
+                return UploadResult(etag=etag, md5=md5, size=size, attempts=attempt + 1)
+            except Exception as e:
+                if attempt >= self.uploader.max_retries or not self._is_retryable(e):
+                    raise UploadError(f"{local_path.name}: {e}") from e
+                delay = self.uploader._backoff(attempt)
+                print(f"  ⚠️ {local_path.name} 重试 {attempt + 1}/{self.uploader.max_retries}，等待{delay:.1f}s: {e}")
+                metrics.inc("upload_retries")
+                await asyncio.sleep(delay)
+                attempt += 1
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+整段对话音轨：把一个子场景的问答对按顺序（问题 + 选定的一个答案）拼成一条连续的 MP3，
+客户端“听完整对话”时只需请求一个对象
+
+- 在 MP3 帧级别首尾相接，不重新编码；轮次之间插入与片段同格式的静音帧（mp3.silent_frame）
+- 每个片段去掉开头依赖比特储备的帧（frame_data(standalone=True)），接在静音帧之后也能正确解码
+- 格式（版本 / 层 / 采样率 / 声道）与第一个片段不同的片段无法直接拼接，跳过并记入 missing
+
+每条音轨三个文件（本地 audio/dialogues/，COS qa/dialogues/）:
+- {sub_scene_id}.mp3
+- {sub_scene_id}.json  各轮次的时间点与字节范围:
+    {"version": 1, "id": "daily_001_sub_1", "duration": 42.1, "size": 252000, "md5": "...",
+     "gap": 0.5, "pair_gap": 1.0,
+     "turns": [{"qa_id": "daily_001_sub_1_qa_1", "role": "question", "response": null,
+                "name": "questions/daily_001_sub_1_qa_1.mp3", "text": "...", "text_cn": "...",
+                "start": 0.0, "duration": 1.68, "offset": 0, "length": 10080}, ...],
+     "missing": ["responses/daily_001_sub_1_qa_3_response0.mp3"]}
+- {sub_scene_id}.vtt   WebVTT 章节（每轮一条 cue），可直接交给播放器显示字幕/章节
+
+增量重建: 状态文件记录每条音轨由哪些文件（名称、大小、mtime）、文本（章节内容）和停顿参数组成，
+未变化的音轨直接跳过；需要重建的音轨交给进程池并行拼接。
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import mp3
+from .audio_inventory import AudioInventory
+from .audio_validator import AudioValidator
+from .json_index import read_json, save_merged, snapshot, write_json
+
+TRACK_VERSION = 1
+STATE_VERSION = 1
+
+DEFAULT_GAP = 0.5           # 同一问答对内问题与答案之间的停顿（秒）
+DEFAULT_PAIR_GAP = 1.0      # 问答对之间的停顿（秒）
+
+
+@dataclass
+class DialogueTurn:
+    qa_id: str
+    role: str                   # "question" | "response"
+    response: Optional[int]     # 答案序号，问题为 None
+    name: str                   # 子目录/文件名
+    text: str
+    text_cn: str
+
+
+def choose_response(qa: Dict[str, Any], preferred: int = 0) -> Optional[int]:
+    """选用的答案序号：优先 preferred，该答案没有文本时取第一个有文本的答案"""
+    responses = qa["responses"] or []
+    if 0 <= preferred < len(responses) and responses[preferred].get("text", ""):
+        return preferred
+    for idx, response in enumerate(responses):
+        if response.get("text", ""):
+            return idx
+    return None
+
+
+def plan_dialogues(rows: Iterable[Dict[str, Any]], preferred: int = 0) -> Dict[str, List[DialogueTurn]]:
+    """按子场景分组，轮次顺序与数据源一致（order；每个问答对问题在前、答案在后）"""
+    dialogues: Dict[str, List[DialogueTurn]] = {}
+    for qa in rows:
+        turns = dialogues.setdefault(qa["sub_scene_id"], [])
+        qa_id = qa["id"]
+        turns.append(DialogueTurn(qa_id, "question", None, f"questions/{qa_id}.mp3",
+                                  qa["speaker_text"] or "", qa.get("speaker_text_cn") or ""))
+        idx = choose_response(qa, preferred)
+        if idx is not None:
+            response = qa["responses"][idx]
+            turns.append(DialogueTurn(qa_id, "response", idx, f"responses/{qa_id}_response{idx}.mp3",
+                                      response.get("text", ""), response.get("text_cn", "")))
+    return dialogues
+
+
+# ============================================================
+# 拼接（在子进程中执行）
+# ============================================================
+
+def _timestamp(seconds: float) -> str:
+    ms = round(seconds * 1000)
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+
+def to_vtt(turns: List[Dict[str, Any]]) -> str:
+    """WebVTT 章节：每轮一条 cue，正文为英文 + 中文"""
+    lines = ["WEBVTT", ""]
+    for turn in turns:
+        cue_id = f"{turn['qa_id']}-{turn['role']}"
+        lines.append(cue_id)
+        lines.append(f"{_timestamp(turn['start'])} --> {_timestamp(turn['start'] + turn['duration'])}")
+        lines.extend(line for line in (turn["text"], turn["text_cn"]) if line)
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def render_track(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    拼接一条音轨并写出 .mp3 / .json / .vtt
+    job: {"id", "paths": (mp3, json, vtt), "turns": [(DialogueTurn 字典, 音频路径), ...],
+          "gap", "pair_gap", "missing": [...]}
+    返回 {"id", "md5", "size", "duration", "turns", "missing"}；没有可用片段时 md5 为 None，不写文件
+    """
+    missing = list(job["missing"])
+    parts: List[Tuple[Dict[str, Any], bytes, float]] = []
+    layout: Optional[Tuple] = None
+    silence = b""
+    frame_seconds = 0.0
+    for turn, path in job["turns"]:
+        with open(path, "rb") as f:
+            payload = mp3.frame_data(f.read(), standalone=True)
+        frame_list = mp3.frames(payload)
+        if not frame_list:
+            missing.append(turn["name"])
+            continue
+        header = frame_list[0].header
+        fmt = (header.version, header.layer, header.sample_rate, header.channels)
+        if layout is None:
+            layout = fmt
+            silence = mp3.silent_frame(payload[:4])
+            frame_seconds = header.duration
+        elif fmt != layout:
+            # 不同格式的帧不能直接相接（需要重新编码），这一轮留给客户端回退到单条音频
+            missing.append(turn["name"])
+            continue
+        parts.append((turn, payload, sum(frame.header.duration for frame in frame_list)))
+
+    if not parts:
+        return {"id": job["id"], "md5": None, "size": 0, "duration": 0.0, "turns": [], "missing": missing}
+
+    entries: List[Dict[str, Any]] = []
+    chunks: List[bytes] = []
+    offset = 0
+    elapsed = 0.0
+    previous_qa: Optional[str] = None
+    for turn, payload, seconds in parts:
+        if previous_qa is not None:
+            # 停顿按整帧取整（edge-tts 输出每帧 24ms）
+            count = round((job["gap"] if turn["qa_id"] == previous_qa else job["pair_gap"]) / frame_seconds)
+            chunks.append(silence * count)
+            offset += len(silence) * count
+            elapsed += frame_seconds * count
+        entries.append({
+            **turn,
+            "start": round(elapsed, 3),
+            "duration": round(seconds, 3),
+            "offset": offset,
+            "length": len(payload),
+        })
+        chunks.append(payload)
+        offset += len(payload)
+        elapsed += seconds
+        previous_qa = turn["qa_id"]
+
+    data = b"".join(chunks)
+    md5 = hashlib.md5(data).hexdigest()
+    mp3_path, index_path, vtt_path = (Path(p) for p in job["paths"])
+    mp3_path.parent.mkdir(parents=True, exist_ok=True)
+    _atomic_write(mp3_path, data)
+    _atomic_write(vtt_path, to_vtt(entries).encode("utf-8"))
+    write_json(index_path, {
+        "version": TRACK_VERSION,
+        "id": job["id"],
+        "duration": round(elapsed, 3),
+        "size": len(data),
+        "md5": md5,
+        "gap": job["gap"],
+        "pair_gap": job["pair_gap"],
+        "turns": entries,
+        "missing": missing,
+    })
+    return {"id": job["id"], "md5": md5, "size": len(data), "duration": elapsed, "turns": entries, "missing": missing}
+
+
+# ============================================================
+# 增量调度
+# ============================================================
+
+class DialogueRenderer:
+    """把 audio_dir 下的单条音频拼成 track_dir 下的整段对话音轨，按状态文件增量重建"""
+
+    def __init__(
+        self,
+        audio_dir: Path,
+        track_dir: Path,
+        validator: AudioValidator,
+        inventory: Optional[AudioInventory] = None,
+        gap: float = DEFAULT_GAP,
+        pair_gap: float = DEFAULT_PAIR_GAP,
+        workers: Optional[int] = None,
+    ):
+        self.audio_dir = Path(audio_dir)
+        self.track_dir = Path(track_dir)
+        self.validator = validator
+        self.inventory = inventory
+        self.settings = {"gap": gap, "pair_gap": pair_gap}
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.state_path = self.track_dir / "dialogue_state.json"
+        # 子场景 id -> {"clips": [[名称, 大小, mtime_ns], ...], "texts": 文本摘要, "settings": {...}, "md5": 音轨的 MD5}
+        self.state: Dict[str, Dict] = {}
+        self._saved: Dict[str, Dict] = {"tracks": {}}
+        self.stats = {"built": 0, "unchanged": 0, "empty": 0, "removed": 0,
+                      "turns": 0, "missing": 0, "bytes": 0, "seconds": 0.0}
+        self._load()
+
+    def paths(self, track_id: str) -> Tuple[Path, Path, Path]:
+        """音轨、索引与 WebVTT 章节的本地路径"""
+        return tuple(self.track_dir / f"{track_id}{suffix}" for suffix in (".mp3", ".json", ".vtt"))
+
+    def _stat(self, path: Path) -> Optional[os.stat_result]:
+        if self.inventory is not None:
+            return self.inventory.stat(path)
+        try:
+            return os.stat(path)
+        except FileNotFoundError:
+            return None
+
+    def _job(self, track_id: str, turns: List[DialogueTurn], settings: Dict, force: bool) -> Optional[Dict[str, Any]]:
+        """校验各片段并生成拼接任务；音轨未变化时返回 None"""
+        present: List[Tuple[Dict[str, Any], str]] = []
+        fingerprint: List[List] = []
+        missing: List[str] = []
+        for turn in turns:
+            path = self.audio_dir / turn.name
+            st = self._stat(path)
+            result = self.validator.check(path, st) if st is not None else None
+            if result is None or not result.ok:
+                missing.append(turn.name)
+                continue
+            present.append((asdict(turn), str(path)))
+            fingerprint.append([turn.name, st.st_size, st.st_mtime_ns])
+
+        texts = hashlib.md5(json.dumps([turn for turn, _ in present], ensure_ascii=False).encode("utf-8")).hexdigest()
+        recorded = self.state.get(track_id)
+        if (not force and recorded and recorded["clips"] == fingerprint and recorded.get("texts") == texts
+                and recorded["settings"] == settings and all(path.exists() for path in self.paths(track_id))):
+            self.stats["unchanged"] += 1
+            self.stats["missing"] += len(missing)
+            return None
+        return {"id": track_id, "paths": tuple(str(p) for p in self.paths(track_id)), "turns": present,
+                "missing": missing, "fingerprint": (fingerprint, texts), **settings}
+
+    def render(self, plan: Dict[str, List[DialogueTurn]], force: bool = False) -> List[str]:
+        """按需重建 plan 中的音轨（并行），返回重建过的音轨 id"""
+        settings = dict(self.settings)
+        jobs = []
+        for track_id, turns in plan.items():
+            job = self._job(track_id, turns, settings, force)
+            if job is not None:
+                jobs.append(job)
+        if not jobs:
+            return []
+
+        self.track_dir.mkdir(parents=True, exist_ok=True)
+        fingerprints = {job["id"]: job.pop("fingerprint") for job in jobs}
+        if len(jobs) == 1 or self.workers == 1:
+            return self._collect(map(render_track, jobs), fingerprints, settings)
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs))) as pool:
+            return self._collect(pool.map(render_track, jobs), fingerprints, settings)
+
+    def _collect(self, outputs: Iterable[Dict[str, Any]], fingerprints: Dict[str, Tuple], settings: Dict) -> List[str]:
+        built: List[str] = []
+        for output in outputs:
+            track_id = output["id"]
+            self.stats["missing"] += len(output["missing"])
+            if output["md5"] is None:
+                self.remove(track_id)
+                self.stats["empty"] += 1
+                continue
+            clips, texts = fingerprints[track_id]
+            self.state[track_id] = {"clips": clips, "texts": texts, "settings": settings, "md5": output["md5"]}
+            self.stats["built"] += 1
+            self.stats["turns"] += len(output["turns"])
+            self.stats["bytes"] += output["size"]
+            self.stats["seconds"] += output["duration"]
+            built.append(track_id)
+        return built
+
+    def remove(self, track_id: str) -> bool:
+        """删除音轨、索引、章节和状态记录，返回原来是否存在"""
+        existed = False
+        for path in self.paths(track_id):
+            if path.exists():
+                path.unlink()
+                existed = True
+        self.state.pop(track_id, None)
+        return existed
+
+    def prune(self, keep: Iterable[str]) -> int:
+        """删除不在 keep 中的音轨（对应的子场景已不存在），返回删除的音轨数"""
+        keep = set(keep)
+        removed = 0
+        if not self.track_dir.is_dir():
+            return 0
+        with os.scandir(self.track_dir) as it:
+            stale = {entry.name.rsplit(".", 1)[0] for entry in it
+                     if entry.name.endswith((".mp3", ".json", ".vtt")) and entry.name != self.state_path.name}
+        for track_id in sorted(stale - keep):
+            removed += self.remove(track_id)
+        self.stats["removed"] += removed
+        return removed
+
+    def _load(self) -> None:
+        data = read_json(self.state_path)
+        if data and data.get("version") == STATE_VERSION:
+            self.state = data.get("tracks", {})
+        self._saved = snapshot({"tracks": self.state})
+
+    def save(self) -> None:
+        """写回状态文件（与其他进程写入的条目合并）"""
+        merged = save_merged(self.state_path, {"tracks": self.state}, self._saved, header={"version": STATE_VERSION})
+        self.state = merged["tracks"]
+        self._saved = snapshot({"tracks": self.state})
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+音频任务日志（SQLite）：每个 (音频, 阶段) 一行，记录状态、尝试次数和最近一次错误，
+脚本中途退出后可以只处理未完成的部分
+
+状态:
+  pending  已登记，尚未开始
+  running  正在处理（进程中断后会停留在此状态，续跑时视为未完成）
+  done     已完成（生成: 本地文件已是当前内容；上传: 远端已是当前内容）
+  failed   最近一次尝试失败
+
+各脚本的运行模式:
+  默认              全部重新检查，同时记录日志
+  --resume          只处理未完成的（pending / running / failed，以及日志中还没有的）
+  --retry-failed    只处理上次失败的
+
+生成和上传共用音频目录下的 jobs.sqlite，音频以“上级目录名/文件名”标识
+（如 questions/xxx.mp3）；生成阶段重新写入某个音频后，同一音频的上传阶段会被重置为 pending。
+
+状态变化先进入内存缓冲，每 FLUSH_EVERY 条或 FLUSH_INTERVAL 秒在一个事务中写入（WAL 模式），
+进程被杀时最多丢失最后一批，这些音频续跑时会被重新处理。
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+STAGE_GENERATE = "generate"
+STAGE_UPLOAD = "upload"
+
+# 运行模式（None 表示全部处理）
+RESUME = "resume"
+RETRY_FAILED = "retry-failed"
+
+FLUSH_EVERY = 200
+FLUSH_INTERVAL = 1.0
+MAX_ERROR_LENGTH = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    clip       TEXT NOT NULL,
+    stage      TEXT NOT NULL,
+    state      TEXT NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    error      TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (stage, clip)
+) WITHOUT ROWID;
+"""
+
+UPSERT_SQL = """
+INSERT INTO jobs (clip, stage, state, attempts, error, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (stage, clip) DO UPDATE SET
+    state = excluded.state,
+    attempts = jobs.attempts + excluded.attempts,
+    error = excluded.error,
+    updated_at = excluded.updated_at
+"""
+REGISTER_SQL = "INSERT OR IGNORE INTO jobs (clip, stage, state, attempts, error, updated_at) VALUES (?, ?, ?, 0, NULL, ?)"
+RESET_SQL = "UPDATE jobs SET state = ?, updated_at = ? WHERE stage = ? AND clip = ? AND state != ?"
+FORGET_SQL = "DELETE FROM jobs WHERE stage = ? AND clip = ?"
+
+
+def clip_key(path: Path) -> str:
+    """音频在日志中的标识：上级目录名/文件名"""
+    path = Path(path)
+    return f"{path.parent.name}/{path.name}"
+
+
+def run_mode(args) -> Optional[str]:
+    """从命令行参数（--resume / --retry-failed）得到运行模式"""
+    if getattr(args, "retry_failed", False):
+        return RETRY_FAILED
+    if getattr(args, "resume", False):
+        return RESUME
+    return None
+
+
+class JobJournal:
+    """线程安全的任务日志"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("PRAGMA busy_timeout = 10000")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._buffer: List[Tuple[str, tuple]] = []
+        self._last_flush = time.monotonic()
+
+    def __enter__(self) -> "JobJournal":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # --------------------------------------------------------
+    # 写入
+    # --------------------------------------------------------
+
+    def _push(self, statements: Sequence[Tuple[str, tuple]]) -> None:
+        with self._lock:
+            self._buffer.extend(statements)
+            if len(self._buffer) < FLUSH_EVERY and time.monotonic() - self._last_flush < FLUSH_INTERVAL:
+                return
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        buffer, self._buffer = self._buffer, []
+        self.conn.execute("BEGIN")
+        try:
+            for sql, params in buffer:
+                self.conn.execute(sql, params)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def register(self, stage: str, clips: Iterable[str]) -> None:
+        """登记待处理的音频（已有记录的保持原状态）"""
+        now = time.time()
+        self._push([(REGISTER_SQL, (clip, stage, PENDING, now)) for clip in clips])
+
+    def start(self, stage: str, clip: str) -> None:
+        """开始处理（尝试次数 +1）"""
+        self._push([(UPSERT_SQL, (clip, stage, RUNNING, 1, None, time.time()))])
+
+    def done(self, stage: str, clip: str, reset: Sequence[str] = ()) -> None:
+        """
+        处理完成；reset 中的后续阶段被重置为 pending
+        （如重新生成音频后，需要重新上传）
+        """
+        now = time.time()
+        statements = [(UPSERT_SQL, (clip, stage, DONE, 0, None, now))]
+        statements += [(RESET_SQL, (PENDING, now, later, clip, PENDING)) for later in reset]
+        self._push(statements)
+
+    def fail(self, stage: str, clip: str, error: str = "") -> None:
+        self._push([(UPSERT_SQL, (clip, stage, FAILED, 0, (error or "")[:MAX_ERROR_LENGTH], time.time()))])
+
+    def forget(self, stage: str, clips: Iterable[str]) -> None:
+        """删除音频在该阶段的记录（音频已被清理，不再视为已完成）"""
+        self._push([(FORGET_SQL, (stage, clip)) for clip in clips])
+
+    # --------------------------------------------------------
+    # 查询
+    # --------------------------------------------------------
+
+    def states(self, stage: str) -> Dict[str, str]:
+        """某阶段全部音频的状态"""
+        self.flush()
+        return dict(self.conn.execute("SELECT clip, state FROM jobs WHERE stage = ?", (stage,)))
+
+    def clips(self, stage: str, state: str) -> Set[str]:
+        """某阶段处于指定状态的全部音频"""
+        self.flush()
+        return {clip for (clip,) in self.conn.execute(
+            "SELECT clip FROM jobs WHERE stage = ? AND state = ?", (stage, state))}
+
+    def selector(self, stage: str, mode: Optional[str]) -> Optional[Callable[[str], bool]]:
+        """
+        按运行模式返回筛选函数（clip -> 是否需要处理），默认模式返回 None（全部处理）
+        状态在调用时一次性读入内存，之后的判断不访问数据库
+        """
+        if mode is None:
+            return None
+        states = self.states(stage)
+        if mode == RETRY_FAILED:
+            return lambda clip: states.get(clip) == FAILED
+        return lambda clip: states.get(clip) != DONE
+
+    def summary(self, stage: str) -> Dict[str, int]:
+        self.flush()
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for state, count in self.conn.execute(
+            "SELECT state, COUNT(*) FROM jobs WHERE stage = ? GROUP BY state", (stage,)
+        ):
+            counts[state] = count
+        return counts
+
+    def failures(self, stage: str, limit: int = 20) -> List[Tuple[str, int, str]]:
+        """最近失败的音频: (clip, 尝试次数, 错误信息)"""
+        self.flush()
+        return list(self.conn.execute(
+            "SELECT clip, attempts, error FROM jobs WHERE stage = ? AND state = ? ORDER BY updated_at DESC LIMIT ?",
+            (stage, FAILED, limit),
+        ))
+
+    def print_summary(self, stage: str, title: str = "任务日志") -> None:
+        counts = self.summary(stage)
+        unfinished = counts[PENDING] + counts[RUNNING]
+        print(f"   {title}: 完成 {counts[DONE]}，失败 {counts[FAILED]}，未完成 {unfinished}（{self.path}）")
+        for clip, attempts, error in self.failures(stage, limit=5):
+            print(f"      ❌ {clip}（尝试 {attempts} 次）: {error}")
+        if counts[FAILED] or unfinished:
+            print("      使用 --retry-failed 只重试失败的，--resume 处理全部未完成的")
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+JSON 索引文件的多进程安全保存（TTS 缓存、后处理缓存、校验索引、上传清单共用）
+
+分片并行时多个进程共用同一个索引文件。保存时先加文件锁，重新读取磁盘上的内容，
+只把本进程修改过的条目（与加载时的快照比较得出）合并进去，再原子替换，
+其他进程写入的条目不会被覆盖。
+"""
+
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows：不加锁（分片并行只在 POSIX 系统上使用）
+    fcntl = None
+
+Sections = Dict[str, Dict[str, Any]]
+
+
+def read_json(path: Path) -> Optional[Dict[str, Any]]:
+    """读取 JSON 文件，不存在或已损坏时返回 None"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def write_json(path: Path, payload: Dict[str, Any]) -> None:
+    """原子写入（临时文件名带进程号，多个进程同时保存互不干扰）"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def locked(path: Path) -> Iterator[None]:
+    """对 path 旁边的 .lock 文件加排他锁"""
+    if fcntl is None:
+        yield
+        return
+    lock_path = Path(path).with_name(Path(path).name + ".lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def snapshot(sections: Sections) -> Sections:
+    """记录各段落当前内容（浅拷贝），保存时据此判断哪些条目被本进程修改过"""
+    return {name: dict(entries) for name, entries in sections.items()}
+
+
+def save_merged(path: Path, sections: Sections, base: Sections, header: Optional[Dict[str, Any]] = None) -> Sections:
+    """
+    把 sections 中相对 base 新增、修改（值不是同一对象）或删除的条目合并进磁盘上的索引
+    header 为文件顶层的固定字段（如版本号），与磁盘上不一致时丢弃磁盘内容
+    返回合并后的各段落（包含其他进程写入的条目），调用方可用它替换内存中的内容
+    """
+    header = header or {}
+    with locked(path):
+        data = read_json(path) or {}
+        if any(data.get(key) != value for key, value in header.items()):
+            data = {}
+        merged: Sections = {}
+        for name, entries in sections.items():
+            current = data.get(name)
+            current = dict(current) if isinstance(current, dict) else {}
+            loaded = base.get(name, {})
+            for key, value in entries.items():
+                if loaded.get(key) is not value:
+                    current[key] = value
+            for key in loaded.keys() - entries.keys():
+                current.pop(key, None)
+            merged[name] = current
+        write_json(path, {**header, **merged})
+    return merged
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+分阶段计时与指标导出（问答对生成/上传脚本、短语生成脚本共用）
+
+进程内共用一个 metrics（Metrics 实例），各模块直接导入:
+    from audio_common.metrics import metrics
+
+    with metrics.stage("tts", voice=voice):     # 阶段耗时直方图 + 在途数；抛出异常计入 {stage}_errors
+        ...
+    metrics.inc("tts_retries")                  # 计数器（字节数同样用计数器: metrics.inc("upload_bytes", size)）
+    metrics.set_gauge("tts_queue_depth", n)     # 仪表（同时记录最大值）
+    async for chunk in metrics.timed_aiter(source, "db_fetch"):   # 等待下一项的时间计入该阶段
+
+默认只在内存中累计（每次计时一次 perf_counter 和一次二分查找）。
+脚本传入 --metrics-dir 后由 configure() 打开导出，目录下写出（文件名以 任务名[-实例] 开头）:
+- {name}.events.jsonl  每个阶段结束一行 {"ts", "job", "stage", "seconds", "ok", ...附加字段}
+- {name}.prom          Prometheus 文本格式（可放入 node_exporter 的 textfile 目录），
+                       运行中每 EXPORT_INTERVAL 秒刷新，结束时再写一次
+结束时 print_summary() 打印各阶段的次数 / p50 / p95 / 最大值 / 累计耗时，可据此判断慢在
+TTS、数据库、磁盘还是上传。
+
+性能分析（--profile-stage tts upload ...）:
+  在创建 profiler 的线程（事件循环所在的主线程）中进入这些阶段时打开 cProfile，
+  并发/嵌套的阶段按引用计数共用一个 profiler（同一时间只能有一个），结束时写出
+  {name}.prof（pstats 格式，可用 python -m pstats 或 snakeviz 查看）。
+  协程交错执行，结果会包含同时运行的其他协程；其他线程中的阶段不做 cProfile，
+  需要时用 py-spy 从外部采样（py-spy record --pid <PID> --threads，线程池按阶段命名）。
+"""
+
+import bisect
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence
+
+# 直方图桶上限（秒）
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+EXPORT_INTERVAL = 15.0
+METRIC_PREFIX = "kouyu_audio"
+
+
+def _number(value: float) -> str:
+    """整数按整数输出（字节数等大计数不用科学计数法）"""
+    return str(int(value)) if float(value).is_integer() else f"{value:.6g}"
+
+
+class Histogram:
+    """固定桶直方图（分位数按桶内线性插值估算）"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                # 桶的上下界收窄到实际出现过的最小/最大值，样本集中在一个宽桶里时估算才不会偏到边界
+                lower = max(BUCKETS[i - 1] if i > 0 else 0.0, self.min)
+                upper = min(BUCKETS[i] if i < len(BUCKETS) else self.max, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+
+class Metrics:
+    """线程安全的指标注册表"""
+
+    def __init__(self):
+        self.job = ""
+        self.instance = ""
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.gauge_max: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._events = None
+        self._prom_path: Optional[Path] = None
+        self._profile_path: Optional[Path] = None
+        self._last_export = 0.0
+        self._profile_stages: frozenset = frozenset()
+        self._profiler: Optional[cProfile.Profile] = None
+        self._profiler_thread: Optional[int] = None
+        self._profile_depth = 0
+        self._profiled = False
+
+    # --------------------------------------------------------
+    # 配置
+    # --------------------------------------------------------
+
+    def configure(
+        self,
+        directory: Optional[Path],
+        job: str,
+        instance: str = "",
+        profile_stages: Sequence[str] = (),
+    ) -> None:
+        """打开导出（directory 为 None 时只做性能分析或什么都不做）"""
+        self.job = job
+        self.instance = instance
+        name = f"{job}-{instance}" if instance else job
+        if directory:
+            directory = Path(directory)
+            directory.mkdir(parents=True, exist_ok=True)
+            self._events = open(directory / f"{name}.events.jsonl", "a", encoding="utf-8")
+            self._prom_path = directory / f"{name}.prom"
+        if profile_stages:
+            self._profile_stages = frozenset(profile_stages)
+            self._profiler = cProfile.Profile()
+            self._profiler_thread = threading.get_ident()
+            self._profile_path = Path(directory or ".") / f"{name}.prof"
+
+    # --------------------------------------------------------
+    # 记录
+    # --------------------------------------------------------
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self.gauges[name] = value
+            if value > self.gauge_max.get(name, float("-inf")):
+                self.gauge_max[name] = value
+
+    def _add_gauge(self, name: str, delta: float) -> None:
+        with self._lock:
+            value = self.gauges.get(name, 0) + delta
+            self.gauges[name] = value
+            if value > self.gauge_max.get(name, float("-inf")):
+                self.gauge_max[name] = value
+
+    def observe(self, stage: str, seconds: float, ok: bool = True, **fields: Any) -> None:
+        """记录一次阶段耗时（已在别处测得时直接调用，如子进程中的后处理）"""
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+            if not ok:
+                self.counters[f"{stage}_errors"] = self.counters.get(f"{stage}_errors", 0) + 1
+            if self._events is not None:
+                event = {"ts": round(time.time(), 4), "job": self.job, "stage": stage,
+                         "seconds": round(seconds, 6), "ok": ok, **fields}
+                if self.instance:
+                    event["instance"] = self.instance
+                self._events.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+            # 在锁内占下这次导出，多个线程不会同时写同一个临时文件
+            export = self._prom_path is not None and time.monotonic() - self._last_export >= EXPORT_INTERVAL
+            if export:
+                self._last_export = time.monotonic()
+        if export:
+            self.export()
+
+    @contextmanager
+    def stage(self, stage: str, **fields: Any) -> Iterator[None]:
+        """对一段代码计时（可在协程中包住 await），期间计入 {stage}_in_flight"""
+        self._add_gauge(f"{stage}_in_flight", 1)
+        profiling = self._profile_enter(stage)
+        started = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            elapsed = time.perf_counter() - started
+            if profiling:
+                self._profile_exit()
+            self._add_gauge(f"{stage}_in_flight", -1)
+            self.observe(stage, elapsed, ok, **fields)
+
+    def count(self, stage: str) -> int:
+        """阶段已结束的次数（如 tts 阶段即 TTS 请求数，含重试）"""
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            return histogram.count if histogram else 0
+
+    def timed_iter(self, iterable: Iterable, stage: str) -> Iterator:
+        """逐项产出，等待每一项的时间计入 stage（如数据库读取下一块）"""
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage, time.perf_counter() - started)
+            yield item
+
+    async def timed_aiter(self, iterable: AsyncIterator, stage: str) -> AsyncIterator:
+        """timed_iter 的异步版本"""
+        iterator = iterable.__aiter__()
+        while True:
+            started = time.perf_counter()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            self.observe(stage, time.perf_counter() - started)
+            yield item
+
+    # --------------------------------------------------------
+    # 性能分析
+    # --------------------------------------------------------
+
+    def _profile_enter(self, stage: str) -> bool:
+        if stage not in self._profile_stages or threading.get_ident() != self._profiler_thread:
+            return False
+        if self._profile_depth == 0:
+            self._profiler.enable()
+            self._profiled = True
+        self._profile_depth += 1
+        return True
+
+    def _profile_exit(self) -> None:
+        self._profile_depth -= 1
+        if self._profile_depth == 0:
+            self._profiler.disable()
+
+    # --------------------------------------------------------
+    # 导出
+    # --------------------------------------------------------
+
+    def _labels(self, **extra: str) -> str:
+        labels = {"job": self.job, **({"instance": self.instance} if self.instance else {}), **extra}
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+    def prometheus_text(self) -> str:
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        with self._lock:
+            histograms = {stage: (list(h.counts), h.count, h.sum) for stage, h in sorted(self.histograms.items())}
+            counters = dict(sorted(self.counters.items()))
+            gauges = dict(sorted(self.gauges.items()))
+            gauge_max = dict(sorted(self.gauge_max.items()))
+
+        lines: List[str] = []
+        name = f"{METRIC_PREFIX}_stage_seconds"
+        lines += [f"# HELP {name} 各阶段耗时（秒）", f"# TYPE {name} histogram"]
+        for stage, (counts, count, total) in histograms.items():
+            cumulative = 0
+            for bound, bucket in zip([*map(str, BUCKETS), "+Inf"], counts):
+                cumulative += bucket
+                lines.append(f"{name}_bucket{self._labels(stage=stage, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{self._labels(stage=stage)} {total:.6f}")
+            lines.append(f"{name}_count{self._labels(stage=stage)} {count}")
+        for key, value in counters.items():
+            metric = f"{METRIC_PREFIX}_{key}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric}{self._labels()} {_number(value)}"]
+        for key, value in gauges.items():
+            metric = f"{METRIC_PREFIX}_{key}"
+            lines += [f"# TYPE {metric} gauge", f"{metric}{self._labels()} {_number(value)}",
+                      f"# TYPE {metric}_max gauge", f"{metric}_max{self._labels()} {_number(gauge_max[key])}"]
+        return "\n".join(lines) + "\n"
+
+    def export(self) -> None:
+        """写出 Prometheus 文本文件（原子替换）"""
+        if self._prom_path is None:
+            return
+        tmp_path = self._prom_path.with_name(f"{self._prom_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(self.prometheus_text(), encoding="utf-8")
+        os.replace(tmp_path, self._prom_path)
+
+    def print_summary(self) -> None:
+        """打印各阶段耗时分布、计数器和仪表最大值"""
+        with self._lock:
+            histograms = sorted(self.histograms.items(), key=lambda item: -item[1].sum)
+            counters = dict(sorted(self.counters.items()))
+            gauge_max = {key: value for key, value in sorted(self.gauge_max.items()) if value > 0}
+        if not histograms and not counters:
+            return
+        print("\n⏱️ 分阶段耗时（按累计耗时排序）")
+        # 中文占两列，表头按显示宽度对齐
+        print(f"   {'阶段':<16}{'次数':>6}{'p50':>10}{'p95':>10}{'最大':>8}{'累计':>9}")
+        for stage, h in histograms:
+            print(f"   {stage:<18}{h.count:>8}{h.quantile(0.5):>9.3f}s{h.quantile(0.95):>9.3f}s"
+                  f"{h.max:>9.3f}s{h.sum:>10.1f}s")
+        if counters:
+            print("   计数: " + "，".join(f"{key}={_number(value)}" for key, value in counters.items()))
+        if gauge_max:
+            print("   峰值: " + "，".join(f"{key}={_number(value)}" for key, value in gauge_max.items()))
+
+    def close(self) -> None:
+        """写出最终指标、事件和性能分析结果"""
+        if self._profiler is not None:
+            if self._profile_depth:
+                self._profiler.disable()
+                self._profile_depth = 0
+            stages = ", ".join(sorted(self._profile_stages))
+            if self._profiled:
+                self._profile_path.parent.mkdir(parents=True, exist_ok=True)
+                self._profiler.dump_stats(str(self._profile_path))
+                print(f"   性能分析: {self._profile_path}（阶段: {stages}）")
+            else:
+                print(f"   性能分析: 本次运行没有在主线程中进入这些阶段（{stages}），未写出 .prof")
+            self._profiler = None
+        if self._prom_path is not None:
+            self.export()
+            print(f"   指标: {self._prom_path}")
+        if self._events is not None:
+            self._events.close()
+            self._events = None
+
+
+# 进程内共用的指标注册表
+metrics = Metrics()
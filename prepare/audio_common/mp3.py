@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+MPEG 音频（MP3）帧解析与按帧切分
+
+只解析帧头（4 字节），不解码音频：
+- iter_frames: 顺序遍历帧（跳过开头的 ID3v2 标签，遇到无法识别的字节向后重新同步）
+- split_at: 按时间点在帧边界处切分，每一段都是可独立播放的 MP3
+- frame_data: 只保留音频帧（去掉标签和 Xing/Info 信息帧），多段首尾相接即为一个连续码流
+- silent_frame: 与给定帧头同格式的静音帧（帧头之后全为 0），用于在拼接处插入停顿
+
+edge-tts 默认输出为 MPEG-2 Layer III 24kHz 48kbps 单声道，每帧 576 个采样（24ms）、144 字节，
+但这里按标准帧头计算，支持任意 MPEG-1/2/2.5 Layer I/II/III 码流。
+"""
+
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Sequence
+
+# 版本位 -> 版本（1 为保留值）
+VERSIONS = {0: "2.5", 2: "2", 3: "1"}
+# 层位 -> 层（0 为保留值）
+LAYERS = {1: 3, 2: 2, 3: 1}
+
+# 码率表（kbps），下标为帧头中的码率索引，0 为 free format，15 为非法
+BITRATES = {
+    ("1", 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    ("1", 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    ("1", 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    ("2", 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    ("2", 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    ("2", 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+SAMPLE_RATES = {
+    "1": (44100, 48000, 32000),
+    "2": (22050, 24000, 16000),
+    "2.5": (11025, 12000, 8000),
+}
+
+
+@dataclass
+class FrameHeader:
+    """一个 MP3 帧头"""
+    version: str        # "1" | "2" | "2.5"
+    layer: int          # 1 | 2 | 3
+    bitrate: int        # kbps
+    sample_rate: int    # Hz
+    padding: int
+    channels: int
+    length: int         # 整帧字节数（含帧头）
+    samples: int        # 每帧采样数
+
+    @property
+    def duration(self) -> float:
+        return self.samples / self.sample_rate
+
+
+@dataclass
+class Frame:
+    """码流中的一帧：在数据中的位置 + 帧头"""
+    offset: int
+    header: FrameHeader
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.header.length
+
+
+def parse_header(data: bytes, pos: int = 0) -> Optional[FrameHeader]:
+    """解析 pos 处的帧头，不是合法帧头时返回 None（free format 码流不支持，也返回 None）"""
+    if pos + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[pos], data[pos + 1], data[pos + 2], data[pos + 3]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = VERSIONS.get((b1 >> 3) & 0x03)
+    layer = LAYERS.get((b1 >> 1) & 0x03)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x03
+    if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate = BITRATES[("1" if version == "1" else "2", layer)][bitrate_index]
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 0x01
+    channels = 1 if (b3 >> 6) == 3 else 2
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    else:
+        samples = 576 if layer == 3 and version != "1" else 1152
+        length = samples // 8 * bitrate * 1000 // sample_rate + padding
+    return FrameHeader(version, layer, bitrate, sample_rate, padding, channels, length, samples)
+
+
+def id3v2_size(data: bytes) -> int:
+    """开头 ID3v2 标签的总字节数，没有标签时为 0"""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for b in data[6:10]:
+        size = (size << 7) | (b & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def iter_frames(data: bytes) -> Iterator[Frame]:
+    """顺序遍历全部帧；帧之间的无法识别的字节被跳过"""
+    pos = id3v2_size(data)
+    end = len(data)
+    while pos + 4 <= end:
+        header = parse_header(data, pos)
+        if header is None or pos + header.length > end:
+            if header is not None:
+                # 最后一帧被截断
+                return
+            pos = data.find(b"\xff", pos + 1)
+            if pos < 0:
+                return
+            continue
+        yield Frame(pos, header)
+        pos += header.length
+
+
+def frames(data: bytes) -> List[Frame]:
+    return list(iter_frames(data))
+
+
+def duration(data: bytes) -> float:
+    """音频总时长（秒）"""
+    return sum(frame.header.duration for frame in iter_frames(data))
+
+
+def split_at(data: bytes, cut_seconds: Sequence[float], frame_list: Optional[List[Frame]] = None) -> List[bytes]:
+    """
+    在最接近各时间点的帧边界处切分，返回 len(cut_seconds) + 1 段
+    切点需递增；落在同一帧边界上的切点会产生空段
+    """
+    frame_list = frame_list if frame_list is not None else frames(data)
+    if not frame_list:
+        return [b""] * (len(cut_seconds) + 1)
+
+    # edges[i] 为第 i 帧的起始时间，最后一项为总时长
+    edges: List[float] = [0.0]
+    for frame in frame_list:
+        edges.append(edges[-1] + frame.header.duration)
+
+    boundaries = [0]
+    for cut in cut_seconds:
+        index = bisect_left(edges, cut)
+        # 取更近的那个帧边界
+        if index > 0 and (index == len(edges) or cut - edges[index - 1] < edges[index] - cut):
+            index -= 1
+        boundaries.append(max(boundaries[-1], index))
+    boundaries.append(len(frame_list))
+
+    offsets = [frame.offset for frame in frame_list] + [frame_list[-1].end]
+    return [data[offsets[a]:offsets[b]] for a, b in zip(boundaries, boundaries[1:])]
+
+
+def is_info_frame(data: bytes, frame: Frame) -> bool:
+    """是否为编码器写入的 Xing / Info / VBRI 信息帧（解码为静音，只在文件开头有意义）"""
+    side = data[frame.offset + 4:min(frame.end, frame.offset + 4 + 40)]
+    return b"Xing" in side or b"Info" in side or b"VBRI" in side
+
+
+def main_data_begin(data: bytes, frame: Frame) -> int:
+    """
+    Layer III 帧的 main_data_begin：本帧的主数据从前面多少字节处开始（比特储备），
+    大于 0 的帧依赖前一帧的数据，放在别的帧后面时无法正确解码；其他层恒为 0
+    """
+    if frame.header.layer != 3:
+        return 0
+    pos = frame.offset + 4 + (0 if data[frame.offset + 1] & 0x01 else 2)   # 有 CRC 时跳过 2 字节
+    if frame.header.version == "1":
+        return (data[pos] << 1) | (data[pos + 1] >> 7)                      # 9 位
+    return data[pos]                                                        # MPEG-2/2.5: 8 位
+
+
+def frame_data(data: bytes, standalone: bool = False) -> bytes:
+    """
+    第一帧到最后一帧的字节：去掉 ID3v2 / ID3v1 标签与开头的信息帧
+    standalone=True 时再去掉开头依赖比特储备的帧（按帧切分出的片段才会有），拼接在任意帧之后都能正确解码
+    """
+    frame_list = frames(data)
+    if frame_list and is_info_frame(data, frame_list[0]):
+        frame_list = frame_list[1:]
+    if standalone:
+        while frame_list and main_data_begin(data, frame_list[0]) > 0:
+            frame_list = frame_list[1:]
+    if not frame_list:
+        return b""
+    return data[frame_list[0].offset:frame_list[-1].end]
+
+
+def silent_frame(header: bytes) -> bytes:
+    """
+    与 header（4 字节帧头）同版本、层、码率、采样率、声道的静音帧：
+    不带 CRC、不填充，帧头之后全为 0（没有比特分配 / 哈夫曼数据，main_data_begin 为 0，解码为静音）
+    """
+    header = bytes([header[0], header[1] | 0x01, header[2] & 0xFD, header[3]])
+    parsed = parse_header(header)
+    if parsed is None:
+        raise ValueError("不是合法的帧头")
+    return header + bytes(parsed.length - 4)
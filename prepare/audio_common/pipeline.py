@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成 → 上传 流水线的上传阶段
+
+合成脚本每就绪一个音频就调用 submit() 放入有界队列，若干上传 worker
+（线程池中执行阻塞的 SDK 调用）并行消费。队列满时 submit() 会等待，
+对合成端形成反压；总耗时约等于合成与上传中较慢的那一段。
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from .metrics import metrics
+
+DEFAULT_UPLOAD_WORKERS = 8
+DEFAULT_QUEUE_SIZE = 64
+
+
+class UploadStage:
+    """有界队列 + 上传 worker"""
+
+    def __init__(
+        self,
+        upload: Callable[[Path], bool],
+        workers: int = DEFAULT_UPLOAD_WORKERS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+    ):
+        self.upload = upload
+        self.workers = max(1, workers)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self.stats = {"submitted": 0, "uploaded": 0, "failed": 0, "max_queue_depth": 0}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="upload")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, path: Path) -> None:
+        """音频就绪回调：放入上传队列（队列满时等待）"""
+        await self.queue.put(path)
+        self.stats["submitted"] += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.queue.qsize())
+        metrics.set_gauge("upload_queue_depth", self.queue.qsize())
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            path = await self.queue.get()
+            metrics.set_gauge("upload_queue_depth", self.queue.qsize())
+            if path is None:
+                return
+            try:
+                ok = await loop.run_in_executor(self._executor, self.upload, path)
+            except Exception as e:
+                print(f"  ❌ 上传异常 {path.name}: {e}")
+                ok = False
+            self.stats["uploaded" if ok else "failed"] += 1
+
+    async def finish(self) -> None:
+        """等待队列中剩余文件上传完成"""
+        for _ in self._tasks:
+            await self.queue.put(None)
+        await asyncio.gather(*self._tasks)
+        if self._executor:
+            self._executor.shutdown(wait=True)
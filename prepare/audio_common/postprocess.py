@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+"""
+音频后处理（生成之后、上传之前）：响度归一化、首尾静音裁剪、低码率转码
+
+每个片段:
+  1. ffmpeg 解码为单声道 float32 PCM
+  2. NumPy 向量化分析
+     - 首尾静音：10ms 窗口 RMS 低于最响窗口 trim_db 以下的部分裁掉，两端各保留 pad_ms
+     - 响度：EBU R128 / ITU-R BS.1770 积分响度（K 加权 + 400ms 块、-70 LUFS 绝对门限、-10 LU 相对门限）
+       K 加权滤波在频域按幅频响应相乘（响度只与能量有关，不需要相位）
+  3. 增益 = 目标响度 - 实测响度，且峰值不超过 peak_db
+  4. ffmpeg 编码回 MP3（默认 32kbps，覆盖原文件），可选额外输出 Opus(.opus) / AAC(.m4a) 同名文件
+  5. 有单词时间 sidecar（word_timings）时按裁掉的开头时长平移
+
+结果按 sha256(输入 MD5 + 参数) 缓存在 prepare/.postprocess_cache/，索引记录每个输出文件处理后的 MD5：
+- 文件未变（仍是处理后的内容）：跳过
+- 新片段或内容变化：查缓存，命中直接链接，否则处理
+处理在 ProcessPoolExecutor 中进行，默认使用全部 CPU 核。
+
+依赖: numpy、ffmpeg（PATH 中或 FFMPEG_BIN 环境变量指定）
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import word_timings
+from .json_index import read_json, save_merged, snapshot, write_json
+from .metrics import metrics
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent / ".postprocess_cache"
+
+# 可选的额外转码格式: 名称 -> (扩展名, ffmpeg 编码参数)
+VARIANTS = {
+    "opus": (".opus", ["-c:a", "libopus", "-b:a", "16k", "-application", "voip"]),
+    "aac": (".m4a", ["-c:a", "aac", "-b:a", "32k", "-movflags", "+faststart"]),
+}
+
+# 结果状态
+PROCESSED = "processed"
+CACHED = "cached"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+
+class PostProcessError(Exception):
+    """解码/编码失败"""
+
+
+@dataclass(frozen=True)
+class PostProcessSettings:
+    target_lufs: float = -16.0      # 移动端语音常用的目标响度
+    peak_db: float = -1.0           # 峰值上限（dBFS）
+    trim_db: float = -40.0          # 低于最响 10ms 窗口该值以下视为静音
+    pad_ms: int = 80                # 裁剪后两端保留的静音
+    sample_rate: int = 24000
+    mp3_bitrate: str = "32k"
+    variants: Tuple[str, ...] = field(default_factory=tuple)
+
+    def key(self) -> str:
+        payload = json.dumps(asdict(self), sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def ffmpeg_bin() -> str:
+    binary = os.getenv("FFMPEG_BIN") or shutil.which("ffmpeg")
+    if not binary:
+        raise PostProcessError("找不到 ffmpeg，请安装 ffmpeg 或设置 FFMPEG_BIN 环境变量")
+    return binary
+
+
+# ============================================================
+# 分析（NumPy）
+# ============================================================
+
+def _biquad_response(b: Tuple[float, float, float], a: Tuple[float, float, float], w: np.ndarray) -> np.ndarray:
+    z1 = np.exp(-1j * w)
+    z2 = z1 * z1
+    return (b[0] + b[1] * z1 + b[2] * z2) / (a[0] + a[1] * z1 + a[2] * z2)
+
+
+def k_weighting_response(n: int, sample_rate: int) -> np.ndarray:
+    """长度为 n 的实信号 rfft 各频点上的 K 加权幅度（高架 + 高通两级，按采样率换算系数）"""
+    w = 2 * np.pi * np.arange(n // 2 + 1) / n
+
+    # 第一级：高架滤波器（模拟头部声学效应）
+    gain_db, q, fc = 4.0, 1 / np.sqrt(2), 1681.974450955533
+    a_ = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * fc / sample_rate
+    alpha, cos_w0 = np.sin(w0) / (2 * q), np.cos(w0)
+    shelf = _biquad_response(
+        (a_ * ((a_ + 1) + (a_ - 1) * cos_w0 + 2 * np.sqrt(a_) * alpha),
+         -2 * a_ * ((a_ - 1) + (a_ + 1) * cos_w0),
+         a_ * ((a_ + 1) + (a_ - 1) * cos_w0 - 2 * np.sqrt(a_) * alpha)),
+        ((a_ + 1) - (a_ - 1) * cos_w0 + 2 * np.sqrt(a_) * alpha,
+         2 * ((a_ - 1) - (a_ + 1) * cos_w0),
+         (a_ + 1) - (a_ - 1) * cos_w0 - 2 * np.sqrt(a_) * alpha),
+        w,
+    )
+
+    # 第二级：高通（RLB 加权）
+    q, fc = 0.5003270373238773, 38.13547087602444
+    w0 = 2 * np.pi * fc / sample_rate
+    alpha, cos_w0 = np.sin(w0) / (2 * q), np.cos(w0)
+    highpass = _biquad_response(
+        ((1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2),
+        (1 + alpha, -2 * cos_w0, 1 - alpha),
+        w,
+    )
+    return np.abs(shelf * highpass)
+
+
+def integrated_loudness(samples: np.ndarray, sample_rate: int) -> float:
+    """BS.1770 积分响度（LUFS），全静音时返回 -inf"""
+    if samples.size == 0:
+        return float("-inf")
+    weighted = np.fft.irfft(np.fft.rfft(samples) * k_weighting_response(samples.size, sample_rate), samples.size)
+    power = weighted.astype(np.float64) ** 2
+
+    block, step = int(0.4 * sample_rate), int(0.1 * sample_rate)
+    if power.size < block:
+        energies = np.array([power.mean()])
+    else:
+        cumulative = np.concatenate(([0.0], np.cumsum(power)))
+        starts = np.arange(0, power.size - block + 1, step)
+        energies = (cumulative[starts + block] - cumulative[starts]) / block
+
+    with np.errstate(divide="ignore"):
+        levels = -0.691 + 10 * np.log10(energies)
+    energies, levels = energies[levels > -70.0], levels[levels > -70.0]
+    if energies.size == 0:
+        return float("-inf")
+    relative_gate = -0.691 + 10 * np.log10(energies.mean()) - 10.0
+    gated = energies[levels > relative_gate]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def trim_bounds(samples: np.ndarray, sample_rate: int, trim_db: float, pad_ms: int) -> Tuple[int, int]:
+    """首尾静音裁剪后的 [start, end) 采样区间"""
+    window = max(1, sample_rate // 100)
+    count = samples.size // window
+    if count == 0:
+        return 0, samples.size
+    rms = np.sqrt(np.mean(samples[:count * window].reshape(count, window) ** 2, axis=1))
+    with np.errstate(divide="ignore"):
+        levels = 20 * np.log10(rms)
+    loud = np.flatnonzero(levels > levels.max() + trim_db)
+    if loud.size == 0 or not np.isfinite(levels.max()):
+        return 0, samples.size
+    pad = int(pad_ms * sample_rate / 1000)
+    start = max(0, loud[0] * window - pad)
+    end = min(samples.size, (loud[-1] + 1) * window + pad)
+    return int(start), int(end)
+
+
+# ============================================================
+# 编解码（ffmpeg）
+# ============================================================
+
+def decode(path: Path, sample_rate: int) -> np.ndarray:
+    cmd = [ffmpeg_bin(), "-v", "error", "-i", str(path), "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"]
+    proc = subprocess.run(cmd, capture_output=True)
+    if proc.returncode != 0:
+        raise PostProcessError(f"解码失败: {proc.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(proc.stdout, dtype="<f4")
+
+
+def encode(samples: np.ndarray, sample_rate: int, output_path: Path, codec_args: List[str]) -> None:
+    cmd = [
+        ffmpeg_bin(), "-v", "error", "-y", "-f", "f32le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+        *codec_args, str(output_path),
+    ]
+    proc = subprocess.run(cmd, input=samples.astype("<f4").tobytes(), capture_output=True)
+    if proc.returncode != 0:
+        raise PostProcessError(f"编码失败: {proc.stderr.decode(errors='replace').strip()}")
+
+
+def _link_or_copy(source: Path, target: Path) -> None:
+    """原子替换 target（新 inode，不影响与 TTS 缓存共享的旧文件）"""
+    tmp_path = target.with_name(target.name + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copy2(source, tmp_path)
+    os.replace(tmp_path, target)
+
+
+def _md5(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
+# ============================================================
+# 单个片段（在子进程中执行）
+# ============================================================
+
+def process_file(path: str, settings: PostProcessSettings, cache_dir: str, processed_md5: str = "") -> Dict[str, Any]:
+    """
+    处理单个 MP3，返回 {path, status, out_md5, bytes_before, bytes_after, seconds, ...}
+    processed_md5 为上次处理后记录的 MD5，与当前文件一致时跳过
+    """
+    started = time.perf_counter()
+    source = Path(path)
+    result: Dict[str, Any] = {"path": path, "status": FAILED}
+    try:
+        data = source.read_bytes()
+        result["bytes_before"] = len(data)
+        src_md5 = _md5(data)
+        if processed_md5 and src_md5 == processed_md5:
+            result.update(status=SKIPPED, out_md5=src_md5, bytes_after=len(data),
+                          seconds=time.perf_counter() - started)
+            return result
+
+        key = hashlib.sha256(f"{src_md5}:{settings.key()}".encode()).hexdigest()
+        cached_dir = Path(cache_dir) / key[:2]
+        cached_mp3 = cached_dir / f"{key}.mp3"
+        cached_variants = {name: cached_dir / f"{key}{VARIANTS[name][0]}" for name in settings.variants}
+        # 裁掉的开头时长（平移单词时间用）；早期的缓存条目没有记录，有 sidecar 时重新处理一次
+        cached_trim = cached_dir / f"{key}.trim.json"
+        has_words = word_timings.sidecar_path(source).exists()
+
+        trim_start = 0.0
+        if (cached_mp3.exists() and all(p.exists() for p in cached_variants.values())
+                and (not has_words or cached_trim.exists())):
+            result["status"] = CACHED
+            trim_start = (read_json(cached_trim) or {}).get("start", 0.0)
+        else:
+            samples = decode(source, settings.sample_rate)
+            start, end = trim_bounds(samples, settings.sample_rate, settings.trim_db, settings.pad_ms)
+            trimmed = samples[start:end]
+            loudness = integrated_loudness(trimmed, settings.sample_rate)
+            peak = float(np.max(np.abs(trimmed))) if trimmed.size else 0.0
+            gain_db = 0.0
+            if np.isfinite(loudness) and peak > 0:
+                gain_db = min(settings.target_lufs - loudness, settings.peak_db - 20 * np.log10(peak))
+            output = trimmed * np.float32(10 ** (gain_db / 20))
+
+            cached_dir.mkdir(parents=True, exist_ok=True)
+            tmp_mp3 = cached_mp3.with_name(f"{key}.{os.getpid()}.tmp.mp3")
+            encode(output, settings.sample_rate, tmp_mp3,
+                   ["-c:a", "libmp3lame", "-b:a", settings.mp3_bitrate, "-ar", str(settings.sample_rate)])
+            for name, cached_path in cached_variants.items():
+                extension, codec_args = VARIANTS[name]
+                tmp_variant = cached_path.with_name(f"{key}.{os.getpid()}.tmp{extension}")
+                encode(output, settings.sample_rate, tmp_variant, codec_args)
+                os.replace(tmp_variant, cached_path)
+            trim_start = start / settings.sample_rate
+            write_json(cached_trim, {"start": trim_start})
+            os.replace(tmp_mp3, cached_mp3)
+
+            result.update(
+                status=PROCESSED,
+                loudness_before=round(loudness, 2) if np.isfinite(loudness) else None,
+                gain_db=round(float(gain_db), 2),
+                trimmed_ms=round((samples.size - trimmed.size) * 1000 / settings.sample_rate),
+            )
+
+        _link_or_copy(cached_mp3, source)
+        for name, cached_path in cached_variants.items():
+            _link_or_copy(cached_path, source.with_suffix(VARIANTS[name][0]))
+        processed = cached_mp3.read_bytes()
+        result.update(out_md5=_md5(processed), bytes_after=len(processed))
+        if has_words:
+            word_timings.shift(source, trim_start, len(data), len(processed))
+    except (OSError, PostProcessError) as e:
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+# ============================================================
+# 进程池调度
+# ============================================================
+
+class PostProcessor:
+    """在进程池中批量/逐个后处理音频，维护处理结果索引"""
+
+    def __init__(
+        self,
+        settings: Optional[PostProcessSettings] = None,
+        workers: Optional[int] = None,
+        cache_dir: Path = DEFAULT_CACHE_DIR,
+    ):
+        if np is None:
+            raise PostProcessError("后处理需要 numpy，请先安装: pip install numpy")
+        self.settings = settings or PostProcessSettings()
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.cache_dir / "index.json"
+        # 输出文件绝对路径 -> {"md5": 处理后的 MD5, "settings": 参数键}
+        self.outputs: Dict[str, Dict[str, str]] = {}
+        self.stats = {PROCESSED: 0, CACHED: 0, SKIPPED: 0, FAILED: 0, "bytes_before": 0, "bytes_after": 0}
+        self.failed_items: List[str] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._load()
+        ffmpeg_bin()
+
+    def __enter__(self) -> "PostProcessor":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self.save()
+
+    def _args(self, path: Path) -> Tuple[str, PostProcessSettings, str, str]:
+        output_key = str(Path(path).resolve())
+        recorded = self.outputs.get(output_key, {})
+        processed_md5 = recorded.get("md5", "") if recorded.get("settings") == self.settings.key() else ""
+        return output_key, self.settings, str(self.cache_dir), processed_md5
+
+    def _record(self, result: Dict[str, Any]) -> bool:
+        status = result["status"]
+        self.stats[status] += 1
+        # 耗时在子进程中测得，这里汇总到主进程的指标
+        metrics.observe("postprocess", result.get("seconds", 0.0), status != FAILED, status=status)
+        if status == FAILED:
+            self.failed_items.append(f"{Path(result['path']).name}: {result.get('error', '')}")
+            return False
+        self.stats["bytes_before"] += result.get("bytes_before", 0)
+        self.stats["bytes_after"] += result.get("bytes_after", 0)
+        self.outputs[result["path"]] = {"md5": result["out_md5"], "settings": self.settings.key()}
+        return True
+
+    def run(self, paths: Iterable[Path]) -> Dict[str, int]:
+        """批量处理（阻塞），返回统计"""
+        args = [self._args(p) for p in paths]
+        if not args:
+            return self.stats
+        chunksize = max(1, len(args) // (self.workers * 8))
+        done = 0
+        for result in self.pool.map(process_file, *zip(*args), chunksize=chunksize):
+            self._record(result)
+            done += 1
+            if result["status"] == FAILED:
+                print(f"  ❌ 后处理失败 {Path(result['path']).name}: {result.get('error', '')}")
+            if done % 200 == 0:
+                print(f"  🎚️ 后处理进度: {done}/{len(args)}")
+        return self.stats
+
+    async def process(self, path: Path) -> bool:
+        """处理单个文件（供生成→上传流水线使用），成功返回 True"""
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self.pool, process_file, *self._args(path))
+        if result["status"] == FAILED:
+            print(f"  ❌ 后处理失败 {Path(path).name}: {result.get('error', '')}")
+        return self._record(result)
+
+    def then(self, submit: Callable[[Path], Awaitable[None]]) -> Callable[[Path], Awaitable[None]]:
+        """返回 on_clip_ready 回调：先后处理，成功后再交给下一阶段（如上传）"""
+        async def on_clip_ready(path: Path) -> None:
+            if await self.process(path):
+                await submit(path)
+        return on_clip_ready
+
+    def print_summary(self) -> None:
+        before, after = self.stats["bytes_before"], self.stats["bytes_after"]
+        print(f"   后处理: 处理 {self.stats[PROCESSED]}，缓存 {self.stats[CACHED]}，"
+              f"跳过 {self.stats[SKIPPED]}，失败 {self.stats[FAILED]}")
+        if before:
+            print(f"   体积: {before / 1024 / 1024:.1f}MB -> {after / 1024 / 1024:.1f}MB（{after / before:.0%}）")
+
+    def _load(self) -> None:
+        data = read_json(self.index_path)
+        if data is not None:
+            self.outputs = data.get("outputs", {})
+        self._saved = snapshot({"outputs": self.outputs})
+
+    def save(self) -> None:
+        """写回索引（与其他进程写入的条目合并）"""
+        merged = save_merged(self.index_path, {"outputs": self.outputs}, self._saved)
+        self.outputs = merged["outputs"]
+        self._saved = snapshot({"outputs": self.outputs})
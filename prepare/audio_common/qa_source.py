@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+问答对数据源（生成脚本与上传脚本共用）
+
+两种实现，接口相同（iter_qa_pair_chunks / iter_qa_pairs / aiter_qa_pair_chunks），
+均按 (sub_scene_id, "order", id) 排序产出与 QA_COLUMNS 字段一致的字典：
+
+- PostgresQASource（db）: 通过 Postgres 命名游标（服务端游标）按块流式读取 qa_pairs；
+  连接中途断开时按最后一行的键继续读取（keyset 分页），不会重复或遗漏。
+  调用方拿到第一块数据即可开始处理，内存占用只与块大小有关。
+- FileQASource（files）: 直接读取 prepare/scene/data/sub-scenes/*.json，
+  用进程池并行解析并在内存中按 scene_id / qa_id 建索引，无需数据库即可运行。
+
+用 open_qa_source("db" | "files") 按名称创建。
+qa_clip_names() 给出一个问答对应有的音频（问题 + 有文本的答案），清理、打包等脚本共用。
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+DEFAULT_CHUNK_SIZE = 500
+MAX_RECONNECTS = 3
+
+SUB_SCENES_DIR = Path(__file__).resolve().parent.parent / "scene" / "data" / "sub-scenes"
+SOURCE_NAMES = ("db", "files")
+# 文件数少于该值时串行解析更快（进程池启动开销约数十毫秒）
+PARALLEL_PARSE_MIN_FILES = 256
+
+QA_COLUMNS = """
+    qp.id,
+    qp.sub_scene_id,
+    qp.speaker_text,
+    qp.speaker_text_cn,
+    qp.responses,
+    qp.audio_url,
+    qp.qa_type,
+    qp."order",
+    ss.scene_id
+"""
+
+
+def qa_clip_names(qa: Dict[str, Any]) -> Iterator[Tuple[Optional[int], str]]:
+    """问答对应有的音频: (答案序号；问题为 None, 子目录/文件名)，与生成脚本的 clip_paths 一致"""
+    qa_id = qa["id"]
+    yield None, f"questions/{qa_id}.mp3"
+    for idx, response in enumerate(qa["responses"] or []):
+        if response.get("text", ""):
+            yield idx, f"responses/{qa_id}_response{idx}.mp3"
+
+
+def get_db_connection(database_url: Optional[str] = None):
+    """获取数据库连接（未指定时读取 DATABASE_URL 环境变量）"""
+    database_url = database_url or os.getenv("DATABASE_URL", "")
+    if not database_url:
+        print("❌ 错误: 请设置 DATABASE_URL 环境变量")
+        sys.exit(1)
+    return psycopg2.connect(database_url)
+
+
+def _build_query(scene_ids: Optional[Sequence[str]], after: Optional[Tuple[str, int, str]]) -> Tuple[str, List[Any]]:
+    conditions: List[str] = []
+    params: List[Any] = []
+    if scene_ids:
+        conditions.append("ss.scene_id = ANY(%s)")
+        params.append(list(scene_ids))
+    if after:
+        # id 作为最后一列保证键唯一（同一子场景内 order 可能重复），断线续读不会跳过同序的行
+        conditions.append('(qp.sub_scene_id, qp."order", qp.id) > (%s, %s, %s)')
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+        SELECT {QA_COLUMNS}
+        FROM qa_pairs qp
+        JOIN sub_scenes ss ON qp.sub_scene_id = ss.id
+        {where}
+        ORDER BY qp.sub_scene_id, qp."order", qp.id
+    """
+    return query, params
+
+
+def iter_qa_pair_chunks(
+    scene_ids: Optional[Sequence[str]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    database_url: Optional[str] = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """按块产出问答对（每块最多 chunk_size 行）"""
+    after: Optional[Tuple[str, int, str]] = None
+    reconnects = 0
+
+    while True:
+        conn = get_db_connection(database_url)
+        try:
+            # 命名游标只能在事务内使用；只读事务避免持有多余的锁
+            conn.set_session(readonly=True)
+            with conn.cursor(name="qa_pairs_stream", cursor_factory=RealDictCursor) as cursor:
+                cursor.itersize = chunk_size
+                query, params = _build_query(scene_ids, after)
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        return
+                    chunk = [dict(row) for row in rows]
+                    after = (chunk[-1]["sub_scene_id"], chunk[-1]["order"], chunk[-1]["id"])
+                    reconnects = 0
+                    yield chunk
+        except psycopg2.OperationalError as e:
+            # 连接中断：从最后一个已产出的键继续
+            reconnects += 1
+            if reconnects > MAX_RECONNECTS:
+                raise
+            print(f"  ⚠️ 数据库连接中断，从 {after} 继续读取 ({reconnects}/{MAX_RECONNECTS}): {e}")
+        finally:
+            conn.close()
+
+
+def iter_qa_pairs(
+    scene_ids: Optional[Sequence[str]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    database_url: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """逐行产出问答对"""
+    for chunk in iter_qa_pair_chunks(scene_ids, chunk_size, database_url):
+        yield from chunk
+
+
+async def aiter_qa_pair_chunks(
+    scene_ids: Optional[Sequence[str]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    database_url: Optional[str] = None,
+    prefetch: int = 2,
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    异步产出问答对块：数据库读取在后台线程进行，
+    最多预读 prefetch 块，事件循环不会被阻塞
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, prefetch))
+    done = object()
+    stop = threading.Event()
+
+    def produce() -> None:
+        try:
+            for chunk in iter_qa_pair_chunks(scene_ids, chunk_size, database_url):
+                if stop.is_set():
+                    return
+                asyncio.run_coroutine_threadsafe(queue.put(chunk), loop).result()
+            asyncio.run_coroutine_threadsafe(queue.put(done), loop).result()
+        except BaseException as e:
+            if not stop.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put(e), loop).result()
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # 让阻塞在 put 上的生产线程退出
+        while not queue.empty():
+            queue.get_nowait()
+        await producer
+
+
+# ============================================================
+# 可插拔数据源
+# ============================================================
+
+class PostgresQASource:
+    """从 Postgres 流式读取问答对（封装上面的模块级函数）"""
+
+    name = "db"
+
+    def __init__(self, database_url: Optional[str] = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.database_url = database_url
+        self.chunk_size = chunk_size
+
+    def iter_qa_pair_chunks(self, scene_ids: Optional[Sequence[str]] = None) -> Iterator[List[Dict[str, Any]]]:
+        return iter_qa_pair_chunks(scene_ids, self.chunk_size, self.database_url)
+
+    def iter_qa_pairs(self, scene_ids: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+        return iter_qa_pairs(scene_ids, self.chunk_size, self.database_url)
+
+    def aiter_qa_pair_chunks(self, scene_ids: Optional[Sequence[str]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        return aiter_qa_pair_chunks(scene_ids, self.chunk_size, self.database_url)
+
+
+def parse_sub_scene_file(path: str) -> List[Dict[str, Any]]:
+    """
+    解析单个子场景文件为问答对行（进程池中执行）
+    文件中没有 order / subSceneId / sceneId 的，按列表顺序（从 1 开始）和所属层级补齐
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    scene_id = data.get("sceneId") or Path(path).stem
+    rows: List[Dict[str, Any]] = []
+    for sub_index, sub_scene in enumerate(data.get("subScenes") or [], start=1):
+        sub_scene_id = sub_scene["id"]
+        for qa_index, qa in enumerate(sub_scene.get("qaPairs") or [], start=1):
+            rows.append({
+                "id": qa["id"],
+                "sub_scene_id": qa.get("subSceneId") or sub_scene_id,
+                "speaker_text": qa.get("speakerText", ""),
+                "speaker_text_cn": qa.get("speakerTextCn", ""),
+                "responses": qa.get("responses") or [],
+                "audio_url": qa.get("audioUrl"),
+                "qa_type": qa.get("qaType", ""),
+                "order": qa.get("order") or qa_index,
+                "scene_id": sub_scene.get("sceneId") or scene_id,
+            })
+    return rows
+
+
+class FileQASource:
+    """从子场景 JSON 文件读取问答对：进程池并行解析，内存中按 scene_id / qa_id 建索引"""
+
+    name = "files"
+
+    def __init__(
+        self,
+        data_dir: Path = SUB_SCENES_DIR,
+        workers: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        """workers: 解析进程数；None 时按文件数自动选择串行或进程池（进程数=CPU 数），1 为串行"""
+        self.data_dir = Path(data_dir)
+        self.chunk_size = chunk_size
+        self.by_scene: Dict[str, List[Dict[str, Any]]] = {}
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self._load(workers)
+
+    def _load(self, workers: Optional[int]) -> None:
+        files = sorted(str(p) for p in self.data_dir.glob("*.json"))
+        if not files:
+            print(f"❌ 错误: 子场景目录中没有 JSON 文件: {self.data_dir}")
+            sys.exit(1)
+
+        if workers == 1 or (workers is None and len(files) < PARALLEL_PARSE_MIN_FILES):
+            results = [(path, parse_sub_scene_file(path)) for path in files]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunksize = max(1, len(files) // ((workers or os.cpu_count() or 1) * 4))
+                results = list(zip(files, pool.map(parse_sub_scene_file, files, chunksize=chunksize)))
+
+        for path, rows in results:
+            for row in rows:
+                if row["id"] in self.by_id:
+                    print(f"  ⚠️ 问答对 ID 重复，保留先出现的: {row['id']}（{Path(path).name}）")
+                    continue
+                self.by_id[row["id"]] = row
+                self.by_scene.setdefault(row["scene_id"], []).append(row)
+
+        for rows in self.by_scene.values():
+            rows.sort(key=lambda row: (row["sub_scene_id"], row["order"], row["id"]))
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def get(self, qa_id: str) -> Optional[Dict[str, Any]]:
+        return self.by_id.get(qa_id)
+
+    def select(self, scene_ids: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """按场景过滤（顺序与数据库读取一致）"""
+        if not scene_ids:
+            scene_ids = list(self.by_scene)
+        missing = [scene_id for scene_id in scene_ids if scene_id not in self.by_scene]
+        if missing:
+            print(f"  ⚠️ 子场景文件中没有这些场景: {', '.join(missing)}")
+        rows = [row for scene_id in scene_ids for row in self.by_scene.get(scene_id, [])]
+        rows.sort(key=lambda row: (row["sub_scene_id"], row["order"], row["id"]))
+        return rows
+
+    def iter_qa_pair_chunks(self, scene_ids: Optional[Sequence[str]] = None) -> Iterator[List[Dict[str, Any]]]:
+        rows = self.select(scene_ids)
+        for start in range(0, len(rows), self.chunk_size):
+            # 返回副本，调用方修改不会影响索引
+            yield [dict(row) for row in rows[start:start + self.chunk_size]]
+
+    def iter_qa_pairs(self, scene_ids: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+        for chunk in self.iter_qa_pair_chunks(scene_ids):
+            yield from chunk
+
+    async def aiter_qa_pair_chunks(self, scene_ids: Optional[Sequence[str]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        for chunk in self.iter_qa_pair_chunks(scene_ids):
+            yield chunk
+            await asyncio.sleep(0)
+
+
+def open_qa_source(name: str = "db", **kwargs):
+    """按名称创建数据源: db=Postgres，files=子场景 JSON 文件"""
+    if name == "db":
+        return PostgresQASource(**kwargs)
+    if name == "files":
+        return FileQASource(**kwargs)
+    raise ValueError(f"未知的问答对数据源: {name}（可选: {', '.join(SOURCE_NAMES)}）")
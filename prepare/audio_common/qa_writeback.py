@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传完成后把 COS 路径批量回写到 qa_pairs
+
+- qa_pairs.audio_url               -> COS:/qa/questions/{qa_id}.mp3
+- qa_pairs.responses[i].audio_url  -> COS:/qa/responses/{qa_id}_response{i}.mp3
+
+使用 execute_values + UPDATE ... FROM (VALUES ...) 按批提交，每批一个事务；
+值未变化的行不会被改写。
+
+referenced_cos_keys() 反向读取数据库中仍被引用的 COS Key（清理孤立音频时保留这些对象）。
+"""
+
+import json
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from psycopg2.extras import execute_values
+
+from .metrics import metrics
+
+DEFAULT_BATCH_SIZE = 500
+COS_URL_PREFIX = "COS:/"
+
+QUESTION_UPDATE_SQL = """
+    UPDATE qa_pairs AS qp
+    SET audio_url = v.audio_url,
+        updated_at = CURRENT_TIMESTAMP
+    FROM (VALUES %s) AS v(id, audio_url)
+    WHERE qp.id = v.id
+      AND qp.audio_url IS DISTINCT FROM v.audio_url
+"""
+
+# v.urls 形如 {"0": "COS:/...", "2": "COS:/..."}，键为 responses 数组下标
+RESPONSE_UPDATE_SQL = """
+    UPDATE qa_pairs AS qp
+    SET responses = (
+            SELECT jsonb_agg(
+                CASE WHEN v.urls ? (e.ord - 1)::text
+                     THEN jsonb_set(e.elem, '{audio_url}', v.urls -> (e.ord - 1)::text)
+                     ELSE e.elem
+                END
+                ORDER BY e.ord
+            )
+            FROM jsonb_array_elements(qp.responses) WITH ORDINALITY AS e(elem, ord)
+        ),
+        updated_at = CURRENT_TIMESTAMP
+    FROM (VALUES %s) AS v(id, urls)
+    WHERE qp.id = v.id
+      AND EXISTS (
+            SELECT 1
+            FROM jsonb_array_elements(qp.responses) WITH ORDINALITY AS e(elem, ord)
+            WHERE v.urls ? (e.ord - 1)::text
+              AND e.elem ->> 'audio_url' IS DISTINCT FROM v.urls ->> (e.ord - 1)::text
+      )
+"""
+
+# 不关联 sub_scenes：所属子场景已删除的问答对仍引用的音频也要保留
+REFERENCED_URLS_SQL = """
+    SELECT qp.audio_url FROM qa_pairs AS qp
+    WHERE qp.audio_url LIKE 'COS:/%'
+    UNION
+    SELECT e.elem ->> 'audio_url' FROM qa_pairs AS qp
+    CROSS JOIN LATERAL jsonb_array_elements(
+        CASE WHEN jsonb_typeof(qp.responses) = 'array' THEN qp.responses ELSE '[]'::jsonb END
+    ) AS e(elem)
+    WHERE e.elem ->> 'audio_url' LIKE 'COS:/%'
+"""
+
+
+def cos_url(cos_path: str) -> str:
+    """COS Key -> 数据库中保存的 COS:/ 协议路径"""
+    return f"{COS_URL_PREFIX}{cos_path.lstrip('/')}"
+
+
+def cos_key(url: Optional[str]) -> Optional[str]:
+    """数据库中的 COS:/ 协议路径 -> COS Key（不是 COS 路径时返回 None）"""
+    if not url or not url.startswith(COS_URL_PREFIX):
+        return None
+    return url[len(COS_URL_PREFIX):].lstrip("/")
+
+
+def referenced_cos_keys(conn) -> Set[str]:
+    """qa_pairs.audio_url 与 responses[].audio_url 引用的全部 COS Key"""
+    with conn.cursor() as cursor:
+        cursor.execute(REFERENCED_URLS_SQL)
+        return {cos_key(url) for (url,) in cursor}
+
+
+class AudioUrlWriteback:
+    """线程安全地收集上传成功的音频，按批回写数据库"""
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.batch_size = max(1, batch_size)
+        self.questions: Dict[str, str] = {}
+        self.responses: Dict[str, Dict[str, str]] = defaultdict(dict)
+        self.updated = {"questions": 0, "responses": 0}
+        self._lock = threading.Lock()
+
+    def add_question(self, qa_id: str, cos_path: str) -> None:
+        with self._lock:
+            self.questions[qa_id] = cos_url(cos_path)
+
+    def add_response(self, qa_id: str, idx: int, cos_path: str) -> None:
+        with self._lock:
+            self.responses[qa_id][str(idx)] = cos_url(cos_path)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self.questions) + len(self.responses)
+
+    def _take(self, force: bool) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+        """取出待写入的行；非 force 时只取满批的部分"""
+        with self._lock:
+            questions = list(self.questions.items())
+            responses = [(qa_id, json.dumps(urls)) for qa_id, urls in self.responses.items()]
+            if not force:
+                questions = questions[: len(questions) - len(questions) % self.batch_size]
+                responses = responses[: len(responses) - len(responses) % self.batch_size]
+            for qa_id, _ in questions:
+                del self.questions[qa_id]
+            for qa_id, _ in responses:
+                del self.responses[qa_id]
+        return questions, responses
+
+    def flush(self, conn, force: bool = False) -> None:
+        """写入已收集的行（每批一个事务），force=False 时保留不足一批的尾部"""
+        questions, responses = self._take(force)
+
+        for i in range(0, len(questions), self.batch_size):
+            batch = questions[i:i + self.batch_size]
+            with metrics.stage("db_writeback", rows=len(batch)), conn, conn.cursor() as cursor:
+                execute_values(cursor, QUESTION_UPDATE_SQL, batch, page_size=len(batch))
+                self.updated["questions"] += cursor.rowcount
+
+        for i in range(0, len(responses), self.batch_size):
+            batch = responses[i:i + self.batch_size]
+            with metrics.stage("db_writeback", rows=len(batch)), conn, conn.cursor() as cursor:
+                execute_values(cursor, RESPONSE_UPDATE_SQL, batch, template="(%s, %s::jsonb)", page_size=len(batch))
+                self.updated["responses"] += cursor.rowcount
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+跨进程共享的令牌桶限速（SQLite）
+
+同一台机器上的多个分片进程打开同一个 SQLite 文件，每个键（如音色）一个令牌桶：
+每秒补充 rate 个令牌，最多积累 burst 个。取令牌在一个 BEGIN IMMEDIATE 事务中完成；
+令牌不足时直接预支（令牌数变为负数），按欠下的令牌数算出等待时间，等够再发请求，
+因此每次请求只访问一次数据库，不需要轮询。所有进程合计的请求速率不超过 rate。
+
+path 为 None 时使用内存数据库，只在本进程内限速。
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parent.parent / ".rate_limit.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key        TEXT PRIMARY KEY,
+    tokens     REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class SharedRateLimiter:
+    """每个键每秒最多 rate 次（所有共用同一数据库文件的进程合计）"""
+
+    def __init__(self, path: Optional[Path], rate: float, burst: float = 1.0):
+        self.path = Path(path) if path else None
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path or ":memory:"), isolation_level=None,
+                                    check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.execute(SCHEMA)
+        self._lock = threading.Lock()
+
+    def reserve(self, key: str) -> float:
+        """取一个令牌，返回发请求前还需等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self.conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+                tokens -= 1
+                self.conn.execute(
+                    "INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                    (key, tokens, now),
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return -tokens / self.rate if tokens < 0 else 0.0
+
+    async def acquire(self, key: str) -> None:
+        if self.rate <= 0:
+            return
+        # 等锁（其他进程正在取令牌）时不阻塞事件循环
+        wait = await asyncio.to_thread(self.reserve, key)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+运行计划：大批量生成/上传之前，一次性解析数据源、本地清单和上传状态，给出精确的工作量与耗时估计
+
+逐个音频的判断与生成/上传脚本一致，但只读、不逐个读文件:
+- 本地音频用一次 scandir 取得（AudioInventory），校验结果只查索引；
+  文件变化后还没校验过的按存在计（记为“未校验”，运行时才解析）
+- TTS 缓存与上传清单只查内存中的索引，不链接、不计算 MD5
+
+生成动作:
+  synthesize    本地没有（或未通过校验）且缓存中也没有 → 合成
+  resynthesize  本地文件由其他文本/音色生成（TTS 缓存记录的键不同），即文本变化 → 重新合成
+  link          缓存中已有该内容 → 直接链接，不请求 TTS
+  fresh         已是当前内容 → 跳过
+上传动作:
+  upload        将生成/链接的音频，或与上传清单不一致（从未上传、大小不同）的音频
+  recheck       大小相同但 mtime 变化：上传时比较 MD5，通常不需要上传
+  unchanged     与上传清单一致 → 跳过
+
+估计值来自吞吐历史：生成/上传脚本每次运行结束时把处理量和墙钟耗时追加到
+prepare/.audio_throughput.json（每种任务保留最近 MAX_RUNS 次）；没有历史时按默认延迟粗略估计，
+并在输出中注明。有限速时耗时不低于限速下限（每个音色的请求数 / 每秒请求数）。
+
+计划文件记录数据源、场景、TTS 后端和每个音频的动作；生成/上传脚本用 --plan 执行时只处理
+计划中需要合成/上传的音频，仍逐个按当前状态复核（计划生成后已完成的会被跳过）。
+"""
+
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .audio_inventory import AudioInventory
+from .audio_validator import AudioValidator
+from .json_index import read_json, save_merged, snapshot, write_json
+from .tts_batch import batched
+from .tts_cache import TTSCache
+from .upload_manifest import UploadManifest
+
+PLAN_VERSION = 1
+HISTORY_VERSION = 1
+DEFAULT_HISTORY_PATH = Path(__file__).parent.parent / ".audio_throughput.json"
+MAX_RUNS = 10
+
+SYNTHESIZE = "synthesize"
+RESYNTHESIZE = "resynthesize"
+LINK = "link"
+FRESH = "fresh"
+GENERATE_ACTIONS = (SYNTHESIZE, RESYNTHESIZE, LINK, FRESH)
+NEEDS_TTS = (SYNTHESIZE, RESYNTHESIZE)
+
+UPLOAD = "upload"
+RECHECK = "recheck"
+UNCHANGED = "unchanged"
+UPLOAD_ACTIONS = (UPLOAD, RECHECK, UNCHANGED)
+
+# 没有吞吐历史时的默认值
+DEFAULT_TTS_LATENCY = 1.5           # 单次 edge-tts 请求（秒）
+DEFAULT_BYTES_PER_CHAR = 450        # 48kbps MP3，约 14 个字符/秒
+DEFAULT_UPLOAD_LATENCY = 0.15       # 单个小文件上传（秒）
+
+
+class PlanError(Exception):
+    """计划文件不存在、版本不符或与当前脚本不匹配"""
+
+
+@dataclass
+class PlannedClip:
+    name: str               # 子目录/文件名（与任务日志的 clip_key 一致）
+    text: str
+    voice: str
+    cos_key: str
+    generate: str = FRESH
+    upload: str = UNCHANGED
+    size: int = 0           # 本地（链接时为缓存中）文件的字节数；需要合成的为 0
+    cache_key: str = ""
+
+
+# ============================================================
+# 逐个音频判断
+# ============================================================
+
+class ClipPlanner:
+    """按当前本地状态判断每个音频的生成/上传动作（只读，不修改任何文件和索引）"""
+
+    def __init__(
+        self,
+        audio_dir: Path,
+        subdirs: Sequence[str],
+        validator: AudioValidator,
+        cache: Optional[TTSCache],
+        manifest: Optional[UploadManifest],
+        engine: str,
+        rate: str,
+        force: bool = False,
+    ):
+        self.inventory = AudioInventory(audio_dir, subdirs)
+        # TTS 缓存按 resolve() 后的路径记录输出：目录只解析一次，逐个文件不再 realpath
+        self.resolved_dir = str(Path(audio_dir).resolve())
+        self.validator = validator
+        self.cache = cache
+        self.manifest = manifest
+        self.engine = engine
+        self.rate = rate
+        self.force = force
+        self.clips: List[PlannedClip] = []
+        self.unverified = 0
+        self.adopted = 0    # 索引中没有文本记录的已有文件（按当前文本收录，不进入缓存）
+
+    def add(self, name: str, text: str, voice: str, cos_key: str) -> PlannedClip:
+        path = os.path.join(self.inventory.root, name)
+        entry = self.inventory.entries.get(path)
+        st = entry.stat() if entry is not None else None
+        valid = st is not None
+        if st is not None:
+            result = self.validator.cached(path, st)
+            if result is None:
+                self.unverified += 1
+            else:
+                valid = result.ok
+        clip = PlannedClip(name, text, voice, cos_key, size=st.st_size if valid else 0)
+        clip.generate = self._generate_action(clip, valid)
+        clip.upload = self._upload_action(clip, st)
+        self.clips.append(clip)
+        return clip
+
+    def _generate_action(self, clip: PlannedClip, valid: bool) -> str:
+        """与生成脚本的 plan_clip / TTSCache.resolve 一致"""
+        if self.cache is None:
+            return SYNTHESIZE if self.force or not valid else FRESH
+        clip.cache_key = self.cache.key(clip.text, clip.voice, self.rate, self.engine)
+        if self.force:
+            return RESYNTHESIZE if valid else SYNTHESIZE
+        if valid:
+            recorded = self.cache.outputs.get(os.path.join(self.resolved_dir, clip.name))
+            if recorded == clip.cache_key:
+                return FRESH
+            if recorded is None:
+                # resolve() 只把它记为当前文本的输出，不放入缓存：不影响其他音频的链接判断
+                self.adopted += 1
+                return FRESH
+        try:
+            clip.size = self.cache.path_for(clip.cache_key).stat().st_size
+            return LINK
+        except FileNotFoundError:
+            clip.size = 0
+        return RESYNTHESIZE if valid else SYNTHESIZE
+
+    def _upload_action(self, clip: PlannedClip, st: Optional[os.stat_result]) -> str:
+        """与 UploadManifest.is_unchanged 一致（mtime 变化时不计算 MD5，记为 recheck）"""
+        entry = self.manifest.entries.get(clip.cos_key) if self.manifest else None
+        if clip.generate != FRESH:
+            # 从缓存链接的内容可能与上次上传的相同（如本地文件被删除后恢复），上传时按 MD5 判断
+            if clip.generate == LINK and entry and entry["size"] == clip.size:
+                return RECHECK
+            return UPLOAD
+        if not entry or entry["size"] != st.st_size:
+            return UPLOAD
+        return UNCHANGED if entry["mtime_ns"] == st.st_mtime_ns else RECHECK
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        generate = dict.fromkeys(GENERATE_ACTIONS, 0)
+        upload = dict.fromkeys(UPLOAD_ACTIONS, 0)
+        for clip in self.clips:
+            generate[clip.generate] += 1
+            upload[clip.upload] += 1
+        return {"generate": generate, "upload": upload}
+
+    def tts_texts(self) -> Dict[str, List[str]]:
+        """需要请求 TTS 的文本（按音色分组；文本与音色相同的只合成一次，其余从缓存链接）"""
+        seen = set()
+        texts: Dict[str, List[str]] = {}
+        for clip in self.clips:
+            if clip.generate not in NEEDS_TTS:
+                continue
+            key = clip.cache_key or clip.name
+            if key in seen:
+                continue
+            seen.add(key)
+            texts.setdefault(clip.voice, []).append(clip.text)
+        return texts
+
+
+# ============================================================
+# 吞吐历史与估计
+# ============================================================
+
+class ThroughputHistory:
+    """各任务最近几次运行的处理量与墙钟耗时（生成/上传脚本结束时追加，规划时据此估计）"""
+
+    def __init__(self, path: Path = DEFAULT_HISTORY_PATH):
+        self.path = Path(path)
+        self.runs: Dict[str, Dict[str, Any]] = {}
+        data = read_json(self.path)
+        if data and data.get("version") == HISTORY_VERSION:
+            self.runs = data.get("runs", {})
+        self._saved = snapshot({"runs": self.runs})
+
+    def record(self, job: str, seconds: float, **totals: float) -> None:
+        """追加一次运行并立即保存（与其他进程写入的条目合并），该任务只保留最近 MAX_RUNS 次"""
+        if seconds <= 0:
+            return
+        self.runs[f"{job}/{time.time_ns()}-{os.getpid()}"] = {
+            "job": job, "ts": round(time.time(), 3), "seconds": round(seconds, 3), **totals,
+        }
+        recent = sorted((run["ts"], key) for key, run in self.runs.items() if run.get("job") == job)
+        for _, key in recent[:-MAX_RUNS]:
+            del self.runs[key]
+        merged = save_merged(self.path, {"runs": self.runs}, self._saved, header={"version": HISTORY_VERSION})
+        self.runs = merged["runs"]
+        self._saved = snapshot({"runs": self.runs})
+
+    def totals(self, job: str) -> Optional[Dict[str, float]]:
+        """该任务最近几次运行的合计（含 runs 次数），没有历史时返回 None"""
+        totals: Dict[str, float] = {}
+        for run in self.runs.values():
+            if run.get("job") != job:
+                continue
+            totals["runs"] = totals.get("runs", 0) + 1
+            for name, value in run.items():
+                if name != "ts" and isinstance(value, (int, float)):
+                    totals[name] = totals.get(name, 0) + value
+        return totals or None
+
+
+def estimate_generation(
+    texts: Dict[str, List[str]],
+    batch_size: int,
+    concurrency: int,
+    voice_rate: float,
+    history: Optional[Dict[str, float]],
+) -> Dict[str, Any]:
+    """按音色分批（与生成脚本相同的规则）得到请求数，再按历史吞吐估计字节数和耗时"""
+    requests_by_voice = {
+        voice: len(batched(voice_texts, batch_size)) if batch_size > 1 else len(voice_texts)
+        for voice, voice_texts in texts.items()
+    }
+    requests = sum(requests_by_voice.values())
+    chars = sum(len(text) for voice_texts in texts.values() for text in voice_texts)
+    if history and history.get("requests") and history.get("chars"):
+        seconds = requests * history["seconds"] / history["requests"]
+        bytes_per_char = history.get("bytes", 0) / history["chars"] or DEFAULT_BYTES_PER_CHAR
+        basis = f"最近 {int(history['runs'])} 次运行"
+    else:
+        seconds = requests * DEFAULT_TTS_LATENCY / max(1, concurrency)
+        bytes_per_char = DEFAULT_BYTES_PER_CHAR
+        basis = "默认值（没有吞吐历史）"
+    if voice_rate > 0:
+        seconds = max(seconds, max(requests_by_voice.values(), default=0) / voice_rate)
+    return {"requests": requests, "chars": chars, "bytes": round(chars * bytes_per_char),
+            "seconds": round(seconds, 1), "basis": basis}
+
+
+def estimate_upload(files: int, size: int, workers: int, history: Optional[Dict[str, float]]) -> Dict[str, Any]:
+    """按历史的文件数/秒与字节数/秒（取较慢者）估计上传耗时"""
+    if history and history.get("files"):
+        seconds = max(files * history["seconds"] / history["files"],
+                      size * history["seconds"] / history["bytes"] if history.get("bytes") else 0.0)
+        basis = f"最近 {int(history['runs'])} 次运行"
+    else:
+        seconds = files * DEFAULT_UPLOAD_LATENCY / max(1, workers)
+        basis = "默认值（没有吞吐历史）"
+    return {"files": files, "bytes": size, "seconds": round(seconds, 1), "basis": basis}
+
+
+# ============================================================
+# 计划文件
+# ============================================================
+
+def write_plan(path: Path, target: str, settings: Dict[str, Any], clips: Sequence[PlannedClip],
+               summary: Dict[str, Any]) -> None:
+    """写出计划：各阶段需要处理的音频按动作列出（跳过的只计数，不列出）"""
+    write_json(path, {
+        "version": PLAN_VERSION,
+        "created": round(time.time()),
+        "target": target,
+        **settings,
+        "summary": summary,
+        "generate": {action: [clip.name for clip in clips if clip.generate == action]
+                     for action in (SYNTHESIZE, RESYNTHESIZE, LINK)},
+        "upload": {action: [clip.name for clip in clips if clip.upload == action] for action in (UPLOAD, RECHECK)},
+    })
+
+
+def read_plan(path: Path, target: str) -> Dict[str, Any]:
+    """读取计划文件，不存在、版本不符或不是 target 的计划时抛出 PlanError"""
+    plan = read_json(path)
+    if plan is None:
+        raise PlanError(f"无法读取计划文件: {path}")
+    if plan.get("version") != PLAN_VERSION:
+        raise PlanError(f"计划文件版本不符（{plan.get('version')}），请重新运行 plan_audio.py")
+    if plan.get("target") != target:
+        raise PlanError(f"计划文件是 {plan.get('target')} 的计划，不能用于 {target}")
+    return plan
+
+
+def plan_selector(plan: Dict[str, Any], stage: str) -> Callable[[str], bool]:
+    """计划中该阶段（generate / upload）需要处理的音频 -> 筛选函数（与任务日志的 selector 用法相同）"""
+    names = set()
+    for clip_names in plan.get(stage, {}).values():
+        names.update(clip_names)
+    return names.__contains__
+
+
+def describe_plan(plan: Dict[str, Any], stage: str) -> str:
+    created = time.strftime("%Y-%m-%d %H:%M", time.localtime(plan.get("created", 0)))
+    counts = ", ".join(f"{action} {len(names)}" for action, names in plan.get(stage, {}).items())
+    return f"{created} 生成的计划（{counts}）"
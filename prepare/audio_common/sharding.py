@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+确定性分片：--shard i/N 把问答对 / 短语分给 N 个进程（或 N 台机器）
+
+分配方式（ShardAssigner，各进程按相同顺序读取同一数据源，各自算出相同的结果）:
+- 每个 ID 按稳定哈希对全部分片排序（rendezvous 哈希），优先分给排名第一的分片，
+  因此数据增删时绝大多数 ID 的归属不变（上次生成的文件、TTS 缓存仍在原来的机器上）
+- 权重按文本长度计（每条音频另加固定开销）；某分片的负载超过平均值的 (1 + LOAD_SLACK) 倍时，
+  顺延给排名下一位的分片，各分片的总工作量因此大致相同，能在相近的时间完成
+
+生成与上传必须使用相同的 --shard、--source 和 --scenes，同一个分片才会拿到同一批音频。
+各分片用 --stats-json 写出统计，由启动器（qa_audio/run_shards.py）合并。
+"""
+
+import argparse
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+from .json_index import write_json
+
+CLIP_OVERHEAD = 40      # 每条音频的固定开销（折算为字符数：请求往返、写文件、校验）
+LOAD_SLACK = 0.1        # 允许分片负载超过平均值的比例
+
+MASK64 = (1 << 64) - 1
+
+
+@dataclass(frozen=True)
+class Shard:
+    index: int
+    count: int
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    @property
+    def label(self) -> str:
+        """用于文件名和指标标签（不含 /）"""
+        return f"shard{self.index}of{self.count}"
+
+
+def parse_shard(value: str) -> Shard:
+    """argparse 的 type：解析 "i/N"（0 <= i < N）"""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"分片格式应为 i/N（如 0/4）: {value}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"分片序号应满足 0 <= i < N: {value}")
+    return Shard(index, count)
+
+
+def text_weight(texts: Iterable[str]) -> int:
+    """一组待合成文本的工作量（空文本不生成音频，不计入）"""
+    return sum(len(text) + CLIP_OVERHEAD for text in texts if text)
+
+
+def qa_pair_weight(qa: Dict[str, Any]) -> int:
+    """问答对的工作量：问题 + 各答案（生成与上传脚本共用，保证分配结果一致）"""
+    responses = qa.get("responses") or []
+    return text_weight([qa.get("speaker_text") or "", *((r or {}).get("text", "") for r in responses)])
+
+
+def _mix(value: int) -> int:
+    """splitmix64 的混合函数"""
+    value = (value + 0x9E3779B97F4A7C15) & MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+    return value ^ (value >> 31)
+
+
+def shard_ranking(key: str, count: int) -> List[int]:
+    """ID 对各分片的稳定排名（rendezvous 哈希，与进程、Python 版本无关）"""
+    seed = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+    return sorted(range(count), key=lambda shard: _mix(seed ^ (shard * 0xD6E8FEB86659FD93 & MASK64)), reverse=True)
+
+
+class ShardAssigner:
+    """
+    按数据源顺序逐个分配；每个 ID 都要经过 owns()（包括不属于本分片的），
+    各进程的负载记录才会保持一致
+    """
+
+    def __init__(self, shard: Shard):
+        self.shard = shard
+        self.loads = [0] * shard.count
+        self.total = 0
+        self.stats = {"owned": 0, "other": 0, "owned_weight": 0}
+
+    def owner(self, key: str, weight: int) -> int:
+        ranking = shard_ranking(key, self.shard.count)
+        self.total += weight
+        limit = (1 + LOAD_SLACK) * self.total / self.shard.count
+        target = next((s for s in ranking if self.loads[s] + weight <= limit), None)
+        if target is None:
+            # 所有分片都会超限（开头几项或单项很重时）：给负载最小的
+            target = min(ranking, key=lambda s: self.loads[s])
+        self.loads[target] += weight
+        return target
+
+    def owns(self, key: str, weight: int) -> bool:
+        owned = self.owner(key, weight) == self.shard.index
+        if owned:
+            self.stats["owned"] += 1
+            self.stats["owned_weight"] += weight
+        else:
+            self.stats["other"] += 1
+        return owned
+
+    def describe(self) -> str:
+        share = self.stats["owned_weight"] / self.total if self.total else 0.0
+        return (f"分片 {self.shard}: 本分片 {self.stats['owned']} 项（工作量占 {share:.1%}），"
+                f"其他分片 {self.stats['other']} 项")
+
+
+# ============================================================
+# 统计汇总
+# ============================================================
+
+def write_stats(path: Path, stats: Dict[str, Any]) -> None:
+    """写出本分片的统计（数值字段由启动器逐项相加）"""
+    write_json(path, stats)
+
+
+def merge_stats(parts: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """逐项相加各分片的数值统计（保持首次出现的字段顺序）"""
+    merged: Dict[str, Any] = {}
+    for part in parts:
+        for key, value in part.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            merged[key] = merged.get(key, 0) + value
+    return merged
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+TTS 后端：生成脚本通过统一接口合成，edge-tts 只是其中一个实现
+
+- edge:   edge-tts（远程服务，默认）；流式合成时同时取得单词时间（word_timings），可批量合成后切分（tts_batch）
+- piper:  Piper 神经网络 TTS（本机 CPU，离线）；每个 worker 进程启动时加载一次所用音色的模型
+- espeak: eSpeak NG（本机 CPU，离线，无需模型文件，音质一般，适合基准测试与 CI）
+
+本地后端在进程池中合成 WAV，再用 ffmpeg 转为与 edge-tts 相同规格的 MP3（24kHz 48kbps 单声道，
+不带 ID3/Xing 头），后续的校验、切分、后处理、上传流程不需要区分来源。
+
+音色映射：脚本中的音色常量（QUESTION_VOICE、ANSWER_VOICES、VOICE）使用 edge-tts 音色名，
+其他后端按 DEFAULT_VOICE_MAPS 换成本地音色，可用 --voice-map 指定 JSON 文件覆盖:
+    {"piper": {"en-US-AriaNeural": "en_US-amy-medium"}, "espeak": {"en-US-AriaNeural": "en-us+f2"}}
+TTS 缓存的键包含映射后的音色和后端版本（engine），不同后端生成的音频不会互相命中。
+
+依赖:
+- edge:   edge-tts
+- piper:  pip install piper-tts，模型（{音色}.onnx + {音色}.onnx.json）放在 PIPER_MODEL_DIR
+          （默认 prepare/.tts_models/piper/），下载地址 https://huggingface.co/rhasspy/piper-voices
+- espeak: espeak-ng（PATH 中或 ESPEAK_BIN 指定）
+- 本地后端均需要 ffmpeg（PATH 中或 FFMPEG_BIN 指定）
+"""
+
+import asyncio
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from importlib import metadata
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from . import tts_batch, word_timings
+from .postprocess import PostProcessError, ffmpeg_bin
+
+BACKEND_NAMES = ["edge", "piper", "espeak"]
+
+DEFAULT_PIPER_MODEL_DIR = Path(__file__).resolve().parent.parent / ".tts_models" / "piper"
+ESPEAK_WPM = 175            # eSpeak 默认语速（单词/分钟），"+20%" 即 210
+
+# 与 edge-tts 输出一致的 MP3 参数
+MP3_ARGS = ["-ac", "1", "-ar", "24000", "-c:a", "libmp3lame", "-b:a", "48k",
+            "-write_xing", "0", "-id3v2_version", "0", "-f", "mp3"]
+
+# edge-tts 音色 -> 各后端的本地音色
+DEFAULT_VOICE_MAPS: Dict[str, Dict[str, str]] = {
+    "piper": {
+        "en-US-AriaNeural": "en_US-amy-medium",
+        "en-US-JennyNeural": "en_US-lessac-medium",
+        "en-GB-SoniaNeural": "en_GB-alba-medium",
+        "en-US-DavisNeural": "en_US-ryan-medium",
+    },
+    "espeak": {
+        "en-US-AriaNeural": "en-us+f3",
+        "en-US-JennyNeural": "en-us+f4",
+        "en-GB-SoniaNeural": "en-gb+f2",
+        "en-US-DavisNeural": "en-us+m3",
+    },
+}
+
+
+class TTSBackendError(Exception):
+    """后端不可用（缺少依赖/模型/音色映射）或本地合成失败"""
+
+
+def rate_factor(rate: str) -> float:
+    """edge-tts 语速（"+20%" / "-10%"）-> 倍数（1.2 / 0.9）"""
+    match = re.fullmatch(r"\s*([+-]?\d+(?:\.\d+)?)%\s*", rate or "+0%")
+    if not match:
+        raise TTSBackendError(f"无法解析语速: {rate}")
+    return max(0.1, 1 + float(match.group(1)) / 100)
+
+
+def load_voice_map(backend: str, path: Optional[Path] = None) -> Dict[str, str]:
+    """后端的音色映射：默认映射，再用 JSON 文件中该后端的部分覆盖"""
+    voices = dict(DEFAULT_VOICE_MAPS.get(backend, {}))
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            voices.update(json.load(f).get(backend, {}))
+    return voices
+
+
+# ============================================================
+# 接口
+# ============================================================
+
+class TTSBackend:
+    """TTS 后端接口：合成返回 MP3 数据，音色名按映射转换"""
+
+    name = ""
+    remote = False              # 远程服务：需要按音色限速
+    supports_batch = False      # 能返回单词边界，可批量合成后切分
+    supports_timings = False    # 合成时能给出单词时间
+
+    def __init__(self, voice_map: Optional[Dict[str, str]] = None):
+        self.voice_map = voice_map or {}
+
+    @property
+    def engine(self) -> str:
+        """后端及版本（TTS 缓存键的一部分）"""
+        raise NotImplementedError
+
+    def voice(self, name: str) -> str:
+        """脚本中的音色名（edge-tts 音色）-> 本后端的音色"""
+        return self.voice_map.get(name, name)
+
+    def check_voices(self, names: Iterable[str]) -> List[str]:
+        """启动时检查所需音色都可用，返回映射后的音色"""
+        return [self.voice(name) for name in names]
+
+    async def synthesize(self, text: str, voice: str, rate: str) -> bytes:
+        """合成一条文本（voice 为映射后的音色），失败时抛出异常"""
+        raise NotImplementedError
+
+    async def synthesize_words(self, text: str, voice: str, rate: str) -> Tuple[bytes, Optional[word_timings.Words]]:
+        """合成一条文本并给出单词时间（相对音频开头，毫秒）；不支持时单词时间为 None"""
+        return await self.synthesize(text, voice, rate), None
+
+    async def synthesize_batch(
+        self, texts: Sequence[str], voice: str, rate: str
+    ) -> Optional[List[Tuple[bytes, Optional[word_timings.Words]]]]:
+        """一次合成多条并切分，返回 (MP3 数据, 单词时间)；不支持或无法切分时返回 None"""
+        return None
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "TTSBackend":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# ============================================================
+# edge-tts
+# ============================================================
+
+class EdgeBackend(TTSBackend):
+    name = "edge"
+    remote = True
+    supports_batch = True
+    supports_timings = True
+
+    def __init__(self, voice_map: Optional[Dict[str, str]] = None):
+        super().__init__(voice_map)
+        try:
+            import edge_tts
+        except ImportError:
+            raise TTSBackendError("edge 后端需要 edge-tts，请先安装: pip install edge-tts")
+        self._edge_tts = edge_tts
+
+    @property
+    def engine(self) -> str:
+        return f"edge-tts/{getattr(self._edge_tts, '__version__', 'unknown')}"
+
+    async def synthesize(self, text: str, voice: str, rate: str) -> bytes:
+        return (await self.synthesize_words(text, voice, rate))[0]
+
+    async def synthesize_words(self, text: str, voice: str, rate: str) -> Tuple[bytes, Optional[word_timings.Words]]:
+        audio, boundaries = await tts_batch.stream_synthesis(text, voice, rate)
+        # 没有单词边界（旧版本只返回句子边界等）时不写时间信息
+        return audio, word_timings.to_words(boundaries) or None
+
+    async def synthesize_batch(
+        self, texts: Sequence[str], voice: str, rate: str
+    ) -> Optional[List[Tuple[bytes, Optional[word_timings.Words]]]]:
+        return await tts_batch.synthesize_batch(texts, voice, rate)
+
+
+# ============================================================
+# 本地引擎（在 worker 进程中执行）
+# ============================================================
+
+def wav_to_mp3(wav: bytes) -> bytes:
+    proc = subprocess.run([ffmpeg_bin(), "-v", "error", "-f", "wav", "-i", "pipe:0", *MP3_ARGS, "pipe:1"],
+                          input=wav, capture_output=True)
+    if proc.returncode != 0 or not proc.stdout:
+        raise TTSBackendError(f"MP3 编码失败: {proc.stderr.decode(errors='replace').strip()}")
+    return proc.stdout
+
+
+class PiperEngine:
+    """每个 worker 进程一个实例，启动时加载所用音色的模型"""
+
+    def __init__(self, model_dir: str, voices: Sequence[str] = ()):
+        from piper import PiperVoice
+        self._piper_voice = PiperVoice
+        self.model_dir = Path(model_dir)
+        self._voices = {}
+        for voice in voices:
+            self._load(voice)
+
+    def _load(self, voice: str):
+        model = self._piper_voice.load(str(self.model_dir / f"{voice}.onnx"))
+        self._voices[voice] = model
+        return model
+
+    def synthesize_wav(self, text: str, voice: str, speed: float) -> bytes:
+        model = self._voices.get(voice) or self._load(voice)
+        length_scale = getattr(model.config, "length_scale", 1.0) / speed
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav_file:
+            if hasattr(model, "synthesize_wav"):
+                # piper-tts >= 1.3
+                from piper import SynthesisConfig
+                model.synthesize_wav(text, wav_file, syn_config=SynthesisConfig(length_scale=length_scale))
+            else:
+                model.synthesize(text, wav_file, length_scale=length_scale)
+        return buffer.getvalue()
+
+
+class EspeakEngine:
+    def __init__(self, binary: str, voices: Sequence[str] = ()):
+        self.binary = binary
+
+    def synthesize_wav(self, text: str, voice: str, speed: float) -> bytes:
+        # 文本从标准输入传入，避免以 "-" 开头的文本被当作参数
+        proc = subprocess.run([self.binary, "-v", voice, "-s", str(round(ESPEAK_WPM * speed)), "--stdout"],
+                              input=text.encode("utf-8"), capture_output=True)
+        if proc.returncode != 0 or not proc.stdout:
+            raise TTSBackendError(f"espeak-ng 合成失败: {proc.stderr.decode(errors='replace').strip()}")
+        return proc.stdout
+
+
+_worker_engine = None
+
+
+def _init_worker(engine_class, options: Dict) -> None:
+    global _worker_engine
+    _worker_engine = engine_class(**options)
+
+
+def _synthesize_in_worker(text: str, voice: str, speed: float) -> bytes:
+    return wav_to_mp3(_worker_engine.synthesize_wav(text, voice, speed))
+
+
+# ============================================================
+# 本地后端（进程池）
+# ============================================================
+
+class LocalBackend(TTSBackend):
+    """本机 CPU 合成：workers 个进程，每个进程只初始化一次引擎"""
+
+    engine_class = None
+
+    def __init__(self, voice_map: Optional[Dict[str, str]] = None, workers: Optional[int] = None):
+        super().__init__(voice_map)
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self._voices: List[str] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+        try:
+            ffmpeg_bin()
+        except PostProcessError as e:
+            raise TTSBackendError(str(e))
+
+    def voice(self, name: str) -> str:
+        voice = self.voice_map.get(name)
+        if not voice:
+            raise TTSBackendError(f"{self.name} 后端没有音色 {name} 的映射，请在 --voice-map 中配置")
+        return voice
+
+    def check_voices(self, names: Iterable[str]) -> List[str]:
+        voices = super().check_voices(names)
+        self._voices = sorted(set(self._voices) | set(voices))
+        return voices
+
+    def engine_options(self) -> Dict:
+        raise NotImplementedError
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            options = {**self.engine_options(), "voices": self._voices}
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             initargs=(self.engine_class, options))
+        return self._pool
+
+    async def synthesize(self, text: str, voice: str, rate: str) -> bytes:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, _synthesize_in_worker, text, voice, rate_factor(rate))
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+class PiperBackend(LocalBackend):
+    name = "piper"
+    engine_class = PiperEngine
+
+    def __init__(self, voice_map: Optional[Dict[str, str]] = None, workers: Optional[int] = None):
+        try:
+            import piper  # noqa: F401
+        except ImportError:
+            raise TTSBackendError("piper 后端需要 piper-tts，请先安装: pip install piper-tts")
+        super().__init__(voice_map, workers)
+        self.model_dir = Path(os.getenv("PIPER_MODEL_DIR") or DEFAULT_PIPER_MODEL_DIR)
+
+    @property
+    def engine(self) -> str:
+        try:
+            version = metadata.version("piper-tts")
+        except metadata.PackageNotFoundError:
+            version = "unknown"
+        return f"piper/{version}"
+
+    def check_voices(self, names: Iterable[str]) -> List[str]:
+        voices = super().check_voices(names)
+        missing = [voice for voice in voices if not (self.model_dir / f"{voice}.onnx").exists()]
+        if missing:
+            raise TTSBackendError(f"找不到 Piper 模型（{self.model_dir}）: {', '.join(f'{v}.onnx' for v in missing)}")
+        return voices
+
+    def engine_options(self) -> Dict:
+        return {"model_dir": str(self.model_dir)}
+
+
+class EspeakBackend(LocalBackend):
+    name = "espeak"
+    engine_class = EspeakEngine
+
+    def __init__(self, voice_map: Optional[Dict[str, str]] = None, workers: Optional[int] = None):
+        self.binary = os.getenv("ESPEAK_BIN") or shutil.which("espeak-ng") or shutil.which("espeak")
+        if not self.binary:
+            raise TTSBackendError("找不到 espeak-ng，请安装 espeak-ng 或设置 ESPEAK_BIN 环境变量")
+        super().__init__(voice_map, workers)
+        self._engine = ""
+
+    @property
+    def engine(self) -> str:
+        if not self._engine:
+            proc = subprocess.run([self.binary, "--version"], capture_output=True, text=True)
+            match = re.search(r"(\d+(?:\.\d+)+)", proc.stdout)
+            self._engine = f"espeak-ng/{match.group(1) if match else 'unknown'}"
+        return self._engine
+
+    def engine_options(self) -> Dict:
+        return {"binary": self.binary}
+
+
+BACKENDS = {"edge": EdgeBackend, "piper": PiperBackend, "espeak": EspeakBackend}
+
+
+def open_backend(name: str = "edge", voice_map_path: Optional[Path] = None, workers: Optional[int] = None) -> TTSBackend:
+    """按名称创建后端（缺少依赖时抛出 TTSBackendError）"""
+    voice_map = load_voice_map(name, voice_map_path)
+    if name == "edge":
+        return EdgeBackend(voice_map)
+    return BACKENDS[name](voice_map, workers)
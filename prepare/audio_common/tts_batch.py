@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+批量 TTS：把同一音色、语速的多条短文本合成一次，再按单词边界切回每条的音频
+
+短语、示例、问答多为 2~6 个单词，单独合成时握手和建连的耗时远大于合成本身。
+批量模式下:
+  1. 各条文本补齐句末标点后用换行拼接，一次请求合成（句间有自然停顿）
+  2. 从 edge-tts 流中收集 WordBoundary 事件，按顺序把单词对齐回各条文本，得到每条的起止时间
+  3. 在相邻两条之间停顿的中点、最近的 MP3 帧边界处切开（audio_common.mp3）
+  4. 单词按各片段在整段音频中的起止时间分配，换算为相对片段开头的时间（word_timings）
+
+对齐失败（引擎返回的单词与原文对不上、单词数不符等）时返回 None，调用方应逐条单独合成。
+批量合成的语调与单独合成略有差异，因此只作为可选模式（各脚本的 --batch-size）。
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple, TypeVar
+
+from . import mp3, word_timings
+
+TICKS_PER_SECOND = 10_000_000       # WordBoundary 的 offset/duration 单位为 100ns
+
+DEFAULT_BATCH_SIZE = 1              # 1 表示不批量
+MAX_BATCH_CHARS = 1000              # 单批文本总长度上限（edge-tts 单次请求约 4KB）
+
+SENTENCE_END = re.compile(r"[.!?。！？…][\"'”’)\]]*\s*$")
+WORD_CHAR = re.compile(r"\w")
+
+T = TypeVar("T")
+
+
+@dataclass
+class WordBoundary:
+    offset: int         # 100ns
+    duration: int       # 100ns
+    text: str
+
+
+def batched(items: Sequence[T], batch_size: int, text_of=lambda item: item) -> List[List[T]]:
+    """按条数和总字符数分批，保持原有顺序"""
+    batches: List[List[T]] = []
+    current: List[T] = []
+    chars = 0
+    for item in items:
+        length = len(text_of(item))
+        if current and (len(current) >= batch_size or chars + length > MAX_BATCH_CHARS):
+            batches.append(current)
+            current, chars = [], 0
+        current.append(item)
+        chars += length
+    if current:
+        batches.append(current)
+    return batches
+
+
+def join_texts(texts: Sequence[str]) -> str:
+    """补齐句末标点后换行拼接，保证相邻两条之间有停顿"""
+    lines = []
+    for text in texts:
+        text = " ".join(text.split())
+        lines.append(text if SENTENCE_END.search(text) else f"{text}.")
+    return "\n".join(lines)
+
+
+def align_words(texts: Sequence[str], boundaries: Sequence[WordBoundary]) -> Optional[List[Tuple[int, int]]]:
+    """
+    把单词边界依次对齐到各条文本，返回每条的 (开始, 结束)（100ns）
+    每个单词必须紧接着上一个单词出现在原文中（中间只允许标点和空白），否则视为对齐失败
+    """
+    words = [b for b in boundaries if WORD_CHAR.search(b.text)]
+    spans: List[Tuple[int, int]] = []
+    index = 0
+    for text in texts:
+        lowered = text.lower()
+        cursor = 0
+        start = end = None
+        while index < len(words):
+            word = words[index]
+            pos = lowered.find(word.text.lower(), cursor)
+            if pos < 0 or WORD_CHAR.search(lowered, cursor, pos):
+                break
+            if start is None:
+                start = word.offset
+            end = word.offset + word.duration
+            cursor = pos + len(word.text)
+            index += 1
+        if start is None or WORD_CHAR.search(lowered, cursor):
+            return None
+        spans.append((start, end))
+    if index != len(words):
+        return None
+    return spans
+
+
+def cut_points(spans: Sequence[Tuple[int, int]]) -> Optional[List[float]]:
+    """相邻两条之间停顿的中点（秒）；时间有重叠时返回 None"""
+    cuts = []
+    for (_, end), (start, _) in zip(spans, spans[1:]):
+        if start < end:
+            return None
+        cuts.append((end + start) / 2 / TICKS_PER_SECOND)
+    return cuts
+
+
+def split_audio(audio: bytes, texts: Sequence[str], boundaries: Sequence[WordBoundary]) -> Optional[List[bytes]]:
+    """按单词边界把整段音频切成每条文本的音频，无法可靠切分时返回 None"""
+    spans = align_words(texts, boundaries)
+    if spans is None:
+        return None
+    cuts = cut_points(spans)
+    if cuts is None:
+        return None
+    clips = mp3.split_at(audio, cuts)
+    if any(not clip for clip in clips):
+        return None
+    return clips
+
+
+def split_words(clips: Sequence[bytes], boundaries: Sequence[WordBoundary]) -> List[word_timings.Words]:
+    """各片段的单词时间（相对片段开头）：单词归入开始时间所在的片段"""
+    words: List[word_timings.Words] = []
+    start = 0.0
+    for i, clip in enumerate(clips):
+        end = start + mp3.duration(clip)
+        words.append(word_timings.to_words(boundaries, start, end if i < len(clips) - 1 else None))
+        start = end
+    return words
+
+
+def _communicate(text: str, voice: str, rate: str):
+    # 用到时才导入：只用本地 TTS 后端时不需要安装 edge-tts
+    import edge_tts
+    # edge-tts 7.x 默认只返回 SentenceBoundary，需要显式要求单词边界；旧版本没有该参数且默认即为单词边界
+    try:
+        return edge_tts.Communicate(text, voice, rate=rate, boundary="WordBoundary")
+    except TypeError:
+        return edge_tts.Communicate(text, voice, rate=rate)
+
+
+async def stream_synthesis(text: str, voice: str, rate: str) -> Tuple[bytes, List[WordBoundary]]:
+    """流式合成一条文本：音频与单词边界在同一次请求中取得，请求失败时抛出异常"""
+    audio = bytearray()
+    boundaries: List[WordBoundary] = []
+    async for chunk in _communicate(text, voice, rate).stream():
+        if chunk["type"] == "audio":
+            audio.extend(chunk["data"])
+        elif chunk["type"] == "WordBoundary":
+            boundaries.append(WordBoundary(chunk["offset"], chunk["duration"], chunk["text"]))
+    return bytes(audio), boundaries
+
+
+async def synthesize_batch(
+    texts: Sequence[str], voice: str, rate: str
+) -> Optional[List[Tuple[bytes, word_timings.Words]]]:
+    """
+    一次请求合成多条文本，返回与 texts 一一对应的 (MP3 数据, 单词时间)
+    请求失败时抛出异常；合成成功但无法切分时返回 None
+    """
+    audio, boundaries = await stream_synthesis(join_texts(texts), voice, rate)
+    clips = split_audio(audio, texts, boundaries)
+    if clips is None:
+        return None
+    return list(zip(clips, split_words(clips, boundaries)))
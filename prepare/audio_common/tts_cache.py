@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内容寻址的 TTS 音频缓存（短语与问答对音频生成脚本共用）
+
+缓存键 = sha256(文本, 音色, 语速, 引擎版本)，缓存文件保存在
+  prepare/.tts_cache/{key[:2]}/{key}.mp3
+
+输出文件通过硬链接指向缓存文件（跨文件系统时退化为复制），因此：
+- 文本未变：输出文件记录的键与当前键一致，直接跳过
+- 文本变化：键变化，重新合成
+- 相同句子：只合成一次，其余输出直接链接
+- 引入缓存前生成、索引中没有记录的文件：按当前文本记入 outputs，但不放入缓存
+  （无法确认其内容与当前文本一致，不能链接给其他输出）
+缓存总大小超过上限时，按最近使用时间淘汰最旧的条目。
+合成时写出的单词时间 sidecar（word_timings）作为 {key}.words.json 随音频一起缓存、链接和淘汰。
+多个进程（分片并行）共用同一缓存目录时，保存索引只合并本进程修改过的条目。
+"""
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from . import word_timings
+from .json_index import read_json, save_merged, snapshot
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent / ".tts_cache"
+DEFAULT_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# resolve() 的返回值
+FRESH = "fresh"     # 输出文件已是当前内容
+LINKED = "linked"   # 从缓存链接得到
+MISS = "miss"       # 需要合成
+
+
+class TTSCache:
+    """基于内容哈希的本地音频缓存"""
+
+    def __init__(self, root: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.index_path = self.root / "index.json"
+        self.root.mkdir(parents=True, exist_ok=True)
+        # outputs: 输出文件路径 -> 生成它的缓存键；last_used: 缓存键 -> 最近使用时间
+        self.outputs: Dict[str, str] = {}
+        self.last_used: Dict[str, float] = {}
+        self._saved = snapshot(self._sections())
+        self._load()
+
+    @staticmethod
+    def key(text: str, voice: str, rate: str, engine: str) -> str:
+        """计算缓存键"""
+        payload = json.dumps([text, voice, rate, engine], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.mp3"
+
+    @staticmethod
+    def _link(source: Path, target: Path, replace: bool = True) -> None:
+        """
+        硬链接（跨文件系统时复制）后原子替换 target
+        replace=False 时不覆盖已有的 target（分片共用缓存目录，其他进程先写入的条目视为成功）
+        临时文件名带进程号，多个进程同时写同一个 target 时互不干扰
+        """
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+        tmp_path.unlink(missing_ok=True)
+        try:
+            os.link(source, tmp_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.copy2(source, tmp_path)
+        try:
+            if replace:
+                os.replace(tmp_path, target)
+            else:
+                os.link(tmp_path, target)
+        except FileExistsError:
+            pass
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    # --------------------------------------------------------
+    # 查询与写入
+    # --------------------------------------------------------
+
+    def resolve(self, output_path: Path, key: str, is_valid: Optional[Callable[[Path], bool]] = None) -> str:
+        """
+        让 output_path 对应 key 的内容
+        返回 FRESH / LINKED / MISS，MISS 时调用方需合成后调用 store()
+        is_valid 用于判断已有文件是否完整（如 AudioValidator.is_valid），默认只要求文件存在
+        """
+        is_valid = is_valid or Path.exists
+        output_key = str(Path(output_path).resolve())
+        if is_valid(output_path):
+            recorded = self.outputs.get(output_key)
+            if recorded == key:
+                self.last_used[key] = time.time()
+                return FRESH
+            if recorded is None:
+                # 引入缓存前生成的文件：只记录为当前文本的输出，不收录进缓存，
+                # 避免文本已修改但未重新生成的旧音频被链接给其他相同文本的输出
+                self.outputs[output_key] = key
+                self.last_used[key] = time.time()
+                return FRESH
+        if self.materialize(key, output_path):
+            if is_valid(output_path):
+                return LINKED
+            # 缓存中的文件已损坏：丢弃后重新合成
+            self.outputs.pop(output_key, None)
+            self.path_for(key).unlink(missing_ok=True)
+        return MISS
+
+    def materialize(self, key: str, output_path: Path) -> bool:
+        """把缓存内容链接到 output_path，缓存未命中返回 False"""
+        cached = self.path_for(key)
+        if not cached.exists():
+            return False
+        self._link(cached, output_path)
+        # 单词时间随音频一起恢复；缓存中没有时删除输出旁边的旧 sidecar（描述的是旧音频）
+        cached_words = word_timings.sidecar_path(cached)
+        if cached_words.exists():
+            self._link(cached_words, word_timings.sidecar_path(output_path))
+        else:
+            word_timings.remove(output_path)
+        self.outputs[str(Path(output_path).resolve())] = key
+        self.last_used[key] = time.time()
+        return True
+
+    def store(self, key: str, source_path: Path) -> None:
+        """收录新合成的音频（源文件保持不动，缓存中建立硬链接）"""
+        cached = self.path_for(key)
+        if not cached.exists():
+            self._link(source_path, cached, replace=False)
+        source_words = word_timings.sidecar_path(source_path)
+        if source_words.exists() and not word_timings.sidecar_path(cached).exists():
+            self._link(source_words, word_timings.sidecar_path(cached), replace=False)
+        self.outputs[str(Path(source_path).resolve())] = key
+        self.last_used[key] = time.time()
+
+    # --------------------------------------------------------
+    # 淘汰与持久化
+    # --------------------------------------------------------
+
+    def evict(self) -> int:
+        """按最近使用时间淘汰，直到总大小不超过上限，返回删除的条目数"""
+        entries = []
+        total = 0
+        for sub in os.scandir(self.root):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if not entry.name.endswith(".mp3"):
+                    continue
+                st = entry.stat()
+                key = entry.name[:-4]
+                entries.append((self.last_used.get(key, st.st_mtime), st.st_size, key, entry.path))
+                total += st.st_size
+
+        removed = 0
+        if total <= self.max_bytes:
+            return removed
+        for _, size, key, path in sorted(entries):
+            os.unlink(path)
+            word_timings.remove(Path(path))
+            self.last_used.pop(key, None)
+            total -= size
+            removed += 1
+            if total <= self.max_bytes:
+                break
+        return removed
+
+    def _sections(self) -> Dict[str, Dict]:
+        return {"outputs": self.outputs, "last_used": self.last_used}
+
+    def _load(self) -> None:
+        if not self.index_path.exists():
+            return
+        data = read_json(self.index_path)
+        if data is None:
+            # 索引损坏时从空索引开始，已有输出会被重新收录
+            return
+        self.outputs = data.get("outputs", {})
+        self.last_used = data.get("last_used", {})
+        self._saved = snapshot(self._sections())
+
+    def save(self) -> None:
+        """淘汰超额条目并写回索引（与其他进程写入的条目合并）"""
+        self.evict()
+        merged = save_merged(self.index_path, self._sections(), self._saved)
+        self.outputs, self.last_used = merged["outputs"], merged["last_used"]
+        self._saved = snapshot(self._sections())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量上传清单
+
+本地持久化每个已上传对象的 (本地路径, 大小, mtime, 内容MD5, 远端ETag)，
+再次上传前：
+- 大小和 mtime 均未变：直接跳过，不读文件、不访问网络
+- mtime 变了但 MD5 相同（如文件被 touch / 重新链接）：更新 mtime 后跳过
+- 其余情况：需要上传
+
+reconcile() 通过 list_objects 批量拉取远端对象，重建清单（清单丢失或
+在其他机器上传过时使用）。
+多个上传进程（分片并行）共用同一清单时，保存只合并本进程修改过的条目。
+"""
+
+import hashlib
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional
+
+from .json_index import read_json, save_merged, snapshot
+
+MD5_CHUNK_SIZE = 1024 * 1024
+
+
+def file_md5(path: Path) -> str:
+    """计算文件内容的 MD5（十六进制）"""
+    digest = hashlib.md5()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(MD5_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalize_etag(etag: Optional[str]) -> str:
+    """去掉 ETag 两侧的引号并转小写"""
+    return (etag or "").strip('"').lower()
+
+
+class UploadManifest:
+    """线程安全的上传清单，键为对象存储中的 Key"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._saved: Dict[str, Dict] = {"entries": {}}
+        self._load()
+
+    def is_unchanged(self, local_path: Path, key: str) -> bool:
+        """本地文件与上次上传的内容一致时返回 True"""
+        with self._lock:
+            entry = self.entries.get(key)
+        if not entry:
+            return False
+
+        st = local_path.stat()
+        if st.st_size != entry["size"]:
+            return False
+        if st.st_mtime_ns == entry["mtime_ns"]:
+            return True
+
+        # mtime 变化时退化为比较内容
+        if file_md5(local_path) != entry["md5"]:
+            return False
+        with self._lock:
+            # 整条替换（而非原地修改），保存时才能识别为本进程修改过的条目
+            self.entries[key] = {**entry, "mtime_ns": st.st_mtime_ns, "path": str(local_path)}
+        return True
+
+    def record(self, local_path: Path, key: str, etag: Optional[str] = None, md5: Optional[str] = None) -> None:
+        """记录一次成功上传"""
+        st = local_path.stat()
+        md5 = md5 or file_md5(local_path)
+        with self._lock:
+            self.entries[key] = {
+                "path": str(local_path),
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "md5": md5,
+                "etag": normalize_etag(etag) or md5,
+            }
+
+    def forget(self, keys: Iterable[str]) -> None:
+        """移除已从远端删除的对象（之后再出现同名文件时会重新上传）"""
+        with self._lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def reconcile(
+        self,
+        client,
+        bucket: str,
+        prefix: str,
+        local_path_for: Callable[[str], Optional[Path]],
+    ) -> Dict[str, int]:
+        """
+        通过 list_objects 重建清单：远端 ETag 与本地文件 MD5 一致的对象记为已上传
+        local_path_for 把对象 Key 映射为本地路径（无对应文件时返回 None）
+        """
+        result = {"remote": 0, "matched": 0, "mismatched": 0}
+        entries: Dict[str, Dict] = {}
+        marker = ""
+        while True:
+            response = client.list_objects(Bucket=bucket, Prefix=prefix, Marker=marker, MaxKeys=1000)
+            for obj in response.get("Contents", []):
+                result["remote"] += 1
+                key = obj["Key"]
+                local_path = local_path_for(key)
+                if not local_path or not local_path.exists():
+                    continue
+                st = local_path.stat()
+                etag = normalize_etag(obj.get("ETag"))
+                if st.st_size == int(obj.get("Size", -1)) and file_md5(local_path) == etag:
+                    entries[key] = {
+                        "path": str(local_path),
+                        "size": st.st_size,
+                        "mtime_ns": st.st_mtime_ns,
+                        "md5": etag,
+                        "etag": etag,
+                    }
+                    result["matched"] += 1
+                else:
+                    result["mismatched"] += 1
+            if response.get("IsTruncated") != "true":
+                break
+            marker = response.get("NextMarker") or response["Contents"][-1]["Key"]
+
+        with self._lock:
+            self.entries = entries
+        return result
+
+    def _load(self) -> None:
+        data = read_json(self.path)
+        if data is not None:
+            self.entries = data.get("entries", {})
+        self._saved = snapshot({"entries": self.entries})
+
+    def save(self) -> None:
+        """写回清单（与其他进程写入的条目合并）"""
+        with self._lock:
+            merged = save_merged(self.path, {"entries": self.entries}, self._saved)
+            self.entries = merged["entries"]
+            self._saved = snapshot({"entries": self.entries})
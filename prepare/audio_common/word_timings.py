@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+单词时间信息：合成时从 edge-tts 的 WordBoundary 事件中取得，与音频在同一次请求中写出，
+单词高亮、跟读比对等功能直接使用，不必在运行时做强制对齐
+
+每条音频一个 sidecar（与音频同目录）: questions/x.mp3 -> questions/x.words.json
+    {"version": 1, "size": 12345, "words": [["Hi", 112, 288], ["there", 400, 312]]}
+  words 为 [单词, 开始, 时长]（毫秒，相对该音频开头）；
+  size 为所描述的 MP3 的字节数，MP3 被替换而 sidecar 未同步时据此识别为过期（读取时忽略）
+- 批量合成切分后，按各片段在整段音频中的起止时间分配单词并换算为相对片段开头（tts_batch）
+- TTS 缓存与音频一起缓存 sidecar，缓存命中时一起恢复（tts_cache）
+- 后处理裁掉开头静音后按裁掉的时长平移（postprocess）
+- 本地后端（Piper / eSpeak）没有单词边界，不写 sidecar
+
+TimingIndexBuilder 把一组（场景）全部片段的 sidecar 汇总成一个索引文件，与音频一起上传:
+    timings/{scene_id}.json  {"version": 1, "id": "daily_001",
+                              "clips": {"questions/daily_001_sub_1_qa_1.mp3": [["Hi", 112, 288], ...], ...},
+                              "missing": ["responses/daily_001_sub_1_qa_1_response2.mp3"]}
+  missing 为没有（有效）时间信息的片段。状态文件记录每个索引由哪些 sidecar（大小、mtime）组成，未变化的不重建。
+"""
+
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from .audio_inventory import AudioInventory
+from .json_index import read_json, save_merged, snapshot, write_json
+
+SUFFIX = ".words.json"
+VERSION = 1
+INDEX_VERSION = 1
+STATE_VERSION = 1
+
+TICKS_PER_MS = 10_000       # WordBoundary 的 offset/duration 单位为 100ns
+WORD_CHAR = re.compile(r"\w")
+
+Words = List[List[Any]]     # [[单词, 开始毫秒, 时长毫秒], ...]
+
+
+def sidecar_path(audio_path: Path) -> Path:
+    return Path(audio_path).with_suffix(SUFFIX)
+
+
+def to_words(boundaries: Sequence[Any], start: float = 0.0, end: Optional[float] = None) -> Words:
+    """
+    单词边界（offset/duration/text，100ns）-> 开始时间在 [start, end) 秒内的单词，时间相对 start
+    只保留含字母数字的单词（部分版本会把标点作为单独的边界返回）
+    """
+    start_ms = round(start * 1000)
+    end_ms = round(end * 1000) if end is not None else None
+    words: Words = []
+    for boundary in boundaries:
+        offset = boundary.offset // TICKS_PER_MS
+        if offset < start_ms or (end_ms is not None and offset >= end_ms) or not WORD_CHAR.search(boundary.text):
+            continue
+        words.append([boundary.text, offset - start_ms, boundary.duration // TICKS_PER_MS])
+    return words
+
+
+def write(audio_path: Path, words: Optional[Words], size: int) -> None:
+    """写出 audio_path 的 sidecar（size 为 MP3 字节数）；words 为 None 时删除已有的 sidecar"""
+    if words is None:
+        remove(audio_path)
+        return
+    write_json(sidecar_path(audio_path), {"version": VERSION, "size": size, "words": words})
+
+
+def read(audio_path: Path, size: Optional[int] = None) -> Optional[Words]:
+    """读取 sidecar；不存在、格式不符或与当前 MP3 大小不一致（过期）时返回 None"""
+    data = read_json(sidecar_path(audio_path))
+    if not data or data.get("version") != VERSION:
+        return None
+    if size is not None and data.get("size") != size:
+        return None
+    return data.get("words")
+
+
+def remove(audio_path: Path) -> None:
+    sidecar_path(audio_path).unlink(missing_ok=True)
+
+
+def shift(audio_path: Path, seconds: float, size_before: int, size_after: int) -> bool:
+    """
+    音频开头被裁掉 seconds 秒、大小由 size_before 变为 size_after 后平移 sidecar
+    sidecar 描述的不是处理前的音频时不做改动，返回是否已平移
+    """
+    words = read(audio_path, size_before)
+    if words is None:
+        return False
+    cut = round(seconds * 1000)
+    write(audio_path, [[word, max(0, offset - cut), duration] for word, offset, duration in words], size_after)
+    return True
+
+
+# ============================================================
+# 按场景汇总
+# ============================================================
+
+class TimingIndexBuilder:
+    """把 audio_dir 下各片段的 sidecar 汇总到 index_dir/{组 id}.json，按状态文件增量重建"""
+
+    def __init__(self, audio_dir: Path, index_dir: Path, subdirs: Sequence[str]):
+        self.audio_dir = Path(audio_dir)
+        self.index_dir = Path(index_dir)
+        self.subdirs = tuple(subdirs)
+        self.groups: Dict[str, List[str]] = {}
+        self.state_path = self.index_dir / "timing_state.json"
+        # 组 id -> [[名称, sidecar 大小, sidecar mtime_ns, MP3 大小], ...]
+        self.state: Dict[str, List] = {}
+        self._saved: Dict[str, Dict] = {"indexes": {}}
+        self.stats = {"built": 0, "unchanged": 0, "clips": 0, "missing": 0}
+        self._load()
+
+    def add(self, group: str, names: Iterable[str]) -> None:
+        """登记一组的片段（子目录/文件名），同一组可多次登记"""
+        self.groups.setdefault(group, []).extend(names)
+
+    def add_qa_pairs(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """按场景登记问答对的全部片段（问题 + 有文本的答案）"""
+        # 用到时才导入：合成与后处理进程不需要数据库驱动
+        from .qa_source import qa_clip_names
+
+        for qa in rows:
+            self.add(qa["scene_id"], (name for _, name in qa_clip_names(qa)))
+
+    def path(self, group: str) -> Path:
+        return self.index_dir / f"{group}.json"
+
+    def build(self, force: bool = False) -> List[Path]:
+        """按需重建各组的索引，返回全部索引文件（未变化的也返回，是否上传交给上传清单判断）"""
+        # 各子目录各一次 scandir：sidecar 与 MP3 的大小都取自目录项，不逐个 stat
+        sidecars = AudioInventory(self.audio_dir, self.subdirs, SUFFIX)
+        audio = AudioInventory(self.audio_dir, self.subdirs)
+        paths: List[Path] = []
+        for group, names in self.groups.items():
+            fingerprint: List[List] = []
+            for name in names:
+                path = os.path.join(sidecars.root, name)
+                sidecar = sidecars.entries.get(os.path.splitext(path)[0] + SUFFIX)
+                clip = audio.entries.get(path)
+                if sidecar is None or clip is None:
+                    fingerprint.append([name, None, None, None])
+                    continue
+                st = sidecar.stat()
+                fingerprint.append([name, st.st_size, st.st_mtime_ns, clip.stat().st_size])
+
+            index_path = self.path(group)
+            if not force and self.state.get(group) == fingerprint and index_path.exists():
+                self.stats["unchanged"] += 1
+                paths.append(index_path)
+                continue
+
+            clips: Dict[str, Words] = {}
+            missing: List[str] = []
+            for name, _, _, size in fingerprint:
+                words = read(self.audio_dir / name, size) if size is not None else None
+                if words is None:
+                    missing.append(name)
+                else:
+                    clips[name] = words
+            write_json(index_path, {"version": INDEX_VERSION, "id": group, "clips": clips, "missing": missing})
+            self.state[group] = fingerprint
+            self.stats["built"] += 1
+            self.stats["clips"] += len(clips)
+            self.stats["missing"] += len(missing)
+            paths.append(index_path)
+        return paths
+
+    def _load(self) -> None:
+        data = read_json(self.state_path)
+        if data and data.get("version") == STATE_VERSION:
+            self.state = data.get("indexes", {})
+        self._saved = snapshot({"indexes": self.state})
+
+    def save(self) -> None:
+        """写回状态文件（与其他进程写入的条目合并）"""
+        merged = save_merged(self.state_path, {"indexes": self.state}, self._saved, header={"version": STATE_VERSION})
+        self.state = merged["indexes"]
+        self._saved = snapshot({"indexes": self.state})
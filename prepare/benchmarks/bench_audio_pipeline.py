@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+音频准备流水线基准测试
+
+用本地替身（fakes.py）代替 edge-tts、Postgres 和腾讯云COS，直接运行真实的流水线代码：
+- phrases_generate:   generate_audio_edge_tts.AudioGenerator.process_phrases
+- qa_generate:        1_generate_audio.SynthesisScheduler（与 process_qa_pair / main 相同的调度路径）
+- qa_upload_thread:   2_upload_to_cos 线程池引擎（process_qa_pair）
+- qa_upload_async:    2_upload_to_cos 异步引擎（--engine async，走本地 HTTP 假桶）
+
+每个 场景 × 规模 在独立子进程中运行，峰值 RSS 互不影响。
+结果为 JSON：每个条目的 p50/p95 延迟、items/s、峰值 RSS 等，可与基线对比做回归检测。
+
+使用方法:
+  python prepare/benchmarks/bench_audio_pipeline.py                                # 全部场景，1k/10k/100k
+  python prepare/benchmarks/bench_audio_pipeline.py --scenarios qa_generate --scales 1000
+  python prepare/benchmarks/bench_audio_pipeline.py --tts-latency-ms 200 --tts-error-rate 0.02
+  python prepare/benchmarks/bench_audio_pipeline.py --output bench.json
+  python prepare/benchmarks/bench_audio_pipeline.py --compare baseline.json        # 吞吐下降超过容差时退出码为 1
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+BENCH_DIR = Path(__file__).resolve().parent
+PREPARE_DIR = BENCH_DIR.parent
+QA_AUDIO_DIR = PREPARE_DIR / "qa_audio"
+PHRASE_SCRIPTS_DIR = PREPARE_DIR / "phrases" / "scripts"
+
+sys.path.insert(0, str(PREPARE_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+from audio_common.audio_validator import AudioValidator
+from fakes import (
+    FakeBucket,
+    FakeCommunicate,
+    FakeTTS,
+    FaultInjector,
+    InMemoryQASource,
+    synthetic_mp3,
+    synthetic_qa_pairs,
+)
+
+SCENARIOS = ["phrases_generate", "qa_generate", "qa_upload_thread", "qa_upload_async"]
+DEFAULT_SCALES = [1_000, 10_000, 100_000]
+
+
+def load_script(path: Path, name: str):
+    """按路径加载脚本模块（qa_audio 下的脚本名以数字开头，无法直接 import）"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值常驻内存（MB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class LatencyRecorder:
+    """包装被测函数，记录每次调用的耗时"""
+
+    def __init__(self):
+        self.samples: List[float] = []
+
+    def wrap(self, func: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.samples.append(time.perf_counter() - started)
+        return timed
+
+    def wrap_async(self, func: Callable) -> Callable:
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.samples.append(time.perf_counter() - started)
+        return timed
+
+    def summary(self) -> Dict[str, float]:
+        samples = sorted(self.samples)
+        if not samples:
+            return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+
+        def rank(p: float) -> float:
+            return round(samples[max(0, math.ceil(p / 100 * len(samples)) - 1)] * 1000, 3)
+
+        return {"p50": rank(50), "p95": rank(95), "p99": rank(99), "max": round(samples[-1] * 1000, 3)}
+
+
+# ============================================================
+# 场景
+# ============================================================
+
+def qa_count_for(clips: int, responses_per_qa: int) -> int:
+    return math.ceil(clips / (1 + responses_per_qa))
+
+
+def make_cache(args, workdir: Path):
+    if not args.cache:
+        return None
+    from audio_common.tts_cache import TTSCache
+    return TTSCache(workdir / "tts_cache")
+
+
+def install_fake_tts(args) -> FaultInjector:
+    """把 edge-tts 换成替身（edge 后端在合成时才取 edge_tts.Communicate）"""
+    import edge_tts
+    FakeTTS.injector = FaultInjector(args.tts_latency_ms, args.tts_error_rate, args.seed)
+    FakeTTS.frames_per_word = args.frames_per_word
+    edge_tts.Communicate = FakeCommunicate
+    return FakeTTS.injector
+
+
+async def bench_phrases_generate(args, clips: int, workdir: Path, recorder: LatencyRecorder) -> Dict[str, Any]:
+    tts = load_script(PHRASE_SCRIPTS_DIR / "generate_audio_edge_tts.py", "bench_phrase_tts")
+    injector = install_fake_tts(args)
+    tts.PHRASES_DIR = workdir / "phrases"
+    tts.EXAMPLES_DIR = workdir / "examples"
+    tts.PHRASES_DIR.mkdir(parents=True)
+    tts.EXAMPLES_DIR.mkdir(parents=True)
+    tts.validator = AudioValidator()
+
+    # 每个短语 = 1 个短语音频 + responses_per_qa 个示例音频
+    phrases = [
+        {"id": qa["id"], "english": qa["speaker_text"], "examples": [{"english": r["text"]} for r in qa["responses"]]}
+        for qa in synthetic_qa_pairs(qa_count_for(clips, args.responses_per_qa), args.responses_per_qa,
+                                     args.duplicate_ratio, args.seed)
+    ]
+    generator = tts.AudioGenerator(args.concurrency, make_cache(args, workdir), args.tts_batch_size)
+    generator.generate_audio = recorder.wrap_async(generator.generate_audio)
+    generator.generate_batch = recorder.wrap_async(generator.generate_batch)
+
+    await generator.process_phrases(phrases)
+    return {
+        "items": generator.stats["success"] + generator.stats["cached"],
+        "failed": generator.stats["failed"],
+        "tts_calls": injector.calls,
+        "injected_errors": injector.errors,
+        "stats": dict(generator.stats),
+    }
+
+
+async def bench_qa_generate(args, clips: int, workdir: Path, recorder: LatencyRecorder) -> Dict[str, Any]:
+    gen = load_script(QA_AUDIO_DIR / "1_generate_audio.py", "bench_qa_generate")
+    injector = install_fake_tts(args)
+    gen.QUESTIONS_DIR = workdir / "questions"
+    gen.RESPONSES_DIR = workdir / "responses"
+    gen.QUESTIONS_DIR.mkdir(parents=True)
+    gen.RESPONSES_DIR.mkdir(parents=True)
+    gen.validator = AudioValidator()
+    gen.generate_audio = recorder.wrap_async(gen.generate_audio)
+    gen.generate_audio_batch = recorder.wrap_async(gen.generate_audio_batch)
+
+    source = InMemoryQASource(synthetic_qa_pairs(
+        qa_count_for(clips, args.responses_per_qa), args.responses_per_qa, args.duplicate_ratio, args.seed))
+    stats = gen.new_stats()
+    cache = make_cache(args, workdir)
+    scheduler = gen.SynthesisScheduler(args.concurrency, args.voice_rate, cache, args.tts_batch_size)
+
+    async def plan_chunks():
+        async for chunk in source.aiter_qa_pair_chunks():
+            jobs = []
+            for qa in chunk:
+                jobs.extend(gen.plan_qa_pair_jobs(qa, stats, False, cache))
+            yield jobs
+
+    await scheduler.run_stream(plan_chunks(), stats)
+    return {
+        "items": sum(stats[f"{kind}_{state}"] for kind in ("questions", "responses") for state in ("success", "cached")),
+        "failed": stats["questions_failed"] + stats["responses_failed"],
+        "tts_calls": injector.calls,
+        "injected_errors": injector.errors,
+        "stats": stats,
+    }
+
+
+def prepare_upload(args, clips: int, workdir: Path, engine: str):
+    """加载上传脚本并准备本地音频文件（不计入耗时）"""
+    cos = load_script(QA_AUDIO_DIR / "2_upload_to_cos.py", f"bench_qa_upload_{engine}")
+    from audio_common.cos_uploader import CosUploader
+
+    cos.AUDIO_DIR = workdir / "audio"
+    cos.QUESTIONS_DIR = cos.AUDIO_DIR / "questions"
+    cos.RESPONSES_DIR = cos.AUDIO_DIR / "responses"
+    cos.QUESTIONS_DIR.mkdir(parents=True)
+    cos.RESPONSES_DIR.mkdir(parents=True)
+    cos.validator = AudioValidator()
+
+    source = InMemoryQASource(synthetic_qa_pairs(
+        qa_count_for(clips, args.responses_per_qa), args.responses_per_qa, args.duplicate_ratio, args.seed))
+    for qa in source.qa_pairs:
+        for _, local_path, _, _ in cos.qa_clips(qa):
+            local_path.write_bytes(synthetic_mp3(len(qa["speaker_text"].split()) * args.frames_per_word))
+
+    bucket = FakeBucket(FaultInjector(args.cos_latency_ms, args.cos_error_rate, args.seed))
+    uploader = CosUploader(bucket, "bench", base_delay=args.retry_base_delay)
+    return cos, source, bucket, uploader
+
+
+def upload_result(cos, bucket: FakeBucket) -> Dict[str, Any]:
+    return {
+        "items": cos.stats["questions_uploaded"] + cos.stats["responses_uploaded"],
+        "failed": cos.stats["questions_failed"] + cos.stats["responses_failed"],
+        "bytes": cos.stats["bytes_uploaded"],
+        "cos_calls": bucket.injector.calls,
+        "injected_errors": bucket.injector.errors,
+        "stats": dict(cos.stats),
+    }
+
+
+async def bench_qa_upload_thread(args, clips: int, workdir: Path, recorder: LatencyRecorder) -> Dict[str, Any]:
+    cos, source, bucket, uploader = prepare_upload(args, clips, workdir, "thread")
+    cos.MAX_WORKERS = args.upload_workers
+    cos.MAX_PENDING = args.upload_workers * 4
+    cos.upload_clip = recorder.wrap(cos.upload_clip)
+
+    started = time.perf_counter()
+    run_args = argparse.Namespace(scenes=None)
+    await asyncio.get_running_loop().run_in_executor(
+        None, cos.run_thread_engine, source, uploader, run_args, None, None, None)
+    return {**upload_result(cos, bucket), "elapsed": time.perf_counter() - started}
+
+
+async def bench_qa_upload_async(args, clips: int, workdir: Path, recorder: LatencyRecorder) -> Dict[str, Any]:
+    cos, source, bucket, uploader = prepare_upload(args, clips, workdir, "async")
+    cos.upload_clip_async = recorder.wrap_async(cos.upload_clip_async)
+    bucket.start_server()
+
+    started = time.perf_counter()
+    try:
+        run_args = argparse.Namespace(scenes=None, concurrency=args.upload_concurrency)
+        await cos.run_async_engine(source, uploader, run_args, None, None, None)
+    finally:
+        bucket.stop_server()
+    return {**upload_result(cos, bucket), "elapsed": time.perf_counter() - started}
+
+
+BENCHMARKS = {
+    "phrases_generate": bench_phrases_generate,
+    "qa_generate": bench_qa_generate,
+    "qa_upload_thread": bench_qa_upload_thread,
+    "qa_upload_async": bench_qa_upload_async,
+}
+
+
+def run_child(args) -> Dict[str, Any]:
+    """在当前进程中运行单个 场景 × 规模，返回结果"""
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench_{args.child}_", dir=args.workdir))
+    recorder = LatencyRecorder()
+    try:
+        started = time.perf_counter()
+        if args.verbose:
+            result = asyncio.run(BENCHMARKS[args.child](args, args.child_clips, workdir, recorder))
+        else:
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                result = asyncio.run(BENCHMARKS[args.child](args, args.child_clips, workdir, recorder))
+        # 上传场景不计入准备本地文件的时间
+        elapsed = result.pop("elapsed", time.perf_counter() - started)
+    finally:
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "scenario": args.child,
+        "clips": args.child_clips,
+        "elapsed_s": round(elapsed, 3),
+        "items_per_s": round(result["items"] / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": recorder.summary(),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        **result,
+    }
+
+
+# ============================================================
+# 主进程：逐个启动子进程并汇总
+# ============================================================
+
+def run_in_subprocess(scenario: str, clips: int) -> Dict[str, Any]:
+    cmd = [sys.executable, str(Path(__file__).resolve()), *sys.argv[1:],
+           "--child", scenario, "--child-clips", str(clips)]
+    completed = subprocess.run(cmd, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {"scenario": scenario, "clips": clips, "error": completed.stderr.strip()[-2000:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def compare_with_baseline(results: List[Dict[str, Any]], baseline_path: Path, tolerance: float) -> List[str]:
+    """吞吐下降或 p95 上升超过容差的条目"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["scenario"], r["clips"]): r for r in json.load(f).get("results", []) if "error" not in r}
+
+    regressions = []
+    for result in results:
+        base = baseline.get((result["scenario"], result["clips"]))
+        if not base or "error" in result:
+            continue
+        if result["items_per_s"] < base["items_per_s"] * (1 - tolerance):
+            regressions.append(f"{result['scenario']}@{result['clips']}: items/s "
+                               f"{base['items_per_s']} → {result['items_per_s']}")
+        if result["latency_ms"]["p95"] > base["latency_ms"]["p95"] * (1 + tolerance):
+            regressions.append(f"{result['scenario']}@{result['clips']}: p95 "
+                               f"{base['latency_ms']['p95']}ms → {result['latency_ms']['p95']}ms")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="音频准备流水线基准测试（本地假 TTS / 假对象存储 / 内存数据源）")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS, help="要运行的场景（默认全部）")
+    parser.add_argument("--scales", type=lambda s: [int(x) for x in s.split(",")], default=DEFAULT_SCALES,
+                        help="音频条数，逗号分隔（默认 1000,10000,100000）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    # 假 TTS
+    parser.add_argument("--tts-latency-ms", type=float, default=20.0, help="假 TTS 延迟中位数（毫秒，默认 20）")
+    parser.add_argument("--tts-error-rate", type=float, default=0.0, help="假 TTS 错误率（默认 0）")
+    parser.add_argument("--frames-per-word", type=int, default=3, help="合成音频每个单词的 MP3 帧数（默认 3）")
+    parser.add_argument("--tts-batch-size", type=int, default=1, help="批量合成每批条数（默认 1 不批量）")
+    parser.add_argument("--concurrency", type=int, default=64, help="TTS 并发数（默认 64）")
+    parser.add_argument("--voice-rate", type=float, default=0.0, help="问答对: 每个音色每秒请求数（默认 0 不限速）")
+    parser.add_argument("--cache", action="store_true", help="启用 TTS 缓存（位于临时目录）")
+    # 数据
+    parser.add_argument("--responses-per-qa", type=int, default=2, help="每个问答对的答案数（默认 2）")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0, help="重复文本比例，用于测试缓存去重（默认 0）")
+    # 假对象存储
+    parser.add_argument("--cos-latency-ms", type=float, default=10.0, help="假对象存储延迟中位数（毫秒，默认 10）")
+    parser.add_argument("--cos-error-rate", type=float, default=0.0, help="假对象存储错误率（默认 0）")
+    parser.add_argument("--retry-base-delay", type=float, default=0.05, help="上传重试退避基数（秒，默认 0.05）")
+    parser.add_argument("--upload-workers", type=int, default=20, help="线程引擎上传线程数（默认 20）")
+    parser.add_argument("--upload-concurrency", type=int, default=200, help="异步引擎同时上传数（默认 200）")
+    # 输出
+    parser.add_argument("--output", type=Path, help="结果 JSON 写入文件（默认输出到标准输出）")
+    parser.add_argument("--compare", type=Path, help="与基线 JSON 对比，出现回归时退出码为 1")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="回归容差（默认 0.1 即 10%%）")
+    parser.add_argument("--workdir", type=Path, help="临时文件目录（默认系统临时目录）")
+    parser.add_argument("--keep-workdir", action="store_true", help="保留生成的临时文件")
+    parser.add_argument("--verbose", action="store_true", help="显示被测代码的输出")
+    # 内部使用：子进程运行单个场景
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--child-clips", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        print(json.dumps(run_child(args), ensure_ascii=False))
+        return
+
+    log = sys.stderr if args.output is None else sys.stdout
+    print("⏱️ 音频准备流水线基准测试", file=log)
+    print("=" * 60, file=log)
+
+    results = []
+    for clips in args.scales:
+        for scenario in args.scenarios:
+            print(f"▶️ {scenario} × {clips} ...", file=log, flush=True)
+            result = run_in_subprocess(scenario, clips)
+            results.append(result)
+            if "error" in result:
+                print(f"   ❌ 失败: {result['error'].splitlines()[-1] if result['error'] else ''}", file=log)
+            else:
+                print(f"   ✅ {result['items_per_s']} items/s，p50 {result['latency_ms']['p50']}ms，"
+                      f"p95 {result['latency_ms']['p95']}ms，峰值RSS {result['peak_rss_mb']}MB，"
+                      f"失败 {result['failed']}", file=log)
+
+    report = {
+        "benchmark": "audio_pipeline",
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()
+                   if k not in ("child", "child_clips", "output", "compare", "verbose")},
+        "results": results,
+    }
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已写入: {args.output}", file=log)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    failed = any("error" in r for r in results)
+    if args.compare:
+        regressions = compare_with_baseline(results, args.compare, args.tolerance)
+        if regressions:
+            print("\n⚠️ 发现性能回归:", file=log)
+            for line in regressions:
+                print(f"   - {line}", file=log)
+            failed = True
+        else:
+            print(f"\n✅ 与基线 {args.compare} 相比无回归（容差 {args.tolerance:.0%}）", file=log)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
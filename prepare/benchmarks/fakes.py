@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准测试用的本地替身：假 TTS、假对象存储、内存问答对数据源
+
+- FakeCommunicate: 与 edge_tts.Communicate 接口一致，按注入的延迟/错误率返回合成的 MP3 帧
+- FakeBucket: CosS3Client 接口子集（put_object / 分片 / list_objects / 预签名URL），
+  start_server() 后在本地起一个 HTTP 服务接收预签名 PUT，供异步上传引擎走真实网络栈
+- synthetic_qa_pairs / InMemoryQASource: 与 qa_source 输出结构一致的问答对
+"""
+
+import asyncio
+import hashlib
+import math
+import random
+import string
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+# MPEG-2 Layer III, 48kbps, 24kHz, 单声道（与 edge-tts 默认输出格式一致）
+MP3_FRAME_HEADER = bytes([0xFF, 0xF3, 0x64, 0xC0])
+MP3_FRAME_SIZE = 144
+MP3_FRAME_SECONDS = 576 / 24000
+TICKS_PER_SECOND = 10_000_000      # edge-tts 的 offset/duration 单位为 100ns
+
+
+def synthetic_mp3(frames: int) -> bytes:
+    """生成指定帧数的静音 MP3 数据（帧头合法，帧体全零）"""
+    frame = MP3_FRAME_HEADER + bytes(MP3_FRAME_SIZE - len(MP3_FRAME_HEADER))
+    return frame * max(1, frames)
+
+
+class InjectedError(Exception):
+    """按错误率注入的失败"""
+
+
+class FaultInjector:
+    """对数正态分布的延迟 + 固定错误率，可在多个替身间共享随机种子"""
+
+    def __init__(self, latency_ms: float = 0.0, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def sample(self) -> float:
+        """返回本次调用的延迟（秒），命中错误率时抛出 InjectedError"""
+        with self._lock:
+            self.calls += 1
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            delay = 0.0
+            if self.latency_ms > 0:
+                delay = self._random.lognormvariate(math.log(self.latency_ms / 1000), 0.5)
+        if fail:
+            raise InjectedError("injected failure")
+        return delay
+
+
+# ============================================================
+# 假 TTS
+# ============================================================
+
+class FakeTTS:
+    """FakeCommunicate 的共享配置（延迟、错误率、每个单词的帧数）"""
+
+    injector = FaultInjector()
+    frames_per_word = 3
+
+
+class FakeCommunicate:
+    """edge_tts.Communicate 的替身"""
+
+    def __init__(self, text: str, voice: str = "", rate: str = "+0%", **kwargs):
+        self.text = text
+        self.voice = voice
+        self.rate = rate
+
+    async def stream(self) -> AsyncIterator[Dict[str, Any]]:
+        await asyncio.sleep(FakeTTS.injector.sample())
+
+        # 与真实服务一致：单词边界的文本不含首尾标点
+        words = [w.strip(string.punctuation) for w in self.text.split()] or [""]
+        word_ticks = int(FakeTTS.frames_per_word * MP3_FRAME_SECONDS * TICKS_PER_SECOND)
+        for i, word in enumerate(words):
+            yield {
+                "type": "WordBoundary",
+                "offset": i * word_ticks,
+                "duration": word_ticks,
+                "text": word,
+            }
+            yield {"type": "audio", "data": synthetic_mp3(FakeTTS.frames_per_word)}
+
+    async def save(self, audio_fname: str, metadata_fname: Optional[str] = None) -> None:
+        with open(audio_fname, "wb") as audio:
+            async for chunk in self.stream():
+                if chunk["type"] == "audio":
+                    audio.write(chunk["data"])
+
+
+# ============================================================
+# 假对象存储
+# ============================================================
+
+class FakeBucket:
+    """
+    CosS3Client 的替身：只保存每个 Key 的大小和 MD5，不保存内容
+    put_object 等方法是阻塞调用（time.sleep 模拟网络延迟），与真实 SDK 一致
+    """
+
+    def __init__(self, injector: Optional[FaultInjector] = None):
+        self.injector = injector or FaultInjector()
+        self.objects: Dict[str, Dict[str, Any]] = {}
+        self._multipart: Dict[str, Dict[int, bytes]] = {}
+        self._lock = threading.Lock()
+        self._server_url = ""
+        self._server_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _store(self, key: str, data: bytes) -> str:
+        md5 = hashlib.md5(data).hexdigest()
+        with self._lock:
+            self.objects[key] = {"size": len(data), "md5": md5}
+        return md5
+
+    def _request(self) -> None:
+        try:
+            time.sleep(self.injector.sample())
+        except InjectedError as e:
+            raise ConnectionError(str(e))
+
+    # ---- CosS3Client 接口 ----
+
+    def put_object(self, Bucket: str, Body, Key: str, **kwargs) -> Dict[str, str]:
+        data = Body.read() if hasattr(Body, "read") else bytes(Body)
+        self._request()
+        return {"ETag": f'"{self._store(Key, data)}"'}
+
+    def create_multipart_upload(self, Bucket: str, Key: str, **kwargs) -> Dict[str, str]:
+        self._request()
+        upload_id = hashlib.md5(f"{Key}{time.time()}".encode()).hexdigest()
+        with self._lock:
+            self._multipart[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket: str, Key: str, Body, PartNumber: int, UploadId: str, **kwargs) -> Dict[str, str]:
+        data = Body.read() if hasattr(Body, "read") else bytes(Body)
+        self._request()
+        with self._lock:
+            self._multipart[UploadId][PartNumber] = data
+        return {"ETag": f'"{hashlib.md5(data).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: Dict) -> Dict[str, str]:
+        self._request()
+        with self._lock:
+            parts = self._multipart.pop(UploadId)
+        data = b"".join(parts[p["PartNumber"]] for p in MultipartUpload["Part"])
+        self._store(Key, data)
+        return {"ETag": f'"multipart-{len(parts)}"'}
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str, **kwargs) -> None:
+        with self._lock:
+            self._multipart.pop(UploadId, None)
+
+    def list_objects(self, Bucket: str, Prefix: str = "", Marker: str = "", MaxKeys: int = 1000, **kwargs) -> Dict:
+        self._request()
+        with self._lock:
+            keys = sorted(k for k in self.objects if k.startswith(Prefix) and k > Marker)
+            page = keys[:MaxKeys]
+            contents = [
+                {"Key": k, "Size": str(self.objects[k]["size"]), "ETag": f'"{self.objects[k]["md5"]}"'}
+                for k in page
+            ]
+        result = {"Contents": contents, "IsTruncated": "true" if len(keys) > MaxKeys else "false"}
+        if len(keys) > MaxKeys:
+            result["NextMarker"] = page[-1]
+        return result
+
+    def get_presigned_url(self, Bucket: str, Key: str, Method: str = "GET", Expired: int = 300, **kwargs) -> str:
+        if not self._server_url:
+            raise RuntimeError("FakeBucket HTTP 服务未启动，请先调用 start_server()")
+        return f"{self._server_url}/{Key}"
+
+    # ---- 本地 HTTP 服务（预签名 PUT） ----
+
+    def start_server(self) -> str:
+        """在后台线程的独立事件循环中启动 HTTP 服务，返回服务地址"""
+        from aiohttp import web
+
+        async def handle_put(request: "web.Request") -> "web.Response":
+            data = await request.read()
+            try:
+                await asyncio.sleep(self.injector.sample())
+            except InjectedError:
+                return web.Response(status=503, text="injected failure")
+            md5 = self._store(request.match_info["key"], data)
+            return web.Response(status=200, headers={"ETag": f'"{md5}"'})
+
+        started = threading.Event()
+
+        def serve() -> None:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            app = web.Application(client_max_size=1024 ** 3)
+            app.router.add_put("/{key:.+}", handle_put)
+            runner = web.AppRunner(app, access_log=None)
+            loop.run_until_complete(runner.setup())
+            site = web.TCPSite(runner, "127.0.0.1", 0, backlog=4096)
+            loop.run_until_complete(site.start())
+            port = runner.addresses[0][1]
+            self._server_url = f"http://127.0.0.1:{port}"
+            self._server_loop = loop
+            started.set()
+            try:
+                loop.run_forever()
+            finally:
+                loop.run_until_complete(runner.cleanup())
+                loop.close()
+
+        threading.Thread(target=serve, name="fake-bucket", daemon=True).start()
+        started.wait()
+        return self._server_url
+
+    def stop_server(self) -> None:
+        if self._server_loop:
+            self._server_loop.call_soon_threadsafe(self._server_loop.stop)
+            self._server_loop = None
+
+
+# ============================================================
+# 内存问答对数据源
+# ============================================================
+
+WORDS = (
+    "could you please tell me where the nearest station is and how long it takes "
+    "to get there by bus or on foot I would like a table for two near the window"
+).split()
+
+
+def synthetic_qa_pairs(
+    count: int,
+    responses_per_qa: int = 2,
+    duplicate_ratio: float = 0.0,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    生成 count 个问答对（字段与 qa_source.QA_COLUMNS 一致）
+    duplicate_ratio 比例的文本取自固定的小集合，用于测试 TTS 缓存去重
+    """
+    rng = random.Random(seed)
+
+    def sentence(i: int) -> str:
+        if rng.random() < duplicate_ratio:
+            i = rng.randrange(16)
+        words = [WORDS[(i * 7 + j) % len(WORDS)] for j in range(6 + i % 8)]
+        return f"{' '.join(words)} {i}"
+
+    pairs = []
+    for n in range(count):
+        sub_scene = n // 10
+        pairs.append({
+            "id": f"bench_{n:07d}",
+            "sub_scene_id": f"bench_sub_{sub_scene:06d}",
+            "speaker_text": sentence(n * (responses_per_qa + 1)),
+            "speaker_text_cn": "",
+            "responses": [
+                {"text": sentence(n * (responses_per_qa + 1) + r + 1)} for r in range(responses_per_qa)
+            ],
+            "audio_url": None,
+            "qa_type": "must_speak",
+            "order": n % 10 + 1,
+            "scene_id": f"bench_{sub_scene // 10:05d}",
+        })
+    return pairs
+
+
+class InMemoryQASource:
+    """与 qa_source 中数据源接口一致，按块返回内存中的问答对"""
+
+    def __init__(self, qa_pairs: List[Dict[str, Any]], chunk_size: int = 500):
+        self.qa_pairs = qa_pairs
+        self.chunk_size = chunk_size
+
+    def _select(self, scene_ids: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+        if not scene_ids:
+            return self.qa_pairs
+        wanted = set(scene_ids)
+        return [qa for qa in self.qa_pairs if qa["scene_id"] in wanted]
+
+    def iter_qa_pair_chunks(self, scene_ids: Optional[Sequence[str]] = None, **kwargs) -> Iterator[List[Dict[str, Any]]]:
+        rows = self._select(scene_ids)
+        for start in range(0, len(rows), self.chunk_size):
+            yield rows[start:start + self.chunk_size]
+
+    def iter_qa_pairs(self, scene_ids: Optional[Sequence[str]] = None, **kwargs) -> Iterator[Dict[str, Any]]:
+        for chunk in self.iter_qa_pair_chunks(scene_ids):
+            yield from chunk
+
+    async def aiter_qa_pair_chunks(self, scene_ids: Optional[Sequence[str]] = None, **kwargs) -> AsyncIterator[List[Dict[str, Any]]]:
+        for chunk in self.iter_qa_pair_chunks(scene_ids):
+            yield chunk
+            await asyncio.sleep(0)
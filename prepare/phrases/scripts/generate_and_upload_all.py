@@ -1,18 +1,69 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-一键生成音频并上传到 Vercel Blob
-1. 使用 edge-tts 生成所有音频
-2. 调用 TypeScript 脚本上传到 Vercel Blob
-3. 更新 JSON 文件中的 audioUrl
+一键生成音频并上传（生成与上传在同一进程内流水线并行）
+
+每个音频合成完成即进入有界上传队列，由上传 worker 并行上传到腾讯云COS，
+上传成功后更新 JSON 或数据库，总耗时约等于合成与上传中较慢的一段：
+- phrases: 短语/示例音频 → COS (phrases/...) → 更新 phrases_100_quality.json 的 audioUrl（COS:/ 格式）
+- qa:      问答对音频 → COS (qa/...) → 批量回写 qa_pairs.audio_url 与 responses[].audio_url，
+           最后汇总各场景的单词时间索引 → COS (qa/timings/...)
+
+使用方法:
+  python prepare/phrases/scripts/generate_and_upload_all.py                    # 短语
+  python prepare/phrases/scripts/generate_and_upload_all.py --target qa --scenes daily_001
+  python prepare/phrases/scripts/generate_and_upload_all.py --target all --upload-workers 16
+  python prepare/phrases/scripts/generate_and_upload_all.py --target qa --postprocess   # 上传前做响度归一化/裁剪/转码
+  python prepare/phrases/scripts/generate_and_upload_all.py --target all --resume       # 只合成任务日志中未完成的
+  python prepare/phrases/scripts/generate_and_upload_all.py --target all --tts-backend piper   # 本机离线合成
+
+  # 原流程：先生成全部音频，再调用 TypeScript 脚本上传到 Vercel Blob
+  python prepare/phrases/scripts/generate_and_upload_all.py --legacy
 """
 
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import shutil
 import subprocess
 import sys
+import threading
+import time
 from pathlib import Path
+from typing import Dict
+
+from dotenv import load_dotenv
 
 SCRIPTS_DIR = Path(__file__).parent
-PROJECT_DIR = SCRIPTS_DIR.parent.parent
+PROJECT_DIR = SCRIPTS_DIR.parent.parent.parent
+PREPARE_DIR = PROJECT_DIR / "prepare"
+QA_AUDIO_DIR = PREPARE_DIR / "qa_audio"
+
+load_dotenv(PROJECT_DIR / ".env.local")
+
+sys.path.insert(0, str(PREPARE_DIR))
+from audio_common.job_journal import STAGE_GENERATE, JobJournal, clip_key, run_mode
+from audio_common.pipeline import UploadStage, DEFAULT_UPLOAD_WORKERS
+from audio_common.postprocess import PostProcessError, PostProcessor, PostProcessSettings
+from audio_common.qa_source import SOURCE_NAMES, get_db_connection, open_qa_source
+from audio_common.qa_writeback import AudioUrlWriteback, cos_url
+from audio_common.tts_backends import BACKEND_NAMES, TTSBackend, TTSBackendError, open_backend
+from audio_common.tts_cache import TTSCache
+from audio_common.upload_manifest import UploadManifest
+from audio_common.word_timings import TimingIndexBuilder
+
+# 短语音频在 COS 中的前缀
+PHRASES_COS_PREFIX = "phrases/"
+
+
+def load_script(path: Path, name: str):
+    """按路径加载脚本模块（qa_audio 下的脚本名以数字开头，无法直接 import）"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
 
 
 def run_command(cmd: list[str], cwd: Path = None, description: str = "") -> bool:
@@ -36,7 +87,8 @@ def run_command(cmd: list[str], cwd: Path = None, description: str = "") -> bool
         return False
 
 
-def main():
+def run_legacy() -> None:
+    """原流程：子进程生成全部音频后，再调用 TypeScript 脚本上传到 Vercel Blob"""
     print("🚀 开始一键生成音频并上传到 Vercel Blob\n")
 
     # 步骤 1: 生成音频
@@ -62,5 +114,296 @@ def main():
     print("="*50)
 
 
+def print_stage_stats(stage: UploadStage, elapsed: float) -> None:
+    print(f"   上传队列: 提交 {stage.stats['submitted']}，成功 {stage.stats['uploaded']}，"
+          f"失败 {stage.stats['failed']}，最大队列深度 {stage.stats['max_queue_depth']}")
+    print(f"   总耗时: {elapsed:.1f}s")
+
+
+# ============================================================
+# 短语流水线
+# ============================================================
+
+def clip_ready_callback(stage: UploadStage, postprocessor):
+    """合成完成的音频进入上传队列；开启后处理时先后处理，成功后再上传"""
+    return postprocessor.then(stage.submit) if postprocessor else stage.submit
+
+
+def update_phrases_json(json_file: Path, url_map: Dict[str, str]) -> int:
+    """把上传得到的 COS:/ 路径写回短语 JSON（写入前备份），返回更新的条数"""
+    with open(json_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    updated = 0
+    for phrase in data.get("phrases", []):
+        url = url_map.get(f"phrases/{phrase['id']}.mp3")
+        if url and phrase.get("audioUrl") != url:
+            phrase["audioUrl"] = url
+            updated += 1
+        for i, example in enumerate(phrase.get("examples") or []):
+            url = url_map.get(f"examples/{phrase['id']}_ex{i+1}.mp3")
+            if url and example.get("audioUrl") != url:
+                example["audioUrl"] = url
+                updated += 1
+
+    if updated:
+        backup_path = json_file.with_name(f"{json_file.name}.backup.{int(time.time() * 1000)}")
+        shutil.copy2(json_file, backup_path)
+        print(f"  💾 已备份原文件到: {backup_path.name}")
+        with open(json_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    return updated
+
+
+async def run_phrases_pipeline(args, postprocessor, backend: TTSBackend) -> bool:
+    import generate_audio_edge_tts as phrase_tts
+    cos = load_script(QA_AUDIO_DIR / "2_upload_to_cos.py", "qa_upload_to_cos")
+    backend.check_voices([phrase_tts.VOICE])
+
+    print("\n📌 短语音频: 生成 → 上传COS → 更新JSON")
+    with open(phrase_tts.JSON_FILE, "r", encoding="utf-8") as f:
+        phrases = json.load(f).get("phrases", [])
+
+    uploader = cos.init_cos_client(args.upload_workers)
+    manifest = UploadManifest(phrase_tts.AUDIO_DIR / "upload_manifest.json")
+    url_map: Dict[str, str] = {}
+    url_lock = threading.Lock()
+
+    def upload(path: Path) -> bool:
+        rel_path = path.relative_to(phrase_tts.AUDIO_DIR).as_posix()
+        cos_path = f"{PHRASES_COS_PREFIX}{rel_path}"
+        if not manifest.is_unchanged(path, cos_path):
+            result = cos.upload_to_cos(uploader, path, cos_path)
+            if result is None:
+                return False
+            manifest.record(path, cos_path, result.etag, result.md5)
+        with url_lock:
+            url_map[rel_path] = cos_url(cos_path)
+        return True
+
+    stage = UploadStage(upload, args.upload_workers)
+    cache = TTSCache()
+    journal = JobJournal(phrase_tts.JOURNAL_PATH)
+    select = journal.selector(STAGE_GENERATE, run_mode(args))
+    generator = phrase_tts.AudioGenerator(args.concurrency, cache, args.batch_size, journal, backend=backend)
+    generator.on_clip_ready = clip_ready_callback(stage, postprocessor)
+
+    started = time.monotonic()
+    stage.start()
+    try:
+        if select:
+            # 按任务日志跳过合成的音频仍进入上传阶段（上传清单会过滤内容未变的），保证 JSON 中的 audioUrl 完整
+            for _, path in generator.collect_items(phrases):
+                if not select(clip_key(path)) and path.exists():
+                    await stage.submit(path)
+        await generator.process_phrases(phrases, select)
+    finally:
+        await stage.finish()
+        cache.save()
+        manifest.save()
+        phrase_tts.validator.save()
+        journal.flush()
+
+    updated = update_phrases_json(phrase_tts.JSON_FILE, url_map)
+    generator.print_summary()
+    journal.close()
+    print(f"   JSON 更新: {updated} 条 audioUrl")
+    print_stage_stats(stage, time.monotonic() - started)
+    return generator.stats["failed"] == 0 and stage.stats["failed"] == 0
+
+
+# ============================================================
+# 问答对流水线
+# ============================================================
+
+async def run_qa_pipeline(args, postprocessor, backend: TTSBackend) -> bool:
+    gen = load_script(QA_AUDIO_DIR / "1_generate_audio.py", "qa_generate_audio")
+    cos = load_script(QA_AUDIO_DIR / "2_upload_to_cos.py", "qa_upload_to_cos")
+    backend.check_voices([gen.QUESTION_VOICE, *gen.ANSWER_VOICES])
+    gen.tts_backend = backend
+
+    print("\n📌 问答对音频: 生成 → 上传COS → 回写数据库")
+    gen.QUESTIONS_DIR.mkdir(parents=True, exist_ok=True)
+    gen.RESPONSES_DIR.mkdir(parents=True, exist_ok=True)
+
+    uploader = cos.init_cos_client(args.upload_workers)
+    manifest = UploadManifest(cos.MANIFEST_PATH)
+    source = open_qa_source(args.source)
+    writeback = None
+    writeback_conn = None
+    if args.source == "files" and not os.getenv("DATABASE_URL"):
+        print("   ⚠️ 未设置 DATABASE_URL，跳过数据库回写")
+    else:
+        writeback = AudioUrlWriteback()
+        writeback_conn = get_db_connection()
+    db_lock = threading.Lock()
+
+    def upload(path: Path) -> bool:
+        kind = path.parent.name  # questions / responses
+        cos_path = f"{cos.COS_PREFIX}{kind}/{path.name}"
+        if not cos.upload_clip(uploader, path, cos_path, kind, manifest):
+            return False
+        if writeback is None:
+            return True
+        if kind == "questions":
+            writeback.add_question(path.stem, cos_path)
+        else:
+            qa_id, idx = path.stem.rsplit("_response", 1)
+            writeback.add_response(qa_id, int(idx), cos_path)
+        if writeback.pending() >= writeback.batch_size:
+            with db_lock:
+                writeback.flush(writeback_conn)
+        return True
+
+    stage = UploadStage(upload, args.upload_workers)
+    stats = gen.new_stats()
+    cache = TTSCache()
+    # 生成与上传共用任务日志；--resume / --retry-failed 只作用于合成，上传由上传清单过滤
+    journal = JobJournal(gen.JOURNAL_PATH)
+    cos.journal = journal
+    select = journal.selector(STAGE_GENERATE, run_mode(args))
+    scheduler = gen.SynthesisScheduler(args.concurrency, args.voice_rate, cache, args.batch_size, journal)
+    on_clip_ready = clip_ready_callback(stage, postprocessor)
+    scheduler.on_clip_ready = on_clip_ready
+    cos.timing_index = TimingIndexBuilder(cos.AUDIO_DIR, cos.TIMINGS_DIR, [gen.QUESTIONS_DIR.name, gen.RESPONSES_DIR.name])
+
+    async def plan_chunks():
+        async for chunk in source.aiter_qa_pair_chunks(args.scenes):
+            cos.timing_index.add_qa_pairs(chunk)
+            jobs = []
+            for qa in chunk:
+                planned = gen.plan_qa_pair_jobs(qa, stats, False, cache, journal, select)
+                jobs.extend(planned)
+                # 无需合成的文件直接进入后处理/上传阶段（已处理、上传清单中内容未变的会被跳过）
+                pending_paths = {job.output_path for job in planned}
+                for path in gen.clip_paths(qa):
+                    if path not in pending_paths and path.exists():
+                        await on_clip_ready(path)
+            yield jobs
+
+    started = time.monotonic()
+    stage.start()
+    try:
+        await scheduler.run_stream(plan_chunks(), stats)
+    finally:
+        await stage.finish()
+        cache.save()
+        manifest.save()
+        cos.validator.save()
+        journal.flush()
+        if writeback:
+            with db_lock:
+                writeback.flush(writeback_conn, force=True)
+            writeback_conn.close()
+
+    # 后处理（平移单词时间）和上传都结束后再汇总各场景的单词时间索引
+    cos.upload_timing_indexes(uploader, manifest)
+    manifest.save()
+
+    print(f"   生成: 问题 成功 {stats['questions_success']} / 失败 {stats['questions_failed']}，"
+          f"答案 成功 {stats['responses_success']} / 失败 {stats['responses_failed']}")
+    print(f"   上传: 问题 {cos.stats['questions_uploaded']}（未变化 {cos.stats['questions_unchanged']}，"
+          f"不完整 {cos.stats['questions_invalid']}），"
+          f"答案 {cos.stats['responses_uploaded']}（未变化 {cos.stats['responses_unchanged']}，"
+          f"不完整 {cos.stats['responses_invalid']}）")
+    print(f"   单词时间索引: 重建 {cos.timing_index.stats['built']} 个场景，上传 {cos.stats['timings_uploaded']}，"
+          f"失败 {cos.stats['timings_failed']}")
+    if writeback:
+        print(f"   数据库回写: 问题 {writeback.updated['questions']} 行，答案 {writeback.updated['responses']} 行")
+    if select:
+        print(f"   按任务日志跳过合成: {stats['journal_skipped']}")
+    journal.print_summary(STAGE_GENERATE, "任务日志（生成）")
+    journal.close()
+    print_stage_stats(stage, time.monotonic() - started)
+    failed = stats["questions_failed"] + stats["responses_failed"] + stage.stats["failed"] + cos.stats["timings_failed"]
+    return failed == 0
+
+
+async def run_pipelines(args) -> bool:
+    postprocessor = None
+    if args.postprocess:
+        try:
+            postprocessor = PostProcessor(PostProcessSettings(target_lufs=args.target_lufs, variants=tuple(args.variants)))
+        except PostProcessError as e:
+            print(f"❌ 错误: {e}")
+            sys.exit(1)
+
+    try:
+        backend = open_backend(args.tts_backend, args.voice_map, args.tts_workers)
+    except TTSBackendError as e:
+        print(f"❌ 错误: {e}")
+        sys.exit(1)
+    if not backend.remote:
+        # 本地合成不需要限速；并发数至少为进程数，进程池才能跑满
+        args.voice_rate = 0
+        args.concurrency = max(args.concurrency, backend.workers)
+    if args.batch_size > 1 and not backend.supports_batch:
+        print(f"⚠️ {backend.name} 后端不支持批量合成，改为逐条合成")
+        args.batch_size = 1
+    print(f"🎙️ TTS 后端: {backend.engine}")
+
+    ok = True
+    try:
+        if args.target in ("phrases", "all"):
+            ok = await run_phrases_pipeline(args, postprocessor, backend) and ok
+        if args.target in ("qa", "all"):
+            ok = await run_qa_pipeline(args, postprocessor, backend) and ok
+    except TTSBackendError as e:
+        print(f"❌ 错误: {e}")
+        ok = False
+    finally:
+        backend.close()
+        if postprocessor:
+            postprocessor.close()
+    if postprocessor:
+        postprocessor.print_summary()
+        ok = ok and postprocessor.stats["failed"] == 0
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="一键生成音频并上传（生成与上传流水线并行）")
+    parser.add_argument("--target", choices=["phrases", "qa", "all"], default="phrases",
+                        help="处理短语、问答对或全部（默认 phrases）")
+    parser.add_argument("--scenes", nargs="+", help="问答对: 指定场景ID列表（可选）")
+    parser.add_argument("--source", choices=SOURCE_NAMES, default="db",
+                        help="问答对来源: db=数据库（默认），files=子场景 JSON 文件（无 DATABASE_URL 时不回写）")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时进行的TTS请求数（默认 8）")
+    parser.add_argument("--voice-rate", type=float, default=4.0, help="问答对: 每个音色每秒最多请求数（默认 4）")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="同一音色每批合成的条数，>1 时一次请求合成多条再按单词边界切分（默认 1 不批量）")
+    parser.add_argument("--postprocess", action="store_true",
+                        help="上传前做响度归一化、静音裁剪并转为低码率 MP3（需要 numpy 和 ffmpeg）")
+    parser.add_argument("--variants", nargs="+", choices=["opus", "aac"], default=[],
+                        help="后处理时额外在本地输出的格式（.opus / .m4a，不上传）")
+    parser.add_argument("--target-lufs", type=float, default=-16.0, help="后处理目标响度（默认 -16 LUFS）")
+    resume_group = parser.add_mutually_exclusive_group()
+    resume_group.add_argument("--resume", action="store_true",
+                              help="只合成任务日志中未完成的音频（上传由上传清单过滤内容未变的）")
+    resume_group.add_argument("--retry-failed", action="store_true", help="只重新合成任务日志中上次失败的音频")
+    parser.add_argument("--tts-backend", choices=BACKEND_NAMES, default="edge",
+                        help="TTS 后端: edge=edge-tts（远程，默认），piper / espeak=本机 CPU 离线合成（进程池）")
+    parser.add_argument("--voice-map", type=Path, help="音色映射 JSON，按后端覆盖默认映射")
+    parser.add_argument("--tts-workers", type=int, help="本地后端的合成进程数（默认 CPU 核数）")
+    parser.add_argument("--upload-workers", type=int, default=DEFAULT_UPLOAD_WORKERS,
+                        help=f"上传 worker 数（默认 {DEFAULT_UPLOAD_WORKERS}）")
+    parser.add_argument("--legacy", action="store_true",
+                        help="使用原流程：生成全部音频后再调用 TypeScript 脚本上传到 Vercel Blob")
+    args = parser.parse_args()
+
+    if args.legacy:
+        run_legacy()
+        return
+
+    print("🚀 开始一键生成音频并上传（流水线模式）\n")
+    if not asyncio.run(run_pipelines(args)):
+        print("\n⚠️ 部分音频生成或上传失败，请检查日志")
+        sys.exit(1)
+
+    print("\n" + "="*50)
+    print("✨ 全部完成！音频已生成并上传到腾讯云COS")
+    print("="*50)
+
+
 if __name__ == "__main__":
     main()
@@ -1,54 +1,177 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-使用 edge-tts 生成音频文件
+使用 edge-tts（或本机离线的 Piper / eSpeak NG，--tts-backend）生成音频文件
 1. 读取 phrases_100_quality.json
-2. 为每个短语和示例生成音频
-3. 保存到本地目录
+2. 为每个短语和示例生成音频（固定数量的 worker 持续从队列取任务，自适应限流）
+3. 保存到本地目录（edge-tts 在同一次请求中给出单词时间，写入同名 .words.json，见 audio_common/word_timings.py）
+
+使用方法:
+  python prepare/phrases/scripts/generate_audio_edge_tts.py
+  python prepare/phrases/scripts/generate_audio_edge_tts.py --concurrency 8
+  python prepare/phrases/scripts/generate_audio_edge_tts.py --no-cache   # 仅按文件名判断跳过
+  python prepare/phrases/scripts/generate_audio_edge_tts.py --batch-size 16   # 每 16 条合成一次再按单词边界切分
+  python prepare/phrases/scripts/generate_audio_edge_tts.py --postprocess --variants opus   # 响度归一化/裁剪/转码
+  python prepare/phrases/scripts/generate_audio_edge_tts.py --resume         # 只处理任务日志中未完成的
+  python prepare/phrases/scripts/generate_audio_edge_tts.py --retry-failed   # 只重试上次失败的
+  python prepare/phrases/scripts/generate_audio_edge_tts.py --shard 0/4      # 只处理 4 份中的第 0 份
+  python prepare/qa_audio/run_shards.py phrases --shards 4 -- --voice-rate 4   # 本机 4 个分片，合计限速
+  python prepare/phrases/scripts/generate_audio_edge_tts.py --tts-backend espeak   # 离线合成（本机进程池）
+  python prepare/phrases/scripts/generate_audio_edge_tts.py --metrics-dir prepare/phrases/data/metrics --profile-stage tts
+  python prepare/qa_audio/plan_audio.py --target phrases --out plan.json             # 预演并写出计划
+  python prepare/phrases/scripts/generate_audio_edge_tts.py --plan plan.json         # 只处理计划中的音频
 """
 
+import argparse
 import asyncio
 import json
 import os
 import sys
+import time
 from pathlib import Path
-from typing import List, Dict, Any
-import edge_tts
+from typing import List, Dict, Any, Awaitable, Callable, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+from audio_common import word_timings
+from audio_common.audio_validator import shared_validator, validate_bytes
+from audio_common.job_journal import STAGE_GENERATE, JobJournal, clip_key, run_mode
+from audio_common.metrics import metrics
+from audio_common.tts_cache import TTSCache, FRESH, LINKED
+from audio_common.tts_backends import BACKEND_NAMES, EdgeBackend, TTSBackend, TTSBackendError, open_backend
+from audio_common.tts_batch import DEFAULT_BATCH_SIZE, batched
+from audio_common.postprocess import PostProcessError, PostProcessor, PostProcessSettings
+from audio_common.rate_limit import SharedRateLimiter
+from audio_common.run_plan import PlanError, ThroughputHistory, describe_plan, plan_selector, read_plan
+from audio_common.sharding import ShardAssigner, parse_shard, text_weight, write_stats
 
 # 配置
-VOICE = "en-US-AriaNeural"  # 美式英语女声，发音清晰
+VOICE = "en-US-AriaNeural"  # 美式英语女声，发音清晰（edge-tts 音色名，其他后端按音色映射换成本地音色）
+TTS_RATE = "+0%"
 DATA_DIR = Path(__file__).parent.parent / "data"
 AUDIO_DIR = DATA_DIR / "audio"
 JSON_FILE = DATA_DIR / "phrases_100_quality.json"
 
+# 并发与限流配置
+MAX_CONCURRENCY = 5          # 同时进行的 TTS 请求上限
+SLOW_LATENCY = 8.0           # 单次合成超过该秒数视为服务变慢
+MAX_BACKOFF_DELAY = 5.0      # 出错时请求前的最大等待（秒）
+
 # 确保音频目录存在
 PHRASES_DIR = AUDIO_DIR / "phrases"
 EXAMPLES_DIR = AUDIO_DIR / "examples"
 PHRASES_DIR.mkdir(parents=True, exist_ok=True)
 EXAMPLES_DIR.mkdir(parents=True, exist_ok=True)
 
+# 音频校验结果索引：已有文件未通过 MP3 结构校验时重新生成
+validator = shared_validator(AUDIO_DIR / "validation_index.json")
+
+# 任务日志：记录每个音频的生成状态，用于 --resume / --retry-failed
+JOURNAL_PATH = AUDIO_DIR / "jobs.sqlite"
+
+
+class AdaptiveThrottle:
+    """
+    自适应限流（AIMD）
+    - 正常时不等待，连续成功后逐步把并发上限恢复到 max_concurrency
+    - 出错时并发上限减半并增加请求前等待；延迟升高时并发上限减一
+    """
+
+    def __init__(self, max_concurrency: int, slow_latency: float = SLOW_LATENCY):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.slow_latency = slow_latency
+        self.delay = 0.0
+        self.in_flight = 0
+        self._successes = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        if self.delay > 0:
+            await asyncio.sleep(self.delay)
+
+    async def release(self, ok: bool, latency: float) -> None:
+        async with self._cond:
+            self.in_flight -= 1
+            if not ok:
+                self.limit = max(1, self.limit // 2)
+                self.delay = min(MAX_BACKOFF_DELAY, max(0.25, self.delay * 2))
+                self._successes = 0
+            elif latency > self.slow_latency:
+                self.limit = max(1, self.limit - 1)
+                self._successes = 0
+            else:
+                self._successes += 1
+                self.delay = self.delay / 2 if self.delay > 0.05 else 0.0
+                if self._successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+PendingItem = Tuple[str, Path, str, List[Path]]
+
 
 class AudioGenerator:
-    def __init__(self):
+    def __init__(
+        self,
+        concurrency: int = MAX_CONCURRENCY,
+        cache: Optional[TTSCache] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        journal: Optional[JobJournal] = None,
+        limiter: Optional[SharedRateLimiter] = None,
+        backend: Optional[TTSBackend] = None,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.cache = cache
+        self.journal = journal
+        self.limiter = limiter   # 请求速率上限（分片并行时跨进程共享），None 表示只做自适应限流
+        self.backend = backend or EdgeBackend()
+        self.voice = self.backend.voice(VOICE)
+        self.batch_size = max(1, batch_size) if self.backend.supports_batch else 1
+        # 每个音频文件就绪（生成、跳过或从缓存链接）后的回调，供流水线上传使用
+        self.on_clip_ready: Optional[Callable[[Path], Awaitable[None]]] = None
         self.stats = {
             "total": 0,
             "success": 0,
             "failed": 0,
-            "skipped": 0
+            "skipped": 0,
+            "cached": 0,
+            "batch_requests": 0,
+            "batch_fallbacks": 0,
+            "journal_skipped": 0,
         }
         self.failed_items: List[str] = []
+        self.errors: Dict[Path, str] = {}   # 输出路径 -> 最近一次失败原因，写入任务日志
 
-    async def generate_audio(self, text: str, output_path: Path) -> bool:
+    async def generate_audio(self, text: str, output_path: Path, overwrite: bool = False) -> bool:
         """生成单个音频文件"""
         try:
-            # 如果文件已存在，跳过
-            if output_path.exists():
+            # 如果文件已存在且完整，跳过
+            if not overwrite and validator.is_valid(output_path):
                 print(f"  ⏭️  跳过已存在: {output_path.name}")
                 self.stats["skipped"] += 1
                 return True
 
-            communicate = edge_tts.Communicate(text, VOICE)
-            await communicate.save(str(output_path))
+            # 先写临时文件，校验通过后再替换，中途失败不会留下残缺文件
+            tmp_path = output_path.with_name(output_path.name + ".tmp")
+            try:
+                with metrics.stage("tts", voice=self.voice, chars=len(text)):
+                    data, words = await self.backend.synthesize_words(text, self.voice, TTS_RATE)
+                with metrics.stage("validate"):
+                    result = validate_bytes(data)
+                if not result.ok:
+                    raise ValueError(f"音频不完整（{result.reason}）")
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, output_path)
+                word_timings.write(output_path, words, len(data))
+                metrics.inc("tts_bytes", len(data))
+                metrics.inc("tts_chars", len(text))
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
             print(f"  ✅ 生成成功: {output_path.name}")
             self.stats["success"] += 1
             return True
@@ -56,37 +179,218 @@ class AudioGenerator:
             print(f"  ❌ 生成失败: {output_path.name} - {str(e)}")
             self.stats["failed"] += 1
             self.failed_items.append(f"{output_path.name}: {text}")
+            self.errors[output_path] = f"{type(e).__name__}: {e}"
             return False
 
-    async def process_phrases(self, phrases: List[Dict[str, Any]]):
-        """处理所有短语和示例"""
-        tasks = []
+    async def generate_batch(self, texts: List[str]) -> Optional[List[Tuple[bytes, Optional[word_timings.Words]]]]:
+        """一次请求合成多条文本并切分，返回 (音频, 单词时间)，失败或无法切分时返回 None"""
+        try:
+            with metrics.stage("tts_batch", voice=self.voice, texts=len(texts), chars=sum(map(len, texts))):
+                clips = await self.backend.synthesize_batch(texts, self.voice, TTS_RATE)
+        except Exception as e:
+            print(f"  ⚠️ 批量合成失败（{len(texts)} 条）: {e}，改为逐条合成")
+            return None
+        if clips is None:
+            print(f"  ⚠️ 批量合成无法按单词边界切分（{len(texts)} 条），改为逐条合成")
+        return clips
+
+    def collect_items(self, phrases: List[Dict[str, Any]]) -> List[Tuple[str, Path]]:
+        """展开所有短语和示例的 (文本, 输出路径)"""
+        items: List[Tuple[str, Path]] = []
 
         for phrase in phrases:
             phrase_id = phrase["id"]
-            phrase_text = phrase["english"]
 
             # 短语音频
-            phrase_audio_path = PHRASES_DIR / f"{phrase_id}.mp3"
-            self.stats["total"] += 1
-            tasks.append(self.generate_audio(phrase_text, phrase_audio_path))
+            items.append((phrase["english"], PHRASES_DIR / f"{phrase_id}.mp3"))
 
             # 示例音频
             if "examples" in phrase and phrase["examples"]:
                 for i, example in enumerate(phrase["examples"]):
-                    example_text = example["english"]
-                    example_audio_path = EXAMPLES_DIR / f"{phrase_id}_ex{i+1}.mp3"
-                    self.stats["total"] += 1
-                    tasks.append(self.generate_audio(example_text, example_audio_path))
-
-        # 批量执行，限制并发数
-        batch_size = 5
-        for i in range(0, len(tasks), batch_size):
-            batch = tasks[i:i+batch_size]
-            await asyncio.gather(*batch, return_exceptions=True)
-            print(f"  进度: {min(i+batch_size, len(tasks))}/{len(tasks)}")
-            # 小延迟避免请求过快
-            await asyncio.sleep(0.5)
+                    items.append((example["english"], EXAMPLES_DIR / f"{phrase_id}_ex{i+1}.mp3"))
+
+        return items
+
+    def resolve_cached(
+        self, items: List[Tuple[str, Path]], ready: Optional[List[Path]] = None
+    ) -> List[PendingItem]:
+        """
+        通过 TTS 缓存过滤任务：文本未变的跳过，缓存命中的直接链接（二者加入 ready），
+        返回 (文本, 输出路径, 缓存键, 相同内容的其他输出路径) 列表
+        """
+        pending: Dict[str, PendingItem] = {}
+        for text, output_path in items:
+            if self.cache is None:
+                pending[str(output_path)] = (text, output_path, "", [])
+                continue
+
+            key = self.cache.key(text, self.voice, TTS_RATE, self.backend.engine)
+            state = self.cache.resolve(output_path, key, validator.is_valid)
+            if state == FRESH:
+                self.stats["skipped"] += 1
+            elif state == LINKED:
+                print(f"  🔗 缓存命中: {output_path.name}")
+                self.stats["cached"] += 1
+            if state in (FRESH, LINKED):
+                if self.journal:
+                    self.journal.done(STAGE_GENERATE, clip_key(output_path))
+                if ready is not None:
+                    ready.append(output_path)
+            elif key in pending:
+                pending[key][3].append(output_path)
+            else:
+                pending[key] = (text, output_path, key, [])
+        return list(pending.values())
+
+    async def _notify(self, path: Path) -> None:
+        if self.on_clip_ready:
+            await self.on_clip_ready(path)
+
+    async def process_phrases(self, phrases: List[Dict[str, Any]], select: Optional[Callable[[str], bool]] = None):
+        """
+        处理所有短语和示例：N 个 worker 持续取任务，始终保持 N 个请求在途
+        select 为任务日志的筛选函数（--resume / --retry-failed），未选中的音频不做任何检查
+        """
+        items = self.collect_items(phrases)
+        if select:
+            selected = [item for item in items if select(clip_key(item[1]))]
+            self.stats["journal_skipped"] += len(items) - len(selected)
+            items = selected
+        if self.journal:
+            self.journal.register(STAGE_GENERATE, [clip_key(path) for _, path in items])
+        self.stats["total"] += len(items)
+        ready: List[Path] = []
+        pending = self.resolve_cached(items, ready)
+        for path in ready:
+            await self._notify(path)
+        total = len(pending)
+        if total == 0:
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for batch in self.plan_batches(pending):
+            queue.put_nowait(batch)
+
+        throttle = AdaptiveThrottle(self.concurrency)
+        done = 0
+
+        async def worker() -> None:
+            nonlocal done
+            while True:
+                try:
+                    batch = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                metrics.set_gauge("tts_queue_depth", queue.qsize())
+
+                if len(batch) > 1:
+                    await self._run_batch(batch, throttle)
+                else:
+                    await self._run_item(batch[0], throttle)
+
+                done += len(batch)
+                metrics.set_gauge("tts_concurrency_limit", throttle.limit)
+                print(f"  进度: {done}/{total}（并发上限 {throttle.limit}）")
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, queue.qsize()))))
+
+    def plan_batches(self, pending: List[PendingItem]) -> List[List[PendingItem]]:
+        """需要合成的任务按 batch_size 分批；未启用缓存且文件已存在的任务会被跳过，不参与批量"""
+        if self.batch_size <= 1:
+            return [[item] for item in pending]
+        singles: List[PendingItem] = []
+        batchable: List[PendingItem] = []
+        for item in pending:
+            (singles if not item[2] and validator.is_valid(item[1]) else batchable).append(item)
+        return [[item] for item in singles] + batched(batchable, self.batch_size, lambda item: item[0])
+
+    async def _acquire(self, throttle: AdaptiveThrottle) -> None:
+        """等待限流名额（自适应并发上限 + 请求速率上限），等待时间计入 rate_wait"""
+        with metrics.stage("rate_wait", voice=self.voice):
+            await throttle.acquire()
+            if self.limiter:
+                await self.limiter.acquire(self.voice)
+
+    async def _run_item(self, item: PendingItem, throttle: AdaptiveThrottle) -> None:
+        text, output_path, key, duplicates = item
+        if not key and validator.is_valid(output_path):
+            # 已存在的文件不占用限流名额
+            ok = await self.generate_audio(text, output_path)
+        else:
+            if self.journal:
+                self.journal.start(STAGE_GENERATE, clip_key(output_path))
+            loop = asyncio.get_running_loop()
+            await self._acquire(throttle)
+            started = loop.time()
+            ok = False
+            try:
+                ok = await self.generate_audio(text, output_path, overwrite=bool(key))
+            finally:
+                await throttle.release(ok, loop.time() - started)
+        await self._finish_item(item, ok)
+
+    async def _run_batch(self, batch: List[PendingItem], throttle: AdaptiveThrottle) -> None:
+        """一次请求合成整批，切分后写入各自的文件；无法切分时逐条合成"""
+        if self.journal:
+            for item in batch:
+                self.journal.start(STAGE_GENERATE, clip_key(item[1]))
+        loop = asyncio.get_running_loop()
+        await self._acquire(throttle)
+        started = loop.time()
+        clips = None
+        try:
+            clips = await self.generate_batch([item[0] for item in batch])
+        finally:
+            await throttle.release(clips is not None, loop.time() - started)
+
+        if clips is None:
+            self.stats["batch_fallbacks"] += 1
+            for item in batch:
+                await self._run_item(item, throttle)
+            return
+        self.stats["batch_requests"] += 1
+        for item, (clip, words) in zip(batch, clips):
+            output_path = item[1]
+            with metrics.stage("validate"):
+                valid = validate_bytes(clip).ok
+            if not valid:
+                # 切出的片段过短或不完整（多为对齐偏差），这一条单独合成
+                await self._run_item(item, throttle)
+                continue
+            with metrics.stage("write"):
+                tmp_path = output_path.with_name(output_path.name + ".tmp")
+                tmp_path.write_bytes(clip)
+                os.replace(tmp_path, output_path)
+                word_timings.write(output_path, words, len(clip))
+            metrics.inc("tts_bytes", len(clip))
+            metrics.inc("tts_chars", len(item[0]))
+            print(f"  ✅ 生成成功: {output_path.name}")
+            self.stats["success"] += 1
+            await self._finish_item(item, True)
+
+    async def _finish_item(self, item: PendingItem, ok: bool) -> None:
+        """写入缓存、链接相同内容的其他输出，写入任务日志，并通知流水线"""
+        text, output_path, key, duplicates = item
+        if self.journal:
+            for path in [output_path, *duplicates]:
+                if ok:
+                    self.journal.done(STAGE_GENERATE, clip_key(path))
+                else:
+                    self.journal.fail(STAGE_GENERATE, clip_key(path), self.errors.get(output_path, "生成失败"))
+        if key:
+            if ok:
+                self.cache.store(key, output_path)
+                for duplicate in duplicates:
+                    self.cache.materialize(key, duplicate)
+                    self.stats["cached"] += 1
+            elif duplicates:
+                self.stats["failed"] += len(duplicates)
+                self.failed_items.extend(f"{d.name}: {text}" for d in duplicates)
+                duplicates = []
+
+        if ok:
+            for path in [output_path, *duplicates]:
+                await self._notify(path)
 
     def print_summary(self):
         """打印统计信息"""
@@ -96,7 +400,14 @@ class AudioGenerator:
         print(f"   总计: {self.stats['total']}")
         print(f"   成功: {self.stats['success']}")
         print(f"   跳过: {self.stats['skipped']}")
+        print(f"   缓存: {self.stats['cached']}")
         print(f"   失败: {self.stats['failed']}")
+        if self.batch_size > 1:
+            print(f"   批量请求: {self.stats['batch_requests']}（回退逐条: {self.stats['batch_fallbacks']} 批）")
+        if self.stats["journal_skipped"]:
+            print(f"   按任务日志/计划跳过（未检查）: {self.stats['journal_skipped']}")
+        if self.journal:
+            self.journal.print_summary(STAGE_GENERATE)
 
         if self.failed_items:
             print("\n❌ 失败的项目:")
@@ -105,8 +416,70 @@ class AudioGenerator:
 
 
 async def main():
-    print("🎵 开始使用 edge-tts 生成音频文件\n")
-    print(f"🎙️  使用语音: {VOICE}")
+    parser = argparse.ArgumentParser(description="使用 edge-tts（或本机离线 TTS）生成短语音频")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY,
+                        help=f"同时进行的TTS请求上限（默认 {MAX_CONCURRENCY}）")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="不使用内容寻址TTS缓存（仅按文件名判断跳过）")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="每批合成的条数，>1 时一次请求合成多条再按单词边界切分（默认 1 不批量）")
+    parser.add_argument("--postprocess", action="store_true",
+                        help="生成后做响度归一化、静音裁剪并转为低码率 MP3（需要 numpy 和 ffmpeg）")
+    parser.add_argument("--variants", nargs="+", choices=["opus", "aac"], default=[],
+                        help="后处理时额外输出的格式（.opus / .m4a，与 MP3 同名同目录）")
+    parser.add_argument("--target-lufs", type=float, default=-16.0, help="后处理目标响度（默认 -16 LUFS）")
+    resume_group = parser.add_mutually_exclusive_group()
+    resume_group.add_argument("--resume", action="store_true",
+                              help="只处理任务日志中未完成的音频（上次中途退出后使用）")
+    resume_group.add_argument("--retry-failed", action="store_true", help="只重试任务日志中上次失败的音频")
+    resume_group.add_argument("--plan", type=Path,
+                              help="按 plan_audio.py --target phrases 写出的计划执行（只处理需要合成/链接的音频）")
+    parser.add_argument("--voice-rate", type=float, default=0.0,
+                        help="每秒最多请求数，<=0 不限速（默认，仅自适应限流）")
+    parser.add_argument("--rate-limit-db", type=Path,
+                        help="跨进程共享限速的 SQLite 文件（同一文件的所有进程合计每秒最多 --voice-rate 个请求）")
+    parser.add_argument("--tts-backend", choices=BACKEND_NAMES, default="edge",
+                        help="TTS 后端: edge=edge-tts（远程，默认），piper / espeak=本机 CPU 离线合成（进程池）")
+    parser.add_argument("--voice-map", type=Path,
+                        help='音色映射 JSON，按后端覆盖默认映射（如 {"piper": {"en-US-AriaNeural": "en_US-amy-medium"}}）')
+    parser.add_argument("--tts-workers", type=int, help="本地后端的合成进程数（默认 CPU 核数）")
+    parser.add_argument("--shard", type=parse_shard, help="只处理第 i 份短语（格式 i/N）")
+    parser.add_argument("--stats-json", type=Path, help="结束时把统计写入该 JSON 文件（分片启动器汇总用）")
+    parser.add_argument("--metrics-dir", type=Path,
+                        help="写出分阶段指标：events.jsonl（每个阶段一行）和 Prometheus 文本文件（.prom）")
+    parser.add_argument("--profile-stage", nargs="+", default=[], metavar="STAGE",
+                        help="对这些阶段做 cProfile（如 tts validate），结果写入 .prof（默认在 --metrics-dir 下）")
+    args = parser.parse_args()
+    mode = run_mode(args)
+    plan = None
+    if args.plan:
+        try:
+            plan = read_plan(args.plan, "phrases")
+        except PlanError as e:
+            print(f"❌ 错误: {e}")
+            sys.exit(1)
+        if plan["tts_backend"] != args.tts_backend:
+            print(f"❌ 错误: 计划按 {plan['tts_backend']} 后端生成，请使用相同的 --tts-backend")
+            sys.exit(1)
+        args.no_cache = plan["no_cache"]
+    metrics.configure(args.metrics_dir, "phrases", args.shard.label if args.shard else "", args.profile_stage)
+
+    try:
+        backend = open_backend(args.tts_backend, args.voice_map, args.tts_workers)
+        voice = backend.check_voices([VOICE])[0]
+    except TTSBackendError as e:
+        print(f"❌ 错误: {e}")
+        sys.exit(1)
+    if not backend.remote:
+        # 本地合成不需要限速；并发上限至少为进程数，进程池才能跑满
+        args.voice_rate = 0
+        args.concurrency = max(args.concurrency, backend.workers)
+    if args.batch_size > 1 and not backend.supports_batch:
+        print(f"⚠️ {backend.name} 后端不支持批量合成，改为逐条合成")
+
+    print(f"🎵 开始使用 {backend.engine} 生成音频文件\n")
+    print(f"🎙️  使用语音: {voice}")
+    print(f"⚙️  并发上限: {args.concurrency}")
     print("="*50)
 
     # 读取JSON文件
@@ -119,6 +492,15 @@ async def main():
 
     phrases = data.get("phrases", [])
     print(f"\n📖 读取了 {len(phrases)} 个短语")
+    assigner = None
+    if args.shard:
+        # 按短语 ID 分片（短语与其示例在同一分片），权重为全部文本长度
+        assigner = ShardAssigner(args.shard)
+        phrases = [
+            p for p in phrases
+            if assigner.owns(p["id"], text_weight([p["english"], *(e["english"] for e in p.get("examples") or [])]))
+        ]
+        print(f"   {assigner.describe()}")
 
     # 统计音频数量
     total_examples = sum(len(p.get("examples", [])) for p in phrases)
@@ -126,10 +508,58 @@ async def main():
     print(f"   示例音频: {total_examples} 个")
     print(f"   总计: {len(phrases) + total_examples} 个\n")
 
+    postprocessor = None
+    if args.postprocess:
+        try:
+            postprocessor = PostProcessor(PostProcessSettings(target_lufs=args.target_lufs, variants=tuple(args.variants)))
+        except PostProcessError as e:
+            print(f"❌ 错误: {e}")
+            sys.exit(1)
+
     # 生成音频
-    generator = AudioGenerator()
-    await generator.process_phrases(phrases)
+    cache = None if args.no_cache else TTSCache()
+    journal = JobJournal(JOURNAL_PATH)
+    if mode:
+        print(f"📒 {'续跑未完成的音频' if args.resume else '只重试失败的音频'}（任务日志: {JOURNAL_PATH}）\n")
+    if plan:
+        print(f"📒 按计划执行 {args.plan}（{describe_plan(plan, 'generate')}）\n")
+    limiter = SharedRateLimiter(args.rate_limit_db, args.voice_rate) if args.voice_rate > 0 else None
+    generator = AudioGenerator(args.concurrency, cache, args.batch_size, journal, limiter, backend)
+    select = plan_selector(plan, "generate") if plan else journal.selector(STAGE_GENERATE, mode)
+    started = time.monotonic()
+    try:
+        await generator.process_phrases(phrases, select)
+    finally:
+        if cache:
+            cache.save()
+        validator.save()
+        journal.flush()
+        if limiter:
+            limiter.close()
+        backend.close()
+    if generator.stats["success"] and not args.shard:
+        # 吞吐历史供 plan_audio.py 估计耗时（分片时各进程只承担一部分速率，不记录）
+        ThroughputHistory().record(
+            f"generate:{backend.name}", time.monotonic() - started, items=generator.stats["success"],
+            requests=metrics.count("tts") + metrics.count("tts_batch"),
+            chars=metrics.counters.get("tts_chars", 0), bytes=metrics.counters.get("tts_bytes", 0),
+        )
+
+    if postprocessor:
+        # 已处理且未变化的文件会被跳过，只处理新生成/重新生成的片段
+        clips = [path for _, path in generator.collect_items(phrases) if path.exists()]
+        print(f"\n🎚️ 后处理 {len(clips)} 个音频（{postprocessor.workers} 个进程）...")
+        with postprocessor:
+            postprocessor.run(clips)
     generator.print_summary()
+    journal.close()
+    if postprocessor:
+        postprocessor.print_summary()
+    if args.stats_json:
+        postprocess_stats = {f"postprocess_{k}": v for k, v in postprocessor.stats.items()} if postprocessor else {}
+        write_stats(args.stats_json, {"phrases": len(phrases), **generator.stats, **postprocess_stats})
+    metrics.print_summary()
+    metrics.close()
 
     if generator.stats["failed"] > 0:
         sys.exit(1)
@@ -4,9 +4,9 @@
 为问答对生成音频文件
 
 功能：
-1. 从数据库获取问答对
-2. 使用 edge-tts 为问题和答案生成音频
-3. 保存到本地目录
+1. 从数据库（或子场景 JSON 文件）流式读取问答对（读到第一块即开始生成）
+2. 使用 edge-tts（或本机离线的 Piper / eSpeak NG）为问题和答案生成音频
+3. 保存到本地目录（edge-tts 在同一次请求中给出单词时间，写入同名 .words.json，见 audio_common/word_timings.py）
 
 使用方法:
   # 生成所有问答对的音频
@@ -15,8 +15,40 @@
   # 只生成指定场景的音频
   python prepare/qa_audio/1_generate_audio.py --scenes daily_002 travel_055
   
-  # 强制重新生成（覆盖已有文件）
+  # 强制重新生成（忽略已有文件和 TTS 缓存）
   python prepare/qa_audio/1_generate_audio.py --force
+  
+  # 调整并发数和每个音色的限速（请求数/秒）
+  python prepare/qa_audio/1_generate_audio.py --concurrency 16 --voice-rate 4
+  
+  # 不连数据库：直接读取 prepare/scene/data/sub-scenes/*.json
+  python prepare/qa_audio/1_generate_audio.py --source files --scenes daily_001
+  
+  # 批量合成：同一音色每 16 条短句合成一次，再按单词边界切分成单独的文件
+  python prepare/qa_audio/1_generate_audio.py --batch-size 16
+  
+  # 生成后做响度归一化、静音裁剪、转低码率（可额外输出 Opus/AAC）
+  python prepare/qa_audio/1_generate_audio.py --postprocess --variants opus
+  
+  # 上次中途退出：只处理任务日志中未完成的；或只重试上次失败的
+  python prepare/qa_audio/1_generate_audio.py --resume
+  python prepare/qa_audio/1_generate_audio.py --retry-failed
+  
+  # 分片：按问答对 ID 稳定哈希（按文本长度均衡）分成 N 份，本进程只处理第 i 份
+  python prepare/qa_audio/1_generate_audio.py --shard 0/4
+  # 本机同时运行 4 个分片（共享限速，结束后汇总统计）
+  python prepare/qa_audio/run_shards.py generate --shards 4
+  
+  # 离线合成：本机 CPU 进程池（Piper 需要模型文件，见 audio_common/tts_backends.py）
+  python prepare/qa_audio/1_generate_audio.py --tts-backend piper --tts-workers 4
+  python prepare/qa_audio/1_generate_audio.py --tts-backend espeak --voice-map voices.json
+  
+  # 导出分阶段指标（JSONL 事件 + Prometheus 文本文件），并对 TTS 阶段做 cProfile
+  python prepare/qa_audio/1_generate_audio.py --metrics-dir prepare/qa_audio/metrics --profile-stage tts
+  
+  # 先预演并写出计划（见 plan_audio.py），再只处理计划中需要合成/链接的音频
+  python prepare/qa_audio/plan_audio.py --scenes daily_001 --out plan.json
+  python prepare/qa_audio/1_generate_audio.py --plan plan.json
 """
 
 import argparse
@@ -24,17 +56,30 @@ import asyncio
 import json
 import os
 import sys
+import time
 from pathlib import Path
-from typing import List, Dict, Any
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Callable, Optional, Tuple
 
 # 加载环境变量
 from dotenv import load_dotenv
 env_path = Path(__file__).parent.parent.parent / ".env.local"
 load_dotenv(env_path)
 
-import edge_tts
-import psycopg2
-from psycopg2.extras import RealDictCursor
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from audio_common.audio_inventory import AudioInventory
+from audio_common.audio_validator import shared_validator, validate_bytes
+from audio_common.job_journal import STAGE_GENERATE, STAGE_UPLOAD, JobJournal, clip_key, run_mode
+from audio_common.metrics import metrics
+from audio_common.qa_source import SOURCE_NAMES, open_qa_source
+from audio_common.tts_cache import TTSCache, FRESH, LINKED
+from audio_common.tts_backends import BACKEND_NAMES, EdgeBackend, TTSBackend, TTSBackendError, open_backend
+from audio_common.tts_batch import DEFAULT_BATCH_SIZE, batched
+from audio_common.postprocess import PostProcessError, PostProcessor, PostProcessSettings
+from audio_common.rate_limit import SharedRateLimiter
+from audio_common.run_plan import PlanError, ThroughputHistory, describe_plan, plan_selector, read_plan
+from audio_common.sharding import ShardAssigner, parse_shard, qa_pair_weight, write_stats
+from audio_common import word_timings
 
 # ============================================================
 # 配置
@@ -45,147 +90,545 @@ OUTPUT_DIR = Path(__file__).parent / "audio"
 QUESTIONS_DIR = OUTPUT_DIR / "questions"
 RESPONSES_DIR = OUTPUT_DIR / "responses"
 
-# 音色配置
+# 音频校验结果索引（与上传脚本共用，文件未变时不再重复解析）
+VALIDATION_INDEX_PATH = OUTPUT_DIR / "validation_index.json"
+validator = shared_validator(VALIDATION_INDEX_PATH)
+
+# 任务日志（与上传脚本共用，记录每个音频的生成/上传状态，用于 --resume / --retry-failed）
+JOURNAL_PATH = OUTPUT_DIR / "jobs.sqlite"
+
+# 音色配置（edge-tts 音色名；其他后端按 tts_backends 的音色映射换成本地音色）
 QUESTION_VOICE = "en-US-AriaNeural"
 ANSWER_VOICES = ["en-US-JennyNeural", "en-GB-SoniaNeural", "en-US-DavisNeural"]
+TTS_RATE = "+20%"
 
-# 数据库配置
-DATABASE_URL = os.getenv("DATABASE_URL", "")
+# TTS 后端（main 中按 --tts-backend 替换）
+tts_backend: TTSBackend = EdgeBackend()
 
-# ============================================================
-# 数据库操作
-# ============================================================
-
-def fetch_qa_pairs(scene_ids: List[str] = None) -> List[Dict[str, Any]]:
-    """从数据库获取问答对"""
-    if not DATABASE_URL:
-        print("❌ 错误: 请设置 DATABASE_URL 环境变量")
-        sys.exit(1)
-    
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
-    if scene_ids:
-        placeholders = ','.join(['%s'] * len(scene_ids))
-        cursor.execute(f"""
-            SELECT 
-                qp.id, 
-                qp.sub_scene_id, 
-                qp.speaker_text, 
-                qp.speaker_text_cn,
-                qp.responses,
-                qp.audio_url,
-                qp.qa_type,
-                ss.scene_id
-            FROM qa_pairs qp
-            JOIN sub_scenes ss ON qp.sub_scene_id = ss.id
-            WHERE ss.scene_id IN ({placeholders})
-            ORDER BY ss.scene_id, qp."order"
-        """, scene_ids)
-    else:
-        cursor.execute("""
-            SELECT 
-                id, 
-                sub_scene_id, 
-                speaker_text, 
-                speaker_text_cn,
-                responses,
-                audio_url,
-                qa_type
-            FROM qa_pairs
-            ORDER BY sub_scene_id, "order"
-        """)
-    
-    qa_pairs = [dict(row) for row in cursor.fetchall()]
-    cursor.close()
-    conn.close()
-    
-    return qa_pairs
+# 并发配置
+DEFAULT_CONCURRENCY = 8     # 同时进行的 TTS 请求数
+DEFAULT_VOICE_RATE = 4.0    # 每个音色每秒最多发起的请求数（<=0 表示不限速）
 
 # ============================================================
 # 音频生成
 # ============================================================
 
-async def generate_audio(text: str, output_path: Path, voice: str, max_retries: int = 3) -> bool:
-    """使用edge-tts生成音频文件"""
+class VoiceRateLimiter:
+    """
+    按音色限速：同一音色相邻两次请求至少间隔 1/rate 秒
+    传入 shared 时改用跨进程的令牌桶（分片并行时所有进程合计不超过该速率）
+    """
+
+    def __init__(self, rate_per_voice: float, shared: Optional[SharedRateLimiter] = None):
+        self.interval = 1.0 / rate_per_voice if rate_per_voice > 0 else 0.0
+        self.shared = shared
+        self._next_slot: Dict[str, float] = {}
+
+    async def acquire(self, voice: str) -> None:
+        if self.interval <= 0:
+            return
+        with metrics.stage("rate_wait", voice=voice):
+            if self.shared:
+                await self.shared.acquire(voice)
+                return
+            now = asyncio.get_running_loop().time()
+            # 单线程事件循环内读写之间没有 await，无需加锁
+            slot = max(now, self._next_slot.get(voice, now))
+            self._next_slot[voice] = slot + self.interval
+            if slot > now:
+                await asyncio.sleep(slot - now)
+
+# 最近一次生成失败的原因（输出路径 -> 错误信息），由调度器写入任务日志
+failure_reasons: Dict[Path, str] = {}
+
+async def generate_audio(
+    text: str,
+    output_path: Path,
+    voice: str,
+    max_retries: int = 3,
+    limiter: Optional[VoiceRateLimiter] = None,
+) -> bool:
+    """用当前 TTS 后端生成音频文件（校验通过后原子写入，中途失败不会留下残缺文件）"""
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
     for attempt in range(max_retries):
         try:
-            communicate = edge_tts.Communicate(text, voice, rate="+20%")
-            await communicate.save(str(output_path))
+            if limiter:
+                await limiter.acquire(voice)
+            with metrics.stage("tts", voice=voice, chars=len(text), attempt=attempt):
+                data, words = await tts_backend.synthesize_words(text, voice, TTS_RATE)
             
-            if output_path.exists() and output_path.stat().st_size > 1024:
+            with metrics.stage("validate"):
+                result = validate_bytes(data)
+            if result.ok:
+                write_clip(output_path, data, words)
+                metrics.inc("tts_chars", len(text))
                 return True
             else:
-                print(f"  ⚠️ 生成的文件太小或为空")
-                if output_path.exists():
-                    output_path.unlink()
+                print(f"  ⚠️ 生成的音频不完整: {output_path.name}（{result.reason}）")
+                failure_reasons[output_path] = f"音频不完整: {result.reason}"
                 
         except Exception as e:
+            if tmp_path.exists():
+                tmp_path.unlink()
             if attempt == max_retries - 1:
-                print(f"  ❌ 生成失败: {e}")
+                print(f"  ❌ 生成失败 {output_path.name}: {e}")
+                failure_reasons[output_path] = f"{type(e).__name__}: {e}"
                 return False
             else:
                 wait_time = (attempt + 1) * 2
-                print(f"  ⚠️ 重试 {attempt + 1}/{max_retries}，等待{wait_time}s")
+                print(f"  ⚠️ {output_path.name} 重试 {attempt + 1}/{max_retries}，等待{wait_time}s")
+                metrics.inc("tts_retries")
                 await asyncio.sleep(wait_time)
     
     return False
 
+def write_clip(output_path: Path, data: bytes, words: Optional[word_timings.Words] = None) -> None:
+    """原子写入音频片段和单词时间 sidecar（没有单词时间时删除旧的 sidecar）"""
+    with metrics.stage("write"):
+        tmp_path = output_path.with_name(output_path.name + ".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, output_path)
+        word_timings.write(output_path, words, len(data))
+    metrics.inc("tts_bytes", len(data))
+
+async def generate_audio_batch(
+    texts: List[str],
+    voice: str,
+    max_retries: int = 3,
+    limiter: Optional[VoiceRateLimiter] = None,
+) -> Optional[List[Tuple[bytes, Optional[word_timings.Words]]]]:
+    """一次请求合成多条文本并切分，返回 (音频, 单词时间)，失败或无法切分时返回 None（由调用方逐条合成）"""
+    for attempt in range(max_retries):
+        try:
+            if limiter:
+                await limiter.acquire(voice)
+            with metrics.stage("tts_batch", voice=voice, texts=len(texts), chars=sum(map(len, texts)), attempt=attempt):
+                clips = await tts_backend.synthesize_batch(texts, voice, TTS_RATE)
+            if clips is None:
+                print(f"  ⚠️ 批量合成无法按单词边界切分（{len(texts)} 条），改为逐条合成")
+            return clips
+        except Exception as e:
+            if attempt == max_retries - 1:
+                print(f"  ⚠️ 批量合成失败（{len(texts)} 条）: {e}，改为逐条合成")
+                return None
+            wait_time = (attempt + 1) * 2
+            print(f"  ⚠️ 批量合成重试 {attempt + 1}/{max_retries}，等待{wait_time}s")
+            metrics.inc("tts_retries")
+            await asyncio.sleep(wait_time)
+    return None
+
 # ============================================================
 # 主处理逻辑
 # ============================================================
 
-async def process_qa_pair(qa: Dict[str, Any], stats: Dict[str, int], force: bool = False) -> None:
-    """处理单个问答对"""
+@dataclass
+class AudioJob:
+    """单个待合成的音频任务（问题或某个答案）"""
+    kind: str           # "questions" | "responses"
+    qa_id: str
+    text: str
+    output_path: Path
+    voice: str
+    cache_key: str = ""
+    duplicates: List[Path] = field(default_factory=list)   # 文本/音色相同的其他输出，合成后直接链接
+    finished: bool = False  # 已进入 _finish_job（成功或失败已计数）
+
+def needs_generation(path: Path, force: bool) -> bool:
+    """判断音频是否需要（重新）生成：不存在或未通过结构校验"""
+    return force or not validator.is_valid(path)
+
+def plan_clip(
+    kind: str,
+    qa_id: str,
+    text: str,
+    output_path: Path,
+    voice: str,
+    stats: Dict[str, int],
+    force: bool = False,
+    cache: Optional[TTSCache] = None,
+    journal: Optional[JobJournal] = None,
+) -> Optional[AudioJob]:
+    """判断单个音频是否需要合成：文本未变则跳过，缓存命中则直接链接"""
+    if cache is None:
+        if not needs_generation(output_path, force):
+            stats[f"{kind}_skipped"] += 1
+            if journal:
+                journal.done(STAGE_GENERATE, clip_key(output_path))
+            return None
+        return AudioJob(kind, qa_id, text, output_path, voice)
+    
+    key = cache.key(text, voice, TTS_RATE, tts_backend.engine)
+    if not force:
+        state = cache.resolve(output_path, key, validator.is_valid)
+        if state == FRESH:
+            stats[f"{kind}_skipped"] += 1
+            if journal:
+                journal.done(STAGE_GENERATE, clip_key(output_path))
+            return None
+        if state == LINKED:
+            stats[f"{kind}_cached"] += 1
+            if journal:
+                journal.done(STAGE_GENERATE, clip_key(output_path), reset=(STAGE_UPLOAD,))
+            return None
+    return AudioJob(kind, qa_id, text, output_path, voice, cache_key=key)
+
+def clip_paths(qa: Dict[str, Any]) -> List[Path]:
+    """问答对对应的全部本地音频路径（问题 + 有文本的答案）"""
+    qa_id = qa["id"]
+    paths = [QUESTIONS_DIR / f"{qa_id}.mp3"]
+    for idx, response in enumerate(qa["responses"] or []):
+        if response.get("text", ""):
+            paths.append(RESPONSES_DIR / f"{qa_id}_response{idx}.mp3")
+    return paths
+
+def plan_qa_pair_jobs(
+    qa: Dict[str, Any],
+    stats: Dict[str, int],
+    force: bool = False,
+    cache: Optional[TTSCache] = None,
+    journal: Optional[JobJournal] = None,
+    select: Optional[Callable[[str], bool]] = None,
+) -> List[AudioJob]:
+    """
+    展开单个问答对的音频任务，已是最新的文件直接计入跳过
+    select 为任务日志的筛选函数（--resume / --retry-failed），未选中的音频不做任何检查
+    """
     qa_id = qa["id"]
-    speaker_text = qa["speaker_text"]
     responses = qa["responses"] or []
+    jobs: List[AudioJob] = []
     
-    print(f"\n📝 处理问答对: {qa_id}")
-    print(f"   问题: {speaker_text[:50]}...")
-    
-    # 1. 生成问题音频
+    # 1. 问题音频
     question_audio_path = QUESTIONS_DIR / f"{qa_id}.mp3"
-    
-    should_generate = force or not question_audio_path.exists() or question_audio_path.stat().st_size <= 1024
-    
-    if should_generate:
-        print(f"  🎙️ 生成问题音频...")
-        if await generate_audio(speaker_text, question_audio_path, QUESTION_VOICE):
-            stats["questions_success"] += 1
-            print(f"  ✅ 问题音频完成: {question_audio_path.name}")
-        else:
-            stats["questions_failed"] += 1
+    if select and not select(clip_key(question_audio_path)):
+        stats["journal_skipped"] += 1
     else:
-        print(f"  ⏭️ 问题音频已存在: {question_audio_path.name}")
-        stats["questions_skipped"] += 1
+        job = plan_clip("questions", qa_id, qa["speaker_text"], question_audio_path, tts_backend.voice(QUESTION_VOICE),
+                        stats, force, cache, journal)
+        if job:
+            jobs.append(job)
     
-    # 2. 生成答案音频
+    # 2. 答案音频
     for idx, response in enumerate(responses):
         response_text = response.get("text", "")
         if not response_text:
             continue
         
         response_audio_path = RESPONSES_DIR / f"{qa_id}_response{idx}.mp3"
+        if select and not select(clip_key(response_audio_path)):
+            stats["journal_skipped"] += 1
+            continue
+        answer_voice = tts_backend.voice(ANSWER_VOICES[idx % len(ANSWER_VOICES)])
+        job = plan_clip("responses", qa_id, response_text, response_audio_path, answer_voice,
+                        stats, force, cache, journal)
+        if job:
+            jobs.append(job)
+    
+    return jobs
+
+class SynthesisScheduler:
+    """有界并发调度器：固定数量的 worker 从队列取任务，跨问答对并发合成"""
+
+    def __init__(
+        self,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        voice_rate: float = DEFAULT_VOICE_RATE,
+        cache: Optional[TTSCache] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        journal: Optional[JobJournal] = None,
+        shared_limiter: Optional[SharedRateLimiter] = None,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.limiter = VoiceRateLimiter(voice_rate, shared_limiter)
+        self.cache = cache
+        self.batch_size = max(1, batch_size)
+        self.journal = journal
+        self._pending: Dict[str, AudioJob] = {}   # 排队或合成中的缓存键 -> 任务
+        # 每个音频文件就绪（合成完成或从缓存链接）后的回调，供流水线上传使用
+        self.on_clip_ready: Optional[Callable[[Path], Awaitable[None]]] = None
+
+    def _track(self, job: AudioJob, stats: Dict[str, int]) -> str:
+        """
+        相同缓存键的任务只合成一次：已在排队/合成中的，把输出挂到该任务上（attached）；
+        规划之后才合成完成的，直接从缓存链接（linked）；其余需要入队合成（queued）
+        """
+        if not job.cache_key:
+            return "queued"
+        primary = self._pending.get(job.cache_key)
+        if primary:
+            primary.duplicates.append(job.output_path)
+            return "attached"
+        if self.cache and self.cache.materialize(job.cache_key, job.output_path):
+            stats[f"{job.kind}_cached"] += 1
+            if self.journal:
+                self.journal.done(STAGE_GENERATE, clip_key(job.output_path), reset=(STAGE_UPLOAD,))
+            return "linked"
+        self._pending[job.cache_key] = job
+        return "queued"
+
+    async def _notify(self, path: Path) -> None:
+        if self.on_clip_ready:
+            await self.on_clip_ready(path)
+
+    async def _run_job(self, job: AudioJob, stats: Dict[str, int]) -> None:
+        if self.journal:
+            self.journal.start(STAGE_GENERATE, clip_key(job.output_path))
+        ok = await generate_audio(job.text, job.output_path, job.voice, limiter=self.limiter)
+        await self._finish_job(job, ok, stats)
+
+    async def _run_batch(self, jobs: List[AudioJob], stats: Dict[str, int]) -> None:
+        """同一音色的多条文本一次合成后切分；整批失败或无法切分时逐条单独合成"""
+        if self.journal:
+            for job in jobs:
+                self.journal.start(STAGE_GENERATE, clip_key(job.output_path))
+        clips = await generate_audio_batch([job.text for job in jobs], jobs[0].voice, limiter=self.limiter)
+        if clips is None:
+            stats["batch_fallbacks"] += 1
+            for job in jobs:
+                await self._run_job(job, stats)
+            return
+        stats["batch_requests"] += 1
+        for job, (clip, words) in zip(jobs, clips):
+            with metrics.stage("validate"):
+                valid = validate_bytes(clip).ok
+            if not valid:
+                # 切出的片段过短或不完整（多为对齐偏差），这一条单独合成
+                await self._run_job(job, stats)
+                continue
+            try:
+                write_clip(job.output_path, clip, words)
+            except OSError as e:
+                # 磁盘已满、无权限等：这一条记为失败，不影响同批其余片段
+                job.output_path.with_name(job.output_path.name + ".tmp").unlink(missing_ok=True)
+                print(f"  ❌ 写入失败 {job.output_path.name}: {e}")
+                failure_reasons[job.output_path] = f"{type(e).__name__}: {e}"
+                await self._finish_job(job, False, stats)
+                continue
+            metrics.inc("tts_chars", len(job.text))
+            await self._finish_job(job, True, stats)
+    
+    def _journal_finish(self, job: AudioJob, ok: bool) -> None:
+        paths = [job.output_path] + (job.duplicates if job.cache_key else [])
+        if ok:
+            for path in paths:
+                self.journal.done(STAGE_GENERATE, clip_key(path), reset=(STAGE_UPLOAD,))
+        else:
+            error = failure_reasons.pop(job.output_path, "生成失败")
+            for path in paths:
+                self.journal.fail(STAGE_GENERATE, clip_key(path), error)
+
+    async def _finish_job(self, job: AudioJob, ok: bool, stats: Dict[str, int]) -> None:
+        linked: List[Path] = []
+        if job.cache_key:
+            # 先写缓存再计数：写缓存出错时任务尚未结束，由 _abort_jobs 记为失败
+            # 从合成返回到出队之间没有 await，duplicates 不会在此之后再被追加
+            if ok and self.cache:
+                self.cache.store(job.cache_key, job.output_path)
+                for duplicate in job.duplicates:
+                    self.cache.materialize(job.cache_key, duplicate)
+                    linked.append(duplicate)
+            self._pending.pop(job.cache_key, None)
         
-        should_generate = force or not response_audio_path.exists() or response_audio_path.stat().st_size <= 1024
-        
-        if should_generate:
-            answer_voice = ANSWER_VOICES[idx % len(ANSWER_VOICES)]
-            print(f"  🎙️ 生成答案 {idx + 1} 音频...")
-            if await generate_audio(response_text, response_audio_path, answer_voice):
-                stats["responses_success"] += 1
-                print(f"  ✅ 答案音频完成: {response_audio_path.name}")
-            else:
-                stats["responses_failed"] += 1
+        job.finished = True
+        ready: List[Path] = []
+        if ok:
+            stats[f"{job.kind}_success"] += 1
+            stats[f"{job.kind}_cached"] += len(linked)
+            print(f"  ✅ {job.output_path.name}")
+            ready = [job.output_path] + linked
         else:
-            stats["responses_skipped"] += 1
+            stats[f"{job.kind}_failed"] += 1 + len(job.duplicates)
+        
+        if self.journal:
+            self._journal_finish(job, ok)
+        
+        for path in ready:
+            await self._notify(path)
+
+    async def _abort_jobs(self, jobs: List[AudioJob], error: Exception, stats: Dict[str, int]) -> None:
+        """处理任务时出现未预期的异常（写缓存、任务日志等）：尚未结束的任务记为失败，并释放缓存键"""
+        print(f"  ❌ 合成任务异常（{len(jobs)} 条）: {type(error).__name__}: {error}")
+        for job in jobs:
+            if not job.finished:
+                failure_reasons[job.output_path] = f"{type(error).__name__}: {error}"
+                try:
+                    await self._finish_job(job, False, stats)
+                except Exception as e:
+                    print(f"  ⚠️ 记录失败时出错 {job.output_path.name}: {e}")
+            if job.cache_key and self._pending.get(job.cache_key) is job:
+                self._pending.pop(job.cache_key)
+
+    async def run_stream(self, job_chunks: AsyncIterator[List[AudioJob]], stats: Dict[str, int]) -> None:
+        """边读取边合成：任务块进入有界队列，队列满时反压上游读取"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 4)
+        done = 0
+        
+        next_report = 50
+        
+        async def worker() -> None:
+            nonlocal done, next_report
+            while True:
+                item = await queue.get()
+                metrics.set_gauge("tts_queue_depth", queue.qsize())
+                if item is None:
+                    return
+                jobs = item if isinstance(item, list) else [item]
+                try:
+                    if len(jobs) > 1:
+                        await self._run_batch(jobs, stats)
+                    else:
+                        await self._run_job(jobs[0], stats)
+                except Exception as e:
+                    # 单个任务的异常不能让 worker 退出，否则生产者会在队列满时一直等待
+                    await self._abort_jobs(jobs, e, stats)
+                done += len(jobs)
+                if done >= next_report:
+                    next_report = done - done % 50 + 50
+                    print(f"  📊 已完成: {done}")
+        
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+
+        async def put(item: Any) -> None:
+            """入队；等待期间若有 worker 意外退出则抛出其异常，不会一直阻塞"""
+            putter = asyncio.ensure_future(queue.put(item))
+            finished, _ = await asyncio.wait([putter, *workers], return_when=asyncio.FIRST_COMPLETED)
+            if putter not in finished:
+                putter.cancel()
+                for task in finished:
+                    if not task.cancelled() and task.exception():
+                        raise task.exception()
+                raise RuntimeError("合成 worker 意外退出")
+            metrics.set_gauge("tts_queue_depth", queue.qsize())
+
+        try:
+            async for jobs in job_chunks:
+                if self.journal:
+                    self.journal.register(STAGE_GENERATE, [clip_key(job.output_path) for job in jobs])
+                queued: List[AudioJob] = []
+                for job in jobs:
+                    state = self._track(job, stats)
+                    if state == "queued":
+                        if self.batch_size > 1:
+                            queued.append(job)
+                        else:
+                            await put(job)
+                    elif state == "linked":
+                        await self._notify(job.output_path)
+                # 批量模式：每块内按音色分组后分批入队，块结束即入队，不跨块等待凑满
+                by_voice: Dict[str, List[AudioJob]] = {}
+                for job in queued:
+                    by_voice.setdefault(job.voice, []).append(job)
+                for voice_jobs in by_voice.values():
+                    for batch in batched(voice_jobs, self.batch_size, lambda job: job.text):
+                        await put(batch if len(batch) > 1 else batch[0])
+            for _ in workers:
+                await put(None)
+            await asyncio.gather(*workers)
+        finally:
+            # 出错或被取消时 worker 仍在等待队列：直接取消，不再入队结束标记
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def run(self, jobs: List[AudioJob], stats: Dict[str, int]) -> None:
+        async def single_chunk() -> AsyncIterator[List[AudioJob]]:
+            yield jobs
+        await self.run_stream(single_chunk(), stats)
+
+async def process_qa_pair(
+    qa: Dict[str, Any],
+    stats: Dict[str, int],
+    force: bool = False,
+    scheduler: Optional[SynthesisScheduler] = None,
+) -> None:
+    """处理单个问答对（问题与各答案音频并发生成）"""
+    scheduler = scheduler or SynthesisScheduler()
+    jobs = plan_qa_pair_jobs(qa, stats, force, scheduler.cache)
+    await scheduler.run(jobs, stats)
+
+def new_stats() -> Dict[str, int]:
+    """生成统计计数器"""
+    return {
+        "questions_success": 0,
+        "questions_failed": 0,
+        "questions_skipped": 0,
+        "questions_cached": 0,
+        "responses_success": 0,
+        "responses_failed": 0,
+        "responses_skipped": 0,
+        "responses_cached": 0,
+        "batch_requests": 0,
+        "batch_fallbacks": 0,
+        "journal_skipped": 0,
+    }
 
 async def main():
     parser = argparse.ArgumentParser(description='为问答对生成音频文件')
     parser.add_argument('--scenes', nargs='+', help='指定场景ID列表（可选，不传则处理所有）')
-    parser.add_argument('--force', action='store_true', help='强制重新生成（覆盖已有文件）')
+    parser.add_argument('--force', action='store_true', help='强制重新生成（忽略已有文件和TTS缓存）')
+    parser.add_argument('--no-cache', action='store_true', help='不使用内容寻址TTS缓存（仅按文件名判断跳过）')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'同时进行的TTS请求数（默认 {DEFAULT_CONCURRENCY}）')
+    parser.add_argument('--voice-rate', type=float, default=DEFAULT_VOICE_RATE,
+                        help=f'每个音色每秒最多请求数，<=0 不限速（默认 {DEFAULT_VOICE_RATE}）')
+    parser.add_argument('--source', choices=SOURCE_NAMES, default='db',
+                        help='问答对来源: db=数据库（默认），files=prepare/scene/data/sub-scenes 下的 JSON（无需数据库）')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='同一音色每批合成的条数，>1 时一次请求合成多条再按单词边界切分（默认 1 不批量）')
+    parser.add_argument('--postprocess', action='store_true',
+                        help='生成后做响度归一化、静音裁剪并转为低码率 MP3（需要 numpy 和 ffmpeg）')
+    parser.add_argument('--variants', nargs='+', choices=['opus', 'aac'], default=[],
+                        help='后处理时额外输出的格式（.opus / .m4a，与 MP3 同名同目录）')
+    parser.add_argument('--target-lufs', type=float, default=-16.0, help='后处理目标响度（默认 -16 LUFS）')
+    resume_group = parser.add_mutually_exclusive_group()
+    resume_group.add_argument('--resume', action='store_true',
+                              help='只处理任务日志中未完成的音频（上次中途退出后使用）')
+    resume_group.add_argument('--retry-failed', action='store_true', help='只重试任务日志中上次失败的音频')
+    resume_group.add_argument('--plan', type=Path,
+                              help='按 plan_audio.py 写出的计划执行（数据源、场景与计划一致，只处理需要合成/链接的音频）')
+    parser.add_argument('--tts-backend', choices=BACKEND_NAMES, default='edge',
+                        help='TTS 后端: edge=edge-tts（远程，默认），piper / espeak=本机 CPU 离线合成（进程池）')
+    parser.add_argument('--voice-map', type=Path,
+                        help='音色映射 JSON，按后端覆盖默认映射（如 {"piper": {"en-US-AriaNeural": "en_US-amy-medium"}}）')
+    parser.add_argument('--tts-workers', type=int, help='本地后端的合成进程数（默认 CPU 核数）')
+    parser.add_argument('--shard', type=parse_shard,
+                        help='只处理第 i 份（格式 i/N；生成与上传需使用相同的 --shard/--source/--scenes）')
+    parser.add_argument('--rate-limit-db', type=Path,
+                        help='跨进程共享限速的 SQLite 文件（同一文件的所有进程合计每个音色每秒最多 --voice-rate 个请求）')
+    parser.add_argument('--stats-json', type=Path, help='结束时把统计写入该 JSON 文件（分片启动器汇总用）')
+    parser.add_argument('--metrics-dir', type=Path,
+                        help='写出分阶段指标：events.jsonl（每个阶段一行）和 Prometheus 文本文件（.prom）')
+    parser.add_argument('--profile-stage', nargs='+', default=[], metavar='STAGE',
+                        help='对这些阶段做 cProfile（如 tts validate write），结果写入 .prof（默认在 --metrics-dir 下）')
     args = parser.parse_args()
+    mode = run_mode(args)
+    plan = None
+    if args.plan:
+        try:
+            plan = read_plan(args.plan, "qa")
+        except PlanError as e:
+            print(f"❌ 错误: {e}")
+            sys.exit(1)
+        if plan["tts_backend"] != args.tts_backend:
+            print(f"❌ 错误: 计划按 {plan['tts_backend']} 后端生成，请使用相同的 --tts-backend")
+            sys.exit(1)
+        args.source, args.scenes = plan["source"], plan["scenes"]
+        args.force, args.no_cache = plan["force"], plan["no_cache"]
+    metrics.configure(args.metrics_dir, "generate", args.shard.label if args.shard else "", args.profile_stage)
+    
+    global tts_backend
+    try:
+        tts_backend = open_backend(args.tts_backend, args.voice_map, args.tts_workers)
+        voices = tts_backend.check_voices([QUESTION_VOICE, *ANSWER_VOICES])
+    except TTSBackendError as e:
+        print(f"❌ 错误: {e}")
+        sys.exit(1)
+    if not tts_backend.remote:
+        # 本地合成不需要限速；并发数至少为进程数，进程池才能跑满
+        args.voice_rate = 0
+        args.concurrency = max(args.concurrency, tts_backend.workers)
+    if args.batch_size > 1 and not tts_backend.supports_batch:
+        print(f"⚠️ {tts_backend.name} 后端不支持批量合成，改为逐条合成")
+        args.batch_size = 1
     
     print("🎵 问答对音频生成工具")
     print("=" * 60)
@@ -193,6 +636,18 @@ async def main():
         print(f"目标场景: {', '.join(args.scenes)}")
     if args.force:
         print("模式: 强制重新生成")
+    print(f"TTS 后端: {tts_backend.engine}（音色: {', '.join(voices)}）")
+    print(f"并发数: {args.concurrency}，单音色限速: {args.voice_rate}/s")
+    if args.batch_size > 1:
+        print(f"批量合成: 每批最多 {args.batch_size} 条")
+    if mode:
+        print(f"模式: {'续跑未完成的音频' if args.resume else '只重试失败的音频'}（任务日志: {JOURNAL_PATH}）")
+    if plan:
+        print(f"模式: 按计划执行 {args.plan}（{describe_plan(plan, 'generate')}）")
+    if args.shard:
+        print(f"分片: {args.shard}")
+    if args.rate_limit_db:
+        print(f"共享限速: {args.rate_limit_db}")
     
     # 创建输出目录
     QUESTIONS_DIR.mkdir(parents=True, exist_ok=True)
@@ -201,41 +656,110 @@ async def main():
     print(f"   问题: {QUESTIONS_DIR}")
     print(f"   答案: {RESPONSES_DIR}")
     
-    # 获取问答对数据
-    print("\n📖 从数据库获取问答对数据...")
-    qa_pairs = fetch_qa_pairs(args.scenes)
-    print(f"   ✅ 获取到 {len(qa_pairs)} 个问答对")
+    postprocessor = None
+    if args.postprocess:
+        try:
+            postprocessor = PostProcessor(PostProcessSettings(target_lufs=args.target_lufs, variants=tuple(args.variants)))
+        except PostProcessError as e:
+            print(f"❌ 错误: {e}")
+            sys.exit(1)
     
-    # 统计信息
-    stats = {
-        "questions_success": 0,
-        "questions_failed": 0,
-        "questions_skipped": 0,
-        "responses_success": 0,
-        "responses_failed": 0,
-        "responses_skipped": 0,
-    }
+    journal = JobJournal(JOURNAL_PATH)
+    select = plan_selector(plan, "generate") if plan else journal.selector(STAGE_GENERATE, mode)
+    
+    # 一次 scandir 取得已有音频，逐个判断是否需要生成时不再对每个路径 stat（不存在的文件没有系统调用）
+    with metrics.stage("inventory"):
+        validator.inventory = AudioInventory(OUTPUT_DIR, [QUESTIONS_DIR.name, RESPONSES_DIR.name])
+    if not args.force and not mode and not plan and not args.shard:
+        # 并行校验已有音频（分片时各进程只逐个校验自己的音频）（结果写入索引，之后逐个判断是否需要生成时直接复用）
+        results = validator.validate_inventory(validator.inventory)
+        invalid = sum(1 for result in results.values() if not result.ok)
+        print(f"\n🔍 已有音频: {len(results)} 个，未通过校验 {invalid} 个（将重新生成）")
+    
+    source = open_qa_source(args.source)
+    stats = new_stats()
+    cache = None if args.no_cache else TTSCache()
+    qa_count = 0
+    clips: List[Path] = []
+    assigner = ShardAssigner(args.shard) if args.shard else None
+    
+    async def plan_chunks() -> AsyncIterator[List[AudioJob]]:
+        """从数据源按块读取问答对并展开为音频任务"""
+        nonlocal qa_count
+        async for chunk in metrics.timed_aiter(source.aiter_qa_pair_chunks(args.scenes), "db_fetch"):
+            if assigner:
+                chunk = [qa for qa in chunk if assigner.owns(qa["id"], qa_pair_weight(qa))]
+            qa_count += len(chunk)
+            jobs: List[AudioJob] = []
+            with metrics.stage("plan", qa_pairs=len(chunk)):
+                for qa in chunk:
+                    jobs.extend(plan_qa_pair_jobs(qa, stats, args.force, cache, journal, select))
+                    if postprocessor:
+                        clips.extend(clip_paths(qa))
+            yield jobs
     
-    # 处理每个问答对
     print("\n" + "=" * 60)
-    print("🚀 开始生成音频...")
+    print(f"🚀 开始生成音频（从{'数据库' if args.source == 'db' else '子场景文件'}流式读取问答对）...")
     print("=" * 60)
     
-    for qa in qa_pairs:
-        await process_qa_pair(qa, stats, args.force)
+    shared_limiter = SharedRateLimiter(args.rate_limit_db, args.voice_rate) if args.rate_limit_db else None
+    scheduler = SynthesisScheduler(args.concurrency, args.voice_rate, cache, args.batch_size, journal, shared_limiter)
+    started = time.monotonic()
+    try:
+        await scheduler.run_stream(plan_chunks(), stats)
+    finally:
+        if cache:
+            cache.save()
+        validator.save()
+        journal.flush()
+        if shared_limiter:
+            shared_limiter.close()
+        tts_backend.close()
+    synthesized = stats["questions_success"] + stats["responses_success"]
+    if synthesized and not args.shard:
+        # 吞吐历史供 plan_audio.py 估计耗时（分片时各进程只承担一部分速率，不记录）
+        ThroughputHistory().record(
+            f"generate:{tts_backend.name}", time.monotonic() - started, items=synthesized,
+            requests=metrics.count("tts") + metrics.count("tts_batch"),
+            chars=metrics.counters.get("tts_chars", 0), bytes=metrics.counters.get("tts_bytes", 0),
+        )
+    
+    if postprocessor:
+        # 已处理且未变化的文件会被跳过，只处理新生成/重新生成的片段
+        print(f"\n🎚️ 后处理 {len(clips)} 个音频（{postprocessor.workers} 个进程）...")
+        with postprocessor:
+            postprocessor.run(path for path in clips if path.exists())
     
     # 打印统计信息
     print("\n" + "=" * 60)
     print("📊 生成统计")
     print("=" * 60)
+    print(f"   问答对: {qa_count}")
+    if assigner:
+        print(f"   {assigner.describe()}")
     print(f"   问题音频:")
     print(f"      成功: {stats['questions_success']}")
     print(f"      失败: {stats['questions_failed']}")
     print(f"      跳过: {stats['questions_skipped']}")
+    print(f"      缓存: {stats['questions_cached']}")
     print(f"   答案音频:")
     print(f"      成功: {stats['responses_success']}")
     print(f"      失败: {stats['responses_failed']}")
     print(f"      跳过: {stats['responses_skipped']}")
+    print(f"      缓存: {stats['responses_cached']}")
+    if args.batch_size > 1:
+        print(f"   批量请求: {stats['batch_requests']}（回退逐条: {stats['batch_fallbacks']} 批）")
+    if mode or plan:
+        print(f"   {'不在计划中' if plan else '按任务日志跳过'}（未检查）: {stats['journal_skipped']}")
+    journal.print_summary(STAGE_GENERATE)
+    journal.close()
+    if postprocessor:
+        postprocessor.print_summary()
+    if args.stats_json:
+        postprocess_stats = {f"postprocess_{k}": v for k, v in postprocessor.stats.items()} if postprocessor else {}
+        write_stats(args.stats_json, {"qa_pairs": qa_count, **stats, **postprocess_stats})
+    metrics.print_summary()
+    metrics.close()
     
     print(f"\n📁 音频文件保存在: {OUTPUT_DIR}")
     print(f"   下一步: 运行 python prepare/qa_audio/2_upload_to_cos.py 上传到COS")
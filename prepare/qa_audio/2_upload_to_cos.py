@@ -1,23 +1,60 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-将问答对音频上传到腾讯云COS（仅上传，不更新数据库）
+将问答对音频上传到腾讯云COS，并批量回写数据库中的 audio_url
 
 功能：
 1. 扫描本地音频文件
-2. 并发上传到腾讯云COS
+2. 对照本地上传清单，跳过内容未变的文件（无网络请求）
+3. 并发上传到腾讯云COS（连接池、带抖动的指数退避重试、MD5 校验、大文件分片上传）
+4. 按批回写 qa_pairs.audio_url 与 responses[].audio_url（COS:/... 格式）
+5. 把各场景的单词时间（生成时写出的 .words.json）汇总为 timings/{scene_id}.json，上传到 qa/timings/
 
 使用方法:
 python prepare/qa_audio/2_upload_to_cos.py
 python prepare/qa_audio/2_upload_to_cos.py --scenes daily_002 travel_055
+
+# 清单丢失或在其他机器上传过：先用 list_objects 从桶中重建清单
+python prepare/qa_audio/2_upload_to_cos.py --reconcile
+
+# 忽略清单，全部重新上传
+python prepare/qa_audio/2_upload_to_cos.py --no-manifest
+
+# 仅上传，不回写数据库
+python prepare/qa_audio/2_upload_to_cos.py --no-db-update
+
+# 不汇总/上传单词时间索引
+python prepare/qa_audio/2_upload_to_cos.py --no-timings
+
+# 按 plan_audio.py 写出的计划，只上传计划中需要上传/比对的音频
+python prepare/qa_audio/2_upload_to_cos.py --plan plan.json
+
+# 异步上传引擎：单线程保持数百个上传同时进行
+python prepare/qa_audio/2_upload_to_cos.py --engine async --concurrency 300
+
+# 不连数据库：从子场景 JSON 读取问答对，仅上传
+python prepare/qa_audio/2_upload_to_cos.py --source files --no-db-update
+
+# 上次中途退出：只上传任务日志中未完成的（已完成的不再 stat、不查清单）；或只重试上次失败的
+python prepare/qa_audio/2_upload_to_cos.py --resume
+python prepare/qa_audio/2_upload_to_cos.py --retry-failed
+
+# 分片：与生成时相同的 --shard，只上传第 i 份（多台机器各自生成、各自上传）
+python prepare/qa_audio/2_upload_to_cos.py --shard 0/4
+python prepare/qa_audio/run_shards.py upload --shards 4
+
+# 导出分阶段指标（JSONL 事件 + Prometheus 文本文件），并对上传阶段做 cProfile（异步引擎）
+python prepare/qa_audio/2_upload_to_cos.py --engine async --metrics-dir prepare/qa_audio/metrics --profile-stage upload
 """
 
 import argparse
+import asyncio
 import os
 import sys
+import time
 from pathlib import Path
-from typing import List
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import threading
 
 # 加载环境变量
@@ -27,14 +64,24 @@ load_dotenv(env_path)
 
 # 腾讯云COS SDK
 try:
-    from qcloud_cos import CosConfig
-    from qcloud_cos import CosS3Client
+    import qcloud_cos  # noqa: F401
 except ImportError:
     print("请先安装腾讯云COS SDK: pip install cos-python-sdk-v5")
     sys.exit(1)
 
-import psycopg2
-from psycopg2.extras import RealDictCursor
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from audio_common.audio_bundle import upload_bundles
+from audio_common.audio_inventory import AudioInventory
+from audio_common.audio_validator import MISSING, shared_validator
+from audio_common.cos_uploader import AsyncCosUploader, CosUploader, UploadError, UploadResult
+from audio_common.job_journal import DONE, STAGE_UPLOAD, JobJournal, clip_key, run_mode
+from audio_common.metrics import metrics
+from audio_common.qa_source import SOURCE_NAMES, get_db_connection, open_qa_source
+from audio_common.qa_writeback import AudioUrlWriteback
+from audio_common.run_plan import PlanError, ThroughputHistory, describe_plan, plan_selector, read_plan
+from audio_common.sharding import ShardAssigner, parse_shard, qa_pair_weight, write_stats
+from audio_common.upload_manifest import UploadManifest
+from audio_common.word_timings import TimingIndexBuilder
 
 # ============================================================
 # 配置
@@ -45,159 +92,412 @@ AUDIO_DIR = Path(__file__).parent / "audio"
 QUESTIONS_DIR = AUDIO_DIR / "questions"
 RESPONSES_DIR = AUDIO_DIR / "responses"
 
-# COS 配置
+# 增量上传清单
+MANIFEST_PATH = AUDIO_DIR / "upload_manifest.json"
+COS_PREFIX = "qa/"
+
+# 各场景的单词时间索引（main 中创建；流式读取问答对时登记各场景的片段，音频上传后汇总上传）
+TIMINGS_DIR = AUDIO_DIR / "timings"
+timing_index: Optional[TimingIndexBuilder] = None
+
+# 音频校验结果索引（与生成脚本共用）：残缺/截断的音频不上传
+VALIDATION_INDEX_PATH = AUDIO_DIR / "validation_index.json"
+validator = shared_validator(VALIDATION_INDEX_PATH)
+
+# 任务日志（与生成脚本共用）：main 中打开；clip_filter 为 --resume / --retry-failed 的筛选函数，
+# done_clips 为日志中已上传完成的音频
+JOURNAL_PATH = AUDIO_DIR / "jobs.sqlite"
+journal: Optional[JobJournal] = None
+clip_filter: Optional[Callable[[str], bool]] = None
+done_clips: Set[str] = set()
+
+# 分片（--shard）：main 中创建，只处理分给本分片的问答对
+assigner: Optional[ShardAssigner] = None
+
+# COS 配置（COS_ENDPOINT / COS_SCHEME 可指向本地 S3 兼容服务联调）
 COS_SECRET_ID = os.getenv("COS_SECRET_ID", "")
 COS_SECRET_KEY = os.getenv("COS_SECRET_KEY", "")
-COS_REGION = os.getenv("COS_REGION", "ap-guangzhou")
-COS_BUCKET = "kouyu-scene-1300762139"
-
-# 数据库配置
-DATABASE_URL = os.getenv("DATABASE_URL", "")
+COS_BUCKET = os.getenv("COS_BUCKET", "kouyu-scene-1300762139")
 
 # 并发数
 MAX_WORKERS = 20
+# 同时提交到线程池的问答对上限（流式读取时的反压）
+MAX_PENDING = MAX_WORKERS * 4
+# 异步引擎同时进行的上传数
+ASYNC_CONCURRENCY = 200
 
-# 统计信息（线程安全）
+# 统计信息（线程引擎下由 stats_lock 保护；异步引擎只在事件循环线程中修改，无需加锁）
 stats_lock = threading.Lock()
 stats = {
+    "bytes_uploaded": 0,
     "questions_uploaded": 0,
+    "questions_unchanged": 0,
     "questions_skipped": 0,
+    "questions_invalid": 0,
     "questions_failed": 0,
     "responses_uploaded": 0,
+    "responses_unchanged": 0,
     "responses_skipped": 0,
+    "responses_invalid": 0,
     "responses_failed": 0,
+    "journal_skipped": 0,
+    "timings_uploaded": 0,
+    "timings_unchanged": 0,
+    "timings_failed": 0,
 }
 
+# 最近一次上传失败的原因（本地路径 -> 错误信息），写入任务日志
+failure_reasons: Dict[Path, str] = {}
+
 # ============================================================
 # COS 客户端
 # ============================================================
 
-def init_cos_client() -> CosS3Client:
-    """初始化腾讯云COS客户端"""
+def init_cos_client(workers: int = MAX_WORKERS) -> CosUploader:
+    """初始化腾讯云COS上传器（连接池大小与上传并发数一致）"""
     if not COS_SECRET_ID or not COS_SECRET_KEY:
         print("❌ 错误: 请设置 COS_SECRET_ID 和 COS_SECRET_KEY 环境变量")
         sys.exit(1)
     
-    config = CosConfig(
-        Region=COS_REGION,
-        SecretId=COS_SECRET_ID,
-        SecretKey=COS_SECRET_KEY,
-    )
-    return CosS3Client(config)
-
-# ============================================================
-# 数据库操作
-# ============================================================
-
-def get_db_connection():
-    """获取数据库连接"""
-    if not DATABASE_URL:
-        print("❌ 错误: 请设置 DATABASE_URL 环境变量")
-        sys.exit(1)
-    return psycopg2.connect(DATABASE_URL)
-
-def fetch_qa_pairs(scene_ids: List[str] = None) -> List[dict]:
-    """从数据库获取问答对"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
-    if scene_ids:
-        placeholders = ','.join(['%s'] * len(scene_ids))
-        cursor.execute(f"""
-            SELECT qp.id, qp.responses, ss.scene_id
-            FROM qa_pairs qp
-            JOIN sub_scenes ss ON qp.sub_scene_id = ss.id
-            WHERE ss.scene_id IN ({placeholders})
-            ORDER BY ss.scene_id, qp."order"
-        """, scene_ids)
-    else:
-        cursor.execute("""
-            SELECT id, responses
-            FROM qa_pairs
-            ORDER BY sub_scene_id, "order"
-        """)
-    
-    qa_pairs = [dict(row) for row in cursor.fetchall()]
-    cursor.close()
-    conn.close()
-    
-    return qa_pairs
+    return CosUploader.from_env(COS_BUCKET, workers)
 
 # ============================================================
 # COS 上传
 # ============================================================
 
-def upload_to_cos(client: CosS3Client, local_path: Path, cos_path: str) -> bool:
-    """上传文件到腾讯云COS"""
+def upload_to_cos(uploader: CosUploader, local_path: Path, cos_path: str) -> Optional[UploadResult]:
+    """上传文件到腾讯云COS（重试与校验由 CosUploader 负责），失败返回 None"""
     try:
-        with open(local_path, 'rb') as fp:
-            client.put_object(
-                Bucket=COS_BUCKET,
-                Body=fp,
-                Key=cos_path,
-                EnableMD5=False
-            )
-        return True
-    except Exception as e:
+        with metrics.stage("upload", file=local_path.name):
+            result = uploader.upload(local_path, cos_path)
+        metrics.inc("upload_bytes", result.size)
+        return result
+    except (UploadError, OSError) as e:
         with stats_lock:
             print(f"  ❌ 上传失败 {local_path.name}: {e}")
-        return False
+        failure_reasons[local_path] = f"{type(e).__name__}: {e}"
+        return None
+
+async def upload_to_cos_async(uploader: AsyncCosUploader, local_path: Path, cos_path: str) -> Optional[UploadResult]:
+    """异步上传文件到腾讯云COS，失败返回 None"""
+    try:
+        with metrics.stage("upload", file=local_path.name):
+            result = await uploader.upload(local_path, cos_path)
+        metrics.inc("upload_bytes", result.size)
+        return result
+    except (UploadError, OSError) as e:
+        print(f"  ❌ 上传失败 {local_path.name}: {e}")
+        failure_reasons[local_path] = f"{type(e).__name__}: {e}"
+        return None
+
+def local_path_for_key(cos_path: str) -> Optional[Path]:
+    """COS Key -> 本地音频路径（qa/questions/x.mp3 -> audio/questions/x.mp3）"""
+    if not cos_path.startswith(COS_PREFIX):
+        return None
+    return AUDIO_DIR / cos_path[len(COS_PREFIX):]
 
 # ============================================================
 # 处理单个问答对
 # ============================================================
 
-def process_qa_pair(client: CosS3Client, qa: dict):
-    """处理单个问答对，上传音频到COS"""
-    qa_id = qa["id"]
-    responses = qa["responses"] or []
+def local_audio_ok(local_path: Path, kind: str) -> bool:
+    """本地音频存在且通过结构校验（校验结果按文件指纹缓存，未变化的文件不会重复解析）"""
+    with metrics.stage("validate"):
+        result = validator.check(local_path)
+    if result.ok:
+        return True
+    with stats_lock:
+        if result.reason != MISSING:
+            stats[f"{kind}_invalid"] += 1
+            print(f"  ⚠️ 音频不完整，跳过上传 {local_path.name}: {result.reason}")
+        else:
+            stats[f"{kind}_skipped"] += 1
+    if journal:
+        journal.fail(STAGE_UPLOAD, clip_key(local_path), result.reason)
+    return False
+
+def journal_finish(local_path: Path, ok: bool) -> None:
+    """把单个音频的上传结果写入任务日志"""
+    if not journal:
+        return
+    if ok:
+        journal.done(STAGE_UPLOAD, clip_key(local_path))
+    else:
+        journal.fail(STAGE_UPLOAD, clip_key(local_path), failure_reasons.pop(local_path, "上传失败"))
+
+def manifest_unchanged(manifest: Optional[UploadManifest], local_path: Path, cos_path: str) -> bool:
+    """清单中记录的内容与本地文件一致（无需上传）"""
+    if not manifest:
+        return False
+    with metrics.stage("manifest_check"):
+        return manifest.is_unchanged(local_path, cos_path)
+
+def upload_clip(
+    uploader: CosUploader,
+    local_path: Path,
+    cos_path: str,
+    kind: str,
+    manifest: Optional[UploadManifest] = None,
+) -> bool:
+    """
+    上传单个音频：本地缺失计为跳过，未通过校验计为不完整，清单中内容未变计为未变化
+    返回远端是否已有该文件的当前内容（已上传或未变化）
+    """
+    if not local_audio_ok(local_path, kind):
+        return False
     
-    # 1. 上传问题音频
-    question_audio_path = QUESTIONS_DIR / f"{qa_id}.mp3"
+    if manifest_unchanged(manifest, local_path, cos_path):
+        with stats_lock:
+            stats[f"{kind}_unchanged"] += 1
+        journal_finish(local_path, True)
+        return True
     
-    if question_audio_path.exists() and question_audio_path.stat().st_size > 1024:
-        cos_path = f"qa/questions/{qa_id}.mp3"
-        
-        if upload_to_cos(client, question_audio_path, cos_path):
-            with stats_lock:
-                stats["questions_uploaded"] += 1
-        else:
-            with stats_lock:
-                stats["questions_failed"] += 1
+    if journal:
+        journal.start(STAGE_UPLOAD, clip_key(local_path))
+    result = upload_to_cos(uploader, local_path, cos_path)
+    journal_finish(local_path, result is not None)
+    if result is not None:
+        if manifest:
+            manifest.record(local_path, cos_path, result.etag, result.md5)
+        with stats_lock:
+            stats[f"{kind}_uploaded"] += 1
+            stats["bytes_uploaded"] += result.size
+        return True
     else:
         with stats_lock:
-            stats["questions_skipped"] += 1
+            stats[f"{kind}_failed"] += 1
+        return False
+
+async def upload_clip_async(
+    uploader: AsyncCosUploader,
+    local_path: Path,
+    cos_path: str,
+    kind: str,
+    manifest: Optional[UploadManifest] = None,
+) -> bool:
+    """upload_clip 的异步版本（统计只在事件循环线程中修改）"""
+    if not local_audio_ok(local_path, kind):
+        return False
     
-    # 2. 上传答案音频
-    for idx, response in enumerate(responses):
-        response_audio_path = RESPONSES_DIR / f"{qa_id}_response{idx}.mp3"
-        
-        if response_audio_path.exists() and response_audio_path.stat().st_size > 1024:
-            cos_path = f"qa/responses/{qa_id}_response{idx}.mp3"
-            
-            if upload_to_cos(client, response_audio_path, cos_path):
-                with stats_lock:
-                    stats["responses_uploaded"] += 1
-            else:
-                with stats_lock:
-                    stats["responses_failed"] += 1
-        else:
+    if manifest_unchanged(manifest, local_path, cos_path):
+        stats[f"{kind}_unchanged"] += 1
+        journal_finish(local_path, True)
+        return True
+    
+    if journal:
+        journal.start(STAGE_UPLOAD, clip_key(local_path))
+    result = await upload_to_cos_async(uploader, local_path, cos_path)
+    journal_finish(local_path, result is not None)
+    if result is None:
+        stats[f"{kind}_failed"] += 1
+        return False
+    if manifest:
+        manifest.record(local_path, cos_path, result.etag, result.md5)
+    stats[f"{kind}_uploaded"] += 1
+    stats["bytes_uploaded"] += result.size
+    return True
+
+def in_shard(qa: dict) -> bool:
+    """问答对是否属于本分片（须对数据源中的每个问答对按顺序调用）"""
+    return assigner is None or assigner.owns(qa["id"], qa_pair_weight(qa))
+
+def qa_clips(qa: dict) -> Iterator[Tuple[str, Path, str, Optional[int]]]:
+    """问答对的全部音频: (类型, 本地路径, COS路径, 答案序号；问题为 None)"""
+    qa_id = qa["id"]
+    yield "questions", QUESTIONS_DIR / f"{qa_id}.mp3", f"{COS_PREFIX}questions/{qa_id}.mp3", None
+    for idx, _ in enumerate(qa["responses"] or []):
+        name = f"{qa_id}_response{idx}.mp3"
+        yield "responses", RESPONSES_DIR / name, f"{COS_PREFIX}responses/{name}", idx
+
+def selected_clips(
+    qa: dict, writeback: Optional[AudioUrlWriteback] = None
+) -> Iterator[Tuple[str, Path, str, Optional[int]]]:
+    """
+    qa_clips 按任务日志筛选（--resume / --retry-failed），未选中的音频不 stat、不查清单
+    日志中已上传完成的音频仍加入数据库回写（值未变化的行不会被改写），避免上次退出前未提交的回写丢失
+    """
+    for clip in qa_clips(qa):
+        key = clip_key(clip[1])
+        if clip_filter and not clip_filter(key):
             with stats_lock:
-                stats["responses_skipped"] += 1
+                stats["journal_skipped"] += 1
+            if key in done_clips:
+                record_writeback(writeback, qa["id"], clip[2], clip[3])
+            continue
+        yield clip
+
+def record_writeback(writeback: Optional[AudioUrlWriteback], qa_id: str, cos_path: str, idx: Optional[int]) -> None:
+    if not writeback:
+        return
+    if idx is None:
+        writeback.add_question(qa_id, cos_path)
+    else:
+        writeback.add_response(qa_id, idx, cos_path)
+
+def process_qa_pair(
+    uploader: CosUploader,
+    qa: dict,
+    manifest: Optional[UploadManifest] = None,
+    writeback: Optional[AudioUrlWriteback] = None,
+):
+    """处理单个问答对，上传音频到COS，成功的路径交给 writeback 回写数据库"""
+    for kind, local_path, cos_path, idx in selected_clips(qa, writeback):
+        if upload_clip(uploader, local_path, cos_path, kind, manifest):
+            record_writeback(writeback, qa["id"], cos_path, idx)
+
+# ============================================================
+# 上传引擎
+# ============================================================
+
+def run_thread_engine(source, uploader: CosUploader, args, manifest, writeback, writeback_conn) -> None:
+    """线程池引擎：每个问答对一个任务，MAX_WORKERS 个线程阻塞式上传"""
+    print(f"\n🚀 开始并发上传音频（线程引擎，并发数: {MAX_WORKERS}，流式读取问答对）...")
+    print("=" * 60)
+    
+    completed = 0
+    
+    def collect(done_futures) -> None:
+        nonlocal completed
+        for future in done_futures:
+            qa_id = futures.pop(future)
+            try:
+                future.result()
+                completed += 1
+                if completed % 50 == 0:
+                    print(f"  📊 已处理: {completed} 个问答对")
+            except Exception as e:
+                print(f"  ❌ 处理失败 {qa_id}: {e}")
+    
+    futures = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="upload") as executor:
+        for chunk in metrics.timed_iter(source.iter_qa_pair_chunks(args.scenes), "db_fetch"):
+            if timing_index:
+                timing_index.add_qa_pairs(chunk)
+            for qa in filter(in_shard, chunk):
+                futures[executor.submit(process_qa_pair, uploader, qa, manifest, writeback)] = qa["id"]
+                metrics.set_gauge("upload_pending", len(futures))
+                if len(futures) >= MAX_PENDING:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    collect(done)
+                    if writeback:
+                        writeback.flush(writeback_conn)
+        collect(list(futures))
+    print(f"  📊 共处理: {completed} 个问答对")
+
+async def run_async_engine(source, uploader: CosUploader, args, manifest, writeback, writeback_conn) -> None:
+    """异步引擎：单线程事件循环，最多 concurrency 个音频同时上传"""
+    print(f"\n🚀 开始并发上传音频（异步引擎，并发数: {args.concurrency}，流式读取问答对）...")
+    print("=" * 60)
+    
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(args.concurrency)
+    tasks = set()
+    completed = 0
+    flushing = None
+    
+    async def run_clip(au: AsyncCosUploader, qa_id: str, kind: str, local_path: Path, cos_path: str, idx):
+        nonlocal completed
+        try:
+            if await upload_clip_async(au, local_path, cos_path, kind, manifest):
+                record_writeback(writeback, qa_id, cos_path, idx)
+        finally:
+            slots.release()
+        completed += 1
+        if completed % 200 == 0:
+            print(f"  📊 已处理: {completed} 个音频")
+    
+    async with AsyncCosUploader(uploader, args.concurrency) as au:
+        async for chunk in metrics.timed_aiter(source.aiter_qa_pair_chunks(args.scenes), "db_fetch"):
+            if timing_index:
+                timing_index.add_qa_pairs(chunk)
+            for qa in filter(in_shard, chunk):
+                for kind, local_path, cos_path, idx in selected_clips(qa, writeback):
+                    await slots.acquire()
+                    task = asyncio.create_task(run_clip(au, qa["id"], kind, local_path, cos_path, idx))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            # 数据库回写放到线程池，不阻塞事件循环；同一时间只有一个回写
+            if writeback and writeback.pending() >= writeback.batch_size and (flushing is None or flushing.done()):
+                flushing = loop.run_in_executor(None, writeback.flush, writeback_conn)
+        await asyncio.gather(*tasks)
+        if flushing is not None:
+            await flushing
+    print(f"  📊 共处理: {completed} 个音频")
+
+def upload_timing_indexes(uploader: CosUploader, manifest: Optional[UploadManifest]) -> None:
+    """汇总已登记场景的单词时间索引并上传（内容未变的按上传清单跳过）"""
+    with metrics.stage("timings"):
+        paths = timing_index.build()
+    timing_index.save()
+    uploaded, unchanged, failed = upload_bundles(
+        uploader, manifest, [[path] for path in paths],
+        lambda path: COS_PREFIX + path.relative_to(AUDIO_DIR).as_posix(), MAX_WORKERS,
+    )
+    stats["timings_uploaded"] += uploaded
+    stats["timings_unchanged"] += unchanged
+    stats["timings_failed"] += failed
+
+def print_throughput(elapsed: float) -> None:
+    """打印吞吐量，便于对比两种引擎"""
+    files = stats["questions_uploaded"] + stats["responses_uploaded"]
+    megabytes = stats["bytes_uploaded"] / (1024 * 1024)
+    elapsed = max(elapsed, 1e-9)
+    print(f"   吞吐量:")
+    print(f"      耗时: {elapsed:.1f}s，上传 {files} 个文件 / {megabytes:.1f}MB")
+    print(f"      {files / elapsed:.1f} files/s，{megabytes / elapsed:.2f} MB/s")
 
 # ============================================================
 # 主函数
 # ============================================================
 
 def main():
-    parser = argparse.ArgumentParser(description='上传音频到COS（不更新数据库）')
+    parser = argparse.ArgumentParser(description='上传音频到COS并回写数据库 audio_url')
     parser.add_argument('--scenes', nargs='+', help='指定场景ID列表（可选）')
+    parser.add_argument('--reconcile', action='store_true', help='上传前通过 list_objects 从桶中重建上传清单')
+    parser.add_argument('--no-manifest', action='store_true', help='忽略上传清单，全部重新上传')
+    parser.add_argument('--no-db-update', action='store_true', help='仅上传，不回写数据库 audio_url')
+    parser.add_argument('--no-timings', action='store_true', help='不汇总/上传各场景的单词时间索引（qa/timings/）')
+    parser.add_argument('--engine', choices=['thread', 'async'], default='thread',
+                        help='上传引擎: thread=线程池（默认），async=单线程异步')
+    parser.add_argument('--concurrency', type=int, default=ASYNC_CONCURRENCY,
+                        help=f'异步引擎同时进行的上传数（默认 {ASYNC_CONCURRENCY}）')
+    parser.add_argument('--source', choices=SOURCE_NAMES, default='db',
+                        help='问答对来源: db=数据库（默认），files=prepare/scene/data/sub-scenes 下的 JSON')
+    resume_group = parser.add_mutually_exclusive_group()
+    resume_group.add_argument('--resume', action='store_true',
+                              help='只上传任务日志中未完成的音频（上次中途退出后使用）')
+    resume_group.add_argument('--retry-failed', action='store_true', help='只重试任务日志中上次失败的音频')
+    resume_group.add_argument('--plan', type=Path,
+                              help='按 plan_audio.py 写出的计划执行（数据源、场景与计划一致，只处理需要上传的音频）')
+    parser.add_argument('--shard', type=parse_shard,
+                        help='只处理第 i 份（格式 i/N，需与生成时的 --shard/--source/--scenes 一致）')
+    parser.add_argument('--stats-json', type=Path, help='结束时把统计写入该 JSON 文件（分片启动器汇总用）')
+    parser.add_argument('--metrics-dir', type=Path,
+                        help='写出分阶段指标：events.jsonl（每个阶段一行）和 Prometheus 文本文件（.prom）')
+    parser.add_argument('--profile-stage', nargs='+', default=[], metavar='STAGE',
+                        help='对这些阶段做 cProfile（只在主线程中生效，线程引擎请用 py-spy），结果写入 .prof')
     args = parser.parse_args()
+    mode = run_mode(args)
+    plan = None
+    if args.plan:
+        try:
+            plan = read_plan(args.plan, "qa")
+        except PlanError as e:
+            print(f"❌ 错误: {e}")
+            sys.exit(1)
+        args.source, args.scenes = plan["source"], plan["scenes"]
+    global journal, clip_filter, done_clips, assigner, timing_index
+    metrics.configure(args.metrics_dir, "upload", args.shard.label if args.shard else "", args.profile_stage)
     
     print("☁️ 问答对音频上传工具")
     print("=" * 60)
     if args.scenes:
         print(f"目标场景: {', '.join(args.scenes)}")
+    if args.shard:
+        assigner = ShardAssigner(args.shard)
+        print(f"分片: {args.shard}")
+    if plan:
+        print(f"模式: 按计划执行 {args.plan}（{describe_plan(plan, 'upload')}）")
     
     # 检查音频目录
     if not AUDIO_DIR.exists():
@@ -207,35 +507,74 @@ def main():
     
     # 初始化COS客户端
     print("\n☁️ 初始化腾讯云COS客户端...")
-    client = init_cos_client()
-    print("   ✅ COS客户端初始化成功")
+    pool_size = args.concurrency if args.engine == 'async' else MAX_WORKERS
+    uploader = init_cos_client(pool_size)
+    print(f"   ✅ COS客户端初始化成功（连接池: {pool_size}，最多重试 {uploader.max_retries} 次，"
+          f"分片阈值: {uploader.multipart_threshold // (1024 * 1024)}MB）")
     
-    # 获取问答对数据
-    print("\n📖 从数据库获取问答对数据...")
-    qa_pairs = fetch_qa_pairs(args.scenes)
-    print(f"   ✅ 获取到 {len(qa_pairs)} 个问答对")
+    # 加载上传清单
+    manifest = None
+    if not args.no_manifest:
+        manifest = UploadManifest(MANIFEST_PATH)
+        print(f"\n📒 上传清单: {MANIFEST_PATH}（{len(manifest.entries)} 条记录）")
+        if args.reconcile:
+            print("   🔄 通过 list_objects 重建清单...")
+            result = manifest.reconcile(uploader.client, COS_BUCKET, COS_PREFIX, local_path_for_key)
+            manifest.save()
+            print(f"   ✅ 远端对象 {result['remote']} 个，内容一致 {result['matched']} 个，不一致 {result['mismatched']} 个")
     
-    # 并发处理
-    print(f"\n🚀 开始并发上传音频（并发数: {MAX_WORKERS}）...")
-    print("=" * 60)
+    # 回写数据库（与读取问答对使用不同连接，避免打断服务端游标）
+    writeback = None
+    writeback_conn = None
+    if args.source == 'files' and not args.no_db_update and not os.getenv("DATABASE_URL"):
+        print("\n⚠️ 未设置 DATABASE_URL，跳过数据库回写")
+        args.no_db_update = True
+    if not args.no_db_update:
+        writeback = AudioUrlWriteback()
+        writeback_conn = get_db_connection()
     
-    completed = 0
+    # 任务日志
+    journal = JobJournal(JOURNAL_PATH)
+    clip_filter = plan_selector(plan, "upload") if plan else journal.selector(STAGE_UPLOAD, mode)
+    # 一次 scandir 取得本地音频，逐个检查时不再对每个路径 stat（本地没有的音频没有系统调用）
+    with metrics.stage("inventory"):
+        validator.inventory = AudioInventory(AUDIO_DIR, [QUESTIONS_DIR.name, RESPONSES_DIR.name])
+    if mode:
+        done_clips = journal.clips(STAGE_UPLOAD, DONE)
+        print(f"\n📒 任务日志: {JOURNAL_PATH}（{'续跑未完成的音频' if args.resume else '只重试失败的音频'}）")
+    elif not args.shard and not plan:
+        # 并行校验本地音频（结果写入索引，上传时逐个判断直接复用；分片时各进程只逐个校验自己的音频）
+        results = validator.validate_inventory(validator.inventory)
+        invalid = sum(1 for result in results.values() if not result.ok)
+        print(f"\n🔍 本地音频: {len(results)} 个，未通过校验 {invalid} 个（不会上传）")
     
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {
-            executor.submit(process_qa_pair, client, qa): qa["id"] 
-            for qa in qa_pairs
-        }
-        
-        for future in as_completed(futures):
-            qa_id = futures[future]
-            try:
-                future.result()
-                completed += 1
-                if completed % 50 == 0 or completed == len(qa_pairs):
-                    print(f"  📊 进度: {completed}/{len(qa_pairs)} ({completed*100//len(qa_pairs)}%)")
-            except Exception as e:
-                print(f"  ❌ 处理失败 {qa_id}: {e}")
+    # 单词时间索引按场景汇总；分片时每个分片只有部分片段，全部分片结束后不带 --shard 再运行一次即可
+    if not args.no_timings and not args.shard:
+        timing_index = TimingIndexBuilder(AUDIO_DIR, TIMINGS_DIR, [QUESTIONS_DIR.name, RESPONSES_DIR.name])
+    
+    # 边流式读取问答对边上传
+    source = open_qa_source(args.source)
+    started = time.monotonic()
+    try:
+        if args.engine == 'async':
+            asyncio.run(run_async_engine(source, uploader, args, manifest, writeback, writeback_conn))
+        else:
+            run_thread_engine(source, uploader, args, manifest, writeback, writeback_conn)
+        if timing_index:
+            upload_timing_indexes(uploader, manifest)
+    finally:
+        if manifest:
+            manifest.save()
+        validator.save()
+        journal.flush()
+        if writeback:
+            writeback.flush(writeback_conn, force=True)
+            writeback_conn.close()
+    elapsed = time.monotonic() - started
+    uploaded = stats["questions_uploaded"] + stats["responses_uploaded"]
+    if uploaded and not args.shard:
+        # 吞吐历史供 plan_audio.py 估计耗时（分片时各进程只承担一部分速率，不记录）
+        ThroughputHistory().record("upload", elapsed, files=uploaded, bytes=stats["bytes_uploaded"])
     
     # 打印统计信息
     print("\n" + "=" * 60)
@@ -243,14 +582,40 @@ def main():
     print("=" * 60)
     print(f"   问题音频:")
     print(f"      上传: {stats['questions_uploaded']}")
+    print(f"      未变化: {stats['questions_unchanged']}")
     print(f"      跳过: {stats['questions_skipped']}")
+    print(f"      不完整: {stats['questions_invalid']}")
     print(f"      失败: {stats['questions_failed']}")
     print(f"   答案音频:")
     print(f"      上传: {stats['responses_uploaded']}")
+    print(f"      未变化: {stats['responses_unchanged']}")
     print(f"      跳过: {stats['responses_skipped']}")
+    print(f"      不完整: {stats['responses_invalid']}")
     print(f"      失败: {stats['responses_failed']}")
+    if timing_index:
+        print(f"   单词时间索引: 重建 {timing_index.stats['built']} 个场景（缺少时间信息的片段 {timing_index.stats['missing']} 个），"
+              f"上传 {stats['timings_uploaded']}，未变化 {stats['timings_unchanged']}，失败 {stats['timings_failed']}")
+    print_throughput(elapsed)
+    if assigner:
+        print(f"   {assigner.describe()}")
+    if mode or plan:
+        print(f"   {'不在计划中' if plan else '按任务日志跳过'}（未检查）: {stats['journal_skipped']}")
+    journal.print_summary(STAGE_UPLOAD)
+    journal.close()
+    if writeback:
+        print(f"   数据库回写:")
+        print(f"      问题 audio_url: {writeback.updated['questions']} 行")
+        print(f"      答案 audio_url: {writeback.updated['responses']} 行")
+    if args.stats_json:
+        write_stats(args.stats_json, {
+            **stats,
+            "writeback_questions": writeback.updated["questions"] if writeback else 0,
+            "writeback_responses": writeback.updated["responses"] if writeback else 0,
+        })
+    metrics.print_summary()
+    metrics.close()
     
-    if stats["questions_failed"] > 0 or stats["responses_failed"] > 0:
+    if stats["questions_failed"] > 0 or stats["responses_failed"] > 0 or stats["timings_failed"] > 0:
         print("\n⚠️ 部分上传失败，请检查日志")
         sys.exit(1)
     else:
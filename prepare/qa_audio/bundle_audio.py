@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+把问答对音频按子场景（或场景）打包，并可上传到 COS（与单条音频并存）
+
+一个子场景有几十条短音频（每个问答对 1 个问题 + 2~3 个答案），逐条请求开销大。
+打包后客户端一次请求即可预取整个子场景，或按索引用 HTTP Range 读取单条：
+  本地: prepare/qa_audio/audio/bundles/sub_scenes/{sub_scene_id}.mp3 + .json（偏移索引）
+  COS:  qa/bundles/sub_scenes/{sub_scene_id}.mp3 + .json
+格式见 audio_common/audio_bundle.py。
+
+在生成之后运行（分片生成时等所有分片结束后再运行）；只有片段发生变化的包会重新拼接，
+上传时按上传清单跳过内容未变的包，包先于索引上传。
+
+使用方法:
+  python prepare/qa_audio/bundle_audio.py                       # 按子场景打包
+  python prepare/qa_audio/bundle_audio.py --upload              # 打包并上传变化的包
+  python prepare/qa_audio/bundle_audio.py --by scene --upload   # 按场景打包
+  python prepare/qa_audio/bundle_audio.py --scenes daily_001    # 只处理指定场景
+  python prepare/qa_audio/bundle_audio.py --source files --force
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+from dotenv import load_dotenv
+env_path = Path(__file__).parent.parent.parent / ".env.local"
+load_dotenv(env_path)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from audio_common.audio_bundle import GROUPINGS, BundleBuilder, plan_bundles, upload_bundles
+from audio_common.audio_inventory import AudioInventory
+from audio_common.audio_validator import shared_validator
+from audio_common.metrics import metrics
+from audio_common.qa_source import SOURCE_NAMES, open_qa_source
+from audio_common.upload_manifest import UploadManifest
+
+# ============================================================
+# 配置（与生成/上传脚本一致）
+# ============================================================
+
+AUDIO_DIR = Path(__file__).parent / "audio"
+SUBDIRS = ["questions", "responses"]
+BUNDLE_DIR = AUDIO_DIR / "bundles"
+VALIDATION_INDEX_PATH = AUDIO_DIR / "validation_index.json"
+MANIFEST_PATH = AUDIO_DIR / "upload_manifest.json"
+COS_PREFIX = "qa/"
+
+COS_BUCKET = os.getenv("COS_BUCKET", "kouyu-scene-1300762139")
+MAX_WORKERS = 8
+
+# ============================================================
+# 上传
+# ============================================================
+
+def cos_key_for(local_path: Path) -> str:
+    """audio/bundles/sub_scenes/x.mp3 -> qa/bundles/sub_scenes/x.mp3（与 2_upload_to_cos.py 的路径映射一致）"""
+    return COS_PREFIX + local_path.relative_to(AUDIO_DIR).as_posix()
+
+def upload(bundles: List[Tuple[Path, Path]], use_manifest: bool) -> int:
+    """并发上传各包（包在前、索引在后），返回失败的包数"""
+    from audio_common.cos_uploader import CosUploader
+
+    if not os.getenv("COS_SECRET_ID") or not os.getenv("COS_SECRET_KEY"):
+        print("❌ 错误: 请设置 COS_SECRET_ID 和 COS_SECRET_KEY 环境变量")
+        sys.exit(1)
+    uploader = CosUploader.from_env(COS_BUCKET, MAX_WORKERS)
+    manifest = UploadManifest(MANIFEST_PATH) if use_manifest else None
+
+    print(f"\n☁️ 上传 {len(bundles)} 个包到 {COS_BUCKET}/{COS_PREFIX}bundles/ ...")
+    try:
+        totals = upload_bundles(uploader, manifest, bundles, cos_key_for, MAX_WORKERS)
+    finally:
+        if manifest:
+            manifest.save()
+    print(f"   上传: {totals[0]} 个文件，未变化: {totals[1]} 个，失败: {totals[2]} 个包")
+    return totals[2]
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='按子场景/场景打包问答对音频（带偏移索引），可选上传到COS')
+    parser.add_argument('--by', choices=list(GROUPINGS), default='sub_scene',
+                        help='打包粒度: sub_scene=每个子场景一个包（默认），scene=每个场景一个包')
+    parser.add_argument('--scenes', nargs='+', help='指定场景ID列表（可选，默认全部）')
+    parser.add_argument('--source', choices=SOURCE_NAMES, default='db',
+                        help='问答对来源: db=数据库（默认），files=prepare/scene/data/sub-scenes 下的 JSON')
+    parser.add_argument('--force', action='store_true', help='忽略状态文件，重建全部包')
+    parser.add_argument('--upload', action='store_true', help='打包后上传内容变化的包和索引')
+    parser.add_argument('--no-manifest', action='store_true', help='上传时忽略上传清单，全部重新上传')
+    parser.add_argument('--metrics-dir', type=Path,
+                        help='写出分阶段指标：events.jsonl（每个阶段一行）和 Prometheus 文本文件（.prom）')
+    args = parser.parse_args()
+    metrics.configure(args.metrics_dir, "bundle")
+
+    print("📦 问答对音频打包工具")
+    print("=" * 60)
+    print(f"粒度: {args.by}，输出: {BUNDLE_DIR / GROUPINGS[args.by][1]}")
+    if args.scenes:
+        print(f"目标场景: {', '.join(args.scenes)}")
+
+    # 1. 读取问答对并分组
+    with metrics.stage("db_fetch"):
+        rows = list(open_qa_source(args.source).iter_qa_pairs(args.scenes))
+    plan = plan_bundles(rows, args.by)
+    print(f"\n📖 问答对: {len(rows)}，包: {len(plan)} 个")
+    if not plan:
+        print("❌ 错误: 没有可打包的问答对")
+        sys.exit(1)
+
+    # 2. 打包（一次 scandir 取得全部片段，未变化的包不读取任何音频）
+    started = time.monotonic()
+    validator = shared_validator(VALIDATION_INDEX_PATH)
+    with metrics.stage("inventory"):
+        inventory = AudioInventory(AUDIO_DIR, SUBDIRS)
+    validator.inventory = inventory
+    builder = BundleBuilder(AUDIO_DIR, BUNDLE_DIR, validator, args.by, inventory)
+    bundles: List[Tuple[Path, Path]] = []
+    try:
+        for bundle_id, clips in plan.items():
+            with metrics.stage("bundle", bundle=bundle_id):
+                outcome = builder.build(bundle_id, clips, args.force)
+            if outcome is not None:
+                bundles.append(builder.paths(bundle_id))
+        if not args.scenes:
+            # 全量运行时删除已不存在的子场景/场景的本地包
+            builder.prune(plan)
+    finally:
+        builder.save()
+        validator.save()
+    elapsed = time.monotonic() - started
+
+    stats = builder.stats
+    print("\n" + "=" * 60)
+    print("📊 打包统计")
+    print("=" * 60)
+    print(f"   重建: {stats['built']} 个包（{stats['clips']} 个片段，{stats['bytes'] / (1024 * 1024):.1f}MB）")
+    print(f"   未变化: {stats['unchanged']} 个包")
+    print(f"   没有可用片段: {stats['empty']} 个")
+    print(f"   缺失/未通过校验的片段: {stats['missing']} 个（记入索引的 missing，客户端回退到单条音频）")
+    if stats["removed"]:
+        print(f"   已删除过期的包: {stats['removed']} 个")
+    print(f"   耗时: {elapsed:.1f}s")
+
+    failed = 0
+    if args.upload:
+        # 未变化的包也交给上传清单判断（上次上传可能失败）
+        failed = upload(bundles, not args.no_manifest)
+
+    metrics.print_summary()
+    metrics.close()
+    if failed:
+        print("\n⚠️ 部分包上传失败，请检查日志")
+        sys.exit(1)
+    print("\n✨ 打包完成！")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+清理孤立的问答对音频（本地目录 + COS 桶中的 qa/ 前缀）
+
+问答对被删除、答案被删减或重排后，原来的音频不会被任何一次生成/上传删除，
+本地目录和桶中的对象只增不减。本脚本：
+1. 用一次 scandir 建立本地音频清单，用 list_objects 分页列出 qa/questions/ 与 qa/responses/ 下的对象
+2. 与当前问答对数据源应有的音频（问题 + 有文本的答案）批量比对，多出来的即为孤立音频
+3. 数据库中 qa_pairs.audio_url / responses[].audio_url 仍指向的音频一律保留
+4. 默认只报告；--delete 时删除本地文件（连同后处理的 .opus / .m4a 和单词时间 .words.json），
+   远端用 delete_objects 每批最多 1000 个删除，并从上传清单、校验索引和任务日志中移除对应条目
+
+最近修改过的文件（默认 24 小时内）不会被清理，避免误删其他进程正在生成/上传的新问答对音频。
+
+使用方法:
+  python prepare/qa_audio/gc_audio.py                          # 只报告
+  python prepare/qa_audio/gc_audio.py --delete                 # 删除本地与远端的孤立音频
+  python prepare/qa_audio/gc_audio.py --scope local --delete   # 只清理本地
+  python prepare/qa_audio/gc_audio.py --source files           # 以子场景 JSON 为准（仍会核对数据库引用）
+  python prepare/qa_audio/gc_audio.py --min-age-hours 0        # 包括最近修改的文件
+  python prepare/qa_audio/gc_audio.py --report orphans.json    # 完整列表写入 JSON
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+env_path = Path(__file__).parent.parent.parent / ".env.local"
+load_dotenv(env_path)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from audio_common.audio_inventory import AudioInventory
+from audio_common.audio_validator import AudioValidator
+from audio_common.job_journal import STAGE_GENERATE, STAGE_UPLOAD, JobJournal
+from audio_common.postprocess import VARIANTS
+from audio_common.qa_source import SOURCE_NAMES, get_db_connection, open_qa_source, qa_clip_names
+from audio_common.qa_writeback import cos_key, referenced_cos_keys
+from audio_common.upload_manifest import UploadManifest
+from audio_common import word_timings
+
+# ============================================================
+# 配置（与生成/上传脚本一致）
+# ============================================================
+
+AUDIO_DIR = Path(__file__).parent / "audio"
+SUBDIRS = ["questions", "responses"]
+COS_PREFIX = "qa/"
+MANIFEST_PATH = AUDIO_DIR / "upload_manifest.json"
+VALIDATION_INDEX_PATH = AUDIO_DIR / "validation_index.json"
+JOURNAL_PATH = AUDIO_DIR / "jobs.sqlite"
+
+COS_BUCKET = os.getenv("COS_BUCKET", "kouyu-scene-1300762139")
+
+DEFAULT_MIN_AGE_HOURS = 24.0
+
+# 孤立音频: 子目录/文件名 -> 大小（字节）
+Orphans = Dict[str, int]
+
+# ============================================================
+# 应有的音频与被引用的音频
+# ============================================================
+
+def name_for_key(key: Optional[str]) -> Optional[str]:
+    """COS Key -> 子目录/文件名（qa/questions/x.mp3 -> questions/x.mp3），不在 qa/ 下时返回 None"""
+    if not key or not key.startswith(COS_PREFIX):
+        return None
+    return key[len(COS_PREFIX):]
+
+def referenced_names(qa: dict) -> Iterator[str]:
+    """数据源行中 audio_url 指向的音频"""
+    urls = [qa.get("audio_url")] + [response.get("audio_url") for response in qa["responses"] or []]
+    for url in urls:
+        name = name_for_key(cos_key(url))
+        if name:
+            yield name
+
+def load_source(source_name: str) -> Tuple[Set[str], Set[str], int]:
+    """读取全部问答对，返回 (应有的音频, 数据源中引用的音频, 问答对数)"""
+    expected: Set[str] = set()
+    referenced: Set[str] = set()
+    count = 0
+    for qa in open_qa_source(source_name).iter_qa_pairs():
+        count += 1
+        expected.update(name for _, name in qa_clip_names(qa))
+        referenced.update(referenced_names(qa))
+    return expected, referenced, count
+
+# ============================================================
+# 比对
+# ============================================================
+
+def classify(names: Iterator[Tuple[str, int, float]], expected: Set[str], referenced: Set[str],
+             min_age_hours: float, counts: Dict[str, int]) -> Orphans:
+    """把 (名称, 大小, 修改时间) 分为应有 / 被引用 / 太新 / 孤立，返回孤立的部分"""
+    orphans: Orphans = {}
+    now = time.time()
+    for name, size, mtime in names:
+        counts["total"] += 1
+        if name in expected:
+            counts["expected"] += 1
+        elif name in referenced:
+            counts["protected"] += 1
+        elif now - mtime < min_age_hours * 3600:
+            counts["recent"] += 1
+        else:
+            orphans[name] = size
+    return orphans
+
+def local_files(inventory: AudioInventory) -> Iterator[Tuple[str, int, float]]:
+    for name, entry in inventory.files():
+        st = entry.stat()
+        yield name, st.st_size, st.st_mtime
+
+def remote_objects(uploader) -> Iterator[Tuple[str, int, float]]:
+    for subdir in SUBDIRS:
+        for obj in uploader.list_objects(f"{COS_PREFIX}{subdir}/"):
+            if obj["Key"].endswith("/"):
+                continue
+            modified = datetime.fromisoformat(obj["LastModified"].replace("Z", "+00:00")).timestamp()
+            yield name_for_key(obj["Key"]), int(obj.get("Size", 0)), modified
+
+def new_counts() -> Dict[str, int]:
+    return {"total": 0, "expected": 0, "protected": 0, "recent": 0}
+
+def print_orphans(title: str, counts: Dict[str, int], orphans: Orphans, list_all: bool, prefix: str = "") -> None:
+    megabytes = sum(orphans.values()) / (1024 * 1024)
+    print(f"\n{title}: {counts['total']} 个")
+    print(f"   应有: {counts['expected']}")
+    print(f"   数据库仍引用（保留）: {counts['protected']}")
+    print(f"   最近修改（保留）: {counts['recent']}")
+    print(f"   孤立: {len(orphans)} 个 / {megabytes:.1f}MB")
+    limit = None if list_all else 20
+    for name in sorted(orphans)[:limit]:
+        print(f"      {prefix}{name}")
+    if limit and len(orphans) > limit:
+        print(f"      ... 其余 {len(orphans) - limit} 个（--list-all 查看全部）")
+
+# ============================================================
+# 删除
+# ============================================================
+
+def delete_local(orphans: Orphans) -> int:
+    """删除本地孤立音频及其后处理格式，返回删除的音频数"""
+    deleted: List[str] = []
+    for name in orphans:
+        path = AUDIO_DIR / name
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"  ❌ 删除失败 {name}: {e}")
+            continue
+        for extension, _ in VARIANTS.values():
+            path.with_suffix(extension).unlink(missing_ok=True)
+        word_timings.remove(path)
+        deleted.append(name)
+
+    validator = AudioValidator(VALIDATION_INDEX_PATH)
+    validator.forget(AUDIO_DIR / name for name in deleted)
+    validator.save()
+    with JobJournal(JOURNAL_PATH) as journal:
+        journal.forget(STAGE_GENERATE, deleted)
+    return len(deleted)
+
+def delete_remote(uploader, orphans: Orphans) -> int:
+    """批量删除远端孤立对象，返回删除的对象数"""
+    keys = [f"{COS_PREFIX}{name}" for name in orphans]
+    failures = uploader.delete_objects(keys)
+    for key, reason in failures[:20]:
+        print(f"  ❌ 删除失败 {key}: {reason}")
+    failed = {key for key, _ in failures}
+    deleted = [key for key in keys if key not in failed]
+
+    if MANIFEST_PATH.exists():
+        manifest = UploadManifest(MANIFEST_PATH)
+        manifest.forget(deleted)
+        manifest.save()
+    with JobJournal(JOURNAL_PATH) as journal:
+        journal.forget(STAGE_UPLOAD, [name_for_key(key) for key in deleted])
+    return len(deleted)
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='报告并清理孤立的问答对音频（本地 + COS）')
+    parser.add_argument('--source', choices=SOURCE_NAMES, default='db',
+                        help='以哪个数据源为准: db=数据库（默认），files=prepare/scene/data/sub-scenes 下的 JSON')
+    parser.add_argument('--scope', choices=['all', 'local', 'remote'], default='all',
+                        help='清理范围: all=本地与远端（默认），local=只本地，remote=只远端')
+    parser.add_argument('--delete', action='store_true', help='删除孤立音频（默认只报告）')
+    parser.add_argument('--min-age-hours', type=float, default=DEFAULT_MIN_AGE_HOURS,
+                        help=f'只清理修改时间早于这么多小时的文件（默认 {DEFAULT_MIN_AGE_HOURS:g}）')
+    parser.add_argument('--report', type=Path, help='把孤立音频的完整列表写入该 JSON 文件')
+    parser.add_argument('--list-all', action='store_true', help='列出全部孤立音频（默认最多 20 个）')
+    args = parser.parse_args()
+
+    print("🧹 问答对音频清理工具")
+    print("=" * 60)
+    print(f"范围: {args.scope}，{'删除' if args.delete else '只报告'}，保留 {args.min_age_hours:g} 小时内修改的文件")
+
+    # 1. 数据源中应有的音频
+    print(f"\n📖 读取问答对（{'数据库' if args.source == 'db' else '子场景文件'}）...")
+    expected, referenced, qa_count = load_source(args.source)
+    print(f"   问答对: {qa_count}，应有音频: {len(expected)}")
+    if qa_count == 0:
+        print("❌ 错误: 数据源中没有问答对，为避免清空全部音频，已停止")
+        sys.exit(1)
+
+    # 2. 数据库仍引用的音频（不关联子场景，覆盖数据源读不到的行）
+    if os.getenv("DATABASE_URL"):
+        conn = get_db_connection()
+        try:
+            keys = referenced_cos_keys(conn)
+        finally:
+            conn.close()
+        referenced.update(name for name in map(name_for_key, keys) if name)
+        print(f"   数据库引用的音频: {len(referenced)}")
+    elif args.delete:
+        print("❌ 错误: 删除前需要核对数据库中的 audio_url，请设置 DATABASE_URL")
+        sys.exit(1)
+    else:
+        print("   ⚠️ 未设置 DATABASE_URL，只按子场景文件中的 audio_url 保留")
+
+    report = {}
+
+    # 3. 本地
+    local_orphans: Orphans = {}
+    if args.scope in ('all', 'local'):
+        started = time.monotonic()
+        inventory = AudioInventory(AUDIO_DIR, SUBDIRS)
+        counts = new_counts()
+        local_orphans = classify(local_files(inventory), expected, referenced, args.min_age_hours, counts)
+        print_orphans(f"💾 本地音频（{AUDIO_DIR}，扫描 {time.monotonic() - started:.2f}s）",
+                      counts, local_orphans, args.list_all)
+        report["local"] = local_orphans
+
+    # 4. 远端
+    uploader = None
+    remote_orphans: Orphans = {}
+    if args.scope in ('all', 'remote'):
+        if not os.getenv("COS_SECRET_ID") or not os.getenv("COS_SECRET_KEY"):
+            print("❌ 错误: 请设置 COS_SECRET_ID 和 COS_SECRET_KEY 环境变量（或使用 --scope local）")
+            sys.exit(1)
+        from audio_common.cos_uploader import CosUploader, UploadError
+        uploader = CosUploader.from_env(COS_BUCKET, 1)
+        started = time.monotonic()
+        counts = new_counts()
+        try:
+            remote_orphans = classify(remote_objects(uploader), expected, referenced, args.min_age_hours, counts)
+        except UploadError as e:
+            print(f"❌ 错误: 列出远端对象失败: {e}")
+            sys.exit(1)
+        print_orphans(f"☁️ 远端对象（{COS_BUCKET}/{COS_PREFIX}，列出 {time.monotonic() - started:.1f}s）",
+                      counts, remote_orphans, args.list_all, COS_PREFIX)
+        report["remote"] = {f"{COS_PREFIX}{name}": size for name, size in remote_orphans.items()}
+
+    if args.report:
+        args.report.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n📝 孤立音频列表已写入: {args.report}")
+
+    if not args.delete:
+        if local_orphans or remote_orphans:
+            print("\n💡 确认无误后加 --delete 删除")
+        return
+
+    # 5. 删除
+    print("\n" + "=" * 60)
+    failed = False
+    if local_orphans:
+        deleted = delete_local(local_orphans)
+        failed |= deleted < len(local_orphans)
+        print(f"🗑️ 本地: 已删除 {deleted}/{len(local_orphans)} 个")
+    if remote_orphans:
+        deleted = delete_remote(uploader, remote_orphans)
+        failed |= deleted < len(remote_orphans)
+        print(f"🗑️ 远端: 已删除 {deleted}/{len(remote_orphans)} 个（每批最多 1000 个）")
+
+    if failed:
+        print("\n⚠️ 部分删除失败，请检查日志")
+        sys.exit(1)
+    print("\n✨ 清理完成！")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大批量生成/上传之前的预演：不合成、不上传，只报告将要做的工作
+
+一次性解析数据源（问答对或短语）、本地音频清单、TTS 缓存和上传清单，得出:
+- 需要合成、因文本变化需要重新合成、可从缓存链接、已是最新的音频
+- 需要上传、需要比对 MD5、内容未变的音频
+- 按吞吐历史估计的请求数、字符数、字节数和耗时（生成/上传脚本每次运行结束时记录）
+--out 写出计划文件，之后生成/上传脚本用 --plan 只处理计划中的音频。判断规则见 audio_common/run_plan.py。
+
+使用方法:
+  python prepare/qa_audio/plan_audio.py                                        # 问答对（数据库）
+  python prepare/qa_audio/plan_audio.py --source files --scenes daily_001 --out plan.json
+  python prepare/qa_audio/1_generate_audio.py --plan plan.json                 # 按计划生成
+  python prepare/qa_audio/2_upload_to_cos.py --plan plan.json                  # 按计划上传
+  python prepare/qa_audio/plan_audio.py --batch-size 16 --voice-rate 4 --list 20   # 按批量参数估计，列出前 20 个
+  python prepare/qa_audio/plan_audio.py --target phrases --out phrases_plan.json
+  python prepare/phrases/scripts/generate_audio_edge_tts.py --plan phrases_plan.json
+"""
+
+import argparse
+import importlib.util
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from dotenv import load_dotenv
+env_path = Path(__file__).parent.parent.parent / ".env.local"
+load_dotenv(env_path)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from audio_common.job_journal import clip_key
+from audio_common.qa_source import SOURCE_NAMES, open_qa_source, qa_clip_names
+from audio_common.run_plan import (
+    DEFAULT_BYTES_PER_CHAR, GENERATE_ACTIONS, LINK, RECHECK, RESYNTHESIZE, SYNTHESIZE, UPLOAD, UPLOAD_ACTIONS,
+    ClipPlanner, ThroughputHistory, estimate_generation, estimate_upload, write_plan,
+)
+from audio_common.tts_backends import BACKEND_NAMES, TTSBackendError, open_backend
+from audio_common.tts_batch import DEFAULT_BATCH_SIZE
+from audio_common.tts_cache import TTSCache
+from audio_common.upload_manifest import UploadManifest
+
+# ============================================================
+# 配置（与生成/上传脚本一致）
+# ============================================================
+
+PREPARE_DIR = Path(__file__).resolve().parent.parent
+QA_GENERATE_SCRIPT = PREPARE_DIR / "qa_audio" / "1_generate_audio.py"
+PHRASES_GENERATE_SCRIPT = PREPARE_DIR / "phrases" / "scripts" / "generate_audio_edge_tts.py"
+QA_COS_PREFIX = "qa/"
+PHRASES_COS_PREFIX = "phrases/"
+UPLOAD_WORKERS = 20
+
+# (名称, 文本, 音色, COS Key)
+ClipItem = Tuple[str, str, str, str]
+
+ACTION_LABELS = {
+    SYNTHESIZE: "合成",
+    RESYNTHESIZE: "文本变化，重新合成",
+    LINK: "从TTS缓存链接",
+    "fresh": "已是最新",
+    UPLOAD: "上传",
+    RECHECK: "比对MD5（通常不需上传）",
+    "unchanged": "未变化",
+}
+
+
+def load_script(path: Path, name: str):
+    """按路径加载脚本模块（qa_audio 下的脚本名以数字开头，无法直接 import）"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def format_bytes(size: float) -> str:
+    return f"{size / (1024 * 1024):.1f}MB"
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 120:
+        return f"{seconds:.0f}s"
+    if seconds < 7200:
+        return f"{seconds / 60:.1f} 分钟"
+    return f"{seconds / 3600:.1f} 小时"
+
+# ============================================================
+# 数据源
+# ============================================================
+
+def qa_items(gen, backend, args) -> Iterator[ClipItem]:
+    """问答对的全部音频（问题 + 有文本的答案），音色规则与 1_generate_audio.py 一致"""
+    for qa in open_qa_source(args.source).iter_qa_pairs(args.scenes):
+        responses = qa["responses"] or []
+        for idx, name in qa_clip_names(qa):
+            if idx is None:
+                text, voice = qa["speaker_text"], gen.QUESTION_VOICE
+            else:
+                text, voice = responses[idx]["text"], gen.ANSWER_VOICES[idx % len(gen.ANSWER_VOICES)]
+            yield name, text, backend.voice(voice), QA_COS_PREFIX + name
+
+
+def phrase_items(phrase_tts, backend) -> Iterator[ClipItem]:
+    """短语与示例音频，COS Key 与 generate_and_upload_all.py 一致"""
+    with open(phrase_tts.JSON_FILE, "r", encoding="utf-8") as f:
+        phrases = json.load(f).get("phrases", [])
+    voice = backend.voice(phrase_tts.VOICE)
+    for text, path in phrase_tts.AudioGenerator(backend=backend).collect_items(phrases):
+        name = clip_key(path)
+        yield name, text, voice, PHRASES_COS_PREFIX + name
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='预演音频生成/上传：报告需要合成、上传或跳过的音频并估计耗时，可写出计划文件')
+    parser.add_argument('--target', choices=['qa', 'phrases'], default='qa', help='qa=问答对（默认），phrases=短语')
+    parser.add_argument('--scenes', nargs='+', help='指定场景ID列表（仅问答对，可选，默认全部）')
+    parser.add_argument('--source', choices=SOURCE_NAMES, default='db',
+                        help='问答对来源: db=数据库（默认），files=prepare/scene/data/sub-scenes 下的 JSON')
+    parser.add_argument('--tts-backend', choices=BACKEND_NAMES, default='edge', help='按该后端判断缓存和估计（默认 edge）')
+    parser.add_argument('--voice-map', type=Path, help='音色映射 JSON（与生成脚本相同）')
+    parser.add_argument('--force', action='store_true', help='按 --force 运行估计（忽略已有文件和TTS缓存）')
+    parser.add_argument('--no-cache', action='store_true', help='按 --no-cache 运行估计（仅按文件名判断跳过）')
+    parser.add_argument('--no-manifest', action='store_true', help='按 --no-manifest 运行估计（全部重新上传）')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='按该批量大小估计请求数（默认 1）')
+    parser.add_argument('--concurrency', type=int, help='生成并发数（没有吞吐历史时用于估计，默认与生成脚本相同）')
+    parser.add_argument('--voice-rate', type=float, help='每个音色每秒最多请求数（估计耗时的下限，默认与生成脚本相同）')
+    parser.add_argument('--upload-workers', type=int, default=UPLOAD_WORKERS,
+                        help=f'上传并发数（没有吞吐历史时用于估计，默认 {UPLOAD_WORKERS}）')
+    parser.add_argument('--list', type=int, default=0, metavar='N', help='每种动作列出前 N 个音频')
+    parser.add_argument('--out', type=Path, help='写出计划文件，供生成/上传脚本的 --plan 使用')
+    args = parser.parse_args()
+    if args.target == 'phrases' and (args.scenes or args.force):
+        print("❌ 错误: --scenes / --force 只适用于问答对")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    try:
+        backend = open_backend(args.tts_backend, args.voice_map)
+    except TTSBackendError as e:
+        print(f"❌ 错误: {e}")
+        sys.exit(1)
+    try:
+        if args.target == 'qa':
+            gen = load_script(QA_GENERATE_SCRIPT, "qa_generate_audio")
+            audio_dir, subdirs = gen.OUTPUT_DIR, [gen.QUESTIONS_DIR.name, gen.RESPONSES_DIR.name]
+            validator, rate = gen.validator, gen.TTS_RATE
+            concurrency, voice_rate = gen.DEFAULT_CONCURRENCY, gen.DEFAULT_VOICE_RATE
+            manifest_path = audio_dir / "upload_manifest.json"
+            items: Iterator[ClipItem] = qa_items(gen, backend, args)
+        else:
+            phrase_tts = load_script(PHRASES_GENERATE_SCRIPT, "phrase_generate_audio")
+            audio_dir, subdirs = phrase_tts.AUDIO_DIR, [phrase_tts.PHRASES_DIR.name, phrase_tts.EXAMPLES_DIR.name]
+            validator, rate = phrase_tts.validator, phrase_tts.TTS_RATE
+            concurrency, voice_rate = phrase_tts.MAX_CONCURRENCY, 0.0
+            manifest_path = audio_dir / "upload_manifest.json"
+            items = phrase_items(phrase_tts, backend)
+        if not backend.remote:
+            voice_rate = 0.0
+        concurrency = args.concurrency or concurrency
+        voice_rate = voice_rate if args.voice_rate is None else args.voice_rate
+
+        planner = ClipPlanner(
+            audio_dir, subdirs, validator,
+            None if args.no_cache else TTSCache(),
+            None if args.no_manifest else UploadManifest(manifest_path),
+            backend.engine, rate, args.force,
+        )
+        for item in items:
+            planner.add(*item)
+    except TTSBackendError as e:
+        print(f"❌ 错误: {e}")
+        sys.exit(1)
+    finally:
+        # 本地后端的进程池按需启动，规划时不会启动
+        backend.close()
+    elapsed = time.perf_counter() - started
+
+    # 估计
+    history = ThroughputHistory()
+    batch_size = args.batch_size if backend.supports_batch else 1
+    generation = estimate_generation(planner.tts_texts(), batch_size, concurrency, voice_rate,
+                                     history.totals(f"generate:{backend.name}"))
+    per_char = generation["bytes"] / generation["chars"] if generation["chars"] else DEFAULT_BYTES_PER_CHAR
+    uploads = [clip for clip in planner.clips if clip.upload == UPLOAD]
+    upload_bytes = sum(clip.size or round(len(clip.text) * per_char) for clip in uploads)
+    upload = estimate_upload(len(uploads), upload_bytes, args.upload_workers, history.totals("upload"))
+    counts = planner.counts()
+
+    print("🗺️ 音频运行计划（预演，不合成、不上传）")
+    print("=" * 60)
+    print(f"目标: {args.target}" + (f"，场景: {', '.join(args.scenes)}" if args.scenes else "")
+          + f"，TTS 后端: {backend.engine}")
+    print(f"音频: {len(planner.clips)} 个（本地已有 {len(planner.inventory)} 个，"
+          f"其中变化后尚未校验 {planner.unverified} 个，按存在计）")
+    if planner.adopted:
+        print(f"   ⚠️ {planner.adopted} 个已有文件没有文本记录（引入缓存前生成），按当前文本收录；"
+              f"如文本已修改，请用 --force 重新生成")
+
+    print("\n🎵 生成:")
+    for action in GENERATE_ACTIONS:
+        print(f"   {ACTION_LABELS[action]}: {counts['generate'][action]}")
+    print(f"   TTS 请求: {generation['requests']}（批量 {batch_size}，相同文本只合成一次），"
+          f"字符: {generation['chars']}，约 {format_bytes(generation['bytes'])}")
+    print(f"   预计耗时: {format_seconds(generation['seconds'])}（并发 {concurrency}，单音色限速 {voice_rate or '不限'}/s，"
+          f"依据: {generation['basis']}）")
+
+    print("\n☁️ 上传:")
+    for action in UPLOAD_ACTIONS:
+        print(f"   {ACTION_LABELS[action]}: {counts['upload'][action]}")
+    print(f"   上传量: 约 {format_bytes(upload['bytes'])}，预计耗时: {format_seconds(upload['seconds'])}"
+          f"（依据: {upload['basis']}）")
+    print(f"\n⏱️ 规划耗时: {elapsed * 1000:.0f}ms（含读取数据源）")
+
+    if args.list:
+        for stage, actions in (("generate", (SYNTHESIZE, RESYNTHESIZE, LINK)), ("upload", (UPLOAD, RECHECK))):
+            for action in actions:
+                names: List[str] = [clip.name for clip in planner.clips if getattr(clip, stage) == action]
+                if names:
+                    print(f"\n   {ACTION_LABELS[action]}（{len(names)}）:")
+                    for name in names[:args.list]:
+                        print(f"      {name}")
+                    if len(names) > args.list:
+                        print(f"      ... 另有 {len(names) - args.list} 个")
+
+    if args.out:
+        settings: Dict[str, Any] = {"source": args.source, "scenes": args.scenes, "tts_backend": args.tts_backend,
+                                    "force": args.force, "no_cache": args.no_cache}
+        summary = {**counts, "generation": generation, "upload_estimate": upload}
+        write_plan(args.out, args.target, settings, planner.clips, summary)
+        print(f"\n💾 计划已写入: {args.out}")
+        if args.target == 'qa':
+            print(f"   执行: python prepare/qa_audio/1_generate_audio.py --plan {args.out}")
+            print(f"         python prepare/qa_audio/2_upload_to_cos.py --plan {args.out}")
+        else:
+            print(f"   执行: python prepare/phrases/scripts/generate_audio_edge_tts.py --plan {args.out}")
+
+if __name__ == "__main__":
+    main()
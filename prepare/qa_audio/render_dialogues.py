@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+为每个子场景渲染一条整段对话音轨（问题 + 选定答案依次播放，中间插入停顿），并可上传到 COS
+
+“听完整对话”模式下客户端不必按顺序请求几十条短音频，一次请求即可:
+  本地: prepare/qa_audio/audio/dialogues/{sub_scene_id}.mp3 + .json（各轮次时间点）+ .vtt（WebVTT 章节）
+  COS:  qa/dialogues/{sub_scene_id}.mp3 + .json + .vtt
+在 MP3 帧级别拼接，不重新编码；格式见 audio_common/dialogue_track.py。
+
+在生成之后运行（分片生成时等所有分片结束后再运行）；只有片段、文本或停顿参数变化的音轨会重新拼接，
+多条音轨用进程池并行拼接。上传时按上传清单跳过内容未变的文件，音轨先于索引和章节上传。
+
+使用方法:
+  python prepare/qa_audio/render_dialogues.py                        # 渲染全部子场景
+  python prepare/qa_audio/render_dialogues.py --upload               # 渲染并上传变化的音轨
+  python prepare/qa_audio/render_dialogues.py --scenes daily_001     # 只处理指定场景
+  python prepare/qa_audio/render_dialogues.py --response 1 --gap 0.8 --pair-gap 1.5
+  python prepare/qa_audio/render_dialogues.py --source files --force
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+from dotenv import load_dotenv
+env_path = Path(__file__).parent.parent.parent / ".env.local"
+load_dotenv(env_path)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from audio_common.audio_bundle import upload_bundles
+from audio_common.audio_inventory import AudioInventory
+from audio_common.audio_validator import shared_validator
+from audio_common.dialogue_track import DEFAULT_GAP, DEFAULT_PAIR_GAP, DialogueRenderer, plan_dialogues
+from audio_common.metrics import metrics
+from audio_common.qa_source import SOURCE_NAMES, open_qa_source
+from audio_common.upload_manifest import UploadManifest
+
+# ============================================================
+# 配置（与生成/上传脚本一致）
+# ============================================================
+
+AUDIO_DIR = Path(__file__).parent / "audio"
+SUBDIRS = ["questions", "responses"]
+DIALOGUE_DIR = AUDIO_DIR / "dialogues"
+VALIDATION_INDEX_PATH = AUDIO_DIR / "validation_index.json"
+MANIFEST_PATH = AUDIO_DIR / "upload_manifest.json"
+COS_PREFIX = "qa/"
+
+COS_BUCKET = os.getenv("COS_BUCKET", "kouyu-scene-1300762139")
+MAX_WORKERS = 8
+
+# ============================================================
+# 上传
+# ============================================================
+
+def cos_key_for(local_path: Path) -> str:
+    """audio/dialogues/x.mp3 -> qa/dialogues/x.mp3（与 2_upload_to_cos.py 的路径映射一致）"""
+    return COS_PREFIX + local_path.relative_to(AUDIO_DIR).as_posix()
+
+def upload(tracks: List[Tuple[Path, ...]], use_manifest: bool) -> int:
+    """并发上传各音轨（音轨在前、索引和章节在后），返回失败的音轨数"""
+    from audio_common.cos_uploader import CosUploader
+
+    if not os.getenv("COS_SECRET_ID") or not os.getenv("COS_SECRET_KEY"):
+        print("❌ 错误: 请设置 COS_SECRET_ID 和 COS_SECRET_KEY 环境变量")
+        sys.exit(1)
+    uploader = CosUploader.from_env(COS_BUCKET, MAX_WORKERS)
+    manifest = UploadManifest(MANIFEST_PATH) if use_manifest else None
+
+    print(f"\n☁️ 上传 {len(tracks)} 条音轨到 {COS_BUCKET}/{COS_PREFIX}dialogues/ ...")
+    try:
+        totals = upload_bundles(uploader, manifest, tracks, cos_key_for, MAX_WORKERS)
+    finally:
+        if manifest:
+            manifest.save()
+    print(f"   上传: {totals[0]} 个文件，未变化: {totals[1]} 个，失败: {totals[2]} 条音轨")
+    return totals[2]
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='为每个子场景渲染整段对话音轨（帧级拼接，不重新编码），可选上传到COS')
+    parser.add_argument('--scenes', nargs='+', help='指定场景ID列表（可选，默认全部）')
+    parser.add_argument('--source', choices=SOURCE_NAMES, default='db',
+                        help='问答对来源: db=数据库（默认），files=prepare/scene/data/sub-scenes 下的 JSON')
+    parser.add_argument('--response', type=int, default=0,
+                        help='每个问答对选用的答案序号（默认 0；该答案没有文本时用第一个有文本的答案）')
+    parser.add_argument('--gap', type=float, default=DEFAULT_GAP,
+                        help=f'问题与答案之间的停顿秒数（默认 {DEFAULT_GAP}）')
+    parser.add_argument('--pair-gap', type=float, default=DEFAULT_PAIR_GAP,
+                        help=f'问答对之间的停顿秒数（默认 {DEFAULT_PAIR_GAP}）')
+    parser.add_argument('--workers', type=int, help='并行拼接的进程数（默认 CPU 核数）')
+    parser.add_argument('--force', action='store_true', help='忽略状态文件，重建全部音轨')
+    parser.add_argument('--upload', action='store_true', help='渲染后上传内容变化的音轨、索引和章节')
+    parser.add_argument('--no-manifest', action='store_true', help='上传时忽略上传清单，全部重新上传')
+    parser.add_argument('--metrics-dir', type=Path,
+                        help='写出分阶段指标：events.jsonl（每个阶段一行）和 Prometheus 文本文件（.prom）')
+    args = parser.parse_args()
+    if args.gap < 0 or args.pair_gap < 0 or args.response < 0:
+        print("❌ 错误: --gap / --pair-gap / --response 不能为负数")
+        sys.exit(1)
+    metrics.configure(args.metrics_dir, "dialogue")
+
+    print("🎧 整段对话音轨渲染工具")
+    print("=" * 60)
+    print(f"答案: 第 {args.response} 个，停顿: 问答内 {args.gap}s / 问答对之间 {args.pair_gap}s，输出: {DIALOGUE_DIR}")
+    if args.scenes:
+        print(f"目标场景: {', '.join(args.scenes)}")
+
+    # 1. 读取问答对并按子场景排好轮次
+    with metrics.stage("db_fetch"):
+        rows = list(open_qa_source(args.source).iter_qa_pairs(args.scenes))
+    plan = plan_dialogues(rows, args.response)
+    print(f"\n📖 问答对: {len(rows)}，子场景: {len(plan)} 个")
+    if not plan:
+        print("❌ 错误: 没有可渲染的问答对")
+        sys.exit(1)
+
+    # 2. 渲染（一次 scandir 取得全部片段，未变化的音轨不读取任何音频）
+    started = time.monotonic()
+    validator = shared_validator(VALIDATION_INDEX_PATH)
+    with metrics.stage("inventory"):
+        inventory = AudioInventory(AUDIO_DIR, SUBDIRS)
+    validator.inventory = inventory
+    renderer = DialogueRenderer(AUDIO_DIR, DIALOGUE_DIR, validator, inventory,
+                                args.gap, args.pair_gap, args.workers)
+    try:
+        with metrics.stage("render", tracks=len(plan)):
+            built = renderer.render(plan, args.force)
+        if not args.scenes:
+            # 全量运行时删除已不存在的子场景的本地音轨
+            renderer.prune(plan)
+    finally:
+        renderer.save()
+        validator.save()
+    elapsed = time.monotonic() - started
+
+    stats = renderer.stats
+    print("\n" + "=" * 60)
+    print("📊 渲染统计")
+    print("=" * 60)
+    print(f"   重建: {stats['built']} 条音轨（{stats['turns']} 轮，{stats['seconds'] / 60:.1f} 分钟，"
+          f"{stats['bytes'] / (1024 * 1024):.1f}MB）")
+    print(f"   未变化: {stats['unchanged']} 条")
+    print(f"   没有可用片段: {stats['empty']} 个子场景")
+    print(f"   缺失/未通过校验/格式不一致的片段: {stats['missing']} 个（记入索引的 missing，音轨中跳过这一轮）")
+    if stats["removed"]:
+        print(f"   已删除过期的音轨: {stats['removed']} 条")
+    print(f"   耗时: {elapsed:.1f}s")
+    if built:
+        print(f"   例: {DIALOGUE_DIR / (built[0] + '.mp3')}")
+
+    failed = 0
+    if args.upload:
+        # 未变化的音轨也交给上传清单判断（上次上传可能失败）
+        tracks = [renderer.paths(track_id) for track_id in plan if renderer.paths(track_id)[0].exists()]
+        failed = upload(tracks, not args.no_manifest)
+
+    metrics.print_summary()
+    metrics.close()
+    if failed:
+        print("\n⚠️ 部分音轨上传失败，请检查日志")
+        sys.exit(1)
+    print("\n✨ 渲染完成！")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+在本机同时运行多个分片（--shard i/N），结束后汇总各分片的统计
+
+- 每个分片是一个独立的子进程，输出逐行加上 [i/N] 前缀
+- 生成任务自动加上 --rate-limit-db：所有分片共用一个 SQLite 令牌桶，
+  合计每个音色每秒最多 --voice-rate 个 edge-tts 请求（与单进程运行时的限速相同）
+- 各分片共用任务日志、TTS 缓存、校验索引和上传清单（保存时按条目合并）
+- 传入 --metrics-dir 时各分片的指标文件名带分片后缀（如 generate-shard0of4.prom），互不覆盖
+- 多台机器：每台机器用 --only 运行其中几个分片，例如两台机器分 8 片：
+    机器 A: run_shards.py generate --shards 8 --only 0 1 2 3
+    机器 B: run_shards.py generate --shards 8 --only 4 5 6 7
+  之后在同一台机器上用相同的 --shards/--only 运行 upload（音频只在生成它的机器上）
+
+使用方法:
+  python prepare/qa_audio/run_shards.py generate --shards 4
+  python prepare/qa_audio/run_shards.py generate --shards 4 -- --batch-size 8 --source files
+  python prepare/qa_audio/run_shards.py upload --shards 4 -- --engine async
+  python prepare/qa_audio/run_shards.py phrases --shards 2 -- --voice-rate 4
+
+-- 之后的参数原样传给每个分片（不能包含 --shard / --stats-json / --rate-limit-db）
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from audio_common.rate_limit import DEFAULT_DB_PATH
+from audio_common.sharding import Shard, merge_stats
+
+PREPARE_DIR = Path(__file__).resolve().parent.parent
+
+# 目标 -> (脚本, 是否使用共享限速)
+TARGETS = {
+    "generate": (PREPARE_DIR / "qa_audio" / "1_generate_audio.py", True),
+    "upload": (PREPARE_DIR / "qa_audio" / "2_upload_to_cos.py", False),
+    "phrases": (PREPARE_DIR / "phrases" / "scripts" / "generate_audio_edge_tts.py", True),
+}
+RESERVED_ARGS = ("--shard", "--stats-json", "--rate-limit-db")
+
+print_lock = threading.Lock()
+
+
+def pump_output(process: subprocess.Popen, prefix: str) -> None:
+    """把子进程的输出逐行加上分片前缀后打印"""
+    for line in process.stdout:
+        with print_lock:
+            print(f"{prefix} {line}", end="", flush=True)
+
+
+def run_shards(script: Path, shards: List[Shard], extra: List[str], stats_dir: Path,
+               rate_limit_db: Optional[Path] = None) -> Dict[Shard, int]:
+    """启动各分片并等待结束，返回 分片 -> 退出码"""
+    env = {**os.environ, "PYTHONUNBUFFERED": "1"}
+    processes: Dict[Shard, subprocess.Popen] = {}
+    pumps: List[threading.Thread] = []
+    for shard in shards:
+        command = [sys.executable, str(script), *extra, "--shard", str(shard),
+                   "--stats-json", str(stats_dir / f"shard-{shard.index}.json")]
+        if rate_limit_db:
+            command += ["--rate-limit-db", str(rate_limit_db)]
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   text=True, encoding="utf-8", errors="replace", env=env)
+        processes[shard] = process
+        pump = threading.Thread(target=pump_output, args=(process, f"[{shard}]"), daemon=True)
+        pump.start()
+        pumps.append(pump)
+
+    try:
+        codes = {shard: process.wait() for shard, process in processes.items()}
+    except KeyboardInterrupt:
+        print("\n⏹️ 中断，正在停止各分片...")
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.wait()
+        raise
+    for pump in pumps:
+        pump.join()
+    return codes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="在本机并行运行多个分片并汇总统计",
+        epilog="-- 之后的参数原样传给每个分片",
+    )
+    parser.add_argument("target", choices=list(TARGETS), help="generate=问答对生成，upload=问答对上传，phrases=短语生成")
+    parser.add_argument("--shards", type=int, required=True, help="分片总数 N")
+    parser.add_argument("--only", type=int, nargs="+", help="只运行这些分片序号（多台机器分工时使用，默认全部）")
+    parser.add_argument("--rate-limit-db", type=Path, default=DEFAULT_DB_PATH,
+                        help=f"共享限速的 SQLite 文件（默认 {DEFAULT_DB_PATH}）")
+    args, extra = parser.parse_known_args()
+    if extra and extra[0] == "--":
+        extra = extra[1:]
+
+    if args.shards < 1:
+        print("❌ 错误: --shards 至少为 1")
+        sys.exit(1)
+    indices = sorted(set(args.only)) if args.only else list(range(args.shards))
+    if any(not 0 <= index < args.shards for index in indices):
+        print(f"❌ 错误: --only 的序号应在 0 到 {args.shards - 1} 之间")
+        sys.exit(1)
+    reserved = [arg for arg in extra if arg.split("=")[0] in RESERVED_ARGS]
+    if reserved:
+        print(f"❌ 错误: 这些参数由启动器设置，不能手动传入: {' '.join(reserved)}")
+        sys.exit(1)
+
+    script, rate_limited = TARGETS[args.target]
+    shards = [Shard(index, args.shards) for index in indices]
+
+    print("🧩 分片启动器")
+    print("=" * 60)
+    print(f"脚本: {script.relative_to(PREPARE_DIR.parent)}")
+    print(f"分片: {', '.join(str(shard) for shard in shards)}")
+    if extra:
+        print(f"参数: {' '.join(extra)}")
+    if rate_limited:
+        print(f"共享限速: {args.rate_limit_db}")
+    print("=" * 60)
+
+    started = time.monotonic()
+    with tempfile.TemporaryDirectory(prefix="audio-shards-") as tmp:
+        stats_dir = Path(tmp)
+        codes = run_shards(script, shards, extra, stats_dir, args.rate_limit_db if rate_limited else None)
+        parts = {}
+        for shard in shards:
+            path = stats_dir / f"shard-{shard.index}.json"
+            if path.exists():
+                with open(path, "r", encoding="utf-8") as f:
+                    parts[shard] = json.load(f)
+    elapsed = time.monotonic() - started
+
+    print("\n" + "=" * 60)
+    print(f"📊 分片汇总（{len(parts)}/{len(shards)} 个分片有统计，总耗时 {elapsed:.1f}s）")
+    print("=" * 60)
+    for key, value in merge_stats(parts.values()).items():
+        print(f"   {key}: {value:g}" if isinstance(value, float) else f"   {key}: {value}")
+
+    failed = {shard: code for shard, code in codes.items() if code != 0}
+    if failed:
+        print("\n⚠️ 以下分片以非零状态退出:")
+        for shard, code in failed.items():
+            print(f"   [{shard}] 退出码 {code}")
+        sys.exit(1)
+    print("\n✨ 所有分片完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并行校验本地音频语料（MP3 帧结构，可选解码后检查无声/削波）
+
+结果写入各音频目录下的 validation_index.json，生成与上传脚本共用：
+文件未变化时直接复用结果，不再重复解析。
+未通过结构校验的文件在下次运行 1_generate_audio.py / generate_audio_edge_tts.py 时会重新生成，
+2_upload_to_cos.py 不会上传它们。
+
+使用方法:
+  python prepare/qa_audio/validate_audio.py                    # 问答对音频
+  python prepare/qa_audio/validate_audio.py --target all       # 问答对 + 短语音频
+  python prepare/qa_audio/validate_audio.py --signal           # 同时解码检查几乎无声/削波（需要 numpy 和 ffmpeg）
+  python prepare/qa_audio/validate_audio.py --delete-invalid   # 删除未通过结构校验的文件
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from audio_common.audio_validator import AudioValidator
+
+QA_AUDIO_DIR = Path(__file__).parent / "audio"
+PHRASES_AUDIO_DIR = Path(__file__).parent.parent / "phrases" / "data" / "audio"
+
+TARGETS = {
+    "qa": (QA_AUDIO_DIR, ["questions", "responses"]),
+    "phrases": (PHRASES_AUDIO_DIR, ["phrases", "examples"]),
+}
+
+
+def validate_target(name: str, args) -> int:
+    """校验一组音频目录，返回未通过的文件数"""
+    audio_dir, subdirs = TARGETS[name]
+    validator = AudioValidator(audio_dir / "validation_index.json", signal=args.signal, workers=args.workers)
+    if args.signal:
+        try:
+            import numpy  # noqa: F401
+            from audio_common.postprocess import ffmpeg_bin
+            ffmpeg_bin()
+        except Exception as e:
+            print(f"❌ 错误: 信号校验需要 numpy 和 ffmpeg: {e}")
+            sys.exit(1)
+
+    print(f"\n🔍 {name}: {audio_dir}")
+    started = time.monotonic()
+    results = validator.validate_dirs(audio_dir / subdir for subdir in subdirs)
+    validator.save()
+    elapsed = time.monotonic() - started
+
+    invalid = {path: r for path, r in results.items() if not r.ok}
+    signal_issues = {path: r for path, r in results.items() if r.ok and r.signal_issue}
+    total_duration = sum(r.duration for r in results.values() if r.ok)
+    print(f"   文件: {len(results)} 个（新校验 {validator.stats['validated']}，复用 {validator.stats['reused']}），"
+          f"耗时 {elapsed:.1f}s")
+    print(f"   总时长: {total_duration / 60:.1f} 分钟")
+    print(f"   结构未通过: {len(invalid)}")
+    if args.signal:
+        print(f"   信号问题: {len(signal_issues)}")
+
+    limit = None if args.list_all else 20
+    for title, group, detail in (("❌ 结构未通过", invalid, "reason"), ("⚠️ 信号问题", signal_issues, "signal_issue")):
+        if not group:
+            continue
+        print(f"\n   {title}:")
+        for path in sorted(group)[:limit]:
+            print(f"      {os.path.relpath(path, audio_dir)}: {getattr(group[path], detail)}")
+        if limit and len(group) > limit:
+            print(f"      ... 其余 {len(group) - limit} 个（--list-all 查看全部）")
+
+    if args.delete_invalid and invalid:
+        for path in invalid:
+            Path(path).unlink(missing_ok=True)
+        print(f"\n   🗑️ 已删除 {len(invalid)} 个未通过结构校验的文件")
+    return len(invalid)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并行校验本地音频语料")
+    parser.add_argument("--target", choices=["qa", "phrases", "all"], default="qa",
+                        help="校验问答对、短语或全部音频（默认 qa）")
+    parser.add_argument("--signal", action="store_true", help="解码后检查几乎无声和削波（需要 numpy 和 ffmpeg）")
+    parser.add_argument("--workers", type=int, default=None, help="校验进程数（默认 CPU 核数）")
+    parser.add_argument("--list-all", action="store_true", help="列出全部有问题的文件（默认最多 20 个）")
+    parser.add_argument("--delete-invalid", action="store_true", help="删除未通过结构校验的文件")
+    args = parser.parse_args()
+
+    print("🔍 音频校验工具")
+    print("=" * 60)
+    names = ["qa", "phrases"] if args.target == "all" else [args.target]
+    invalid = sum(validate_target(name, args) for name in names)
+
+    if invalid:
+        print(f"\n⚠️ {invalid} 个音频未通过校验，重新运行生成脚本即可重新生成")
+        sys.exit(1)
+    print("\n✨ 所有音频校验通过！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON 语料批量导入数据库（COPY + 集合式 upsert）
+
+数据流:
+  场景语料（scene_corpus.sqlite，过期时自动增量构建）+ phrases_100_quality.json
+    -> COPY ... FROM STDIN 流式写入临时暂存表（TEMP 表不写 WAL）
+    -> 暂存表与正式表按 id 关联，比较每行的变更哈希 md5(ROW(...)::text)，删除未变化的行
+    -> 剩余行一条 INSERT ... ON CONFLICT DO UPDATE 合并进 scenes / sub_scenes / qa_pairs / phrases
+    -> phrase_examples 没有业务主键，按短语整体比较哈希，只替换示例有变化的短语
+
+未变化的行不会被改写（不产生新元组，也就没有 WAL 和索引更新），重复导入几乎是只读操作。
+所有表在一个事务中完成，--dry-run 会在统计后回滚。
+
+audio_url 由上传流程回写，JSON 中为空时保留数据库中已有的值：
+  - scenes 以外各表的 audio_url 列
+  - qa_pairs.responses[i].audio_url（同一下标且 text 相同时）
+
+使用方法:
+  python prepare/scene/scripts/bulk_load.py                      # 导入场景和短语
+  python prepare/scene/scripts/bulk_load.py --tables scene       # 只导入场景、子场景、问答对
+  python prepare/scene/scripts/bulk_load.py --scene daily_001 --dry-run
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from dotenv import load_dotenv
+env_path = Path(__file__).resolve().parent.parent.parent.parent / ".env.local"
+load_dotenv(env_path)
+
+try:
+    import psycopg2
+except ImportError:
+    print("请先安装 psycopg2: pip install psycopg2-binary")
+    sys.exit(1)
+
+from scene_corpus import CORPUS_PATH, SceneCorpus, build_corpus, is_stale
+
+PHRASES_FILE = Path(__file__).resolve().parent.parent.parent / "phrases" / "data" / "phrases_100_quality.json"
+
+TABLE_GROUPS = ("scene", "phrases")
+
+# COPY 流每次向服务端发送的数据量
+COPY_BUFFER_SIZE = 1 << 16
+
+
+class TableSpec:
+    """一张正式表的导入配置"""
+
+    def __init__(self, table: str, columns: Sequence[str], keep_existing: Sequence[str] = ()):
+        self.table = table
+        self.columns = tuple(columns)
+        # JSON 中为空时保留数据库已有值的列
+        self.keep_existing = tuple(keep_existing)
+        self.stage = f"stage_{table}"
+
+    def column_list(self, alias: str = "") -> str:
+        prefix = f"{alias}." if alias else ""
+        return ", ".join(f'{prefix}"{c}"' for c in self.columns)
+
+    def row_hash(self, alias: str) -> str:
+        """每行的变更哈希；暂存表和正式表用同一表达式，列类型一致时文本表示完全相同"""
+        return f"md5(ROW({self.column_list(alias)})::text)"
+
+
+SCENES = TableSpec("scenes", ("id", "name", "category", "description", "difficulty", "duration", "tags"))
+SUB_SCENES = TableSpec("sub_scenes", ("id", "scene_id", "name", "description", "order", "estimated_minutes"))
+QA_PAIRS = TableSpec(
+    "qa_pairs",
+    ("id", "sub_scene_id", "speaker_text", "speaker_text_cn", "responses", "usage_note", "audio_url",
+     "qa_type", "order"),
+    keep_existing=("audio_url",),
+)
+PHRASES = TableSpec(
+    "phrases",
+    ("id", "english", "chinese", "part_of_speech", "scene", "difficulty", "pronunciation_tips", "audio_url"),
+    keep_existing=("audio_url",),
+)
+EXAMPLE_COLUMNS = ("phrase_id", "position", "title", "desc", "english", "chinese", "usage", "audio_url")
+EXAMPLE_VALUES = ("title", "desc", "english", "chinese", "usage", "audio_url")
+
+# 同一下标、text 相同的回答，JSON 中没有 audio_url 时沿用数据库中的值
+KEEP_RESPONSE_AUDIO_SQL = """
+    UPDATE stage_qa_pairs AS s
+    SET responses = (
+            SELECT jsonb_agg(
+                CASE WHEN coalesce(e.elem ->> 'audio_url', '') = ''
+                          AND old.elem ->> 'text' = e.elem ->> 'text'
+                          AND coalesce(old.elem ->> 'audio_url', '') <> ''
+                     THEN jsonb_set(e.elem, '{audio_url}', old.elem -> 'audio_url')
+                     ELSE e.elem
+                END
+                ORDER BY e.ord
+            )
+            FROM jsonb_array_elements(s.responses) WITH ORDINALITY AS e(elem, ord)
+            LEFT JOIN jsonb_array_elements(t.responses) WITH ORDINALITY AS old(elem, ord) ON old.ord = e.ord
+        )
+    FROM qa_pairs AS t
+    WHERE t.id = s.id
+      AND jsonb_typeof(s.responses) = 'array'
+      AND jsonb_typeof(t.responses) = 'array'
+      AND jsonb_array_length(s.responses) > 0
+"""
+
+
+# ============================================================
+# COPY 流
+# ============================================================
+
+def _copy_value(value: Any) -> str:
+    """转成 COPY text 格式的一列"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class CopyStream:
+    """把行迭代器包装成 copy_expert 需要的文件对象，边生成边发送，不在内存中拼完整数据"""
+
+    def __init__(self, rows: Iterable[Sequence[Any]]):
+        self._rows = iter(rows)
+        self._buffer = b""
+        self.count = 0
+
+    def read(self, size: int = COPY_BUFFER_SIZE) -> bytes:
+        size = size if size and size > 0 else COPY_BUFFER_SIZE
+        lines = []
+        pending = len(self._buffer)
+        while pending < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = ("\t".join(_copy_value(v) for v in row) + "\n").encode("utf-8")
+            lines.append(line)
+            pending += len(line)
+            self.count += 1
+        data = self._buffer + b"".join(lines)
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def copy_rows(cursor, stage: str, columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> int:
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    stream = CopyStream(rows)
+    cursor.copy_expert(f"COPY {stage} ({column_list}) FROM STDIN", stream, size=COPY_BUFFER_SIZE)
+    return stream.count
+
+
+# ============================================================
+# 源数据 -> 行
+# ============================================================
+
+def scene_rows(corpus: SceneCorpus, scene_ids: Optional[Sequence[str]]) -> Iterator[tuple]:
+    for record in corpus.scenes():
+        if scene_ids and record.id not in scene_ids:
+            continue
+        scene = record.data
+        yield (
+            scene["id"], scene.get("name") or "", scene.get("category") or "", scene.get("description") or "",
+            scene.get("difficulty") or "", scene.get("duration") or 10, scene.get("tags"),
+        )
+
+
+def sub_scene_rows(corpus: SceneCorpus, scene_ids: Optional[Sequence[str]]) -> Iterator[tuple]:
+    for scene_id in scene_ids or [None]:
+        for record in corpus.sub_scenes(scene_id=scene_id):
+            sub_scene = record.data
+            yield (
+                record.id, record.scene_id, sub_scene.get("name") or "", sub_scene.get("description") or "",
+                record.order, sub_scene.get("estimatedMinutes") or 5,
+            )
+
+
+def qa_pair_rows(corpus: SceneCorpus, scene_ids: Optional[Sequence[str]]) -> Iterator[tuple]:
+    for scene_id in scene_ids or [None]:
+        for record in corpus.qa_pairs(scene_id=scene_id):
+            qa = record.data
+            yield (
+                record.id, record.sub_scene_id, qa.get("speakerText") or "", qa.get("speakerTextCn") or "",
+                qa.get("responses") or [], qa.get("usageNote"), qa.get("audioUrl") or None,
+                record.qa_type or "must_speak", record.order,
+            )
+
+
+def load_phrases(path: Path = PHRASES_FILE) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["phrases"]
+
+
+def phrase_rows(phrases: List[Dict[str, Any]]) -> Iterator[tuple]:
+    for phrase in phrases:
+        yield (
+            phrase["id"], phrase["english"], phrase["chinese"], phrase.get("partOfSpeech") or "phrase",
+            phrase.get("scene") or "", phrase.get("difficulty") or "", phrase.get("pronunciationTips") or "",
+            phrase.get("audioUrl") or None,
+        )
+
+
+def example_rows(phrases: List[Dict[str, Any]]) -> Iterator[tuple]:
+    for phrase in phrases:
+        for position, example in enumerate(phrase.get("examples") or [], start=1):
+            yield (
+                phrase["id"], position, example.get("title") or "", example.get("desc") or "",
+                example.get("english") or "", example.get("chinese") or "", example.get("usage") or "",
+                example.get("audioUrl") or None,
+            )
+
+
+# ============================================================
+# 合并
+# ============================================================
+
+def create_stage(cursor, spec: TableSpec) -> None:
+    """暂存表列类型直接取自正式表，保证两边的行哈希可比"""
+    cursor.execute(
+        f"CREATE TEMP TABLE {spec.stage} ON COMMIT DROP AS "
+        f"SELECT {spec.column_list()} FROM {spec.table} WITH NO DATA"
+    )
+
+
+def merge(cursor, spec: TableSpec) -> Dict[str, int]:
+    """暂存表 -> 正式表，返回 {inserted, updated, unchanged}"""
+    cursor.execute(f"ANALYZE {spec.stage}")
+
+    for column in spec.keep_existing:
+        cursor.execute(f"""
+            UPDATE {spec.stage} AS s SET "{column}" = t."{column}"
+            FROM {spec.table} AS t
+            WHERE t.id = s.id AND s."{column}" IS NULL AND t."{column}" IS NOT NULL
+        """)
+    if spec is QA_PAIRS:
+        cursor.execute(KEEP_RESPONSE_AUDIO_SQL)
+
+    cursor.execute(f"""
+        DELETE FROM {spec.stage} AS s
+        USING {spec.table} AS t
+        WHERE t.id = s.id AND {spec.row_hash("t")} = {spec.row_hash("s")}
+    """)
+    unchanged = cursor.rowcount
+
+    updates = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in spec.columns if c != "id")
+    cursor.execute(f"""
+        INSERT INTO {spec.table} AS t ({spec.column_list()}, created_at, updated_at)
+        SELECT {spec.column_list("s")}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+        FROM {spec.stage} AS s
+        ORDER BY s.id
+        ON CONFLICT (id) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP
+        RETURNING (t.xmax = 0)
+    """)
+    flags = [row[0] for row in cursor.fetchall()]
+    inserted = sum(1 for f in flags if f)
+    return {"inserted": inserted, "updated": len(flags) - inserted, "unchanged": unchanged}
+
+
+def merge_examples(cursor) -> Dict[str, int]:
+    """
+    按短语比较示例列表的哈希，只删除并重插有变化的短语的示例
+    以暂存的全部短语为准：示例列表变为空的短语暂存哈希为 NULL，同样视为变化并删除旧示例
+    """
+    values = ", ".join(f'"{c}"' for c in EXAMPLE_VALUES)
+    cursor.execute("ANALYZE stage_phrase_examples")
+    cursor.execute(f"""
+        CREATE TEMP TABLE changed_phrases ON COMMIT DROP AS
+        WITH staged AS (
+            SELECT phrase_id, md5(string_agg(ROW({values})::text, E'\\n' ORDER BY position)) AS h
+            FROM stage_phrase_examples GROUP BY phrase_id
+        ), current AS (
+            SELECT phrase_id, md5(string_agg(ROW({values})::text, E'\\n' ORDER BY id)) AS h
+            FROM phrase_examples
+            WHERE phrase_id IN (SELECT id FROM {PHRASES.stage})
+            GROUP BY phrase_id
+        )
+        SELECT p.id AS phrase_id
+        FROM {PHRASES.stage} AS p
+        LEFT JOIN staged ON staged.phrase_id = p.id
+        LEFT JOIN current ON current.phrase_id = p.id
+        WHERE current.h IS DISTINCT FROM staged.h
+    """)
+    cursor.execute("SELECT COUNT(*) FROM changed_phrases")
+    changed = cursor.fetchone()[0]
+    cursor.execute(f"SELECT COUNT(*) FROM {PHRASES.stage}")
+    total = cursor.fetchone()[0]
+
+    cursor.execute("DELETE FROM phrase_examples WHERE phrase_id IN (SELECT phrase_id FROM changed_phrases)")
+    deleted = cursor.rowcount
+    cursor.execute(f"""
+        INSERT INTO phrase_examples (phrase_id, {values}, created_at, updated_at)
+        SELECT phrase_id, {values}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+        FROM stage_phrase_examples
+        WHERE phrase_id IN (SELECT phrase_id FROM changed_phrases)
+        ORDER BY phrase_id, position
+    """)
+    return {"inserted": cursor.rowcount, "deleted": deleted, "phrases_changed": changed,
+            "phrases_unchanged": total - changed}
+
+
+def load_scene_tables(cursor, scene_ids: Optional[Sequence[str]]) -> Dict[str, Dict[str, int]]:
+    if is_stale(CORPUS_PATH):
+        built = build_corpus(CORPUS_PATH)
+        if built["failed"]:
+            raise ValueError(f"场景语料有 {built['failed']} 个源文件解析失败，不导入不完整的数据")
+    corpus = SceneCorpus(CORPUS_PATH)
+    try:
+        results = {}
+        for spec, rows in (
+            (SCENES, scene_rows(corpus, scene_ids)),
+            (SUB_SCENES, sub_scene_rows(corpus, scene_ids)),
+            (QA_PAIRS, qa_pair_rows(corpus, scene_ids)),
+        ):
+            create_stage(cursor, spec)
+            copied = copy_rows(cursor, spec.stage, spec.columns, rows)
+            results[spec.table] = {"copied": copied, **merge(cursor, spec)}
+        return results
+    finally:
+        corpus.close()
+
+
+def load_phrase_tables(cursor) -> Dict[str, Dict[str, int]]:
+    phrases = load_phrases()
+    create_stage(cursor, PHRASES)
+    copied = copy_rows(cursor, PHRASES.stage, PHRASES.columns, phrase_rows(phrases))
+    results = {"phrases": {"copied": copied, **merge(cursor, PHRASES)}}
+
+    cursor.execute(
+        "CREATE TEMP TABLE stage_phrase_examples ON COMMIT DROP AS "
+        "SELECT phrase_id, 0 AS position, title, \"desc\", english, chinese, usage, audio_url "
+        "FROM phrase_examples WITH NO DATA"
+    )
+    copied = copy_rows(cursor, "stage_phrase_examples", EXAMPLE_COLUMNS, example_rows(phrases))
+    results["phrase_examples"] = {"copied": copied, **merge_examples(cursor)}
+    return results
+
+
+def bulk_load(
+    database_url: str,
+    groups: Sequence[str] = TABLE_GROUPS,
+    scene_ids: Optional[Sequence[str]] = None,
+    dry_run: bool = False,
+) -> Dict[str, Dict[str, int]]:
+    """在一个事务中完成导入，返回每张表的统计；dry_run 时最后回滚"""
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn.cursor() as cursor:
+            # 导入可整体重跑，提交不必等待 WAL 刷盘
+            cursor.execute("SET LOCAL synchronous_commit = off")
+            results: Dict[str, Dict[str, int]] = {}
+            if "scene" in groups:
+                results.update(load_scene_tables(cursor, scene_ids))
+            if "phrases" in groups:
+                results.update(load_phrase_tables(cursor))
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+        return results
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON 语料批量导入数据库（COPY + upsert）")
+    parser.add_argument("--tables", nargs="+", choices=TABLE_GROUPS, default=list(TABLE_GROUPS),
+                        help="导入哪些数据：scene=场景/子场景/问答对，phrases=短语/示例（默认全部）")
+    parser.add_argument("--scene", nargs="+", help="只导入指定场景（仅对 scene 生效）")
+    parser.add_argument("--dry-run", action="store_true", help="执行全部合并并统计，最后回滚")
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL", "")
+    if not database_url:
+        print("❌ 错误: 请设置 DATABASE_URL 环境变量")
+        sys.exit(1)
+
+    print("🚚 JSON 语料批量导入")
+    print("=" * 60)
+    if args.dry_run:
+        print("🔍 DRY RUN 模式：合并后回滚，不会写入数据库")
+
+    started = time.perf_counter()
+    try:
+        results = bulk_load(database_url, args.tables, args.scene, args.dry_run)
+    except (psycopg2.Error, OSError, ValueError) as e:
+        print(f"❌ 导入失败，已回滚: {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+
+    for table, stats in results.items():
+        if table == "phrase_examples":
+            print(f"   {table:16s} 暂存 {stats['copied']:6d}，变化短语 {stats['phrases_changed']}，"
+                  f"删除 {stats['deleted']}，插入 {stats['inserted']}")
+        else:
+            print(f"   {table:16s} 暂存 {stats['copied']:6d}，新增 {stats['inserted']}，"
+                  f"更新 {stats['updated']}，未变化 {stats['unchanged']}")
+    print(f"\n{'🔍 预演' if args.dry_run else '✅ 导入'}完成，耗时 {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+场景语料编译器：把 scenes_final.json、sub-scenes/*.json 和 practice-questions/*.json
+打包成一个带二级索引的 SQLite 文件（data/scene_corpus.sqlite）
+
+- 每条记录保存索引列（场景、子场景、题型、qaId、顺序）和原始 JSON（body）
+- 增量构建：按源文件的 mtime/大小判断，只重新解析变化的文件，删除已不存在文件的记录；
+  解析失败的文件同样删除其旧记录（不保留过期内容），并计入 failed
+- SceneCorpus 加载器：查询只取索引列，body 在首次访问 .data 时才读取并解析；
+  只读连接开启 mmap，页面直接从映射读取
+
+使用方法:
+  python prepare/scene/scripts/scene_corpus.py build            # 增量构建
+  python prepare/scene/scripts/scene_corpus.py build --force    # 全量重建
+  python prepare/scene/scripts/scene_corpus.py stats
+  python prepare/scene/scripts/scene_corpus.py query --scene daily_001 --type choice
+  python prepare/scene/scripts/scene_corpus.py query --qa daily_001_sub_1_qa_1
+
+在其他脚本中使用:
+  from scene_corpus import SceneCorpus
+  corpus = SceneCorpus.open()                  # 语料过期时自动增量构建
+  for q in corpus.practice_questions(scene_id="daily_001", question_type="speaking"):
+      print(q.id, q.data["content"]["speakerText"])
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+DATA_DIR = SCRIPTS_DIR.parent / "data"
+SCENES_FILE = DATA_DIR / "scenes_final.json"
+SUB_SCENES_DIR = DATA_DIR / "sub-scenes"
+PRACTICE_DIR = DATA_DIR / "practice-questions"
+CORPUS_PATH = DATA_DIR / "scene_corpus.sqlite"
+
+# 表结构变化时递增，版本不一致会触发全量重建
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path     TEXT PRIMARY KEY,
+    kind     TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size     INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scenes (
+    id         TEXT PRIMARY KEY,
+    name       TEXT,
+    category   TEXT,
+    difficulty TEXT,
+    source     TEXT NOT NULL,
+    body       BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sub_scenes (
+    id       TEXT PRIMARY KEY,
+    scene_id TEXT NOT NULL,
+    name     TEXT,
+    "order"  INTEGER NOT NULL,
+    source   TEXT NOT NULL,
+    body     BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS qa_pairs (
+    id           TEXT PRIMARY KEY,
+    scene_id     TEXT NOT NULL,
+    sub_scene_id TEXT NOT NULL,
+    qa_type      TEXT,
+    "order"      INTEGER NOT NULL,
+    source       TEXT NOT NULL,
+    body         BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS practice_questions (
+    id            TEXT PRIMARY KEY,
+    scene_id      TEXT NOT NULL,
+    sub_scene_id  TEXT NOT NULL,
+    question_type TEXT NOT NULL,
+    qa_id         TEXT,
+    "order"       INTEGER NOT NULL,
+    source        TEXT NOT NULL,
+    body          BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sub_scenes_scene ON sub_scenes (scene_id, "order");
+CREATE INDEX IF NOT EXISTS idx_qa_pairs_scene ON qa_pairs (scene_id);
+CREATE INDEX IF NOT EXISTS idx_qa_pairs_sub_scene ON qa_pairs (sub_scene_id, "order");
+CREATE INDEX IF NOT EXISTS idx_practice_scene ON practice_questions (scene_id, question_type);
+CREATE INDEX IF NOT EXISTS idx_practice_sub_scene ON practice_questions (sub_scene_id, question_type, "order");
+CREATE INDEX IF NOT EXISTS idx_practice_type ON practice_questions (question_type);
+CREATE INDEX IF NOT EXISTS idx_practice_qa ON practice_questions (qa_id);
+"""
+
+# 每张表按 source 删除记录时使用的索引
+SOURCE_TABLES = ("scenes", "sub_scenes", "qa_pairs", "practice_questions")
+SOURCE_INDEXES = "".join(
+    f"CREATE INDEX IF NOT EXISTS idx_{table}_source ON {table} (source);\n" for table in SOURCE_TABLES
+)
+
+# 查询时返回的索引列（不含 body）
+TABLE_COLUMNS = {
+    "scenes": ("id", "name", "category", "difficulty"),
+    "sub_scenes": ("id", "scene_id", "name", "order"),
+    "qa_pairs": ("id", "scene_id", "sub_scene_id", "qa_type", "order"),
+    "practice_questions": ("id", "scene_id", "sub_scene_id", "question_type", "qa_id", "order"),
+}
+
+
+def _dump(record: Dict[str, Any]) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def scene_id_of(sub_scene_id: str) -> str:
+    """daily_001_sub_3 -> daily_001"""
+    return sub_scene_id.rsplit("_sub_", 1)[0]
+
+
+# ============================================================
+# 源文件解析（每个函数返回 {表名: [行, ...]}）
+# ============================================================
+
+def parse_scenes_file(path: Path, source: str) -> Dict[str, List[Tuple]]:
+    with open(path, "r", encoding="utf-8") as f:
+        scenes = json.load(f)
+    return {"scenes": [
+        (scene["id"], scene.get("name"), scene.get("category"), scene.get("difficulty"), source, _dump(scene))
+        for scene in scenes
+    ]}
+
+
+def parse_sub_scene_file(path: Path, source: str) -> Dict[str, List[Tuple]]:
+    """文件中没有 order / sceneId 的，按列表顺序（从 1 开始）和文件的 sceneId 补齐"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    scene_id = data.get("sceneId") or path.stem
+    sub_scenes, qa_pairs = [], []
+    for sub_index, sub_scene in enumerate(data.get("subScenes") or [], start=1):
+        qa_list = sub_scene.get("qaPairs") or []
+        meta = {k: v for k, v in sub_scene.items() if k != "qaPairs"}
+        sub_scenes.append((
+            sub_scene["id"], sub_scene.get("sceneId") or scene_id, sub_scene.get("name"),
+            sub_scene.get("order") or sub_index, source, _dump(meta),
+        ))
+        for qa_index, qa in enumerate(qa_list, start=1):
+            qa_pairs.append((
+                qa["id"], sub_scene.get("sceneId") or scene_id, sub_scene["id"], qa.get("qaType"),
+                qa.get("order") or qa_index, source, _dump(qa),
+            ))
+    return {"sub_scenes": sub_scenes, "qa_pairs": qa_pairs}
+
+
+def parse_practice_file(path: Path, source: str) -> Dict[str, List[Tuple]]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    question_type = data.get("questionType")
+    rows = []
+    for index, question in enumerate(data.get("questions") or [], start=1):
+        sub_scene_id = question.get("subSceneId") or data["subSceneId"]
+        rows.append((
+            question["id"], scene_id_of(sub_scene_id), sub_scene_id,
+            question.get("type") or question_type, (question.get("content") or {}).get("qaId"),
+            question.get("order") or index, source, _dump(question),
+        ))
+    return {"practice_questions": rows}
+
+
+PARSERS = {
+    "scenes": parse_scenes_file,
+    "sub_scenes": parse_sub_scene_file,
+    "practice": parse_practice_file,
+}
+
+
+def discover_sources() -> Dict[str, Tuple[str, os.stat_result]]:
+    """当前所有源文件: 相对 data/ 的路径 -> (类型, stat)；语料中只保存相对路径，移动仓库后仍可增量构建"""
+    sources: Dict[str, Tuple[str, os.stat_result]] = {}
+    if SCENES_FILE.exists():
+        sources[SCENES_FILE.name] = ("scenes", SCENES_FILE.stat())
+    for kind, directory in (("sub_scenes", SUB_SCENES_DIR), ("practice", PRACTICE_DIR)):
+        if not directory.is_dir():
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(".json"):
+                    sources[f"{directory.name}/{entry.name}"] = (kind, entry.stat())
+    return sources
+
+
+# ============================================================
+# 构建
+# ============================================================
+
+def _connect_for_write(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def _schema_matches(conn: sqlite3.Connection) -> bool:
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+    except sqlite3.DatabaseError:
+        return False
+    return bool(row) and row[0] == str(SCHEMA_VERSION)
+
+
+def build_corpus(path: Path = CORPUS_PATH, force: bool = False, verbose: bool = True) -> Dict[str, int]:
+    """增量构建语料，返回 {added, updated, removed, unchanged, failed} 文件数"""
+    log = print if verbose else (lambda *a, **k: None)
+
+    if path.exists() and not force:
+        conn = sqlite3.connect(path)
+        schema_ok = _schema_matches(conn)
+        conn.close()
+        if not schema_ok:
+            log("  🔄 语料格式版本变化，全量重建")
+            force = True
+    if force and path.exists():
+        path.unlink()
+    conn = _connect_for_write(path)
+
+    result = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "failed": 0}
+    with conn:
+        conn.executescript(SCHEMA + SOURCE_INDEXES)
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+
+        known = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT path, mtime_ns, size FROM sources")}
+        current = discover_sources()
+
+        for stale in sorted(set(known) - set(current)):
+            for table in SOURCE_TABLES:
+                conn.execute(f"DELETE FROM {table} WHERE source = ?", (stale,))
+            conn.execute("DELETE FROM sources WHERE path = ?", (stale,))
+            result["removed"] += 1
+
+        for source_path, (kind, st) in sorted(current.items()):
+            if known.get(source_path) == (st.st_mtime_ns, st.st_size):
+                result["unchanged"] += 1
+                continue
+            try:
+                tables = PARSERS[kind](DATA_DIR / source_path, source_path)
+            except (OSError, ValueError, KeyError) as e:
+                log(f"  ❌ 解析失败 {Path(source_path).name}: {e}")
+                # 不保留该文件的旧记录；不记入 sources，修复前 is_stale() 保持为 True
+                for table in SOURCE_TABLES:
+                    conn.execute(f"DELETE FROM {table} WHERE source = ?", (source_path,))
+                conn.execute("DELETE FROM sources WHERE path = ?", (source_path,))
+                result["failed"] += 1
+                continue
+
+            if source_path in known:
+                for table in SOURCE_TABLES:
+                    conn.execute(f"DELETE FROM {table} WHERE source = ?", (source_path,))
+                result["updated"] += 1
+            else:
+                result["added"] += 1
+            for table, rows in tables.items():
+                if rows:
+                    placeholders = ", ".join("?" * len(rows[0]))
+                    conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})", rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)",
+                (source_path, kind, st.st_mtime_ns, st.st_size),
+            )
+
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('built_at', ?)", (str(int(time.time())),))
+
+    if result["removed"] or result["updated"] > 50:
+        conn.execute("VACUUM")
+    conn.close()
+    return result
+
+
+def is_stale(path: Path = CORPUS_PATH) -> bool:
+    """语料不存在、格式版本不一致或任一源文件有增删改时返回 True"""
+    if not path.exists():
+        return True
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        if not _schema_matches(conn):
+            return True
+        known = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT path, mtime_ns, size FROM sources")}
+    finally:
+        conn.close()
+    current = discover_sources()
+    if set(known) != set(current):
+        return True
+    return any(known[p] != (st.st_mtime_ns, st.st_size) for p, (_, st) in current.items())
+
+
+# ============================================================
+# 加载器
+# ============================================================
+
+class CorpusRecord:
+    """一条语料记录：索引列可直接访问，完整 JSON 在首次访问 data 时读取"""
+
+    __slots__ = ("_corpus", "_table", "_fields", "_data")
+
+    def __init__(self, corpus: "SceneCorpus", table: str, fields: Dict[str, Any]):
+        self._corpus = corpus
+        self._table = table
+        self._fields = fields
+        self._data = None
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self._fields[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = json.loads(self._corpus.body(self._table, self._fields["id"]))
+        return self._data
+
+    def __repr__(self) -> str:
+        return f"<{self._table} {self._fields['id']}>"
+
+
+class SceneCorpus:
+    """只读访问编译后的语料"""
+
+    def __init__(self, path: Path = CORPUS_PATH):
+        self.path = Path(path)
+        self.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        self.conn.execute(f"PRAGMA mmap_size = {max(self.path.stat().st_size, 1 << 20)}")
+
+    @classmethod
+    def open(cls, path: Path = CORPUS_PATH, rebuild: bool = True) -> "SceneCorpus":
+        """打开语料；rebuild=True 时源文件有变化会先增量构建"""
+        if rebuild and is_stale(path):
+            build_corpus(path, verbose=False)
+        return cls(path)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def body(self, table: str, record_id: str) -> bytes:
+        row = self.conn.execute(f"SELECT body FROM {table} WHERE id = ?", (record_id,)).fetchone()
+        if row is None:
+            raise KeyError(record_id)
+        return row[0]
+
+    def _select(self, table: str, filters: Dict[str, Any], order_by: str) -> Iterator[CorpusRecord]:
+        columns = TABLE_COLUMNS[table]
+        conditions = [f'"{k}" = ?' for k, v in filters.items() if v is not None]
+        params = [v for v in filters.values() if v is not None]
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        column_list = ", ".join(f'"{c}"' for c in columns)
+        for row in self.conn.execute(f"SELECT {column_list} FROM {table} {where} ORDER BY {order_by}", params):
+            yield CorpusRecord(self, table, dict(zip(columns, row)))
+
+    def _one(self, table: str, record_id: str) -> Optional[CorpusRecord]:
+        return next(self._select(table, {"id": record_id}, "id"), None)
+
+    # ---- 查询 ----
+
+    def scenes(self, category: Optional[str] = None) -> Iterator[CorpusRecord]:
+        return self._select("scenes", {"category": category}, "id")
+
+    def scene(self, scene_id: str) -> Optional[CorpusRecord]:
+        return self._one("scenes", scene_id)
+
+    def sub_scenes(self, scene_id: Optional[str] = None) -> Iterator[CorpusRecord]:
+        return self._select("sub_scenes", {"scene_id": scene_id}, 'scene_id, "order"')
+
+    def sub_scene(self, sub_scene_id: str) -> Optional[CorpusRecord]:
+        return self._one("sub_scenes", sub_scene_id)
+
+    def qa_pairs(self, scene_id: Optional[str] = None, sub_scene_id: Optional[str] = None) -> Iterator[CorpusRecord]:
+        return self._select("qa_pairs", {"scene_id": scene_id, "sub_scene_id": sub_scene_id},
+                            'sub_scene_id, "order"')
+
+    def qa_pair(self, qa_id: str) -> Optional[CorpusRecord]:
+        return self._one("qa_pairs", qa_id)
+
+    def practice_questions(
+        self,
+        scene_id: Optional[str] = None,
+        sub_scene_id: Optional[str] = None,
+        question_type: Optional[str] = None,
+        qa_id: Optional[str] = None,
+    ) -> Iterator[CorpusRecord]:
+        filters = {"scene_id": scene_id, "sub_scene_id": sub_scene_id, "question_type": question_type, "qa_id": qa_id}
+        return self._select("practice_questions", filters, 'sub_scene_id, question_type, "order"')
+
+    def practice_question(self, question_id: str) -> Optional[CorpusRecord]:
+        return self._one("practice_questions", question_id)
+
+    def counts(self) -> Dict[str, int]:
+        return {table: self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in SOURCE_TABLES}
+
+
+# ============================================================
+# 命令行
+# ============================================================
+
+def cmd_build(args) -> None:
+    print("📦 编译场景语料")
+    print("=" * 60)
+    started = time.perf_counter()
+    result = build_corpus(args.output, force=args.force)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"   新增 {result['added']}，更新 {result['updated']}，删除 {result['removed']}，"
+          f"未变化 {result['unchanged']} 个源文件（{elapsed:.0f}ms）")
+    if result["failed"]:
+        print(f"❌ 错误: {result['failed']} 个源文件解析失败，其记录未写入语料")
+        sys.exit(1)
+    corpus = SceneCorpus(args.output)
+    counts = corpus.counts()
+    corpus.close()
+    print(f"   场景 {counts['scenes']}，子场景 {counts['sub_scenes']}，问答对 {counts['qa_pairs']}，"
+          f"练习题 {counts['practice_questions']}")
+    print(f"\n✅ 已写入: {args.output}（{args.output.stat().st_size / 1024 / 1024:.1f}MB）")
+
+
+def cmd_stats(args) -> None:
+    corpus = SceneCorpus.open(args.output)
+    print(f"📊 {args.output}")
+    for table, count in corpus.counts().items():
+        print(f"   {table}: {count}")
+    for question_type, count in corpus.conn.execute(
+        "SELECT question_type, COUNT(*) FROM practice_questions GROUP BY question_type ORDER BY question_type"
+    ):
+        print(f"      {question_type}: {count}")
+    corpus.close()
+
+
+def cmd_query(args) -> None:
+    corpus = SceneCorpus.open(args.output)
+    if args.qa:
+        records: List[CorpusRecord] = [r for r in [corpus.qa_pair(args.qa)] if r]
+        records += list(corpus.practice_questions(qa_id=args.qa))
+    elif args.table == "qa_pairs":
+        records = list(corpus.qa_pairs(scene_id=args.scene, sub_scene_id=args.sub_scene))
+    else:
+        records = list(corpus.practice_questions(args.scene, args.sub_scene, args.type))
+    for record in records:
+        print(json.dumps(record.data, ensure_ascii=False))
+    print(f"共 {len(records)} 条", file=sys.stderr)
+    corpus.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="编译与查询场景语料（SQLite）")
+    parser.add_argument("--output", type=Path, default=CORPUS_PATH, help=f"语料文件（默认 {CORPUS_PATH.name}）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="增量构建语料")
+    build.add_argument("--force", action="store_true", help="忽略已有语料，全量重建")
+    build.set_defaults(func=cmd_build)
+
+    stats = sub.add_parser("stats", help="查看记录数")
+    stats.set_defaults(func=cmd_stats)
+
+    query = sub.add_parser("query", help="按索引查询，每行输出一条 JSON")
+    query.add_argument("--table", choices=["practice_questions", "qa_pairs"], default="practice_questions")
+    query.add_argument("--scene", help="场景ID")
+    query.add_argument("--sub-scene", help="子场景ID")
+    query.add_argument("--type", choices=["choice", "fill_blank", "speaking"], help="练习题题型")
+    query.add_argument("--qa", help="问答对ID（输出该问答对及关联的练习题）")
+    query.set_defaults(func=cmd_query)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()